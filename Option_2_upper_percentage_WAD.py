@@ -6,7 +6,6 @@ Author: Kirodh Boodhraj
 import numpy as np
 import os
 from dotenv import load_dotenv
-import copy
 import pandas as pd
 import warnings
 import argparse
@@ -47,17 +46,39 @@ def parse_arguments():
     parser.add_argument('--PERCENT_UPPER_CAPACITY_FACTORS_TIME_SERIES_FILE_2', default=None, required=False, help="Output file for the capacity factors time series.")
     parser.add_argument('--PERCENT_UPPER_CAPACITY_FACTORS_LOCATION_FILE_WAD_2', default=None, required=False, help="Output file for the capacity factors Wind Atlas Data.")
     parser.add_argument('--PERCENT_UPPER_CAPACITY_FACTORS_LOCATION_FILE_ATLITE_2', default=None, required=False, help="Output file for the capacity factors Atlite data.")
+    parser.add_argument('--ATLITE_TIME_FREQUENCY', default=None, required=False, help="Time step frequency of the Atlite files e.g. h for hourly.")
+    parser.add_argument('--TIME_WINDOW_START', default=None, required=False, help="Start date of the time window to process (inclusive).")
+    parser.add_argument('--TIME_WINDOW_END', default=None, required=False, help="End date of the time window to process (exclusive).")
+    parser.add_argument('--TIME_WINDOW_MONTHS', default=None, required=False, help="Months or seasons to process e.g. 6,7,8 or JJA.")
+    parser.add_argument('--TIER_STATISTICS', default=None, required=False, help="Save monthly means, hour of day profiles, P50/P90 and ramp statistics beside the tier files (True/False).")
+    parser.add_argument('--PERCENT_UPPER_SWEEP_2', default=None, required=False, help="Sweep of upper percentages e.g. 1,2,5,10 or 1:50:1, all written to one multi-column file instead of the single percentage tier.")
+    parser.add_argument('--PERCENT_UPPER_SWEEP_TIME_SERIES_FILE_2', default=None, required=False, help="Percentage sweep time series file 2.")
+    parser.add_argument('--ATLITE_CUBE_FILE', default=None, required=False, help="Stitched netcdf cube of capacity factors (e.g. the Option 7 corrected cube) used instead of the Atlite folders.")
+    parser.add_argument('--STAGE_TIMING_LOG_FILE', default=None, required=False, help="Optional JSON lines file the stage timings (seconds, peak memory, items) are appended to.")
+    parser.add_argument('--ROI_BBOX', default=None, required=False, help="Region of interest to read, latitude bottom, latitude top, longitude left, longitude right, e.g. --ROI_BBOX=-35,-22,16,33 (with = because of the minus signs, leave empty for the whole domain)")
+    parser.add_argument('--ROI_GEOMETRY_FILE', default=None, required=False, help="GeoJSON file whose geometries bound the region of interest to read (leave empty for the whole domain)")
+    parser.add_argument('--ATLITE_CHUNKS', default=None, required=False, help="Time steps per chunk to process the Atlite data out-of-core with dask, e.g. 744 or auto (leave empty to load it into memory)")
+    parser.add_argument('--TIER_DASK_SCHEDULER', default=None, required=False, help="Dask scheduler for the chunked computations: threads (default), processes, synchronous, local or a scheduler address (tcp://...)")
+    parser.add_argument('--TIER_DASK_NUM_WORKERS', default=None, required=False, help="Number of dask workers (default: all cores)")
+    parser.add_argument('--ATLITE_PREFETCH_DEPTH', default=None, required=False, help="Number of Atlite csv files read ahead by background threads, e.g. 16 on a network drive (leave empty or 0 to read one file after the other)")
+    parser.add_argument('--ATLITE_FOLDER_MANIFESTS', default=None, required=False, help="True/False: keep a manifest of the csv files (order, sizes, header hashes) in every Atlite folder, unchanged folders are then not listed again. Default False")
+    parser.add_argument('--CHECKPOINT_FOLDER', default=None, required=False, help="Folder for the checkpoints of the finished pipeline stages (ingest, average, reduce), empty for no checkpoints.")
+    parser.add_argument('--RESUME', default=None, required=False, help="True to start a failed run again from its last finished stage in CHECKPOINT_FOLDER (same settings), False to start from the beginning.")
+    parser.add_argument('--ATLITE_LAND_CELLS', default=None, required=False, help="True/False: keep only the Atlite cells with a valid average (land cells) as a (time, cell) matrix, so the memory and the tier reductions scale with the land area. Default False")
+    parser.add_argument('--TIER_MASKS_FOLDER', default=None, required=False, help="Folder of single band .tif masks (value above 0 = usable land) applied to the tier selection, e.g. assets/masks. Leave empty for no masks")
+    parser.add_argument('--TIER_MASK_MODE', default=None, required=False, help="exclude (default): leave out the cells below TIER_MASK_MIN_FRACTION usable, weight: also weight the cells by their usable fraction in the tier means")
+    parser.add_argument('--TIER_MASK_MIN_FRACTION', default=None, required=False, help="Smallest usable fraction (0 to 1) of a cell to keep it in the tiers. Default 0.5 with exclude, any usable part with weight")
+    parser.add_argument('--TIER_MASK_CACHE_FOLDER', default=None, required=False, help="Folder for the masks reprojected onto the grids, keyed by a hash of the .tif files. Default TIER_MASKS_FOLDER/grid_cache")
+    parser.add_argument('--WIND_ATLAS_REDUCTION_METHOD', default=None, required=False, help="How a block of WIND ATLAS cells is reduced to one cell: mean, max, quantile or stride.")
+    parser.add_argument('--WIND_ATLAS_REDUCTION_QUANTILE', default=None, required=False, help="Quantile (0 to 1) of the block for WIND_ATLAS_REDUCTION_METHOD quantile.")
+    parser.add_argument('--WIND_ATLAS_PYRAMID_FOLDER', default=None, required=False, help="Folder of the reduced WIND ATLAS files.")
 
     # parse args
     args = parser.parse_args()
 
-    # Check if all arguments are provided
-    if all(arg is None for arg in vars(args).values()):
-        raise ValueError("ERROR: All arguments are None!")
-
-    # Check if any of the arguments are provided
-    if any(arg is None for arg in vars(args).values()):
-        print("Warning only some arguments provided! Code may fail.")
+    # Check if only some of the arguments are provided (none at all: the .env file is used)
+    if any(arg is None for arg in vars(args).values()) and not all(arg is None for arg in vars(args).values()):
+        print("Warning only some arguments provided! The others are read from the .env file.")
 
     return args
 
@@ -92,6 +113,32 @@ def load_from_env():
         "PERCENT_UPPER_CAPACITY_FACTORS_TIME_SERIES_FILE_2": os.environ.get("PERCENT_UPPER_CAPACITY_FACTORS_TIME_SERIES_FILE_2"),
         "PERCENT_UPPER_CAPACITY_FACTORS_LOCATION_FILE_WAD_2": os.environ.get("PERCENT_UPPER_CAPACITY_FACTORS_LOCATION_FILE_WAD_2"),
         "PERCENT_UPPER_CAPACITY_FACTORS_LOCATION_FILE_ATLITE_2": os.environ.get("PERCENT_UPPER_CAPACITY_FACTORS_LOCATION_FILE_ATLITE_2"),
+        "ATLITE_TIME_FREQUENCY": os.environ.get("ATLITE_TIME_FREQUENCY"),
+        "TIME_WINDOW_START": os.environ.get("TIME_WINDOW_START"),
+        "TIME_WINDOW_END": os.environ.get("TIME_WINDOW_END"),
+        "TIME_WINDOW_MONTHS": os.environ.get("TIME_WINDOW_MONTHS"),
+        "TIER_STATISTICS": os.environ.get("TIER_STATISTICS"),
+        "PERCENT_UPPER_SWEEP_2": os.environ.get("PERCENT_UPPER_SWEEP_2"),
+        "PERCENT_UPPER_SWEEP_TIME_SERIES_FILE_2": os.environ.get("PERCENT_UPPER_SWEEP_TIME_SERIES_FILE_2"),
+        "ATLITE_CUBE_FILE": os.environ.get("ATLITE_CUBE_FILE"),
+        "STAGE_TIMING_LOG_FILE": os.environ.get("STAGE_TIMING_LOG_FILE"),
+        "ROI_BBOX": os.environ.get("ROI_BBOX"),
+        "ROI_GEOMETRY_FILE": os.environ.get("ROI_GEOMETRY_FILE"),
+        "ATLITE_CHUNKS": os.environ.get("ATLITE_CHUNKS"),
+        "TIER_DASK_SCHEDULER": os.environ.get("TIER_DASK_SCHEDULER"),
+        "TIER_DASK_NUM_WORKERS": os.environ.get("TIER_DASK_NUM_WORKERS"),
+        "ATLITE_PREFETCH_DEPTH": os.environ.get("ATLITE_PREFETCH_DEPTH"),
+        "ATLITE_FOLDER_MANIFESTS": os.environ.get("ATLITE_FOLDER_MANIFESTS"),
+        "CHECKPOINT_FOLDER": os.environ.get("CHECKPOINT_FOLDER"),
+        "RESUME": os.environ.get("RESUME"),
+        "ATLITE_LAND_CELLS": os.environ.get("ATLITE_LAND_CELLS"),
+        "TIER_MASKS_FOLDER": os.environ.get("TIER_MASKS_FOLDER"),
+        "TIER_MASK_MODE": os.environ.get("TIER_MASK_MODE"),
+        "TIER_MASK_MIN_FRACTION": os.environ.get("TIER_MASK_MIN_FRACTION"),
+        "TIER_MASK_CACHE_FOLDER": os.environ.get("TIER_MASK_CACHE_FOLDER"),
+        "WIND_ATLAS_REDUCTION_METHOD": os.environ.get("WIND_ATLAS_REDUCTION_METHOD"),
+        "WIND_ATLAS_REDUCTION_QUANTILE": os.environ.get("WIND_ATLAS_REDUCTION_QUANTILE"),
+        "WIND_ATLAS_PYRAMID_FOLDER": os.environ.get("WIND_ATLAS_PYRAMID_FOLDER"),
     }
 
     # Store the names of variables that are None
@@ -112,95 +159,128 @@ def load_from_env():
 ################################################################
 # main codes:
 
-def average_capacity_factors_WAD(ATLITE_DUMMY_DATA, ATLITE_CAPACITY_FACTORS_FOLDERS, DUMMY_START_DATE, DUMMY_END_DATE, DUMMY_LATITUDE_BOTTOM, DUMMY_LATITUDE_TOP, DUMMY_LONGITUDE_LEFT, DUMMY_LONGITUDE_RIGHT, MAXIMUM_CAPACITY, DATA_VARIABLE_NAME, TIME_VARIABLE_NAME, AVG_ATLITE_CAPACITY_FACTORS_FILE_LOCATION, AVG_ATLITE_LATITUDE_VARIABLE_NAME, AVG_ATLITE_LONGITUDE_VARIABLE_NAME, REDUCED_WAD, WIND_ATLAS_RESOLUTION_REDUCTION, WIND_ATLAS_CAPACITY_FACTORS_HEATMAP_FILE_LOCATION, WIND_ATLAS_HEATMAP_LATITUDE_VARIABLE_NAME, WIND_ATLAS_HEATMAP_LONGITUDE_VARIABLE_NAME, WIND_ATLAS_HEATMAP_DATA_VARIABLE_NAME, PERCENT_UPPER_CAPACITY_FACTORS_2, OPTION_2_OUTPUT_FOLDER, SCALE_CAPACITY_FACTORS, PERCENT_UPPER_CAPACITY_FACTORS_TIME_SERIES_FILE_2, PERCENT_UPPER_CAPACITY_FACTORS_LOCATION_FILE_WAD_2, PERCENT_UPPER_CAPACITY_FACTORS_LOCATION_FILE_ATLITE_2):
+def average_capacity_factors_WAD(ATLITE_DUMMY_DATA, ATLITE_CAPACITY_FACTORS_FOLDERS, DUMMY_START_DATE, DUMMY_END_DATE, DUMMY_LATITUDE_BOTTOM, DUMMY_LATITUDE_TOP, DUMMY_LONGITUDE_LEFT, DUMMY_LONGITUDE_RIGHT, MAXIMUM_CAPACITY, DATA_VARIABLE_NAME, TIME_VARIABLE_NAME, AVG_ATLITE_CAPACITY_FACTORS_FILE_LOCATION, AVG_ATLITE_LATITUDE_VARIABLE_NAME, AVG_ATLITE_LONGITUDE_VARIABLE_NAME, REDUCED_WAD, WIND_ATLAS_RESOLUTION_REDUCTION, WIND_ATLAS_CAPACITY_FACTORS_HEATMAP_FILE_LOCATION, WIND_ATLAS_HEATMAP_LATITUDE_VARIABLE_NAME, WIND_ATLAS_HEATMAP_LONGITUDE_VARIABLE_NAME, WIND_ATLAS_HEATMAP_DATA_VARIABLE_NAME, PERCENT_UPPER_CAPACITY_FACTORS_2, OPTION_2_OUTPUT_FOLDER, SCALE_CAPACITY_FACTORS, PERCENT_UPPER_CAPACITY_FACTORS_TIME_SERIES_FILE_2, PERCENT_UPPER_CAPACITY_FACTORS_LOCATION_FILE_WAD_2, PERCENT_UPPER_CAPACITY_FACTORS_LOCATION_FILE_ATLITE_2, ATLITE_TIME_FREQUENCY=None, TIME_WINDOW_START=None, TIME_WINDOW_END=None, TIME_WINDOW_MONTHS=None, TIER_STATISTICS=None, PERCENT_UPPER_SWEEP_2=None, PERCENT_UPPER_SWEEP_TIME_SERIES_FILE_2=None, ATLITE_CUBE_FILE=None, STAGE_TIMING_LOG_FILE=None, ROI_BBOX=None, ROI_GEOMETRY_FILE=None, ATLITE_CHUNKS=None, TIER_DASK_SCHEDULER=None, TIER_DASK_NUM_WORKERS=None, ATLITE_PREFETCH_DEPTH=None, ATLITE_FOLDER_MANIFESTS=None, CHECKPOINT_FOLDER=None, RESUME=None, ATLITE_LAND_CELLS=None, TIER_MASKS_FOLDER=None, TIER_MASK_MODE=None, TIER_MASK_MIN_FRACTION=None, TIER_MASK_CACHE_FOLDER=None, WIND_ATLAS_REDUCTION_METHOD=None, WIND_ATLAS_REDUCTION_QUANTILE=None, WIND_ATLAS_PYRAMID_FOLDER=None):
+    support_functions.check_configuration(locals())
     # Code block where you want to suppress warnings
     with warnings.catch_warnings():
         warnings.simplefilter("ignore")
+        support_functions.start_stage_log("option_2",STAGE_TIMING_LOG_FILE)
+        support_functions.start_pipeline("option_2",locals(),CHECKPOINT_FOLDER,RESUME)
+        support_functions.set_dask_scheduler(TIER_DASK_SCHEDULER,TIER_DASK_NUM_WORKERS)
 
         # average the capacity factors according to time:
-        atlite_capacity_factors, atlite_capacity_factors_avg = support_functions.create_average_capacity_factor_file_atlite(ATLITE_DUMMY_DATA, ATLITE_CAPACITY_FACTORS_FOLDERS,DUMMY_START_DATE,DUMMY_END_DATE,DUMMY_LATITUDE_BOTTOM,DUMMY_LATITUDE_TOP,DUMMY_LONGITUDE_LEFT,DUMMY_LONGITUDE_RIGHT,MAXIMUM_CAPACITY,DATA_VARIABLE_NAME,TIME_VARIABLE_NAME,AVG_ATLITE_CAPACITY_FACTORS_FILE_LOCATION)
+        atlite_capacity_factors, atlite_capacity_factors_avg = support_functions.create_average_capacity_factor_file_atlite(ATLITE_DUMMY_DATA, ATLITE_CAPACITY_FACTORS_FOLDERS,DUMMY_START_DATE,DUMMY_END_DATE,DUMMY_LATITUDE_BOTTOM,DUMMY_LATITUDE_TOP,DUMMY_LONGITUDE_LEFT,DUMMY_LONGITUDE_RIGHT,MAXIMUM_CAPACITY,DATA_VARIABLE_NAME,TIME_VARIABLE_NAME,AVG_ATLITE_CAPACITY_FACTORS_FILE_LOCATION,ATLITE_TIME_FREQUENCY=ATLITE_TIME_FREQUENCY,TIME_WINDOW_START=TIME_WINDOW_START,TIME_WINDOW_END=TIME_WINDOW_END,TIME_WINDOW_MONTHS=TIME_WINDOW_MONTHS,ATLITE_CUBE_FILE=ATLITE_CUBE_FILE,ROI_BBOX=ROI_BBOX,ROI_GEOMETRY_FILE=ROI_GEOMETRY_FILE,ATLITE_CHUNKS=ATLITE_CHUNKS,ATLITE_PREFETCH_DEPTH=ATLITE_PREFETCH_DEPTH,ATLITE_FOLDER_MANIFESTS=ATLITE_FOLDER_MANIFESTS,ATLITE_LAND_CELLS=ATLITE_LAND_CELLS)
         atlite_lats = atlite_capacity_factors[AVG_ATLITE_LATITUDE_VARIABLE_NAME]
         atlite_lons = atlite_capacity_factors[AVG_ATLITE_LONGITUDE_VARIABLE_NAME]
         print("... Read averaged atlite capacity factor data.")
 
-        if REDUCED_WAD.lower() == "true":
-            # open the WAD data
-            latitude_wad,longitude_wad,all_data_wad = support_functions.read_wind_atlas_data_reduced(WIND_ATLAS_RESOLUTION_REDUCTION,WIND_ATLAS_CAPACITY_FACTORS_HEATMAP_FILE_LOCATION,WIND_ATLAS_HEATMAP_LATITUDE_VARIABLE_NAME,WIND_ATLAS_HEATMAP_LONGITUDE_VARIABLE_NAME,WIND_ATLAS_HEATMAP_DATA_VARIABLE_NAME)
-        else:
-            # open the WAD data
-            latitude_wad, longitude_wad, all_data_wad = support_functions.read_wind_atlas_data_full(WIND_ATLAS_CAPACITY_FACTORS_HEATMAP_FILE_LOCATION,WIND_ATLAS_HEATMAP_LATITUDE_VARIABLE_NAME,WIND_ATLAS_HEATMAP_LONGITUDE_VARIABLE_NAME,WIND_ATLAS_HEATMAP_DATA_VARIABLE_NAME)
+        with support_functions.stage_span("read_wad") as span:
+            if REDUCED_WAD.lower() == "true":
+                # open the WAD data
+                latitude_wad,longitude_wad,all_data_wad = support_functions.read_wind_atlas_data_reduced(WIND_ATLAS_RESOLUTION_REDUCTION,WIND_ATLAS_CAPACITY_FACTORS_HEATMAP_FILE_LOCATION,WIND_ATLAS_HEATMAP_LATITUDE_VARIABLE_NAME,WIND_ATLAS_HEATMAP_LONGITUDE_VARIABLE_NAME,WIND_ATLAS_HEATMAP_DATA_VARIABLE_NAME,ROI_BBOX=ROI_BBOX,ROI_GEOMETRY_FILE=ROI_GEOMETRY_FILE,WIND_ATLAS_REDUCTION_METHOD=WIND_ATLAS_REDUCTION_METHOD,WIND_ATLAS_REDUCTION_QUANTILE=WIND_ATLAS_REDUCTION_QUANTILE,WIND_ATLAS_PYRAMID_FOLDER=WIND_ATLAS_PYRAMID_FOLDER)
+            else:
+                # open the WAD data
+                latitude_wad, longitude_wad, all_data_wad = support_functions.read_wind_atlas_data_full(WIND_ATLAS_CAPACITY_FACTORS_HEATMAP_FILE_LOCATION,WIND_ATLAS_HEATMAP_LATITUDE_VARIABLE_NAME,WIND_ATLAS_HEATMAP_LONGITUDE_VARIABLE_NAME,WIND_ATLAS_HEATMAP_DATA_VARIABLE_NAME,ROI_BBOX=ROI_BBOX,ROI_GEOMETRY_FILE=ROI_GEOMETRY_FILE)
+            span['items'] = int(all_data_wad.size)
+
+        # leave out (or weight) the WAD cells that the tier masks mark as not usable
+        all_data_wad, tier_mask_weights = support_functions.apply_tier_masks(all_data_wad,WIND_ATLAS_HEATMAP_LATITUDE_VARIABLE_NAME,WIND_ATLAS_HEATMAP_LONGITUDE_VARIABLE_NAME,TIER_MASKS_FOLDER,TIER_MASK_MODE,TIER_MASK_MIN_FRACTION,TIER_MASK_CACHE_FOLDER)
+
+        # Sweep mode: all upper percentages of the sweep in one pass over the WAD data, saved as one multi-column file
+        if PERCENT_UPPER_SWEEP_2 is not None and str(PERCENT_UPPER_SWEEP_2).strip() != "":
+            sweep_percentages = support_functions.parse_percentage_sweep(PERCENT_UPPER_SWEEP_2)
+            print("... Generating time series for a sweep of ",len(sweep_percentages)," upper percentages: ",sweep_percentages)
+            # the WAD cells are averaged with the time series of their closest atlite cells
+            with support_functions.stage_span("gather",len(sweep_percentages)):
+                closest_atlite_cells = support_functions.nearest_cell_index(latitude_wad,longitude_wad,atlite_lats.values,atlite_lons.values)
+                sweep_means, cells_per_percentage = support_functions.pipeline_stage("reduce",lambda: support_functions.generate_upper_percentage_sweep(all_data_wad.values,support_functions.tier_values(atlite_capacity_factors,DATA_VARIABLE_NAME),sweep_percentages,closest_atlite_cells,cell_weights=tier_mask_weights))
+            for percentage, number_of_cells in zip(sweep_percentages, cells_per_percentage):
+                print("...... Top ",percentage," percent: ",number_of_cells," WAD cells")
+            sweep_df = pd.DataFrame(sweep_means, columns=support_functions.percentage_sweep_column_names(sweep_percentages), index=support_functions.tier_time_index(atlite_capacity_factors,TIME_VARIABLE_NAME))
+
+            # check if output directories are created
+            if not os.path.exists(OPTION_2_OUTPUT_FOLDER):
+                os.makedirs(OPTION_2_OUTPUT_FOLDER)
+
+            # scale capacity factors if required:
+            if SCALE_CAPACITY_FACTORS.lower() == "true":
+                sweep_df = sweep_df / float(MAXIMUM_CAPACITY)  # divide by the weightings
+                print("\n... Capacity factors were scaled by division of maximum capacity:",MAXIMUM_CAPACITY)
+
+            if PERCENT_UPPER_SWEEP_TIME_SERIES_FILE_2 is None or str(PERCENT_UPPER_SWEEP_TIME_SERIES_FILE_2).strip() == "":
+                PERCENT_UPPER_SWEEP_TIME_SERIES_FILE_2 = os.path.splitext(PERCENT_UPPER_CAPACITY_FACTORS_TIME_SERIES_FILE_2)[0]+"_sweep.csv"
+            with support_functions.stage_span("write",1):
+                sweep_df.to_csv(os.path.join(OPTION_2_OUTPUT_FOLDER,PERCENT_UPPER_SWEEP_TIME_SERIES_FILE_2))
+                support_functions.save_tier_statistics(sweep_df,OPTION_2_OUTPUT_FOLDER,PERCENT_UPPER_SWEEP_TIME_SERIES_FILE_2,TIER_STATISTICS)
+            support_functions.finish_pipeline()
+
+            print("\n... Percentage sweep file created: "+PERCENT_UPPER_SWEEP_TIME_SERIES_FILE_2)
+            support_functions.print_stage_summary()
+            print("\nOption_2 completed successfully!")
+            return
 
         # Save top % capacity factors and generate a time series from that
         print("... Generating time series from top "+PERCENT_UPPER_CAPACITY_FACTORS_2+" capacity factors")
-        try:
-            check_percentage = float(PERCENT_UPPER_CAPACITY_FACTORS_2)
-            if check_percentage < 0:
-                ValueError("The percentage is less than 0. Only 0-100 allowed.")
-            if check_percentage > 100:
-                ValueError("The percentage is larger than 100. Only 0-100 allowed.")
-        except Exception as e:
-            ValueError("The percentage is not a number. Only 0-100 allowed.")
-        # Find the top % values from the temporal average
-        top_percentage = copy.deepcopy(all_data_wad).stack(z=(WIND_ATLAS_HEATMAP_LATITUDE_VARIABLE_NAME, WIND_ATLAS_HEATMAP_LONGITUDE_VARIABLE_NAME)).quantile(1.0 - float(PERCENT_UPPER_CAPACITY_FACTORS_2)/100)
-        # print(top_percentage)
-
-        # Use boolean indexing to select the desired indexes
-        selected_indexes = all_data_wad.where(all_data_wad>top_percentage)#, drop=True)
-        # print(selected_indexes)
-
-        # get lats/lons
-        latitudes = selected_indexes[WIND_ATLAS_HEATMAP_LATITUDE_VARIABLE_NAME].values
-        longitudes = selected_indexes[WIND_ATLAS_HEATMAP_LONGITUDE_VARIABLE_NAME].values
-
-        non_nan_indices = np.argwhere(~np.isnan(selected_indexes.data))
-        # print(len(non_nan_indices))
-
-        # empty shell to store the lats/lons and the data, then average them later
+        def reduce_tiers():
+            # Find the top % values from the temporal average
+            with support_functions.stage_span("quantile"):
+                top_percentage = support_functions.field_percentiles(all_data_wad.values,1.0 - float(PERCENT_UPPER_CAPACITY_FACTORS_2)/100)[0]
+            # print(top_percentage)
+
+            # Use boolean indexing to select the desired indexes
+            with support_functions.stage_span("selection"):
+                selected_indexes = all_data_wad.where(all_data_wad>top_percentage)#, drop=True)
+            # print(selected_indexes)
+
+            # get lats/lons
+            latitudes = selected_indexes[WIND_ATLAS_HEATMAP_LATITUDE_VARIABLE_NAME].values
+            longitudes = selected_indexes[WIND_ATLAS_HEATMAP_LONGITUDE_VARIABLE_NAME].values
+
+            non_nan_indices = np.argwhere(~np.isnan(selected_indexes.data))
+            # print(len(non_nan_indices))
+
+            # empty shell to store the lats/lons and the data, then average them later
+            with support_functions.stage_span("gather",len(non_nan_indices)):
+                # index pairs have lat then lon
+                # lat/lon wad
+                lat_lon_df_wad = pd.DataFrame({'latitude': latitudes[non_nan_indices[:, 0]], 'longitude': longitudes[non_nan_indices[:, 1]], 'average_capacity_factor': selected_indexes.data[non_nan_indices[:, 0], non_nan_indices[:, 1]].astype(float)})
+
+                # get lat lon corresponding to atlite data (closest atlite cell of every selected wad cell):
+                closest_lat_index = np.argmin(np.abs(latitudes[non_nan_indices[:, 0]][:, np.newaxis] - atlite_lats.values[np.newaxis, :]), axis=1)
+                closest_lon_index = np.argmin(np.abs(longitudes[non_nan_indices[:, 1]][:, np.newaxis] - atlite_lons.values[np.newaxis, :]), axis=1)
+
+                # lat/lon atlite
+                lat_lon_df_atlite = pd.DataFrame({'latitude': atlite_lats.values[closest_lat_index], 'longitude': atlite_lons.values[closest_lon_index], 'average_capacity_factor': atlite_capacity_factors_avg.data[closest_lat_index, closest_lon_index].astype(float)})
+
+                # timeseries of all selected cells in one read (chunk by chunk for chunked data)
+                cell_series = support_functions.gather_cell_series(support_functions.tier_values(atlite_capacity_factors,DATA_VARIABLE_NAME),closest_lat_index * len(atlite_lons) + closest_lon_index)
+                tiers_raw_df = pd.DataFrame(cell_series, columns=['tier_'+str(column_number+1) for column_number in range(len(non_nan_indices))], index=support_functions.tier_time_index(atlite_capacity_factors,TIME_VARIABLE_NAME))
+
+                # # get the final tier and save it, weighted with the usable fraction of the WAD cells with TIER_MASK_MODE=weight
+                if tier_mask_weights is None:
+                    tiers_raw_df['average_tier_final'] = tiers_raw_df.mean(axis=1)
+                else:
+                    lat_lon_df_wad['tier_mask_weight'] = tier_mask_weights[non_nan_indices[:, 0], non_nan_indices[:, 1]]
+                    tiers_raw_df['average_tier_final'] = support_functions.weighted_row_mean(cell_series,lat_lon_df_wad['tier_mask_weight'].values)
+            return tiers_raw_df, lat_lon_df_wad, lat_lon_df_atlite
+        tiers_raw_df, lat_lon_df_wad, lat_lon_df_atlite = support_functions.pipeline_stage("reduce",reduce_tiers)
+
         # check if output directories are created
         if not os.path.exists(OPTION_2_OUTPUT_FOLDER):
             os.makedirs(OPTION_2_OUTPUT_FOLDER)
 
-        lat_lon_df_atlite = pd.DataFrame(columns=['latitude', 'longitude','average_capacity_factor'])
-        lat_lon_df_wad = pd.DataFrame(columns=['latitude', 'longitude','average_capacity_factor'])
-        tiers_raw_df = pd.DataFrame()
-
-        for index_number,index_pair in enumerate(non_nan_indices): # index pair has lat then lon
-            print("Busy with index: ",index_number+1," out of: ",len(non_nan_indices))
-
-            # get value
-            value = selected_indexes.data[index_pair[0]][index_pair[1]]
-
-            # add data to the data frame
-            # lat/lon wad
-            lat_lon_df_wad.loc[len(lat_lon_df_wad)] = [latitudes[index_pair[0]],longitudes[index_pair[1]],value]
-
-            # get lat lon corresponding to atlite data:
-            closest_lat_index = np.argmin(np.abs(latitudes[index_pair[0]]-atlite_lats.values))
-            closest_lon_index = np.argmin(np.abs(longitudes[index_pair[1]]-atlite_lons.values))
-
-            # lat/lon atlite
-            lat_lon_df_atlite.loc[len(lat_lon_df_atlite)] = [atlite_lats.values[closest_lat_index],atlite_lons.values[closest_lon_index],atlite_capacity_factors_avg.data[closest_lat_index,closest_lon_index]]
-
-            # timeseries
-            # Determine the next number for the new column name
-            next_column_number = len(tiers_raw_df.columns) + 1
-            # Create a new column name
-            new_column_name = f'tier_{next_column_number}'
-            # Add the new column to the DataFrame
-            tiers_raw_df[new_column_name] = atlite_capacity_factors[DATA_VARIABLE_NAME].values[:,closest_lat_index,closest_lon_index]
-
-        # # get the final tier and save it
-        tiers_raw_df['average_tier_final'] = tiers_raw_df.mean(axis=1)
-
         # scale capacity factors if required:
         if SCALE_CAPACITY_FACTORS.lower() == "true":
             tiers_raw_df = tiers_raw_df / float(MAXIMUM_CAPACITY)  # divide by the weightings
             print("\n... Capacity factors were scaled by division of maximum capacity:",MAXIMUM_CAPACITY)
 
         # save to csv files
-        tiers_raw_df.to_csv(os.path.join(OPTION_2_OUTPUT_FOLDER,PERCENT_UPPER_CAPACITY_FACTORS_TIME_SERIES_FILE_2))
-        lat_lon_df_wad.to_csv(os.path.join(OPTION_2_OUTPUT_FOLDER,PERCENT_UPPER_CAPACITY_FACTORS_LOCATION_FILE_WAD_2))
-        lat_lon_df_atlite.to_csv(os.path.join(OPTION_2_OUTPUT_FOLDER,PERCENT_UPPER_CAPACITY_FACTORS_LOCATION_FILE_ATLITE_2))
+        with support_functions.stage_span("write",3):
+            tiers_raw_df.to_csv(os.path.join(OPTION_2_OUTPUT_FOLDER,PERCENT_UPPER_CAPACITY_FACTORS_TIME_SERIES_FILE_2))
+            support_functions.save_tier_statistics(tiers_raw_df,OPTION_2_OUTPUT_FOLDER,PERCENT_UPPER_CAPACITY_FACTORS_TIME_SERIES_FILE_2,TIER_STATISTICS)
+            lat_lon_df_wad.to_csv(os.path.join(OPTION_2_OUTPUT_FOLDER,PERCENT_UPPER_CAPACITY_FACTORS_LOCATION_FILE_WAD_2))
+            lat_lon_df_atlite.to_csv(os.path.join(OPTION_2_OUTPUT_FOLDER,PERCENT_UPPER_CAPACITY_FACTORS_LOCATION_FILE_ATLITE_2))
+        support_functions.finish_pipeline()
 
         print("\n... Tier files for top "+PERCENT_UPPER_CAPACITY_FACTORS_2+" capacity factors created:")
         print("...... ATLITE Location file located in: "+PERCENT_UPPER_CAPACITY_FACTORS_LOCATION_FILE_ATLITE_2)
@@ -208,6 +288,7 @@ def average_capacity_factors_WAD(ATLITE_DUMMY_DATA, ATLITE_CAPACITY_FACTORS_FOLD
         print("...... Tier file located in: "+PERCENT_UPPER_CAPACITY_FACTORS_TIME_SERIES_FILE_2)
         print("... Note that averaged tier is in average_tier_final column.")
 
+        support_functions.print_stage_summary()
         print("\nOption_2 completed successfully!")
 
 
@@ -217,28 +298,10 @@ if __name__ == '__main__':
     print("#########")
 
     # check args or load env file and run codes
-    try:
-        print("TRYING TO USE ARGUMENTS")
-        args = parse_arguments()
-        print("ARGUMENTS FOUND. USING ARGUMENTS")
-
-        # RUN CODES
-        average_capacity_factors_WAD(**vars(args))
-    except Exception as e:
-        print("ARGUMENTS NOT FOUND: ",e)
-        try:
-            print("TRYING TO LOAD ENV FILE VARIABLES")
-            # Load variables from the .env file
-            args = load_from_env()
-            print("ENV FILE FOUND. USING ENV FILE")
-
-            # RUN CODES
-            average_capacity_factors_WAD(**args)
-
-        except Exception as e:
-            print("ENV FILE NOT FOUND: ",e)
-            print("ERROR ... USER ARGS AND ENV FILE NOT FOUND, ABORTING!")
-            raise ValueError("COULD NOT FIND ARGS OR LOAD ENV FILE. USER ARGS OR ENV FILE MISSING.")
+    args = support_functions.script_arguments(parse_arguments(), load_from_env)
+
+    # RUN CODES
+    average_capacity_factors_WAD(**args)
 
     # example use:
     # python Option_2_upper_percentage_WAD.py --ATLITE_DUMMY_DATA True --DUMMY_START_DATE  '2023-01-01' --DUMMY_END_DATE  '2024-01-01' --DUMMY_LATITUDE_BOTTOM  -32.0 --DUMMY_LATITUDE_TOP  -30.0 --DUMMY_LONGITUDE_LEFT  26.0 --DUMMY_LONGITUDE_RIGHT  28.0 --MAXIMUM_CAPACITY  50 --DATA_VARIABLE_NAME  capacity_factors --TIME_VARIABLE_NAME  time --AVG_ATLITE_CAPACITY_FACTORS_FILE_LOCATION  "assets/avg_atlite_capacity_factors.nc" --AVG_ATLITE_LATITUDE_VARIABLE_NAME  latitude --AVG_ATLITE_LONGITUDE_VARIABLE_NAME  longitude --REDUCED_WAD  True --WIND_ATLAS_RESOLUTION_REDUCTION  15 --WIND_ATLAS_CAPACITY_FACTORS_HEATMAP_FILE_LOCATION  "assets/wind_atlas_capacity_factors.nc" --WIND_ATLAS_HEATMAP_LATITUDE_VARIABLE_NAME  lat --WIND_ATLAS_HEATMAP_LONGITUDE_VARIABLE_NAME  lon --WIND_ATLAS_HEATMAP_DATA_VARIABLE_NAME  Band1 --PERCENT_UPPER_CAPACITY_FACTORS_2  10 --OPTION_2_OUTPUT_FOLDER  "assets/option_2_output" --SCALE_CAPACITY_FACTORS  True --PERCENT_UPPER_CAPACITY_FACTORS_TIME_SERIES_FILE_2  "option_2_top_percentage_capacity_factor_time_series.csv" --PERCENT_UPPER_CAPACITY_FACTORS_LOCATION_FILE_WAD_2  "option_2_top_percentage_locations_wad.csv" --PERCENT_UPPER_CAPACITY_FACTORS_LOCATION_FILE_ATLITE_2  "option_2_top_percentage_locations_atlite.csv"
\ No newline at end of file
@@ -4,10 +4,8 @@ Purpose: Returns the averaged capacity factors and saves the netcdf file into th
 
 Author: Kirodh Boodhraj
 """
-import numpy as np
 import os
 from dotenv import load_dotenv
-import copy
 import pandas as pd
 import argparse
 
@@ -41,17 +39,35 @@ def parse_arguments():
     parser.add_argument('--MAXIMUM_CAPACITY', default=None, required=False, help="Maximum capacity.")
     parser.add_argument('--BOUND_CAPACITY_FACTORS_TIME_SERIES_FILE_3', default=None, required=False,help="Output file for the capacity factors time series.")
     parser.add_argument('--SCALE_CAPACITY_FACTORS', default=None, required=False,help="Scale capacity factors with the maximum capacity.")
+    parser.add_argument('--ATLITE_TIME_FREQUENCY', default=None, required=False, help="Time step frequency of the Atlite files e.g. h for hourly.")
+    parser.add_argument('--TIME_WINDOW_START', default=None, required=False, help="Start date of the time window to process (inclusive).")
+    parser.add_argument('--TIME_WINDOW_END', default=None, required=False, help="End date of the time window to process (exclusive).")
+    parser.add_argument('--TIME_WINDOW_MONTHS', default=None, required=False, help="Months or seasons to process e.g. 6,7,8 or JJA.")
+    parser.add_argument('--TIER_STATISTICS', default=None, required=False, help="Save monthly means, hour of day profiles, P50/P90 and ramp statistics beside the tier files (True/False).")
+    parser.add_argument('--TIER_SPECIFICATION', default=None, required=False, help="Tier bounds as lower,upper percentages separated by ; (e.g. 0,10;10,20) or a .json/.yaml file. Overrides the 5 tier variables.")
+    parser.add_argument('--ATLITE_CUBE_FILE', default=None, required=False, help="Stitched netcdf cube of capacity factors (e.g. the Option 7 corrected cube) used instead of the Atlite folders.")
+    parser.add_argument('--STAGE_TIMING_LOG_FILE', default=None, required=False, help="Optional JSON lines file the stage timings (seconds, peak memory, items) are appended to.")
+    parser.add_argument('--ROI_BBOX', default=None, required=False, help="Region of interest to read, latitude bottom, latitude top, longitude left, longitude right, e.g. --ROI_BBOX=-35,-22,16,33 (with = because of the minus signs, leave empty for the whole domain)")
+    parser.add_argument('--ROI_GEOMETRY_FILE', default=None, required=False, help="GeoJSON file whose geometries bound the region of interest to read (leave empty for the whole domain)")
+    parser.add_argument('--ATLITE_CHUNKS', default=None, required=False, help="Time steps per chunk to process the Atlite data out-of-core with dask, e.g. 744 or auto (leave empty to load it into memory)")
+    parser.add_argument('--TIER_DASK_SCHEDULER', default=None, required=False, help="Dask scheduler for the chunked computations: threads (default), processes, synchronous, local or a scheduler address (tcp://...)")
+    parser.add_argument('--TIER_DASK_NUM_WORKERS', default=None, required=False, help="Number of dask workers (default: all cores)")
+    parser.add_argument('--ATLITE_PREFETCH_DEPTH', default=None, required=False, help="Number of Atlite csv files read ahead by background threads, e.g. 16 on a network drive (leave empty or 0 to read one file after the other)")
+    parser.add_argument('--ATLITE_FOLDER_MANIFESTS', default=None, required=False, help="True/False: keep a manifest of the csv files (order, sizes, header hashes) in every Atlite folder, unchanged folders are then not listed again. Default False")
+    parser.add_argument('--CHECKPOINT_FOLDER', default=None, required=False, help="Folder for the checkpoints of the finished pipeline stages (ingest, average, reduce), empty for no checkpoints.")
+    parser.add_argument('--RESUME', default=None, required=False, help="True to start a failed run again from its last finished stage in CHECKPOINT_FOLDER (same settings), False to start from the beginning.")
+    parser.add_argument('--ATLITE_LAND_CELLS', default=None, required=False, help="True/False: keep only the Atlite cells with a valid average (land cells) as a (time, cell) matrix, so the memory and the tier reductions scale with the land area. Default False")
+    parser.add_argument('--TIER_MASKS_FOLDER', default=None, required=False, help="Folder of single band .tif masks (value above 0 = usable land) applied to the tier selection, e.g. assets/masks. Leave empty for no masks")
+    parser.add_argument('--TIER_MASK_MODE', default=None, required=False, help="exclude (default): leave out the cells below TIER_MASK_MIN_FRACTION usable, weight: also weight the cells by their usable fraction in the tier means")
+    parser.add_argument('--TIER_MASK_MIN_FRACTION', default=None, required=False, help="Smallest usable fraction (0 to 1) of a cell to keep it in the tiers. Default 0.5 with exclude, any usable part with weight")
+    parser.add_argument('--TIER_MASK_CACHE_FOLDER', default=None, required=False, help="Folder for the masks reprojected onto the grids, keyed by a hash of the .tif files. Default TIER_MASKS_FOLDER/grid_cache")
 
     # parse args
     args = parser.parse_args()
 
-    # Check if all arguments are provided
-    if all(arg is None for arg in vars(args).values()):
-        raise ValueError("ERROR: All arguments are None!")
-
-    # Check if any of the arguments are provided
-    if any(arg is None for arg in vars(args).values()):
-        print("Warning only some arguments provided! Code may fail.")
+    # Check if only some of the arguments are provided (none at all: the .env file is used)
+    if any(arg is None for arg in vars(args).values()) and not all(arg is None for arg in vars(args).values()):
+        print("Warning only some arguments provided! The others are read from the .env file.")
 
     return args
 
@@ -83,6 +99,28 @@ def load_from_env():
         'MAXIMUM_CAPACITY': os.environ.get('MAXIMUM_CAPACITY'),
         'BOUND_CAPACITY_FACTORS_TIME_SERIES_FILE_3': os.environ.get('BOUND_CAPACITY_FACTORS_TIME_SERIES_FILE_3'),
         'SCALE_CAPACITY_FACTORS': os.environ.get('SCALE_CAPACITY_FACTORS'),
+        'ATLITE_TIME_FREQUENCY': os.environ.get('ATLITE_TIME_FREQUENCY'),
+        'TIME_WINDOW_START': os.environ.get('TIME_WINDOW_START'),
+        'TIME_WINDOW_END': os.environ.get('TIME_WINDOW_END'),
+        'TIME_WINDOW_MONTHS': os.environ.get('TIME_WINDOW_MONTHS'),
+        'TIER_STATISTICS': os.environ.get('TIER_STATISTICS'),
+        'TIER_SPECIFICATION': os.environ.get('TIER_SPECIFICATION'),
+        'ATLITE_CUBE_FILE': os.environ.get('ATLITE_CUBE_FILE'),
+        'STAGE_TIMING_LOG_FILE': os.environ.get('STAGE_TIMING_LOG_FILE'),
+        'ROI_BBOX': os.environ.get('ROI_BBOX'),
+        'ROI_GEOMETRY_FILE': os.environ.get('ROI_GEOMETRY_FILE'),
+        'ATLITE_CHUNKS': os.environ.get('ATLITE_CHUNKS'),
+        'TIER_DASK_SCHEDULER': os.environ.get('TIER_DASK_SCHEDULER'),
+        'TIER_DASK_NUM_WORKERS': os.environ.get('TIER_DASK_NUM_WORKERS'),
+        'ATLITE_PREFETCH_DEPTH': os.environ.get('ATLITE_PREFETCH_DEPTH'),
+        'ATLITE_FOLDER_MANIFESTS': os.environ.get('ATLITE_FOLDER_MANIFESTS'),
+        'CHECKPOINT_FOLDER': os.environ.get('CHECKPOINT_FOLDER'),
+        'RESUME': os.environ.get('RESUME'),
+        'ATLITE_LAND_CELLS': os.environ.get('ATLITE_LAND_CELLS'),
+        'TIER_MASKS_FOLDER': os.environ.get('TIER_MASKS_FOLDER'),
+        'TIER_MASK_MODE': os.environ.get('TIER_MASK_MODE'),
+        'TIER_MASK_MIN_FRACTION': os.environ.get('TIER_MASK_MIN_FRACTION'),
+        'TIER_MASK_CACHE_FOLDER': os.environ.get('TIER_MASK_CACHE_FOLDER'),
     }
 
 
@@ -103,102 +141,31 @@ def load_from_env():
 ################################################################
 # main codes:
 
-def average_capacity_factors_atlite(ATLITE_DUMMY_DATA, ATLITE_CAPACITY_FACTORS_FOLDERS, DUMMY_START_DATE, DUMMY_END_DATE, DUMMY_LATITUDE_BOTTOM, DUMMY_LATITUDE_TOP, DUMMY_LONGITUDE_LEFT, DUMMY_LONGITUDE_RIGHT, DATA_VARIABLE_NAME, TIME_VARIABLE_NAME, AVG_ATLITE_CAPACITY_FACTORS_FILE_LOCATION, PERCENT_UPPER_TIER1_CAPACITY_FACTORS, PERCENT_UPPER_TIER2_CAPACITY_FACTORS, PERCENT_UPPER_TIER3_CAPACITY_FACTORS, PERCENT_UPPER_TIER4_CAPACITY_FACTORS, PERCENT_UPPER_TIER5_CAPACITY_FACTORS, AVG_ATLITE_LATITUDE_VARIABLE_NAME, AVG_ATLITE_LONGITUDE_VARIABLE_NAME, OPTION_3_OUTPUT_FOLDER, MAXIMUM_CAPACITY, BOUND_CAPACITY_FACTORS_TIME_SERIES_FILE_3, SCALE_CAPACITY_FACTORS):
+def average_capacity_factors_atlite(ATLITE_DUMMY_DATA, ATLITE_CAPACITY_FACTORS_FOLDERS, DUMMY_START_DATE, DUMMY_END_DATE, DUMMY_LATITUDE_BOTTOM, DUMMY_LATITUDE_TOP, DUMMY_LONGITUDE_LEFT, DUMMY_LONGITUDE_RIGHT, DATA_VARIABLE_NAME, TIME_VARIABLE_NAME, AVG_ATLITE_CAPACITY_FACTORS_FILE_LOCATION, PERCENT_UPPER_TIER1_CAPACITY_FACTORS, PERCENT_UPPER_TIER2_CAPACITY_FACTORS, PERCENT_UPPER_TIER3_CAPACITY_FACTORS, PERCENT_UPPER_TIER4_CAPACITY_FACTORS, PERCENT_UPPER_TIER5_CAPACITY_FACTORS, AVG_ATLITE_LATITUDE_VARIABLE_NAME, AVG_ATLITE_LONGITUDE_VARIABLE_NAME, OPTION_3_OUTPUT_FOLDER, MAXIMUM_CAPACITY, BOUND_CAPACITY_FACTORS_TIME_SERIES_FILE_3, SCALE_CAPACITY_FACTORS, ATLITE_TIME_FREQUENCY=None, TIME_WINDOW_START=None, TIME_WINDOW_END=None, TIME_WINDOW_MONTHS=None, TIER_STATISTICS=None, TIER_SPECIFICATION=None, ATLITE_CUBE_FILE=None, STAGE_TIMING_LOG_FILE=None, ROI_BBOX=None, ROI_GEOMETRY_FILE=None, ATLITE_CHUNKS=None, TIER_DASK_SCHEDULER=None, TIER_DASK_NUM_WORKERS=None, ATLITE_PREFETCH_DEPTH=None, ATLITE_FOLDER_MANIFESTS=None, CHECKPOINT_FOLDER=None, RESUME=None, ATLITE_LAND_CELLS=None, TIER_MASKS_FOLDER=None, TIER_MASK_MODE=None, TIER_MASK_MIN_FRACTION=None, TIER_MASK_CACHE_FOLDER=None):
+    support_functions.check_configuration(locals())
+    support_functions.start_stage_log("option_3",STAGE_TIMING_LOG_FILE)
+    support_functions.start_pipeline("option_3",locals(),CHECKPOINT_FOLDER,RESUME)
+    support_functions.set_dask_scheduler(TIER_DASK_SCHEDULER,TIER_DASK_NUM_WORKERS)
+
+    # Option 3: Split tiers according to percentage bounds (TIER_SPECIFICATION or the 5 tier variables), read before the data:
+    tier_bands = support_functions.parse_tier_specification(TIER_SPECIFICATION,[PERCENT_UPPER_TIER1_CAPACITY_FACTORS, PERCENT_UPPER_TIER2_CAPACITY_FACTORS, PERCENT_UPPER_TIER3_CAPACITY_FACTORS, PERCENT_UPPER_TIER4_CAPACITY_FACTORS, PERCENT_UPPER_TIER5_CAPACITY_FACTORS])
+    print("... Generating ",len(tier_bands)," tiers.")
+
     # average the capacity factors according to time:
-    atlite_capacity_factors, atlite_capacity_factors_avg = support_functions.create_average_capacity_factor_file_atlite(ATLITE_DUMMY_DATA, ATLITE_CAPACITY_FACTORS_FOLDERS,DUMMY_START_DATE,DUMMY_END_DATE,DUMMY_LATITUDE_BOTTOM,DUMMY_LATITUDE_TOP,DUMMY_LONGITUDE_LEFT,DUMMY_LONGITUDE_RIGHT,MAXIMUM_CAPACITY,DATA_VARIABLE_NAME,TIME_VARIABLE_NAME,AVG_ATLITE_CAPACITY_FACTORS_FILE_LOCATION)
+    atlite_capacity_factors, atlite_capacity_factors_avg = support_functions.create_average_capacity_factor_file_atlite(ATLITE_DUMMY_DATA, ATLITE_CAPACITY_FACTORS_FOLDERS,DUMMY_START_DATE,DUMMY_END_DATE,DUMMY_LATITUDE_BOTTOM,DUMMY_LATITUDE_TOP,DUMMY_LONGITUDE_LEFT,DUMMY_LONGITUDE_RIGHT,MAXIMUM_CAPACITY,DATA_VARIABLE_NAME,TIME_VARIABLE_NAME,AVG_ATLITE_CAPACITY_FACTORS_FILE_LOCATION,ATLITE_TIME_FREQUENCY=ATLITE_TIME_FREQUENCY,TIME_WINDOW_START=TIME_WINDOW_START,TIME_WINDOW_END=TIME_WINDOW_END,TIME_WINDOW_MONTHS=TIME_WINDOW_MONTHS,ATLITE_CUBE_FILE=ATLITE_CUBE_FILE,ROI_BBOX=ROI_BBOX,ROI_GEOMETRY_FILE=ROI_GEOMETRY_FILE,ATLITE_CHUNKS=ATLITE_CHUNKS,ATLITE_PREFETCH_DEPTH=ATLITE_PREFETCH_DEPTH,ATLITE_FOLDER_MANIFESTS=ATLITE_FOLDER_MANIFESTS,ATLITE_LAND_CELLS=ATLITE_LAND_CELLS)
     print("... Averaged atlite capacity factor data.")
 
+    # leave out (or weight) the cells that the tier masks mark as not usable
+    atlite_capacity_factors_avg, tier_mask_weights = support_functions.apply_tier_masks(atlite_capacity_factors_avg,AVG_ATLITE_LATITUDE_VARIABLE_NAME,AVG_ATLITE_LONGITUDE_VARIABLE_NAME,TIER_MASKS_FOLDER,TIER_MASK_MODE,TIER_MASK_MIN_FRACTION,TIER_MASK_CACHE_FOLDER)
 
-    # Option 3: Split tiers according to percentage bounds:
-    def get_tier_percentage_bound(lats,longs,atlite_data,selected_data):
-        # count as the values get added on to take the average at the end
-        number_columns_in_tier = 0
-        # skeleton to hold the values
-        cumulative_average_values = np.zeros((len(atlite_data[DATA_VARIABLE_NAME].values[:,0,0])))
-
-        # loop through and find if nan or data
-        for lat in range(len(lats)):
-            for lon in range(len(longs)):
-                value = selected_data.data[lat][lon]
-                if np.isnan(value):
-                    continue
-                else:
-                    # Add the new column to the skeleton column
-                    cumulative_average_values += atlite_data[DATA_VARIABLE_NAME].values[:, lat, lon]
-                    number_columns_in_tier += 1
-
-        # take the average
-        print("... A tier was created.")
-        return cumulative_average_values/number_columns_in_tier
-
-    # Convert the PERCENT_UPPER_TIER1_CAPACITY_FACTORS variable to a list of floats
-    percent_upper_tier1_capacity_factors = list(map(float, PERCENT_UPPER_TIER1_CAPACITY_FACTORS.split(',')))
-    percent_upper_tier2_capacity_factors = list(map(float, PERCENT_UPPER_TIER2_CAPACITY_FACTORS.split(',')))
-    percent_upper_tier3_capacity_factors = list(map(float, PERCENT_UPPER_TIER3_CAPACITY_FACTORS.split(',')))
-    percent_upper_tier4_capacity_factors = list(map(float, PERCENT_UPPER_TIER4_CAPACITY_FACTORS.split(',')))
-    percent_upper_tier5_capacity_factors = list(map(float, PERCENT_UPPER_TIER5_CAPACITY_FACTORS.split(',')))
-
-    # Find the top % values from the temporal average (sorts out user swapping max and min)
-    upper_percentile_tier1 = 1.0 - min(percent_upper_tier1_capacity_factors) / 100.0
-    upper_percentile_tier2 = 1.0 - min(percent_upper_tier2_capacity_factors) / 100.0
-    upper_percentile_tier3 = 1.0 - min(percent_upper_tier3_capacity_factors) / 100.0
-    upper_percentile_tier4 = 1.0 - min(percent_upper_tier4_capacity_factors) / 100.0
-    upper_percentile_tier5 = 1.0 - min(percent_upper_tier5_capacity_factors) / 100.0
-
-    lower_percentile_tier1 = 1.0 - max(percent_upper_tier1_capacity_factors) / 100.0
-    lower_percentile_tier2 = 1.0 - max(percent_upper_tier2_capacity_factors) / 100.0
-    lower_percentile_tier3 = 1.0 - max(percent_upper_tier3_capacity_factors) / 100.0
-    lower_percentile_tier4 = 1.0 - max(percent_upper_tier4_capacity_factors) / 100.0
-    lower_percentile_tier5 = 1.0 - max(percent_upper_tier5_capacity_factors) / 100.0
-
-    # Find the values between the specified quantiles
-    bounds_tier1 = copy.deepcopy(atlite_capacity_factors_avg).stack(z=(AVG_ATLITE_LATITUDE_VARIABLE_NAME, AVG_ATLITE_LONGITUDE_VARIABLE_NAME)).quantile([lower_percentile_tier1, upper_percentile_tier1], dim='z')
-    bounds_tier2 = copy.deepcopy(atlite_capacity_factors_avg).stack(z=(AVG_ATLITE_LATITUDE_VARIABLE_NAME, AVG_ATLITE_LONGITUDE_VARIABLE_NAME)).quantile([lower_percentile_tier2, upper_percentile_tier2], dim='z')
-    bounds_tier3 = copy.deepcopy(atlite_capacity_factors_avg).stack(z=(AVG_ATLITE_LATITUDE_VARIABLE_NAME, AVG_ATLITE_LONGITUDE_VARIABLE_NAME)).quantile([lower_percentile_tier3, upper_percentile_tier3], dim='z')
-    bounds_tier4 = copy.deepcopy(atlite_capacity_factors_avg).stack(z=(AVG_ATLITE_LATITUDE_VARIABLE_NAME, AVG_ATLITE_LONGITUDE_VARIABLE_NAME)).quantile([lower_percentile_tier4, upper_percentile_tier4], dim='z')
-    bounds_tier5 = copy.deepcopy(atlite_capacity_factors_avg).stack(z=(AVG_ATLITE_LATITUDE_VARIABLE_NAME, AVG_ATLITE_LONGITUDE_VARIABLE_NAME)).quantile([lower_percentile_tier5, upper_percentile_tier5], dim='z')
-
-    # extract the bounds:
-    top_bound_tier1 = bounds_tier1.values[1]
-    top_bound_tier2 = bounds_tier2.values[1]
-    top_bound_tier3 = bounds_tier3.values[1]
-    top_bound_tier4 = bounds_tier4.values[1]
-    top_bound_tier5 = bounds_tier5.values[1]
-
-    bottom_bound_tier1 = bounds_tier1.values[0]
-    bottom_bound_tier2 = bounds_tier2.values[0]
-    bottom_bound_tier3 = bounds_tier3.values[0]
-    bottom_bound_tier4 = bounds_tier4.values[0]
-    bottom_bound_tier5 = bounds_tier5.values[0]
-
-    # Use boolean indexing to select the desired indexes
-    selected_indexes_tier1 = atlite_capacity_factors_avg.where((atlite_capacity_factors_avg>bottom_bound_tier1) & (atlite_capacity_factors_avg<top_bound_tier1))#, drop=True)
-
-    selected_indexes_tier2 = atlite_capacity_factors_avg.where((atlite_capacity_factors_avg>bottom_bound_tier2) & (atlite_capacity_factors_avg<top_bound_tier2))#, drop=True)
-    selected_indexes_tier3 = atlite_capacity_factors_avg.where((atlite_capacity_factors_avg>bottom_bound_tier3) & (atlite_capacity_factors_avg<top_bound_tier3))#, drop=True)
-    selected_indexes_tier4 = atlite_capacity_factors_avg.where((atlite_capacity_factors_avg>bottom_bound_tier4) & (atlite_capacity_factors_avg<top_bound_tier4))#, drop=True)
-    selected_indexes_tier5 = atlite_capacity_factors_avg.where((atlite_capacity_factors_avg>bottom_bound_tier5) & (atlite_capacity_factors_avg<top_bound_tier5))#, drop=True)
-
-    # Generate the tiers:
-    bound_tier1 = get_tier_percentage_bound(atlite_capacity_factors[AVG_ATLITE_LATITUDE_VARIABLE_NAME].values,atlite_capacity_factors[AVG_ATLITE_LONGITUDE_VARIABLE_NAME].values,copy.deepcopy(atlite_capacity_factors),selected_indexes_tier1)
-    bound_tier2 = get_tier_percentage_bound(atlite_capacity_factors[AVG_ATLITE_LATITUDE_VARIABLE_NAME].values,atlite_capacity_factors[AVG_ATLITE_LONGITUDE_VARIABLE_NAME].values,copy.deepcopy(atlite_capacity_factors),selected_indexes_tier2)
-    bound_tier3 = get_tier_percentage_bound(atlite_capacity_factors[AVG_ATLITE_LATITUDE_VARIABLE_NAME].values,atlite_capacity_factors[AVG_ATLITE_LONGITUDE_VARIABLE_NAME].values,copy.deepcopy(atlite_capacity_factors),selected_indexes_tier3)
-    bound_tier4 = get_tier_percentage_bound(atlite_capacity_factors[AVG_ATLITE_LATITUDE_VARIABLE_NAME].values,atlite_capacity_factors[AVG_ATLITE_LONGITUDE_VARIABLE_NAME].values,copy.deepcopy(atlite_capacity_factors),selected_indexes_tier4)
-    bound_tier5 = get_tier_percentage_bound(atlite_capacity_factors[AVG_ATLITE_LATITUDE_VARIABLE_NAME].values,atlite_capacity_factors[AVG_ATLITE_LONGITUDE_VARIABLE_NAME].values,copy.deepcopy(atlite_capacity_factors),selected_indexes_tier5)
-    print(bound_tier1)
-    print(bound_tier2)
-    print(bound_tier3)
-    print(bound_tier4)
-    print(bound_tier5)
+    # Find the values between the specified quantiles and average them into tiers, all tiers at once
+    with support_functions.stage_span("gather",len(tier_bands)):
+        tier_means, bottom_bounds, top_bounds, cells_per_tier = support_functions.pipeline_stage("reduce",lambda: support_functions.generate_bounded_tiers(atlite_capacity_factors_avg.values,support_functions.tier_values(atlite_capacity_factors,DATA_VARIABLE_NAME),tier_bands,cell_weights=tier_mask_weights))
+    for tier_number, tier_band in enumerate(tier_bands):
+        print("... Tier ",tier_number+1," bounds: ",tier_band[0]," - ",tier_band[1]," capacity factors: ",bottom_bounds[tier_number]," - ",top_bounds[tier_number]," cells: ",cells_per_tier[tier_number])
 
     # Create a DataFrame
-    tier_dataframe_option_3 = pd.DataFrame({
-        'tier_1': bound_tier1,
-        'tier_2': bound_tier2,
-        'tier_3': bound_tier3,
-        'tier_4': bound_tier4,
-        'tier_5': bound_tier5
-    })
+    tier_dataframe_option_3 = pd.DataFrame(tier_means, columns=['tier_'+str(tier_number+1) for tier_number in range(len(tier_bands))], index=support_functions.tier_time_index(atlite_capacity_factors,TIME_VARIABLE_NAME))
 
     # check if output directories are created
     if not os.path.exists(OPTION_3_OUTPUT_FOLDER):
@@ -211,9 +178,12 @@ def average_capacity_factors_atlite(ATLITE_DUMMY_DATA, ATLITE_CAPACITY_FACTORS_F
         print("\n... Capacity factors were scaled by division of maximum capacity:",MAXIMUM_CAPACITY)
 
 
-    tier_dataframe_option_3.to_csv(os.path.join(OPTION_3_OUTPUT_FOLDER,BOUND_CAPACITY_FACTORS_TIME_SERIES_FILE_3),index=False)
-
+    with support_functions.stage_span("write",1):
+        tier_dataframe_option_3.to_csv(os.path.join(OPTION_3_OUTPUT_FOLDER,BOUND_CAPACITY_FACTORS_TIME_SERIES_FILE_3))
+        support_functions.save_tier_statistics(tier_dataframe_option_3,OPTION_3_OUTPUT_FOLDER,BOUND_CAPACITY_FACTORS_TIME_SERIES_FILE_3,TIER_STATISTICS)
+    support_functions.finish_pipeline()
 
+    support_functions.print_stage_summary()
     print("\nOption_3 completed successfully!")
 
 if __name__ == '__main__':
@@ -223,28 +193,10 @@ if __name__ == '__main__':
     print("#########")
 
     # check args or load env file and run codes
-    try:
-        print("TRYING TO USE ARGUMENTS")
-        args = parse_arguments()
-        print("ARGUMENTS FOUND. USING ARGUMENTS")
-
-        # RUN CODES
-        average_capacity_factors_atlite(**vars(args))
-    except Exception as e:
-        print("ARGUMENTS NOT FOUND: ", e)
-        try:
-            print("TRYING TO LOAD ENV FILE VARIABLES")
-            # Load variables from the .env file
-            args = load_from_env()
-            print("ENV FILE FOUND. USING ENV FILE")
-
-            # RUN CODES
-            average_capacity_factors_atlite(**args)
-
-        except Exception as e:
-            print("ENV FILE NOT FOUND: ", e)
-            print("ERROR ... USER ARGS AND ENV FILE NOT FOUND, ABORTING!")
-            raise ValueError("COULD NOT FIND ARGS OR LOAD ENV FILE. USER ARGS OR ENV FILE MISSING.")
+    args = support_functions.script_arguments(parse_arguments(), load_from_env)
+
+    # RUN CODES
+    average_capacity_factors_atlite(**args)
 
     # args example use:
     # python Option_3_bound_percentage_atlite.py  --ATLITE_DUMMY_DATA=True  --DUMMY_START_DATE='2023-01-01'  --DUMMY_END_DATE='2024-01-01'  --DUMMY_LATITUDE_BOTTOM=-32.0  --DUMMY_LATITUDE_TOP=-30.0  --DUMMY_LONGITUDE_LEFT=26.0  --DUMMY_LONGITUDE_RIGHT=28.0  --DATA_VARIABLE_NAME=capacity_factors  --TIME_VARIABLE_NAME=time  --AVG_ATLITE_CAPACITY_FACTORS_FILE_LOCATION="assets/avg_atlite_capacity_factors.nc"  --PERCENT_UPPER_TIER1_CAPACITY_FACTORS=0,10  --PERCENT_UPPER_TIER2_CAPACITY_FACTORS=10,20  --PERCENT_UPPER_TIER3_CAPACITY_FACTORS=0,40  --PERCENT_UPPER_TIER4_CAPACITY_FACTORS=60,100  --PERCENT_UPPER_TIER5_CAPACITY_FACTORS=40,60  --AVG_ATLITE_LATITUDE_VARIABLE_NAME=latitude  --AVG_ATLITE_LONGITUDE_VARIABLE_NAME=longitude  --OPTION_3_OUTPUT_FOLDER="assets/option_3_output"  --MAXIMUM_CAPACITY=50  --BOUND_CAPACITY_FACTORS_TIME_SERIES_FILE_3="option_3_top_percentage_capacity_factor_time_series.csv"  --SCALE_CAPACITY_FACTORS=True
@@ -3,10 +3,8 @@ Purpose: Finds the bounded percentage capacity factors for the WIND ATLAS data.
 
 Author: Kirodh Boodhraj
 """
-import numpy as np
 import os
 from dotenv import load_dotenv
-import copy
 import pandas as pd
 # import warnings
 import argparse
@@ -49,17 +47,38 @@ def parse_arguments():
     parser.add_argument('--OPTION_4_OUTPUT_FOLDER', default=None, required=False, help="Option 4 output folder.")
     parser.add_argument('--SCALE_CAPACITY_FACTORS', default=None, required=False, help="Scale capacity factors.")
     parser.add_argument('--BOUND_CAPACITY_FACTORS_TIME_SERIES_FILE_4', default=None, required=False,help="Output file for the bounded capacity factors time series.")
+    parser.add_argument('--ATLITE_TIME_FREQUENCY', default=None, required=False, help="Time step frequency of the Atlite files e.g. h for hourly.")
+    parser.add_argument('--TIME_WINDOW_START', default=None, required=False, help="Start date of the time window to process (inclusive).")
+    parser.add_argument('--TIME_WINDOW_END', default=None, required=False, help="End date of the time window to process (exclusive).")
+    parser.add_argument('--TIME_WINDOW_MONTHS', default=None, required=False, help="Months or seasons to process e.g. 6,7,8 or JJA.")
+    parser.add_argument('--TIER_STATISTICS', default=None, required=False, help="Save monthly means, hour of day profiles, P50/P90 and ramp statistics beside the tier files (True/False).")
+    parser.add_argument('--TIER_SPECIFICATION', default=None, required=False, help="Tier bounds as lower,upper percentages separated by ; (e.g. 0,10;10,20) or a .json/.yaml file. Overrides the 5 tier variables.")
+    parser.add_argument('--ATLITE_CUBE_FILE', default=None, required=False, help="Stitched netcdf cube of capacity factors (e.g. the Option 7 corrected cube) used instead of the Atlite folders.")
+    parser.add_argument('--STAGE_TIMING_LOG_FILE', default=None, required=False, help="Optional JSON lines file the stage timings (seconds, peak memory, items) are appended to.")
+    parser.add_argument('--ROI_BBOX', default=None, required=False, help="Region of interest to read, latitude bottom, latitude top, longitude left, longitude right, e.g. --ROI_BBOX=-35,-22,16,33 (with = because of the minus signs, leave empty for the whole domain)")
+    parser.add_argument('--ROI_GEOMETRY_FILE', default=None, required=False, help="GeoJSON file whose geometries bound the region of interest to read (leave empty for the whole domain)")
+    parser.add_argument('--ATLITE_CHUNKS', default=None, required=False, help="Time steps per chunk to process the Atlite data out-of-core with dask, e.g. 744 or auto (leave empty to load it into memory)")
+    parser.add_argument('--TIER_DASK_SCHEDULER', default=None, required=False, help="Dask scheduler for the chunked computations: threads (default), processes, synchronous, local or a scheduler address (tcp://...)")
+    parser.add_argument('--TIER_DASK_NUM_WORKERS', default=None, required=False, help="Number of dask workers (default: all cores)")
+    parser.add_argument('--ATLITE_PREFETCH_DEPTH', default=None, required=False, help="Number of Atlite csv files read ahead by background threads, e.g. 16 on a network drive (leave empty or 0 to read one file after the other)")
+    parser.add_argument('--ATLITE_FOLDER_MANIFESTS', default=None, required=False, help="True/False: keep a manifest of the csv files (order, sizes, header hashes) in every Atlite folder, unchanged folders are then not listed again. Default False")
+    parser.add_argument('--CHECKPOINT_FOLDER', default=None, required=False, help="Folder for the checkpoints of the finished pipeline stages (ingest, average, reduce), empty for no checkpoints.")
+    parser.add_argument('--RESUME', default=None, required=False, help="True to start a failed run again from its last finished stage in CHECKPOINT_FOLDER (same settings), False to start from the beginning.")
+    parser.add_argument('--ATLITE_LAND_CELLS', default=None, required=False, help="True/False: keep only the Atlite cells with a valid average (land cells) as a (time, cell) matrix, so the memory and the tier reductions scale with the land area. Default False")
+    parser.add_argument('--TIER_MASKS_FOLDER', default=None, required=False, help="Folder of single band .tif masks (value above 0 = usable land) applied to the tier selection, e.g. assets/masks. Leave empty for no masks")
+    parser.add_argument('--TIER_MASK_MODE', default=None, required=False, help="exclude (default): leave out the cells below TIER_MASK_MIN_FRACTION usable, weight: also weight the cells by their usable fraction in the tier means")
+    parser.add_argument('--TIER_MASK_MIN_FRACTION', default=None, required=False, help="Smallest usable fraction (0 to 1) of a cell to keep it in the tiers. Default 0.5 with exclude, any usable part with weight")
+    parser.add_argument('--TIER_MASK_CACHE_FOLDER', default=None, required=False, help="Folder for the masks reprojected onto the grids, keyed by a hash of the .tif files. Default TIER_MASKS_FOLDER/grid_cache")
+    parser.add_argument('--WIND_ATLAS_REDUCTION_METHOD', default=None, required=False, help="How a block of WIND ATLAS cells is reduced to one cell: mean, max, quantile or stride.")
+    parser.add_argument('--WIND_ATLAS_REDUCTION_QUANTILE', default=None, required=False, help="Quantile (0 to 1) of the block for WIND_ATLAS_REDUCTION_METHOD quantile.")
+    parser.add_argument('--WIND_ATLAS_PYRAMID_FOLDER', default=None, required=False, help="Folder of the reduced WIND ATLAS files.")
 
     # parse args
     args = parser.parse_args()
 
-    # Check if all arguments are provided
-    if all(arg is None for arg in vars(args).values()):
-        raise ValueError("ERROR: All arguments are None!")
-
-    # Check if any of the arguments are provided
-    if any(arg is None for arg in vars(args).values()):
-        print("Warning only some arguments provided! Code may fail.")
+    # Check if only some of the arguments are provided (none at all: the .env file is used)
+    if any(arg is None for arg in vars(args).values()) and not all(arg is None for arg in vars(args).values()):
+        print("Warning only some arguments provided! The others are read from the .env file.")
 
     return args
 
@@ -95,7 +114,32 @@ def load_from_env():
         'AVG_ATLITE_DATA_VARIABLE_NAME': os.environ.get('AVG_ATLITE_DATA_VARIABLE_NAME'),
         'OPTION_4_OUTPUT_FOLDER': os.environ.get('OPTION_4_OUTPUT_FOLDER'),
         'SCALE_CAPACITY_FACTORS': os.environ.get('SCALE_CAPACITY_FACTORS'),
-        'BOUND_CAPACITY_FACTORS_TIME_SERIES_FILE_4': os.environ.get('BOUND_CAPACITY_FACTORS_TIME_SERIES_FILE_4')
+        'BOUND_CAPACITY_FACTORS_TIME_SERIES_FILE_4': os.environ.get('BOUND_CAPACITY_FACTORS_TIME_SERIES_FILE_4'),
+        'ATLITE_TIME_FREQUENCY': os.environ.get('ATLITE_TIME_FREQUENCY'),
+        'TIME_WINDOW_START': os.environ.get('TIME_WINDOW_START'),
+        'TIME_WINDOW_END': os.environ.get('TIME_WINDOW_END'),
+        'TIME_WINDOW_MONTHS': os.environ.get('TIME_WINDOW_MONTHS'),
+        'TIER_STATISTICS': os.environ.get('TIER_STATISTICS'),
+        'TIER_SPECIFICATION': os.environ.get('TIER_SPECIFICATION'),
+        'ATLITE_CUBE_FILE': os.environ.get('ATLITE_CUBE_FILE'),
+        'STAGE_TIMING_LOG_FILE': os.environ.get('STAGE_TIMING_LOG_FILE'),
+        'ROI_BBOX': os.environ.get('ROI_BBOX'),
+        'ROI_GEOMETRY_FILE': os.environ.get('ROI_GEOMETRY_FILE'),
+        'ATLITE_CHUNKS': os.environ.get('ATLITE_CHUNKS'),
+        'TIER_DASK_SCHEDULER': os.environ.get('TIER_DASK_SCHEDULER'),
+        'TIER_DASK_NUM_WORKERS': os.environ.get('TIER_DASK_NUM_WORKERS'),
+        'ATLITE_PREFETCH_DEPTH': os.environ.get('ATLITE_PREFETCH_DEPTH'),
+        'ATLITE_FOLDER_MANIFESTS': os.environ.get('ATLITE_FOLDER_MANIFESTS'),
+        'CHECKPOINT_FOLDER': os.environ.get('CHECKPOINT_FOLDER'),
+        'RESUME': os.environ.get('RESUME'),
+        'ATLITE_LAND_CELLS': os.environ.get('ATLITE_LAND_CELLS'),
+        'TIER_MASKS_FOLDER': os.environ.get('TIER_MASKS_FOLDER'),
+        'TIER_MASK_MODE': os.environ.get('TIER_MASK_MODE'),
+        'TIER_MASK_MIN_FRACTION': os.environ.get('TIER_MASK_MIN_FRACTION'),
+        'TIER_MASK_CACHE_FOLDER': os.environ.get('TIER_MASK_CACHE_FOLDER'),
+        'WIND_ATLAS_REDUCTION_METHOD': os.environ.get('WIND_ATLAS_REDUCTION_METHOD'),
+        'WIND_ATLAS_REDUCTION_QUANTILE': os.environ.get('WIND_ATLAS_REDUCTION_QUANTILE'),
+        'WIND_ATLAS_PYRAMID_FOLDER': os.environ.get('WIND_ATLAS_PYRAMID_FOLDER'),
     }
 
 
@@ -116,185 +160,66 @@ def load_from_env():
 ################################################################
 # main codes:
 
-def average_bounded_capacity_factors_WAD(ATLITE_DUMMY_DATA, ATLITE_CAPACITY_FACTORS_FOLDERS, DUMMY_START_DATE, DUMMY_END_DATE, DUMMY_LATITUDE_BOTTOM, DUMMY_LATITUDE_TOP, DUMMY_LONGITUDE_LEFT, DUMMY_LONGITUDE_RIGHT, MAXIMUM_CAPACITY, DATA_VARIABLE_NAME, TIME_VARIABLE_NAME, AVG_ATLITE_CAPACITY_FACTORS_FILE_LOCATION, AVG_ATLITE_LATITUDE_VARIABLE_NAME, AVG_ATLITE_LONGITUDE_VARIABLE_NAME, REDUCED_WAD, WIND_ATLAS_RESOLUTION_REDUCTION, WIND_ATLAS_CAPACITY_FACTORS_HEATMAP_FILE_LOCATION, WIND_ATLAS_HEATMAP_LATITUDE_VARIABLE_NAME, WIND_ATLAS_HEATMAP_LONGITUDE_VARIABLE_NAME, WIND_ATLAS_HEATMAP_DATA_VARIABLE_NAME, PERCENT_UPPER_TIER1_CAPACITY_FACTORS, PERCENT_UPPER_TIER2_CAPACITY_FACTORS, PERCENT_UPPER_TIER3_CAPACITY_FACTORS, PERCENT_UPPER_TIER4_CAPACITY_FACTORS, PERCENT_UPPER_TIER5_CAPACITY_FACTORS, AVG_ATLITE_DATA_VARIABLE_NAME, OPTION_4_OUTPUT_FOLDER, SCALE_CAPACITY_FACTORS, BOUND_CAPACITY_FACTORS_TIME_SERIES_FILE_4):
+def average_bounded_capacity_factors_WAD(ATLITE_DUMMY_DATA, ATLITE_CAPACITY_FACTORS_FOLDERS, DUMMY_START_DATE, DUMMY_END_DATE, DUMMY_LATITUDE_BOTTOM, DUMMY_LATITUDE_TOP, DUMMY_LONGITUDE_LEFT, DUMMY_LONGITUDE_RIGHT, MAXIMUM_CAPACITY, DATA_VARIABLE_NAME, TIME_VARIABLE_NAME, AVG_ATLITE_CAPACITY_FACTORS_FILE_LOCATION, AVG_ATLITE_LATITUDE_VARIABLE_NAME, AVG_ATLITE_LONGITUDE_VARIABLE_NAME, REDUCED_WAD, WIND_ATLAS_RESOLUTION_REDUCTION, WIND_ATLAS_CAPACITY_FACTORS_HEATMAP_FILE_LOCATION, WIND_ATLAS_HEATMAP_LATITUDE_VARIABLE_NAME, WIND_ATLAS_HEATMAP_LONGITUDE_VARIABLE_NAME, WIND_ATLAS_HEATMAP_DATA_VARIABLE_NAME, PERCENT_UPPER_TIER1_CAPACITY_FACTORS, PERCENT_UPPER_TIER2_CAPACITY_FACTORS, PERCENT_UPPER_TIER3_CAPACITY_FACTORS, PERCENT_UPPER_TIER4_CAPACITY_FACTORS, PERCENT_UPPER_TIER5_CAPACITY_FACTORS, AVG_ATLITE_DATA_VARIABLE_NAME, OPTION_4_OUTPUT_FOLDER, SCALE_CAPACITY_FACTORS, BOUND_CAPACITY_FACTORS_TIME_SERIES_FILE_4, ATLITE_TIME_FREQUENCY=None, TIME_WINDOW_START=None, TIME_WINDOW_END=None, TIME_WINDOW_MONTHS=None, TIER_STATISTICS=None, TIER_SPECIFICATION=None, ATLITE_CUBE_FILE=None, STAGE_TIMING_LOG_FILE=None, ROI_BBOX=None, ROI_GEOMETRY_FILE=None, ATLITE_CHUNKS=None, TIER_DASK_SCHEDULER=None, TIER_DASK_NUM_WORKERS=None, ATLITE_PREFETCH_DEPTH=None, ATLITE_FOLDER_MANIFESTS=None, CHECKPOINT_FOLDER=None, RESUME=None, ATLITE_LAND_CELLS=None, TIER_MASKS_FOLDER=None, TIER_MASK_MODE=None, TIER_MASK_MIN_FRACTION=None, TIER_MASK_CACHE_FOLDER=None, WIND_ATLAS_REDUCTION_METHOD=None, WIND_ATLAS_REDUCTION_QUANTILE=None, WIND_ATLAS_PYRAMID_FOLDER=None):
+    support_functions.check_configuration(locals())
     # # Code block where you want to suppress warnings
     # with warnings.catch_warnings():
     #     warnings.simplefilter("ignore")
+    support_functions.start_stage_log("option_4",STAGE_TIMING_LOG_FILE)
+    support_functions.start_pipeline("option_4",locals(),CHECKPOINT_FOLDER,RESUME)
+    support_functions.set_dask_scheduler(TIER_DASK_SCHEDULER,TIER_DASK_NUM_WORKERS)
+
+    # Tier bounds from TIER_SPECIFICATION or the 5 tier variables, read before the data
+    tier_bands = support_functions.parse_tier_specification(TIER_SPECIFICATION,[PERCENT_UPPER_TIER1_CAPACITY_FACTORS, PERCENT_UPPER_TIER2_CAPACITY_FACTORS, PERCENT_UPPER_TIER3_CAPACITY_FACTORS, PERCENT_UPPER_TIER4_CAPACITY_FACTORS, PERCENT_UPPER_TIER5_CAPACITY_FACTORS])
 
     # average the capacity factors according to time:
-    atlite_capacity_factors, atlite_capacity_factors_avg = support_functions.create_average_capacity_factor_file_atlite(ATLITE_DUMMY_DATA, ATLITE_CAPACITY_FACTORS_FOLDERS,DUMMY_START_DATE,DUMMY_END_DATE,DUMMY_LATITUDE_BOTTOM,DUMMY_LATITUDE_TOP,DUMMY_LONGITUDE_LEFT,DUMMY_LONGITUDE_RIGHT,MAXIMUM_CAPACITY,DATA_VARIABLE_NAME,TIME_VARIABLE_NAME,AVG_ATLITE_CAPACITY_FACTORS_FILE_LOCATION)
+    atlite_capacity_factors, atlite_capacity_factors_avg = support_functions.create_average_capacity_factor_file_atlite(ATLITE_DUMMY_DATA, ATLITE_CAPACITY_FACTORS_FOLDERS,DUMMY_START_DATE,DUMMY_END_DATE,DUMMY_LATITUDE_BOTTOM,DUMMY_LATITUDE_TOP,DUMMY_LONGITUDE_LEFT,DUMMY_LONGITUDE_RIGHT,MAXIMUM_CAPACITY,DATA_VARIABLE_NAME,TIME_VARIABLE_NAME,AVG_ATLITE_CAPACITY_FACTORS_FILE_LOCATION,ATLITE_TIME_FREQUENCY=ATLITE_TIME_FREQUENCY,TIME_WINDOW_START=TIME_WINDOW_START,TIME_WINDOW_END=TIME_WINDOW_END,TIME_WINDOW_MONTHS=TIME_WINDOW_MONTHS,ATLITE_CUBE_FILE=ATLITE_CUBE_FILE,ROI_BBOX=ROI_BBOX,ROI_GEOMETRY_FILE=ROI_GEOMETRY_FILE,ATLITE_CHUNKS=ATLITE_CHUNKS,ATLITE_PREFETCH_DEPTH=ATLITE_PREFETCH_DEPTH,ATLITE_FOLDER_MANIFESTS=ATLITE_FOLDER_MANIFESTS,ATLITE_LAND_CELLS=ATLITE_LAND_CELLS)
     atlite_lats = atlite_capacity_factors[AVG_ATLITE_LATITUDE_VARIABLE_NAME]
     atlite_lons = atlite_capacity_factors[AVG_ATLITE_LONGITUDE_VARIABLE_NAME]
 
 
     print("... Read averaged atlite capacity factor data.")
 
-    if REDUCED_WAD.lower() == "true":
-        # open the WAD data
-        latitude_wad,longitude_wad,all_data_wad = support_functions.read_wind_atlas_data_reduced(WIND_ATLAS_RESOLUTION_REDUCTION,WIND_ATLAS_CAPACITY_FACTORS_HEATMAP_FILE_LOCATION,WIND_ATLAS_HEATMAP_LATITUDE_VARIABLE_NAME,WIND_ATLAS_HEATMAP_LONGITUDE_VARIABLE_NAME,WIND_ATLAS_HEATMAP_DATA_VARIABLE_NAME)
-    else:
-        # open the WAD data
-        latitude_wad, longitude_wad, all_data_wad = support_functions.read_wind_atlas_data_full(WIND_ATLAS_CAPACITY_FACTORS_HEATMAP_FILE_LOCATION,WIND_ATLAS_HEATMAP_LATITUDE_VARIABLE_NAME,WIND_ATLAS_HEATMAP_LONGITUDE_VARIABLE_NAME,WIND_ATLAS_HEATMAP_DATA_VARIABLE_NAME)
-
-
-    # Split tiers according to percentage bounds:
-    def get_tier_percentage_bound(non_nan_indexes,atlite_lats,atlite_lons,full_atlite_data,WAD_lats,WAD_lons):
-        # count as the values get added on to take the average at the end
-        number_columns_in_tier = 0
-        # skeleton to hold the values
-        cumulative_average_values = np.zeros((len(full_atlite_data[:,0,0])))
-
-        # loop through non-nan indexes and find the corresponding location in atlite data then cumulative average
-        for count_index, data_index in enumerate(non_nan_indexes):
-            print("Busy with entry: ",count_index," out of ",len(non_nan_indexes))
-
-            # find the closest index within the atlite data:
-            closest_lat_index = np.argmin(np.abs(latitude_wad[data_index[0]]-atlite_lats.values))
-            closest_lon_index = np.argmin(np.abs(longitude_wad[data_index[1]]-atlite_lons.values))
-            # print(closest_lat_index)
-            # print(closest_lon_index)
-            # print(latitude_wad[data_index[0]])
-
-            # dont need the actual value in this case:
-            # # value = full_atlite_data[data_index[0]][data_index[1]]
-
-            # Add the new column to the skeleton column
-            # print(closest_lat_index,closest_lon_index)
-            # print(full_atlite_data[:, closest_lat_index, closest_lon_index])
-            cumulative_average_values += full_atlite_data[:, closest_lat_index, closest_lon_index]
-            number_columns_in_tier += 1
-            # print(cumulative_average_values)
-        # take the average
-        print("... A tier was created.")
-        return cumulative_average_values/number_columns_in_tier
+    with support_functions.stage_span("read_wad") as span:
+        if REDUCED_WAD.lower() == "true":
+            # open the WAD data
+            latitude_wad,longitude_wad,all_data_wad = support_functions.read_wind_atlas_data_reduced(WIND_ATLAS_RESOLUTION_REDUCTION,WIND_ATLAS_CAPACITY_FACTORS_HEATMAP_FILE_LOCATION,WIND_ATLAS_HEATMAP_LATITUDE_VARIABLE_NAME,WIND_ATLAS_HEATMAP_LONGITUDE_VARIABLE_NAME,WIND_ATLAS_HEATMAP_DATA_VARIABLE_NAME,ROI_BBOX=ROI_BBOX,ROI_GEOMETRY_FILE=ROI_GEOMETRY_FILE,WIND_ATLAS_REDUCTION_METHOD=WIND_ATLAS_REDUCTION_METHOD,WIND_ATLAS_REDUCTION_QUANTILE=WIND_ATLAS_REDUCTION_QUANTILE,WIND_ATLAS_PYRAMID_FOLDER=WIND_ATLAS_PYRAMID_FOLDER)
+        else:
+            # open the WAD data
+            latitude_wad, longitude_wad, all_data_wad = support_functions.read_wind_atlas_data_full(WIND_ATLAS_CAPACITY_FACTORS_HEATMAP_FILE_LOCATION,WIND_ATLAS_HEATMAP_LATITUDE_VARIABLE_NAME,WIND_ATLAS_HEATMAP_LONGITUDE_VARIABLE_NAME,WIND_ATLAS_HEATMAP_DATA_VARIABLE_NAME,ROI_BBOX=ROI_BBOX,ROI_GEOMETRY_FILE=ROI_GEOMETRY_FILE)
+        span['items'] = int(all_data_wad.size)
+
+    # leave out (or weight) the WAD cells that the tier masks mark as not usable
+    all_data_wad, tier_mask_weights = support_functions.apply_tier_masks(all_data_wad,WIND_ATLAS_HEATMAP_LATITUDE_VARIABLE_NAME,WIND_ATLAS_HEATMAP_LONGITUDE_VARIABLE_NAME,TIER_MASKS_FOLDER,TIER_MASK_MODE,TIER_MASK_MIN_FRACTION,TIER_MASK_CACHE_FOLDER)
 
 
     print("... Generating user tier bounds.")
     print("...")
 
-    # Convert the PERCENT_UPPER_TIER1_CAPACITY_FACTORS variable to a list of floats
-    percent_upper_tier1_capacity_factors = list(map(float, PERCENT_UPPER_TIER1_CAPACITY_FACTORS.split(',')))
-    percent_upper_tier2_capacity_factors = list(map(float, PERCENT_UPPER_TIER2_CAPACITY_FACTORS.split(',')))
-    percent_upper_tier3_capacity_factors = list(map(float, PERCENT_UPPER_TIER3_CAPACITY_FACTORS.split(',')))
-    percent_upper_tier4_capacity_factors = list(map(float, PERCENT_UPPER_TIER4_CAPACITY_FACTORS.split(',')))
-    percent_upper_tier5_capacity_factors = list(map(float, PERCENT_UPPER_TIER5_CAPACITY_FACTORS.split(',')))
-
-    # Find the top % values from the temporal average
-    upper_percentile_tier1 = 1.0 - min(percent_upper_tier1_capacity_factors) / 100.0
-    upper_percentile_tier2 = 1.0 - min(percent_upper_tier2_capacity_factors) / 100.0
-    upper_percentile_tier3 = 1.0 - min(percent_upper_tier3_capacity_factors) / 100.0
-    upper_percentile_tier4 = 1.0 - min(percent_upper_tier4_capacity_factors) / 100.0
-    upper_percentile_tier5 = 1.0 - min(percent_upper_tier5_capacity_factors) / 100.0
-
-    lower_percentile_tier1 = 1.0 - max(percent_upper_tier1_capacity_factors) / 100.0
-    lower_percentile_tier2 = 1.0 - max(percent_upper_tier2_capacity_factors) / 100.0
-    lower_percentile_tier3 = 1.0 - max(percent_upper_tier3_capacity_factors) / 100.0
-    lower_percentile_tier4 = 1.0 - max(percent_upper_tier4_capacity_factors) / 100.0
-    lower_percentile_tier5 = 1.0 - max(percent_upper_tier5_capacity_factors) / 100.0
-
     print("... Tier bounds processed:")
-    print("... Tier 1 bounds: ", min(percent_upper_tier1_capacity_factors)," - ", max(percent_upper_tier1_capacity_factors))
-    print("... Tier 2 bounds: ", min(percent_upper_tier2_capacity_factors)," - ", max(percent_upper_tier2_capacity_factors))
-    print("... Tier 3 bounds: ", min(percent_upper_tier3_capacity_factors)," - ", max(percent_upper_tier3_capacity_factors))
-    print("... Tier 4 bounds: ", min(percent_upper_tier4_capacity_factors)," - ", max(percent_upper_tier4_capacity_factors))
-    print("... Tier 5 bounds: ", min(percent_upper_tier5_capacity_factors)," - ", max(percent_upper_tier5_capacity_factors))
+    for tier_number, tier_band in enumerate(tier_bands):
+        print("... Tier ",tier_number+1," bounds: ", tier_band[0]," - ", tier_band[1])
     print("...")
 
-    # Find the values between the specified quantiles
-    bounds_tier1 = copy.deepcopy(all_data_wad).stack(z=(WIND_ATLAS_HEATMAP_LATITUDE_VARIABLE_NAME, WIND_ATLAS_HEATMAP_LONGITUDE_VARIABLE_NAME)).quantile([lower_percentile_tier1, upper_percentile_tier1])#, dim='z')
-    bounds_tier2 = copy.deepcopy(all_data_wad).stack(z=(WIND_ATLAS_HEATMAP_LATITUDE_VARIABLE_NAME, WIND_ATLAS_HEATMAP_LONGITUDE_VARIABLE_NAME)).quantile([lower_percentile_tier2, upper_percentile_tier2])#, dim='z')
-    bounds_tier3 = copy.deepcopy(all_data_wad).stack(z=(WIND_ATLAS_HEATMAP_LATITUDE_VARIABLE_NAME, WIND_ATLAS_HEATMAP_LONGITUDE_VARIABLE_NAME)).quantile([lower_percentile_tier3, upper_percentile_tier3])#, dim='z')
-    bounds_tier4 = copy.deepcopy(all_data_wad).stack(z=(WIND_ATLAS_HEATMAP_LATITUDE_VARIABLE_NAME, WIND_ATLAS_HEATMAP_LONGITUDE_VARIABLE_NAME)).quantile([lower_percentile_tier4, upper_percentile_tier4])#, dim='z')
-    bounds_tier5 = copy.deepcopy(all_data_wad).stack(z=(WIND_ATLAS_HEATMAP_LATITUDE_VARIABLE_NAME, WIND_ATLAS_HEATMAP_LONGITUDE_VARIABLE_NAME)).quantile([lower_percentile_tier5, upper_percentile_tier5])#, dim='z')
-
-    print("... Quantiles generated.")
-    print("... Quantile 1: ",bounds_tier1.data)
-    print("... Quantile 2: ",bounds_tier2.data)
-    print("... Quantile 3: ",bounds_tier3.data)
-    print("... Quantile 4: ",bounds_tier4.data)
-    print("... Quantile 5: ",bounds_tier5.data)
-    print("...")
-
-
-    # extract the bounds:
-    top_bound_tier1 = bounds_tier1.values[1]
-    top_bound_tier2 = bounds_tier2.values[1]
-    top_bound_tier3 = bounds_tier3.values[1]
-    top_bound_tier4 = bounds_tier4.values[1]
-    top_bound_tier5 = bounds_tier5.values[1]
+    def reduce_tiers():
+        # find the closest atlite cell for every WAD cell, the WAD cells in a tier are averaged with the atlite time series of these cells
+        with support_functions.stage_span("selection",len(latitude_wad)*len(longitude_wad)):
+            closest_atlite_cells = support_functions.nearest_cell_index(latitude_wad,longitude_wad,atlite_lats.values,atlite_lons.values)
 
-    bottom_bound_tier1 = bounds_tier1.values[0]
-    bottom_bound_tier2 = bounds_tier2.values[0]
-    bottom_bound_tier3 = bounds_tier3.values[0]
-    bottom_bound_tier4 = bounds_tier4.values[0]
-    bottom_bound_tier5 = bounds_tier5.values[0]
+        # Find the WAD values between the specified quantiles and generate the tiers using Atlite data, all tiers at once
+        with support_functions.stage_span("gather",len(tier_bands)):
+            return support_functions.generate_bounded_tiers(all_data_wad.values,support_functions.tier_values(atlite_capacity_factors,AVG_ATLITE_DATA_VARIABLE_NAME),tier_bands,closest_atlite_cells,cell_weights=tier_mask_weights)
+    tier_means, bottom_bounds, top_bounds, cells_per_tier = support_functions.pipeline_stage("reduce",reduce_tiers)
 
     print("... Values for WAD data bounds generated")
-    print("... Tier 1: ",bottom_bound_tier1," - ",top_bound_tier1)
-    print("... Tier 2: ",bottom_bound_tier2," - ",top_bound_tier2)
-    print("... Tier 3: ",bottom_bound_tier3," - ",top_bound_tier3)
-    print("... Tier 4: ",bottom_bound_tier4," - ",top_bound_tier4)
-    print("... Tier 5: ",bottom_bound_tier5," - ",top_bound_tier5)
-    print("...")
-
-    # Use boolean indexing to select the desired indexes
-    selected_indexes_WAD_tier1 = all_data_wad.where((all_data_wad>bottom_bound_tier1) & (all_data_wad<top_bound_tier1))#, drop=True)
-    selected_indexes_WAD_tier2 = all_data_wad.where((all_data_wad>bottom_bound_tier2) & (all_data_wad<top_bound_tier2))#, drop=True)
-    selected_indexes_WAD_tier3 = all_data_wad.where((all_data_wad>bottom_bound_tier3) & (all_data_wad<top_bound_tier3))#, drop=True)
-    selected_indexes_WAD_tier4 = all_data_wad.where((all_data_wad>bottom_bound_tier4) & (all_data_wad<top_bound_tier4))#, drop=True)
-    selected_indexes_WAD_tier5 = all_data_wad.where((all_data_wad>bottom_bound_tier5) & (all_data_wad<top_bound_tier5))#, drop=True)
-
-    # print("selected_indexes_WAD_tiers")
-    # print(selected_indexes_WAD_tier1)
-    # print(selected_indexes_WAD_tier2)
-    # print(selected_indexes_WAD_tier3)
-    # print(selected_indexes_WAD_tier4)
-    # print(selected_indexes_WAD_tier5)
-
-    # get the indices that are not nan, we average on these indexes
-    non_nan_indices_tier1 = np.argwhere(~np.isnan(selected_indexes_WAD_tier1.data))
-    non_nan_indices_tier2 = np.argwhere(~np.isnan(selected_indexes_WAD_tier2.data))
-    non_nan_indices_tier3 = np.argwhere(~np.isnan(selected_indexes_WAD_tier3.data))
-    non_nan_indices_tier4 = np.argwhere(~np.isnan(selected_indexes_WAD_tier4.data))
-    non_nan_indices_tier5 = np.argwhere(~np.isnan(selected_indexes_WAD_tier5.data))
-
-    print("Non-nan indices")
-    print(non_nan_indices_tier1,len(non_nan_indices_tier1))
-    print(non_nan_indices_tier2,len(non_nan_indices_tier2))
-    print(non_nan_indices_tier3,len(non_nan_indices_tier3))
-    print(non_nan_indices_tier4,len(non_nan_indices_tier4))
-    print(non_nan_indices_tier5,len(non_nan_indices_tier5))
-
-    # # Generate the tiers using Atlite data:
-    print("... Generating tier 1:")
-    bound_tier1 = get_tier_percentage_bound(non_nan_indices_tier1,atlite_lats,atlite_lons,atlite_capacity_factors[AVG_ATLITE_DATA_VARIABLE_NAME].values,latitude_wad,longitude_wad)
-    print("... Generating tier 2:")
-    bound_tier2 = get_tier_percentage_bound(non_nan_indices_tier2,atlite_lats,atlite_lons,atlite_capacity_factors[AVG_ATLITE_DATA_VARIABLE_NAME].values,latitude_wad,longitude_wad)
-    print("... Generating tier 3:")
-    bound_tier3 = get_tier_percentage_bound(non_nan_indices_tier3,atlite_lats,atlite_lons,atlite_capacity_factors[AVG_ATLITE_DATA_VARIABLE_NAME].values,latitude_wad,longitude_wad)
-    print("... Generating tier 4:")
-    bound_tier4 = get_tier_percentage_bound(non_nan_indices_tier4,atlite_lats,atlite_lons,atlite_capacity_factors[AVG_ATLITE_DATA_VARIABLE_NAME].values,latitude_wad,longitude_wad)
-    print("... Generating tier 5:")
-    bound_tier5 = get_tier_percentage_bound(non_nan_indices_tier5,atlite_lats,atlite_lons,atlite_capacity_factors[AVG_ATLITE_DATA_VARIABLE_NAME].values,latitude_wad,longitude_wad)
-
+    for tier_number in range(len(tier_bands)):
+        print("... Tier ",tier_number+1,": ",bottom_bounds[tier_number]," - ",top_bounds[tier_number]," WAD cells: ",cells_per_tier[tier_number])
     print("... All tiers created.")
-
-    print("... Tier 1: ",bound_tier1)
-    print("... Tier 2: ",bound_tier2)
-    print("... Tier 3: ",bound_tier3)
-    print("... Tier 4: ",bound_tier4)
-    print("... Tier 5: ",bound_tier5)
     print("...")
 
 
     # Create a DataFrame
-    tier_dataframe = pd.DataFrame({
-        'tier_1': bound_tier1,
-        'tier_2': bound_tier2,
-        'tier_3': bound_tier3,
-        'tier_4': bound_tier4,
-        'tier_5': bound_tier5
-    })
+    tier_dataframe = pd.DataFrame(tier_means, columns=['tier_'+str(tier_number+1) for tier_number in range(len(tier_bands))], index=support_functions.tier_time_index(atlite_capacity_factors,TIME_VARIABLE_NAME))
 
     print("... Saving tiers to csv file.")
     # check if output directories are created
@@ -306,13 +231,16 @@ def average_bounded_capacity_factors_WAD(ATLITE_DUMMY_DATA, ATLITE_CAPACITY_FACT
         tier_dataframe = tier_dataframe / float(MAXIMUM_CAPACITY)  # divide by the weightings
         print("\n... Capacity factors were scaled by division of maximum capacity:",MAXIMUM_CAPACITY)
 
-    tier_dataframe.to_csv(os.path.join(OPTION_4_OUTPUT_FOLDER,BOUND_CAPACITY_FACTORS_TIME_SERIES_FILE_4),index=False)
+    with support_functions.stage_span("write",1):
+        tier_dataframe.to_csv(os.path.join(OPTION_4_OUTPUT_FOLDER,BOUND_CAPACITY_FACTORS_TIME_SERIES_FILE_4))
+        support_functions.save_tier_statistics(tier_dataframe,OPTION_4_OUTPUT_FOLDER,BOUND_CAPACITY_FACTORS_TIME_SERIES_FILE_4,TIER_STATISTICS)
+    support_functions.finish_pipeline()
 
     print("\n... Tier files for bounds capacity factors created:")
     print("...... Tier file located in: " + os.path.join(OPTION_4_OUTPUT_FOLDER,BOUND_CAPACITY_FACTORS_TIME_SERIES_FILE_4))
-    print("... Note that there are only 5 tiers for this option.")
-
+    print("... Number of tiers for this option: ",len(tier_bands))
 
+    support_functions.print_stage_summary()
     print("\nOption_4 completed successfully!")
 
 if __name__ == '__main__':
@@ -321,28 +249,10 @@ if __name__ == '__main__':
     print("#########")
 
     # check args or load env file and run codes
-    try:
-        print("TRYING TO USE ARGUMENTS")
-        args = parse_arguments()
-        print("ARGUMENTS FOUND. USING ARGUMENTS")
-
-        # RUN CODES
-        average_bounded_capacity_factors_WAD(**vars(args))
-    except Exception as e:
-        print("ARGUMENTS NOT FOUND: ", e)
-        try:
-            print("TRYING TO LOAD ENV FILE VARIABLES")
-            # Load variables from the .env file
-            args = load_from_env()
-            print("ENV FILE FOUND. USING ENV FILE")
-
-            # RUN CODES
-            average_bounded_capacity_factors_WAD(**args)
-
-        except Exception as e:
-            print("ENV FILE NOT FOUND: ", e)
-            print("ERROR ... USER ARGS AND ENV FILE NOT FOUND, ABORTING!")
-            raise ValueError("COULD NOT FIND ARGS OR LOAD ENV FILE. USER ARGS OR ENV FILE MISSING.")
+    args = support_functions.script_arguments(parse_arguments(), load_from_env)
+
+    # RUN CODES
+    average_bounded_capacity_factors_WAD(**args)
 
     # args example use:
     # python Option_4_bound_percentage_WAD.py  --ATLITE_DUMMY_DATA True  --DUMMY_START_DATE '2023-01-01'  --DUMMY_END_DATE '2024-01-01'  --DUMMY_LATITUDE_BOTTOM -32.0  --DUMMY_LATITUDE_TOP -30.0  --DUMMY_LONGITUDE_LEFT 26.0  --DUMMY_LONGITUDE_RIGHT 28.0 --MAXIMUM_CAPACITY 50  --DATA_VARIABLE_NAME capacity_factors  --TIME_VARIABLE_NAME time  --AVG_ATLITE_CAPACITY_FACTORS_FILE_LOCATION "assets/avg_atlite_capacity_factors.nc"  --AVG_ATLITE_LATITUDE_VARIABLE_NAME latitude  --AVG_ATLITE_LONGITUDE_VARIABLE_NAME longitude  --REDUCED_WAD True  --WIND_ATLAS_RESOLUTION_REDUCTION 15  --WIND_ATLAS_CAPACITY_FACTORS_HEATMAP_FILE_LOCATION "assets/wind_atlas_capacity_factors.nc"  --WIND_ATLAS_HEATMAP_LATITUDE_VARIABLE_NAME lat  --WIND_ATLAS_HEATMAP_LONGITUDE_VARIABLE_NAME lon  --WIND_ATLAS_HEATMAP_DATA_VARIABLE_NAME Band1  --PERCENT_UPPER_TIER1_CAPACITY_FACTORS 0,10  --PERCENT_UPPER_TIER2_CAPACITY_FACTORS 10,20  --PERCENT_UPPER_TIER3_CAPACITY_FACTORS 0,40  --PERCENT_UPPER_TIER4_CAPACITY_FACTORS 60,100  --PERCENT_UPPER_TIER5_CAPACITY_FACTORS 40,60 --AVG_ATLITE_DATA_VARIABLE_NAME capacity_factors  --OPTION_4_OUTPUT_FOLDER "assets/option_4_output"  --SCALE_CAPACITY_FACTORS True  --MAXIMUM_CAPACITY 50  --BOUND_CAPACITY_FACTORS_TIME_SERIES_FILE_4 "option_4_bounded_percentage_capacity_factor_time_series.csv"
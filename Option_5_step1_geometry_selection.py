@@ -1,11 +1,15 @@
 import os
 
+import time
 import dash
-from dash import html
+from dash import html, dcc, Input, Output
+import dash_leaflet as dl
+import plotly.graph_objects as go
 import folium
 from folium import plugins
 import numpy as np
-import xarray as xr
+import pandas as pd
+from shapely.geometry import shape
 from dotenv import load_dotenv
 import argparse
 
@@ -43,17 +47,27 @@ def parse_arguments():
     parser.add_argument('--WIND_ATLAS_HEATMAP_LONGITUDE_VARIABLE_NAME', default=None, required=False,help="WIND ATLAS heatmap longitude variable name.")
     parser.add_argument('--WIND_ATLAS_HEATMAP_DATA_VARIABLE_NAME', default=None, required=False,help="WIND ATLAS heatmap data variable name.")
     parser.add_argument('--MASKS_FOLDER', default=None, required=False, help="Masks folder.")
+    parser.add_argument('--ATLITE_TIME_FREQUENCY', default=None, required=False, help="Time step frequency of the Atlite files e.g. h for hourly.")
+    parser.add_argument('--TIME_WINDOW_START', default=None, required=False, help="Start date of the time window to process (inclusive).")
+    parser.add_argument('--TIME_WINDOW_END', default=None, required=False, help="End date of the time window to process (exclusive).")
+    parser.add_argument('--TIME_WINDOW_MONTHS', default=None, required=False, help="Months or seasons to process e.g. 6,7,8 or JJA.")
+    parser.add_argument('--ATLITE_CUBE_FILE', default=None, required=False, help="Stitched netcdf cube of capacity factors (e.g. the Option 7 corrected cube) used instead of the Atlite folders.")
+    parser.add_argument('--SCALE_CAPACITY_FACTORS', default=None, required=False, help="Scale the previewed tiers by the maximum capacity (True/False).")
+    parser.add_argument('--STAGE_TIMING_LOG_FILE', default=None, required=False, help="Optional JSON lines file the stage timings (seconds, peak memory, items) are appended to.")
+    parser.add_argument('--ROI_BBOX', default=None, required=False, help="Region of interest to read, latitude bottom, latitude top, longitude left, longitude right, e.g. --ROI_BBOX=-35,-22,16,33 (with = because of the minus signs, leave empty for the whole domain)")
+    parser.add_argument('--ROI_GEOMETRY_FILE', default=None, required=False, help="GeoJSON file whose geometries bound the region of interest to read (leave empty for the whole domain)")
+    parser.add_argument('--ATLITE_PREFETCH_DEPTH', default=None, required=False, help="Number of Atlite csv files read ahead by background threads, e.g. 16 on a network drive (leave empty or 0 to read one file after the other)")
+    parser.add_argument('--ATLITE_FOLDER_MANIFESTS', default=None, required=False, help="True/False: keep a manifest of the csv files (order, sizes, header hashes) in every Atlite folder, unchanged folders are then not listed again. Default False")
+    parser.add_argument('--WIND_ATLAS_REDUCTION_METHOD', default=None, required=False, help="How a block of WIND ATLAS cells is reduced to one cell: mean, max, quantile or stride.")
+    parser.add_argument('--WIND_ATLAS_REDUCTION_QUANTILE', default=None, required=False, help="Quantile (0 to 1) of the block for WIND_ATLAS_REDUCTION_METHOD quantile.")
+    parser.add_argument('--WIND_ATLAS_PYRAMID_FOLDER', default=None, required=False, help="Folder of the reduced WIND ATLAS files.")
 
     # parse args
     args = parser.parse_args()
 
-    # Check if all arguments are provided
-    if all(arg is None for arg in vars(args).values()):
-        raise ValueError("ERROR: All arguments are None!")
-
-    # Check if any of the arguments are provided
-    if any(arg is None for arg in vars(args).values()):
-        print("Warning only some arguments provided! Code may fail.")
+    # Check if only some of the arguments are provided (none at all: the .env file is used)
+    if any(arg is None for arg in vars(args).values()) and not all(arg is None for arg in vars(args).values()):
+        print("Warning only some arguments provided! The others are read from the .env file.")
 
     return args
 
@@ -86,6 +100,20 @@ def load_from_env():
         "WIND_ATLAS_HEATMAP_LONGITUDE_VARIABLE_NAME" : os.environ.get("WIND_ATLAS_HEATMAP_LONGITUDE_VARIABLE_NAME"),
         "WIND_ATLAS_HEATMAP_DATA_VARIABLE_NAME" : os.environ.get("WIND_ATLAS_HEATMAP_DATA_VARIABLE_NAME"),
         "MASKS_FOLDER" : os.environ.get("MASKS_FOLDER"),
+        "ATLITE_TIME_FREQUENCY" : os.environ.get("ATLITE_TIME_FREQUENCY"),
+        "TIME_WINDOW_START" : os.environ.get("TIME_WINDOW_START"),
+        "TIME_WINDOW_END" : os.environ.get("TIME_WINDOW_END"),
+        "TIME_WINDOW_MONTHS" : os.environ.get("TIME_WINDOW_MONTHS"),
+        "ATLITE_CUBE_FILE" : os.environ.get("ATLITE_CUBE_FILE"),
+        "SCALE_CAPACITY_FACTORS" : os.environ.get("SCALE_CAPACITY_FACTORS"),
+        "STAGE_TIMING_LOG_FILE" : os.environ.get("STAGE_TIMING_LOG_FILE"),
+        "ROI_BBOX" : os.environ.get("ROI_BBOX"),
+        "ROI_GEOMETRY_FILE" : os.environ.get("ROI_GEOMETRY_FILE"),
+        "ATLITE_PREFETCH_DEPTH" : os.environ.get("ATLITE_PREFETCH_DEPTH"),
+        "ATLITE_FOLDER_MANIFESTS" : os.environ.get("ATLITE_FOLDER_MANIFESTS"),
+        "WIND_ATLAS_REDUCTION_METHOD" : os.environ.get("WIND_ATLAS_REDUCTION_METHOD"),
+        "WIND_ATLAS_REDUCTION_QUANTILE" : os.environ.get("WIND_ATLAS_REDUCTION_QUANTILE"),
+        "WIND_ATLAS_PYRAMID_FOLDER" : os.environ.get("WIND_ATLAS_PYRAMID_FOLDER"),
     }
 
     # Store the names of variables that are None
@@ -107,11 +135,13 @@ def load_from_env():
 # main codes:
 
 
-def geometry_selection(ATLITE_DUMMY_DATA, ATLITE_CAPACITY_FACTORS_FOLDERS, DUMMY_START_DATE, DUMMY_END_DATE, DUMMY_LATITUDE_BOTTOM, DUMMY_LATITUDE_TOP, DUMMY_LONGITUDE_LEFT, DUMMY_LONGITUDE_RIGHT, MAXIMUM_CAPACITY, DATA_VARIABLE_NAME, TIME_VARIABLE_NAME, AVG_ATLITE_CAPACITY_FACTORS_FILE_LOCATION, AVG_ATLITE_LATITUDE_VARIABLE_NAME, AVG_ATLITE_LONGITUDE_VARIABLE_NAME, WIND_ATLAS_CAPACITY_FACTORS_PNG_FILE_LOCATION, WIND_ATLAS_PNG_LONGITUDE_LEFT, WIND_ATLAS_PNG_LATITUDE_BOTTOM, WIND_ATLAS_PNG_LONGITUDE_RIGHT, WIND_ATLAS_PNG_LATITUDE_TOP, WIND_ATLAS_RESOLUTION_REDUCTION, WIND_ATLAS_CAPACITY_FACTORS_HEATMAP_FILE_LOCATION, WIND_ATLAS_HEATMAP_LATITUDE_VARIABLE_NAME, WIND_ATLAS_HEATMAP_LONGITUDE_VARIABLE_NAME, WIND_ATLAS_HEATMAP_DATA_VARIABLE_NAME, MASKS_FOLDER):
+def geometry_selection(ATLITE_DUMMY_DATA, ATLITE_CAPACITY_FACTORS_FOLDERS, DUMMY_START_DATE, DUMMY_END_DATE, DUMMY_LATITUDE_BOTTOM, DUMMY_LATITUDE_TOP, DUMMY_LONGITUDE_LEFT, DUMMY_LONGITUDE_RIGHT, MAXIMUM_CAPACITY, DATA_VARIABLE_NAME, TIME_VARIABLE_NAME, AVG_ATLITE_CAPACITY_FACTORS_FILE_LOCATION, AVG_ATLITE_LATITUDE_VARIABLE_NAME, AVG_ATLITE_LONGITUDE_VARIABLE_NAME, WIND_ATLAS_CAPACITY_FACTORS_PNG_FILE_LOCATION, WIND_ATLAS_PNG_LONGITUDE_LEFT, WIND_ATLAS_PNG_LATITUDE_BOTTOM, WIND_ATLAS_PNG_LONGITUDE_RIGHT, WIND_ATLAS_PNG_LATITUDE_TOP, WIND_ATLAS_RESOLUTION_REDUCTION, WIND_ATLAS_CAPACITY_FACTORS_HEATMAP_FILE_LOCATION, WIND_ATLAS_HEATMAP_LATITUDE_VARIABLE_NAME, WIND_ATLAS_HEATMAP_LONGITUDE_VARIABLE_NAME, WIND_ATLAS_HEATMAP_DATA_VARIABLE_NAME, MASKS_FOLDER, ATLITE_TIME_FREQUENCY=None, TIME_WINDOW_START=None, TIME_WINDOW_END=None, TIME_WINDOW_MONTHS=None, ATLITE_CUBE_FILE=None, SCALE_CAPACITY_FACTORS=None, STAGE_TIMING_LOG_FILE=None, ROI_BBOX=None, ROI_GEOMETRY_FILE=None, ATLITE_PREFETCH_DEPTH=None, ATLITE_FOLDER_MANIFESTS=None, WIND_ATLAS_REDUCTION_METHOD=None, WIND_ATLAS_REDUCTION_QUANTILE=None, WIND_ATLAS_PYRAMID_FOLDER=None):
     ################################################################
     ## Dash App
     ################################################################
 
+    support_functions.start_stage_log("option_5_step1",STAGE_TIMING_LOG_FILE)
+
     # create dash app
     app = dash.Dash(__name__,prevent_initial_callbacks=True)
 
@@ -121,7 +151,7 @@ def geometry_selection(ATLITE_DUMMY_DATA, ATLITE_CAPACITY_FACTORS_FOLDERS, DUMMY
     ## open atlite capacity factor data
     ########################################################################
     # open the averaged atlite capacity factor data
-    atlite_capacity_factors, atlite_capacity_factors_avg = support_functions.create_average_capacity_factor_file_atlite(ATLITE_DUMMY_DATA, ATLITE_CAPACITY_FACTORS_FOLDERS, DUMMY_START_DATE,DUMMY_END_DATE,DUMMY_LATITUDE_BOTTOM,DUMMY_LATITUDE_TOP,DUMMY_LONGITUDE_LEFT,DUMMY_LONGITUDE_RIGHT,MAXIMUM_CAPACITY,DATA_VARIABLE_NAME,TIME_VARIABLE_NAME,AVG_ATLITE_CAPACITY_FACTORS_FILE_LOCATION)
+    atlite_capacity_factors, atlite_capacity_factors_avg = support_functions.create_average_capacity_factor_file_atlite(ATLITE_DUMMY_DATA, ATLITE_CAPACITY_FACTORS_FOLDERS, DUMMY_START_DATE,DUMMY_END_DATE,DUMMY_LATITUDE_BOTTOM,DUMMY_LATITUDE_TOP,DUMMY_LONGITUDE_LEFT,DUMMY_LONGITUDE_RIGHT,MAXIMUM_CAPACITY,DATA_VARIABLE_NAME,TIME_VARIABLE_NAME,AVG_ATLITE_CAPACITY_FACTORS_FILE_LOCATION,ATLITE_TIME_FREQUENCY=ATLITE_TIME_FREQUENCY,TIME_WINDOW_START=TIME_WINDOW_START,TIME_WINDOW_END=TIME_WINDOW_END,TIME_WINDOW_MONTHS=TIME_WINDOW_MONTHS,ATLITE_CUBE_FILE=ATLITE_CUBE_FILE,ROI_BBOX=ROI_BBOX,ROI_GEOMETRY_FILE=ROI_GEOMETRY_FILE,ATLITE_PREFETCH_DEPTH=ATLITE_PREFETCH_DEPTH,ATLITE_FOLDER_MANIFESTS=ATLITE_FOLDER_MANIFESTS)
     print("... Read averaged atlite capacity factor data.")
 
 
@@ -214,18 +244,9 @@ def geometry_selection(ATLITE_DUMMY_DATA, ATLITE_CAPACITY_FACTORS_FOLDERS, DUMMY
     ########################################################################
     ## Wind Atlas heatmap layer
     ########################################################################
-    # get down scaling resolution of wind atlas netcdf i.e. number of points to skip for lat lon values in array, to make things render faster
-    wind_atlas_resolution_reduction = int(WIND_ATLAS_RESOLUTION_REDUCTION)
-    # open wind atlas netcdf
-    wind_atlas_netcdf = xr.open_dataset(WIND_ATLAS_CAPACITY_FACTORS_HEATMAP_FILE_LOCATION)
-
-    # Select every wind_atlas_resolution_reduction latitude and longitude along with capacity_factor
-    capacity_factor_subset = wind_atlas_netcdf.sel(lat=wind_atlas_netcdf.lat.values[::wind_atlas_resolution_reduction], lon=wind_atlas_netcdf.lon.values[::wind_atlas_resolution_reduction])
-
-    # Access the capacity_factor variable from the subset
-    latitude_wa = capacity_factor_subset[WIND_ATLAS_HEATMAP_LATITUDE_VARIABLE_NAME].values.astype(float)
-    longitude_wa = capacity_factor_subset[WIND_ATLAS_HEATMAP_LONGITUDE_VARIABLE_NAME].values.astype(float)
-    values_wa = capacity_factor_subset[WIND_ATLAS_HEATMAP_DATA_VARIABLE_NAME].values.astype(float)
+    # reduced wind atlas (blocks of WIND_ATLAS_RESOLUTION_REDUCTION x WIND_ATLAS_RESOLUTION_REDUCTION cells), to make things render faster
+    latitude_wa, longitude_wa, values_wa = support_functions.read_wind_atlas_data_reduced(WIND_ATLAS_RESOLUTION_REDUCTION,WIND_ATLAS_CAPACITY_FACTORS_HEATMAP_FILE_LOCATION,WIND_ATLAS_HEATMAP_LATITUDE_VARIABLE_NAME,WIND_ATLAS_HEATMAP_LONGITUDE_VARIABLE_NAME,WIND_ATLAS_HEATMAP_DATA_VARIABLE_NAME,WIND_ATLAS_REDUCTION_METHOD=WIND_ATLAS_REDUCTION_METHOD,WIND_ATLAS_REDUCTION_QUANTILE=WIND_ATLAS_REDUCTION_QUANTILE,WIND_ATLAS_PYRAMID_FOLDER=WIND_ATLAS_PYRAMID_FOLDER)
+    values_wa = values_wa.values.astype(float)
     values_wa[np.isnan(values_wa)] = 0.0  # Replace NaN with 0.0, you can choose a different value if needed
     lon_wa, lat_wa = np.meshgrid(longitude_wa, latitude_wa)
     # serialize data for folium
@@ -238,7 +259,9 @@ def geometry_selection(ATLITE_DUMMY_DATA, ATLITE_CAPACITY_FACTORS_FOLDERS, DUMMY
     ## Mask layers
     ########################################################################
     # add the mask layers to the map
-    mask_layers = support_functions.read_masks_as_folium_layers(MASKS_FOLDER)
+    with support_functions.stage_span("render_masks") as span:
+        mask_layers = support_functions.read_masks_as_folium_layers(MASKS_FOLDER)
+        span['items'] = len(mask_layers)
 
 
 
@@ -273,6 +296,10 @@ def geometry_selection(ATLITE_DUMMY_DATA, ATLITE_CAPACITY_FACTORS_FOLDERS, DUMMY
     """
     m.get_root().html.add_child(folium.Element(legend_html))
 
+    # the map is rendered to html once, for the iframe
+    with support_functions.stage_span("render",1):
+        map_html = m._repr_html_()
+
 
     # Add FeatureGroups to the map, order matters!
     wind_atlas_layer_png.add_to(m)
@@ -286,6 +313,60 @@ def geometry_selection(ATLITE_DUMMY_DATA, ATLITE_CAPACITY_FACTORS_FOLDERS, DUMMY
     folium.LayerControl().add_to(m)
 
 
+    ########################################################################
+    ## Tier preview: drawn geometries straight to tiers
+    ########################################################################
+    # the capacity factors are already in memory, so geometries drawn on the preview map are turned into tiers in the
+    # callback below, without exporting the geojson and running step 2
+    preview_latitudes = atlite_capacity_factors[AVG_ATLITE_LATITUDE_VARIABLE_NAME].values
+    preview_longitudes = atlite_capacity_factors[AVG_ATLITE_LONGITUDE_VARIABLE_NAME].values
+    preview_full_values = np.asarray(atlite_capacity_factors[DATA_VARIABLE_NAME].values, dtype=float)
+    preview_average_values = np.asarray(atlite_capacity_factors_avg.values, dtype=float)
+    preview_time_index = support_functions.tier_time_index(atlite_capacity_factors,TIME_VARIABLE_NAME)
+
+    # drawing map with the same bounding box, circles are considered points
+    preview_map = dl.Map(
+        center=[float(min_latitude + max_latitude) / 2, float(min_longitude + max_longitude) / 2],
+        zoom=7,
+        children=[
+            dl.TileLayer(),
+            dl.Rectangle(bounds=[[float(min_latitude), float(min_longitude)], [float(max_latitude), float(max_longitude)]], color='blue', fill=False, weight=5),
+            dl.FeatureGroup([dl.EditControl(id='preview_draw_control', draw=dict(polyline=False, circlemarker=False))]),
+        ],
+        style={'width': '70%', 'height': '500px', 'margin': '0 auto'},
+    )
+
+    @app.callback(
+        Output('tier_preview_graph', 'figure'),
+        Output('tier_preview_info', 'children'),
+        Input('preview_draw_control', 'geojson'),
+    )
+    def preview_tiers(drawn_geometries):
+        start_time = time.perf_counter()
+        preview_tiers_df = pd.DataFrame(index=preview_time_index)
+        features = [] if drawn_geometries is None else drawn_geometries.get('features', [])
+        skipped = 0
+        for index, feature in enumerate(features):
+            tier_label = f'tier_{index + 1}'
+            geometry = shape(feature['geometry'])
+            if geometry.geom_type not in ('Point', 'Polygon', 'MultiPolygon'):
+                skipped += 1
+                continue
+            series, number_of_cells = support_functions.geometry_tier_series(geometry,preview_latitudes,preview_longitudes,preview_average_values,preview_full_values)
+            preview_tiers_df[tier_label] = series['tier_1']
+
+        # scale capacity factors if required:
+        if SCALE_CAPACITY_FACTORS is not None and SCALE_CAPACITY_FACTORS.lower() == "true":
+            preview_tiers_df = preview_tiers_df / float(MAXIMUM_CAPACITY)
+
+        figure = go.Figure([go.Scatter(x=preview_tiers_df.index, y=preview_tiers_df[column], name=column, mode='lines') for column in preview_tiers_df.columns])
+        figure.update_layout(title='Tier preview', xaxis_title='Time', yaxis_title='Capacity Factor')
+        info = str(len(features) - skipped) + " geometries, tiers computed in " + str(round(time.perf_counter() - start_time, 3)) + " s."
+        if skipped > 0:
+            info += " " + str(skipped) + " line geometries skipped."
+        return figure, info
+
+
     ################################################################
     ## Dash App Layout
     ################################################################
@@ -302,13 +383,26 @@ def geometry_selection(ATLITE_DUMMY_DATA, ATLITE_CAPACITY_FACTORS_FOLDERS, DUMMY
                     html.Li("3. Click the export on the map to save a geojson file of the geometry."),
                     html.Li("4. Copy the geojson file into the current working directory assets/user_geometry and set the environment varibale to the name of the geometry file. run the tier_generation script"),
                     html.Li("5. Run the second step tier generation script."),
+                    html.Li("6. Or draw your geometries on the tier preview map below, their tiers are shown straight away in the graph under it."),
                 ], style={'list-style-type': 'none', 'margin': '30px','background-color': 'lightblue', 'padding': '30px'}),
             ],
             style={'margin-top': '20px', 'margin-bottom': '20px'}
         ),
         # MAP
         html.Div(
-            html.Iframe(id='map', srcDoc=m._repr_html_(), width='70%', height='650', style={'margin': '0 auto'}),
+            html.Iframe(id='map', srcDoc=map_html, width='70%', height='650', style={'margin': '0 auto'}),
+            style={'textAlign': 'center'},
+        ),
+        # SPACING
+        html.Div(style={'bottom': 0, 'width': '90%', 'padding': '20px', 'background-color': 'white', 'text-align': 'center'}),
+        # TIER PREVIEW
+        html.Div(
+            [
+                html.H1("Tier preview", style={'textAlign': 'center'}),
+                preview_map,
+                html.Div(id='tier_preview_info', style={'textAlign': 'center', 'padding': '10px'}),
+                dcc.Graph(id='tier_preview_graph'),
+            ],
             style={'textAlign': 'center'},
         ),
         # SPACING
@@ -323,6 +417,8 @@ def geometry_selection(ATLITE_DUMMY_DATA, ATLITE_CAPACITY_FACTORS_FOLDERS, DUMMY
         )
     ])
 
+    support_functions.print_stage_summary()
+
     # start server
     app.run_server(debug=True)
 
@@ -332,29 +428,10 @@ if __name__ == '__main__':
     print("#########")
 
     # check args or load env file and run codes
-    try:
-        print("TRYING TO USE ARGUMENTS")
-        args = parse_arguments()
-        print("ARGUMENTS FOUND. USING ARGUMENTS")
-
-        # RUN CODES
-        geometry_selection(**vars(args))
-
-    except Exception as e:
-        print("ARGUMENTS NOT FOUND: ", e)
-        try:
-            print("TRYING TO LOAD ENV FILE VARIABLES")
-            # Load variables from the .env file
-            args = load_from_env()
-            print("ENV FILE FOUND. USING ENV FILE")
-
-            # RUN CODES
-            geometry_selection(**args)
-
-        except Exception as e:
-            print("ENV FILE NOT FOUND: ", e)
-            print("ERROR ... USER ARGS AND ENV FILE NOT FOUND, ABORTING!")
-            raise ValueError("COULD NOT FIND ARGS OR LOAD ENV FILE. USER ARGS OR ENV FILE MISSING.")
+    args = support_functions.script_arguments(parse_arguments(), load_from_env)
+
+    # RUN CODES
+    geometry_selection(**args)
 
 
     # args example use:
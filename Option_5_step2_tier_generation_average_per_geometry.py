@@ -3,16 +3,12 @@ Purpose: User can select the pieces of tiers they wish for the final selection o
 
 author: kirodh boodhraj
 """
-import dash
-from dash import html
 import folium
 import numpy as np
 import pandas as pd
 import geopandas as gpd
-from shapely.geometry import box, Point
+from shapely.geometry import box
 import os
-from dash import dash_table
-import plotly.express as px
 from dotenv import load_dotenv
 import argparse
 
@@ -45,17 +41,33 @@ def parse_arguments():
     parser.add_argument('--OPTION_5_OUTPUT_TIERS_FILE', default=None, required=False,help="Output tiers file.")
     parser.add_argument('--OPTION_5_GEOMETRY_REFERENCE_FILE', default=None, required=False,help="Output geometry reference file.")
     parser.add_argument('--OPTION_5_VIEW_VALID_GEOMETRIES', default=None, required=False,help="View geometryTrue or not False.")
+    parser.add_argument('--ATLITE_TIME_FREQUENCY', default=None, required=False, help="Time step frequency of the Atlite files e.g. h for hourly.")
+    parser.add_argument('--TIME_WINDOW_START', default=None, required=False, help="Start date of the time window to process (inclusive).")
+    parser.add_argument('--TIME_WINDOW_END', default=None, required=False, help="End date of the time window to process (exclusive).")
+    parser.add_argument('--TIME_WINDOW_MONTHS', default=None, required=False, help="Months or seasons to process e.g. 6,7,8 or JJA.")
+    parser.add_argument('--TIER_STATISTICS', default=None, required=False, help="Save monthly means, hour of day profiles, P50/P90 and ramp statistics beside the tier files (True/False).")
+    parser.add_argument('--ATLITE_CUBE_FILE', default=None, required=False, help="Stitched netcdf cube of capacity factors (e.g. the Option 7 corrected cube) used instead of the Atlite folders.")
+    parser.add_argument('--STAGE_TIMING_LOG_FILE', default=None, required=False, help="Optional JSON lines file the stage timings (seconds, peak memory, items) are appended to.")
+    parser.add_argument('--ROI_BBOX', default=None, required=False, help="Region of interest to read, latitude bottom, latitude top, longitude left, longitude right, e.g. --ROI_BBOX=-35,-22,16,33 (with = because of the minus signs, leave empty for the whole domain)")
+    parser.add_argument('--ROI_GEOMETRY_FILE', default=None, required=False, help="GeoJSON file whose geometries bound the region of interest to read (leave empty for the whole domain)")
+    parser.add_argument('--ATLITE_CHUNKS', default=None, required=False, help="Time steps per chunk to process the Atlite data out-of-core with dask, e.g. 744 or auto (leave empty to load it into memory)")
+    parser.add_argument('--TIER_DASK_SCHEDULER', default=None, required=False, help="Dask scheduler for the chunked computations: threads (default), processes, synchronous, local or a scheduler address (tcp://...)")
+    parser.add_argument('--TIER_DASK_NUM_WORKERS', default=None, required=False, help="Number of dask workers (default: all cores)")
+    parser.add_argument('--ATLITE_PREFETCH_DEPTH', default=None, required=False, help="Number of Atlite csv files read ahead by background threads, e.g. 16 on a network drive (leave empty or 0 to read one file after the other)")
+    parser.add_argument('--ATLITE_FOLDER_MANIFESTS', default=None, required=False, help="True/False: keep a manifest of the csv files (order, sizes, header hashes) in every Atlite folder, unchanged folders are then not listed again. Default False")
+    parser.add_argument('--CHECKPOINT_FOLDER', default=None, required=False, help="Folder for the checkpoints of the finished pipeline stages (ingest, average, reduce), empty for no checkpoints.")
+    parser.add_argument('--RESUME', default=None, required=False, help="True to start a failed run again from its last finished stage in CHECKPOINT_FOLDER (same settings), False to start from the beginning.")
+    parser.add_argument('--TIER_MASKS_FOLDER', default=None, required=False, help="Folder of single band .tif masks (value above 0 = usable land) applied to the tier selection, e.g. assets/masks. Leave empty for no masks")
+    parser.add_argument('--TIER_MASK_MODE', default=None, required=False, help="exclude (default): leave out the cells below TIER_MASK_MIN_FRACTION usable, weight: also weight the cells by their usable fraction in the tier means")
+    parser.add_argument('--TIER_MASK_MIN_FRACTION', default=None, required=False, help="Smallest usable fraction (0 to 1) of a cell to keep it in the tiers. Default 0.5 with exclude, any usable part with weight")
+    parser.add_argument('--TIER_MASK_CACHE_FOLDER', default=None, required=False, help="Folder for the masks reprojected onto the grids, keyed by a hash of the .tif files. Default TIER_MASKS_FOLDER/grid_cache")
 
     # parse args
     args = parser.parse_args()
 
-    # Check if all arguments are provided
-    if all(arg is None for arg in vars(args).values()):
-        raise ValueError("ERROR: All arguments are None!")
-
-    # Check if any of the arguments are provided
-    if any(arg is None for arg in vars(args).values()):
-        print("Warning only some arguments provided! Code may fail.")
+    # Check if only some of the arguments are provided (none at all: the .env file is used)
+    if any(arg is None for arg in vars(args).values()) and not all(arg is None for arg in vars(args).values()):
+        print("Warning only some arguments provided! The others are read from the .env file.")
 
     return args
 
@@ -85,6 +97,26 @@ def load_from_env():
         "OPTION_5_OUTPUT_TIERS_FILE" : os.environ.get("OPTION_5_OUTPUT_TIERS_FILE"),
         "OPTION_5_GEOMETRY_REFERENCE_FILE" : os.environ.get("OPTION_5_GEOMETRY_REFERENCE_FILE"),
         "OPTION_5_VIEW_VALID_GEOMETRIES" : os.environ.get("OPTION_5_VIEW_VALID_GEOMETRIES"),
+        "ATLITE_TIME_FREQUENCY" : os.environ.get("ATLITE_TIME_FREQUENCY"),
+        "TIME_WINDOW_START" : os.environ.get("TIME_WINDOW_START"),
+        "TIME_WINDOW_END" : os.environ.get("TIME_WINDOW_END"),
+        "TIME_WINDOW_MONTHS" : os.environ.get("TIME_WINDOW_MONTHS"),
+        "TIER_STATISTICS" : os.environ.get("TIER_STATISTICS"),
+        "ATLITE_CUBE_FILE" : os.environ.get("ATLITE_CUBE_FILE"),
+        "STAGE_TIMING_LOG_FILE" : os.environ.get("STAGE_TIMING_LOG_FILE"),
+        "ROI_BBOX" : os.environ.get("ROI_BBOX"),
+        "ROI_GEOMETRY_FILE" : os.environ.get("ROI_GEOMETRY_FILE"),
+        "ATLITE_CHUNKS" : os.environ.get("ATLITE_CHUNKS"),
+        "TIER_DASK_SCHEDULER" : os.environ.get("TIER_DASK_SCHEDULER"),
+        "TIER_DASK_NUM_WORKERS" : os.environ.get("TIER_DASK_NUM_WORKERS"),
+        "ATLITE_PREFETCH_DEPTH" : os.environ.get("ATLITE_PREFETCH_DEPTH"),
+        "ATLITE_FOLDER_MANIFESTS" : os.environ.get("ATLITE_FOLDER_MANIFESTS"),
+        "CHECKPOINT_FOLDER" : os.environ.get("CHECKPOINT_FOLDER"),
+        "RESUME" : os.environ.get("RESUME"),
+        "TIER_MASKS_FOLDER" : os.environ.get("TIER_MASKS_FOLDER"),
+        "TIER_MASK_MODE" : os.environ.get("TIER_MASK_MODE"),
+        "TIER_MASK_MIN_FRACTION" : os.environ.get("TIER_MASK_MIN_FRACTION"),
+        "TIER_MASK_CACHE_FOLDER" : os.environ.get("TIER_MASK_CACHE_FOLDER"),
     }
 
     # Store the names of variables that are None
@@ -151,8 +183,9 @@ def check_geojson_within_bounds(geojson_data, xarray_dataset,AVG_ATLITE_LONGITUD
 #################################################
 ## Helper function: obtain the tiers per valid geometry
 #################################################
-def calculate_valid_tiers(atlite_data,points_geometry,geometry, AVG_ATLITE_LATITUDE_VARIABLE_NAME, AVG_ATLITE_LONGITUDE_VARIABLE_NAME, AVG_ATLITE_DATA_VARIABLE_NAME):
+def calculate_valid_tiers(atlite_data,points_geometry,geometry, AVG_ATLITE_LATITUDE_VARIABLE_NAME, AVG_ATLITE_LONGITUDE_VARIABLE_NAME, AVG_ATLITE_DATA_VARIABLE_NAME, tier_mask_weights=None):
     # returns a list of numbers for the tier
+    # tier_mask_weights: optional (lat, lon) weight of every cell in the polygon average (apply_tier_masks)
     # if point, then find the closest point on the grid and use this as the tier
     if geometry == "Point":
         print("... Dealing with POINT geometry")
@@ -182,20 +215,14 @@ def calculate_valid_tiers(atlite_data,points_geometry,geometry, AVG_ATLITE_LATIT
         lats = atlite_data[AVG_ATLITE_LATITUDE_VARIABLE_NAME].values
         lons = atlite_data[AVG_ATLITE_LONGITUDE_VARIABLE_NAME].values
 
-        # Create a list of Point objects for each (lat, lon) pair in the dataset
-        points = [Point(lon, lat) for lat, lon in zip(lats, lons)]
-
-        # Now you can use the indices of the points within the polygon to select data from the xarray dataset
-        selected_data = atlite_data.sel(latitude=[point.y for point in points],longitude=[point.x for point in points])
-
-        # Spatially average the selected data over lat and lon dimensions
-        spatially_averaged_data = selected_data.mean(dim=[AVG_ATLITE_LATITUDE_VARIABLE_NAME, AVG_ATLITE_LONGITUDE_VARIABLE_NAME], skipna=True)
+        # Spatially average the cells inside the polygon (chunk by chunk for chunked data)
+        spatially_averaged_data, number_of_cells = support_functions.geometry_tier_series(points_geometry,lats,lons,None,atlite_data[AVG_ATLITE_DATA_VARIABLE_NAME].data,cell_weights=tier_mask_weights)
 
-        print("... Generated tiers successfully: ")
-        print(spatially_averaged_data)
+        print("... Generated tiers successfully from ",number_of_cells," cells: ")
+        print(spatially_averaged_data['tier_1'])
         print("#########################################\n")
 
-        return spatially_averaged_data[AVG_ATLITE_DATA_VARIABLE_NAME].values
+        return spatially_averaged_data['tier_1']
 
     # else return nothing
     else:
@@ -209,6 +236,11 @@ def calculate_valid_tiers(atlite_data,points_geometry,geometry, AVG_ATLITE_LATIT
 #################################################
 # dash app
 def visualize_geometries(geographical_bounds_atlite_data,geometry_table_list,valid_output_tiers,geometry_layer_list):
+    # dash and plotly are only needed when the geometries are viewed
+    import dash
+    from dash import html, dash_table
+    import plotly.express as px
+
     # create app
     app = dash.Dash(__name__)
 
@@ -362,13 +394,20 @@ def visualize_geometries(geographical_bounds_atlite_data,geometry_table_list,val
 ## Option 5: main function to process geometries
 #################################################
 
-def option_5_process_geometries_into_tiers(ATLITE_CAPACITY_FACTORS_FOLDERS, AVG_ATLITE_LONGITUDE_VARIABLE_NAME, AVG_ATLITE_LATITUDE_VARIABLE_NAME, AVG_ATLITE_DATA_VARIABLE_NAME, OPTION_5_USER_GEOMETRIES_GEOJSON_FILE, ATLITE_DUMMY_DATA, DUMMY_START_DATE, DUMMY_END_DATE, DUMMY_LATITUDE_BOTTOM, DUMMY_LATITUDE_TOP, DUMMY_LONGITUDE_LEFT, DUMMY_LONGITUDE_RIGHT, MAXIMUM_CAPACITY, DATA_VARIABLE_NAME, TIME_VARIABLE_NAME, AVG_ATLITE_CAPACITY_FACTORS_FILE_LOCATION, OPTION_5_OUTPUT_FOLDER, SCALE_CAPACITY_FACTORS, OPTION_5_OUTPUT_TIERS_FILE, OPTION_5_GEOMETRY_REFERENCE_FILE, OPTION_5_VIEW_VALID_GEOMETRIES):
+def option_5_process_geometries_into_tiers(ATLITE_CAPACITY_FACTORS_FOLDERS, AVG_ATLITE_LONGITUDE_VARIABLE_NAME, AVG_ATLITE_LATITUDE_VARIABLE_NAME, AVG_ATLITE_DATA_VARIABLE_NAME, OPTION_5_USER_GEOMETRIES_GEOJSON_FILE, ATLITE_DUMMY_DATA, DUMMY_START_DATE, DUMMY_END_DATE, DUMMY_LATITUDE_BOTTOM, DUMMY_LATITUDE_TOP, DUMMY_LONGITUDE_LEFT, DUMMY_LONGITUDE_RIGHT, MAXIMUM_CAPACITY, DATA_VARIABLE_NAME, TIME_VARIABLE_NAME, AVG_ATLITE_CAPACITY_FACTORS_FILE_LOCATION, OPTION_5_OUTPUT_FOLDER, SCALE_CAPACITY_FACTORS, OPTION_5_OUTPUT_TIERS_FILE, OPTION_5_GEOMETRY_REFERENCE_FILE, OPTION_5_VIEW_VALID_GEOMETRIES, ATLITE_TIME_FREQUENCY=None, TIME_WINDOW_START=None, TIME_WINDOW_END=None, TIME_WINDOW_MONTHS=None, TIER_STATISTICS=None, ATLITE_CUBE_FILE=None, STAGE_TIMING_LOG_FILE=None, ROI_BBOX=None, ROI_GEOMETRY_FILE=None, ATLITE_CHUNKS=None, TIER_DASK_SCHEDULER=None, TIER_DASK_NUM_WORKERS=None, ATLITE_PREFETCH_DEPTH=None, ATLITE_FOLDER_MANIFESTS=None, CHECKPOINT_FOLDER=None, RESUME=None, TIER_MASKS_FOLDER=None, TIER_MASK_MODE=None, TIER_MASK_MIN_FRACTION=None, TIER_MASK_CACHE_FOLDER=None):
+    support_functions.check_configuration(locals())
+    support_functions.start_stage_log("option_5",STAGE_TIMING_LOG_FILE)
+    support_functions.start_pipeline("option_5",locals(),CHECKPOINT_FOLDER,RESUME)
+    support_functions.set_dask_scheduler(TIER_DASK_SCHEDULER,TIER_DASK_NUM_WORKERS)
+
     # Define the path to the GeoJSON file
     geojson_path = OPTION_5_USER_GEOMETRIES_GEOJSON_FILE
 
     # open the file
     try:
-        geojson_data = gpd.read_file(geojson_path)
+        with support_functions.stage_span("read_geometries") as span:
+            geojson_data = gpd.read_file(geojson_path)
+            span['items'] = len(geojson_data)
         print("... Read in geometry file successfully.\n")
     except Exception as e:
         raise ValueError("Could not read the geometry geojson file. Please check the file name and geometry content. Full error: " + str(e))
@@ -377,11 +416,15 @@ def option_5_process_geometries_into_tiers(ATLITE_CAPACITY_FACTORS_FOLDERS, AVG_
     ## open atlite capacity factor data
     ########################################################################
     # open the averaged atlite capacity factor data
-    atlite_capacity_factors, atlite_capacity_factors_avg = support_functions.create_average_capacity_factor_file_atlite(ATLITE_DUMMY_DATA, ATLITE_CAPACITY_FACTORS_FOLDERS,DUMMY_START_DATE,DUMMY_END_DATE,DUMMY_LATITUDE_BOTTOM,DUMMY_LATITUDE_TOP,DUMMY_LONGITUDE_LEFT,DUMMY_LONGITUDE_RIGHT,MAXIMUM_CAPACITY,DATA_VARIABLE_NAME,TIME_VARIABLE_NAME,AVG_ATLITE_CAPACITY_FACTORS_FILE_LOCATION)
+    atlite_capacity_factors, atlite_capacity_factors_avg = support_functions.create_average_capacity_factor_file_atlite(ATLITE_DUMMY_DATA, ATLITE_CAPACITY_FACTORS_FOLDERS,DUMMY_START_DATE,DUMMY_END_DATE,DUMMY_LATITUDE_BOTTOM,DUMMY_LATITUDE_TOP,DUMMY_LONGITUDE_LEFT,DUMMY_LONGITUDE_RIGHT,MAXIMUM_CAPACITY,DATA_VARIABLE_NAME,TIME_VARIABLE_NAME,AVG_ATLITE_CAPACITY_FACTORS_FILE_LOCATION,ATLITE_TIME_FREQUENCY=ATLITE_TIME_FREQUENCY,TIME_WINDOW_START=TIME_WINDOW_START,TIME_WINDOW_END=TIME_WINDOW_END,TIME_WINDOW_MONTHS=TIME_WINDOW_MONTHS,ATLITE_CUBE_FILE=ATLITE_CUBE_FILE,ROI_BBOX=ROI_BBOX,ROI_GEOMETRY_FILE=ROI_GEOMETRY_FILE,ATLITE_CHUNKS=ATLITE_CHUNKS,ATLITE_PREFETCH_DEPTH=ATLITE_PREFETCH_DEPTH,ATLITE_FOLDER_MANIFESTS=ATLITE_FOLDER_MANIFESTS)
     print("... Read averaged atlite capacity factor data.\n")
 
+    # leave out (or weight) the cells that the tier masks mark as not usable, in the polygon tiers
+    atlite_capacity_factors_avg, tier_mask_weights = support_functions.apply_tier_masks(atlite_capacity_factors_avg,AVG_ATLITE_LATITUDE_VARIABLE_NAME,AVG_ATLITE_LONGITUDE_VARIABLE_NAME,TIER_MASKS_FOLDER,TIER_MASK_MODE,TIER_MASK_MIN_FRACTION,TIER_MASK_CACHE_FOLDER)
+
     # Call the function to check if each geometry is within the bounds
-    inside_or_outside = check_geojson_within_bounds(geojson_data, atlite_capacity_factors, AVG_ATLITE_LONGITUDE_VARIABLE_NAME, AVG_ATLITE_LATITUDE_VARIABLE_NAME)
+    with support_functions.stage_span("selection",len(geojson_data)):
+        inside_or_outside = check_geojson_within_bounds(geojson_data, atlite_capacity_factors, AVG_ATLITE_LONGITUDE_VARIABLE_NAME, AVG_ATLITE_LATITUDE_VARIABLE_NAME)
 
     # Initialize a list to store visualization table data
     geometry_table_list = []
@@ -438,7 +481,8 @@ def option_5_process_geometries_into_tiers(ATLITE_CAPACITY_FACTORS_FOLDERS, AVG_
             if is_within_bounds:
                 print("------------------------------------------------")
                 print(tier_label," is a POLYGON")
-                potential_tier = calculate_valid_tiers(atlite_capacity_factors,row['geometry'],geometry_type, AVG_ATLITE_LATITUDE_VARIABLE_NAME, AVG_ATLITE_LONGITUDE_VARIABLE_NAME, AVG_ATLITE_DATA_VARIABLE_NAME)
+                with support_functions.stage_span("gather",1):
+                    potential_tier = support_functions.pipeline_stage("reduce_"+tier_label,lambda: calculate_valid_tiers(atlite_capacity_factors,row['geometry'],geometry_type, AVG_ATLITE_LATITUDE_VARIABLE_NAME, AVG_ATLITE_LONGITUDE_VARIABLE_NAME, AVG_ATLITE_DATA_VARIABLE_NAME, tier_mask_weights))
                 if potential_tier is not None:
                     tier_data[tier_label] = potential_tier
                     print("... Tier generated successfully for ",tier_label)
@@ -488,7 +532,8 @@ def option_5_process_geometries_into_tiers(ATLITE_CAPACITY_FACTORS_FOLDERS, AVG_
             if is_within_bounds:
                 print("------------------------------------------------")
                 print(tier_label," is a POINT")
-                potential_tier = calculate_valid_tiers(atlite_capacity_factors, row['geometry'], geometry_type, AVG_ATLITE_LATITUDE_VARIABLE_NAME, AVG_ATLITE_LONGITUDE_VARIABLE_NAME, AVG_ATLITE_DATA_VARIABLE_NAME)
+                with support_functions.stage_span("gather",1):
+                    potential_tier = support_functions.pipeline_stage("reduce_"+tier_label,lambda: calculate_valid_tiers(atlite_capacity_factors, row['geometry'], geometry_type, AVG_ATLITE_LATITUDE_VARIABLE_NAME, AVG_ATLITE_LONGITUDE_VARIABLE_NAME, AVG_ATLITE_DATA_VARIABLE_NAME, tier_mask_weights))
                 if potential_tier is not None:
                     tier_data[tier_label] = potential_tier
                     print("... Tier generated successfully for ",tier_label)
@@ -504,7 +549,7 @@ def option_5_process_geometries_into_tiers(ATLITE_CAPACITY_FACTORS_FOLDERS, AVG_
     # format the tier data for the tier piece selection
     print("\n... Finished compiling tier data successfully:")
     print(tier_data)
-    valid_output_tiers = pd.DataFrame(tier_data)
+    valid_output_tiers = pd.DataFrame(tier_data, index=support_functions.tier_time_index(atlite_capacity_factors,TIME_VARIABLE_NAME))
 
     # check if output directories are created
     if not os.path.exists(OPTION_5_OUTPUT_FOLDER):
@@ -515,20 +560,25 @@ def option_5_process_geometries_into_tiers(ATLITE_CAPACITY_FACTORS_FOLDERS, AVG_
         valid_output_tiers = valid_output_tiers / float(MAXIMUM_CAPACITY)  # divide by the weightings
         print("\n... Capacity factors were scaled by division of maximum capacity:", MAXIMUM_CAPACITY)
 
-    # for reference, save tiers to csv file
-    valid_output_tiers.to_csv(os.path.join(OPTION_5_OUTPUT_FOLDER,OPTION_5_OUTPUT_TIERS_FILE))
+    with support_functions.stage_span("write",2):
+        # for reference, save tiers to csv file
+        valid_output_tiers.to_csv(os.path.join(OPTION_5_OUTPUT_FOLDER,OPTION_5_OUTPUT_TIERS_FILE))
+        if not valid_output_tiers.empty:
+            support_functions.save_tier_statistics(valid_output_tiers,OPTION_5_OUTPUT_FOLDER,OPTION_5_OUTPUT_TIERS_FILE,TIER_STATISTICS)
 
-    # Save valid geometries to file:
-    # Convert the list of dictionaries to a pandas DataFrame
-    geometry_table_df = pd.DataFrame(geometry_table_list)
+        # Save valid geometries to file:
+        # Convert the list of dictionaries to a pandas DataFrame
+        geometry_table_df = pd.DataFrame(geometry_table_list)
 
-    # Save the DataFrame to a CSV file
-    geometry_table_df.to_csv(os.path.join(OPTION_5_OUTPUT_FOLDER,OPTION_5_GEOMETRY_REFERENCE_FILE))
+        # Save the DataFrame to a CSV file
+        geometry_table_df.to_csv(os.path.join(OPTION_5_OUTPUT_FOLDER,OPTION_5_GEOMETRY_REFERENCE_FILE))
 
 
 
     print("\n... Saved output tiers file to:",os.path.join(OPTION_5_OUTPUT_FOLDER,OPTION_5_OUTPUT_TIERS_FILE))
     print("... Tier generation completed successfully!")
+    support_functions.finish_pipeline()
+    support_functions.print_stage_summary()
     print("\nOption_5 completed successfully!")
     print("----------------------------------------------------------------\n")
 
@@ -546,28 +596,10 @@ def option_5_process_geometries_into_tiers(ATLITE_CAPACITY_FACTORS_FOLDERS, AVG_
 if __name__ == '__main__':
     print("Starting tier processing for Option 5: single tier per user defined geometry ...")
     # check args or load env file and run codes
-    try:
-        print("TRYING TO USE ARGUMENTS")
-        args = parse_arguments()
-        print("ARGUMENTS FOUND. USING ARGUMENTS")
+    args = support_functions.script_arguments(parse_arguments(), load_from_env)
 
-        # RUN CODES
-        option_5_process_geometries_into_tiers(**vars(args))
-    except Exception as e:
-        print("ARGUMENTS NOT FOUND: ",e)
-        try:
-            print("TRYING TO LOAD ENV FILE VARIABLES")
-            # Load variables from the .env file
-            args = load_from_env()
-            print("ENV FILE FOUND. USING ENV FILE")
-
-            # RUN CODES
-            option_5_process_geometries_into_tiers(**args)
-
-        except Exception as e:
-            print("ENV FILE NOT FOUND: ",e)
-            print("ERROR ... USER ARGS AND ENV FILE NOT FOUND, ABORTING!")
-            raise ValueError("COULD NOT FIND ARGS OR LOAD ENV FILE. USER ARGS OR ENV FILE MISSING.")
+    # RUN CODES
+    option_5_process_geometries_into_tiers(**args)
 
 
     # args example use:
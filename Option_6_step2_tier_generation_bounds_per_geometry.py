@@ -3,17 +3,13 @@ Purpose: User can select the pieces of tiers they wish for the final selection o
 
 author: kirodh boodhraj
 """
-import dash
-from dash import html
 import folium
 import numpy as np
+import xarray as xr
 import pandas as pd
 import geopandas as gpd
-from shapely.geometry import box, Point
+from shapely.geometry import box
 import os
-from dash import dash_table
-import copy
-import plotly.express as px
 from dotenv import load_dotenv
 import argparse
 
@@ -51,17 +47,34 @@ def parse_arguments():
     parser.add_argument('--OPTION_6_OUTPUT_TIERS_FILE', default=None, required=False,help="Output tiers file.")
     parser.add_argument('--OPTION_6_GEOMETRY_REFERENCE_FILE', default=None, required=False,help="Output geometry reference file.")
     parser.add_argument('--OPTION_6_VIEW_VALID_GEOMETRIES', default=None, required=False,help="View geometryTrue or not False.")
+    parser.add_argument('--ATLITE_TIME_FREQUENCY', default=None, required=False, help="Time step frequency of the Atlite files e.g. h for hourly.")
+    parser.add_argument('--TIME_WINDOW_START', default=None, required=False, help="Start date of the time window to process (inclusive).")
+    parser.add_argument('--TIME_WINDOW_END', default=None, required=False, help="End date of the time window to process (exclusive).")
+    parser.add_argument('--TIME_WINDOW_MONTHS', default=None, required=False, help="Months or seasons to process e.g. 6,7,8 or JJA.")
+    parser.add_argument('--TIER_STATISTICS', default=None, required=False, help="Save monthly means, hour of day profiles, P50/P90 and ramp statistics beside the tier files (True/False).")
+    parser.add_argument('--TIER_SPECIFICATION', default=None, required=False, help="Tier bounds as lower,upper percentages separated by ; (e.g. 0,10;10,20) or a .json/.yaml file. Overrides the 5 tier variables.")
+    parser.add_argument('--ATLITE_CUBE_FILE', default=None, required=False, help="Stitched netcdf cube of capacity factors (e.g. the Option 7 corrected cube) used instead of the Atlite folders.")
+    parser.add_argument('--STAGE_TIMING_LOG_FILE', default=None, required=False, help="Optional JSON lines file the stage timings (seconds, peak memory, items) are appended to.")
+    parser.add_argument('--ROI_BBOX', default=None, required=False, help="Region of interest to read, latitude bottom, latitude top, longitude left, longitude right, e.g. --ROI_BBOX=-35,-22,16,33 (with = because of the minus signs, leave empty for the whole domain)")
+    parser.add_argument('--ROI_GEOMETRY_FILE', default=None, required=False, help="GeoJSON file whose geometries bound the region of interest to read (leave empty for the whole domain)")
+    parser.add_argument('--ATLITE_CHUNKS', default=None, required=False, help="Time steps per chunk to process the Atlite data out-of-core with dask, e.g. 744 or auto (leave empty to load it into memory)")
+    parser.add_argument('--TIER_DASK_SCHEDULER', default=None, required=False, help="Dask scheduler for the chunked computations: threads (default), processes, synchronous, local or a scheduler address (tcp://...)")
+    parser.add_argument('--TIER_DASK_NUM_WORKERS', default=None, required=False, help="Number of dask workers (default: all cores)")
+    parser.add_argument('--ATLITE_PREFETCH_DEPTH', default=None, required=False, help="Number of Atlite csv files read ahead by background threads, e.g. 16 on a network drive (leave empty or 0 to read one file after the other)")
+    parser.add_argument('--ATLITE_FOLDER_MANIFESTS', default=None, required=False, help="True/False: keep a manifest of the csv files (order, sizes, header hashes) in every Atlite folder, unchanged folders are then not listed again. Default False")
+    parser.add_argument('--CHECKPOINT_FOLDER', default=None, required=False, help="Folder for the checkpoints of the finished pipeline stages (ingest, average, reduce), empty for no checkpoints.")
+    parser.add_argument('--RESUME', default=None, required=False, help="True to start a failed run again from its last finished stage in CHECKPOINT_FOLDER (same settings), False to start from the beginning.")
+    parser.add_argument('--TIER_MASKS_FOLDER', default=None, required=False, help="Folder of single band .tif masks (value above 0 = usable land) applied to the tier selection, e.g. assets/masks. Leave empty for no masks")
+    parser.add_argument('--TIER_MASK_MODE', default=None, required=False, help="exclude (default): leave out the cells below TIER_MASK_MIN_FRACTION usable, weight: also weight the cells by their usable fraction in the tier means")
+    parser.add_argument('--TIER_MASK_MIN_FRACTION', default=None, required=False, help="Smallest usable fraction (0 to 1) of a cell to keep it in the tiers. Default 0.5 with exclude, any usable part with weight")
+    parser.add_argument('--TIER_MASK_CACHE_FOLDER', default=None, required=False, help="Folder for the masks reprojected onto the grids, keyed by a hash of the .tif files. Default TIER_MASKS_FOLDER/grid_cache")
 
     # parse args
     args = parser.parse_args()
 
-    # Check if all arguments are provided
-    if all(arg is None for arg in vars(args).values()):
-        raise ValueError("ERROR: All arguments are None!")
-
-    # Check if any of the arguments are provided
-    if any(arg is None for arg in vars(args).values()):
-        print("Warning only some arguments provided! Code may fail.")
+    # Check if only some of the arguments are provided (none at all: the .env file is used)
+    if any(arg is None for arg in vars(args).values()) and not all(arg is None for arg in vars(args).values()):
+        print("Warning only some arguments provided! The others are read from the .env file.")
 
     return args
 
@@ -96,6 +109,27 @@ def load_from_env():
         "OPTION_6_OUTPUT_TIERS_FILE" : os.environ.get("OPTION_6_OUTPUT_TIERS_FILE"),
         "OPTION_6_GEOMETRY_REFERENCE_FILE" : os.environ.get("OPTION_6_GEOMETRY_REFERENCE_FILE"),
         "OPTION_6_VIEW_VALID_GEOMETRIES" : os.environ.get("OPTION_6_VIEW_VALID_GEOMETRIES"),
+        "ATLITE_TIME_FREQUENCY" : os.environ.get("ATLITE_TIME_FREQUENCY"),
+        "TIME_WINDOW_START" : os.environ.get("TIME_WINDOW_START"),
+        "TIME_WINDOW_END" : os.environ.get("TIME_WINDOW_END"),
+        "TIME_WINDOW_MONTHS" : os.environ.get("TIME_WINDOW_MONTHS"),
+        "TIER_STATISTICS" : os.environ.get("TIER_STATISTICS"),
+        "TIER_SPECIFICATION" : os.environ.get("TIER_SPECIFICATION"),
+        "ATLITE_CUBE_FILE" : os.environ.get("ATLITE_CUBE_FILE"),
+        "STAGE_TIMING_LOG_FILE" : os.environ.get("STAGE_TIMING_LOG_FILE"),
+        "ROI_BBOX" : os.environ.get("ROI_BBOX"),
+        "ROI_GEOMETRY_FILE" : os.environ.get("ROI_GEOMETRY_FILE"),
+        "ATLITE_CHUNKS" : os.environ.get("ATLITE_CHUNKS"),
+        "TIER_DASK_SCHEDULER" : os.environ.get("TIER_DASK_SCHEDULER"),
+        "TIER_DASK_NUM_WORKERS" : os.environ.get("TIER_DASK_NUM_WORKERS"),
+        "ATLITE_PREFETCH_DEPTH" : os.environ.get("ATLITE_PREFETCH_DEPTH"),
+        "ATLITE_FOLDER_MANIFESTS" : os.environ.get("ATLITE_FOLDER_MANIFESTS"),
+        "CHECKPOINT_FOLDER" : os.environ.get("CHECKPOINT_FOLDER"),
+        "RESUME" : os.environ.get("RESUME"),
+        "TIER_MASKS_FOLDER" : os.environ.get("TIER_MASKS_FOLDER"),
+        "TIER_MASK_MODE" : os.environ.get("TIER_MASK_MODE"),
+        "TIER_MASK_MIN_FRACTION" : os.environ.get("TIER_MASK_MIN_FRACTION"),
+        "TIER_MASK_CACHE_FOLDER" : os.environ.get("TIER_MASK_CACHE_FOLDER"),
     }
 
     # Store the names of variables that are None
@@ -168,13 +202,15 @@ def check_geojson_within_bounds(geojson_data, xarray_dataset, AVG_ATLITE_LONGITU
 #################################################
 ## Helper function: obtain the tiers per valid geometry
 #################################################
-def calculate_valid_tiers(atlite_data,atlite_data_avg,points_geometry,geometry,AVG_ATLITE_LATITUDE_VARIABLE_NAME, AVG_ATLITE_LONGITUDE_VARIABLE_NAME, AVG_ATLITE_DATA_VARIABLE_NAME, PERCENT_UPPER_TIER1_CAPACITY_FACTORS, PERCENT_UPPER_TIER2_CAPACITY_FACTORS, PERCENT_UPPER_TIER3_CAPACITY_FACTORS, PERCENT_UPPER_TIER4_CAPACITY_FACTORS, PERCENT_UPPER_TIER5_CAPACITY_FACTORS, DATA_VARIABLE_NAME):
+def calculate_valid_tiers(atlite_data,atlite_data_avg,points_geometry,geometry,AVG_ATLITE_LATITUDE_VARIABLE_NAME, AVG_ATLITE_LONGITUDE_VARIABLE_NAME, AVG_ATLITE_DATA_VARIABLE_NAME, tier_bands, DATA_VARIABLE_NAME, tier_mask_weights=None):
     """
 
     :param atlite_data: Full Atlite data
     :param atlite_data_avg: Averaged Atlite data
     :param points_geometry: The geometry's points
     :param geometry: Type of geometry i.e. Point, LineString, Polygon etc.
+    :param tier_bands: (N, 2) array of the lower and upper percentages of each tier
+    :param tier_mask_weights: Optional (lat, lon) weight of every cell in the tier means (apply_tier_masks)
     :return: Dataframe of valid tiers (Polygon) or tier (Point)
     """
 
@@ -206,26 +242,6 @@ def calculate_valid_tiers(atlite_data,atlite_data_avg,points_geometry,geometry,A
     elif geometry == "Polygon":
         print("... Dealing with POLYGON geometry")
 
-        # Convert the PERCENT_UPPER_TIER1_CAPACITY_FACTORS variable to a list of floats
-        percent_upper_tier1_capacity_factors = list(map(float, PERCENT_UPPER_TIER1_CAPACITY_FACTORS.split(',')))
-        percent_upper_tier2_capacity_factors = list(map(float, PERCENT_UPPER_TIER2_CAPACITY_FACTORS.split(',')))
-        percent_upper_tier3_capacity_factors = list(map(float, PERCENT_UPPER_TIER3_CAPACITY_FACTORS.split(',')))
-        percent_upper_tier4_capacity_factors = list(map(float, PERCENT_UPPER_TIER4_CAPACITY_FACTORS.split(',')))
-        percent_upper_tier5_capacity_factors = list(map(float, PERCENT_UPPER_TIER5_CAPACITY_FACTORS.split(',')))
-
-        # Find the top % values from the temporal average (sorts out user swapping max and min)
-        upper_percentile_tier1 = 1.0 - min(percent_upper_tier1_capacity_factors) / 100.0
-        upper_percentile_tier2 = 1.0 - min(percent_upper_tier2_capacity_factors) / 100.0
-        upper_percentile_tier3 = 1.0 - min(percent_upper_tier3_capacity_factors) / 100.0
-        upper_percentile_tier4 = 1.0 - min(percent_upper_tier4_capacity_factors) / 100.0
-        upper_percentile_tier5 = 1.0 - min(percent_upper_tier5_capacity_factors) / 100.0
-
-        lower_percentile_tier1 = 1.0 - max(percent_upper_tier1_capacity_factors) / 100.0
-        lower_percentile_tier2 = 1.0 - max(percent_upper_tier2_capacity_factors) / 100.0
-        lower_percentile_tier3 = 1.0 - max(percent_upper_tier3_capacity_factors) / 100.0
-        lower_percentile_tier4 = 1.0 - max(percent_upper_tier4_capacity_factors) / 100.0
-        lower_percentile_tier5 = 1.0 - max(percent_upper_tier5_capacity_factors) / 100.0
-
         # get the geometry bound:
         geometry_bound = points_geometry.bounds
 
@@ -249,32 +265,23 @@ def calculate_valid_tiers(atlite_data,atlite_data_avg,points_geometry,geometry,A
         #     plt.close()
 
         # start with the masking of the values outside thw geometry in the subsetted data
-        # Create meshgrid of latitude and longitude values of subset data, for getting geometry
-        lon, lat = np.meshgrid(subset.longitude.values, subset.latitude.values)
-
-        # Reshape latitude and longitude values to 1D arrays
-        lat_flat = lat.flatten()
-        lon_flat = lon.flatten()
-
-        # Create points array
-        points = np.column_stack((lon_flat, lat_flat))
-
-        # Create a mask for points within the polygon
-        mask = np.array([points_geometry.contains(Point(p)) for p in points])
-
-        # Reshape mask to the shape of the subset
-        mask_reshaped = mask.reshape(subset.latitude.size, subset.longitude.size)
-
-        # Set points outside the polygon to NaN
-        subset.values[~mask_reshaped] = np.nan
+        # Create a mask for the grid points of the subset within the polygon
+        mask_reshaped = support_functions.geometry_cell_mask(points_geometry,subset.latitude.values,subset.longitude.values)
+        # the cells left out by the tier masks are handled like the cells outside the polygon
+        subset_weights = None
+        if tier_mask_weights is not None:
+            subset_weights = xr.DataArray(tier_mask_weights, coords=atlite_data_avg.coords, dims=atlite_data_avg.dims).sel(latitude=slice(geometry_bound[1], geometry_bound[3]), longitude=slice(geometry_bound[0], geometry_bound[2])).values
+            mask_reshaped = mask_reshaped & (subset_weights > 0)
+            subset_weights = np.where(mask_reshaped, subset_weights, 0.0)
+
+        # Set points outside the polygon to NaN, on a copy: the subset shares memory with the loaded data
+        subset = subset.where(mask_reshaped)
         # set all nan to 0, this will allow the percentiles to be computed and not come out as nan
         subset = subset.fillna(0)
 
-        # Repeat the mask along the time dimension to match the full dataset, needed for tier extraction
-        mask_time = np.repeat(mask_reshaped[np.newaxis, :, :], len(atlite_data[DATA_VARIABLE_NAME].values[:,0,0]), axis=0)
-
-        # set points outside geometry to nan
-        subset_full_dataset[DATA_VARIABLE_NAME].values[~mask_time] = np.nan
+        # set points outside geometry to nan (again on a copy), the mask is broadcast along the time dimension
+        # (lazily for chunked data, the values are only read when the tiers are generated)
+        subset_full_values = subset_full_dataset[DATA_VARIABLE_NAME].where(xr.DataArray(mask_reshaped, dims=('latitude', 'longitude'))).data
         # dont set to 0 because the code for tier generation for each percentile checks for nan specifically
         # subset_full_dataset = subset_full_dataset.fillna(0)
 
@@ -289,55 +296,15 @@ def calculate_valid_tiers(atlite_data,atlite_data_avg,points_geometry,geometry,A
         #     plt.savefig("assets/after.png")
         #     plt.close()
 
-        # Calculate percentiles for each tier based on the extracted values
-        bounds_tier1 = np.percentile(subset,[lower_percentile_tier1 * 100, upper_percentile_tier1 * 100])
-        bounds_tier2 = np.percentile(subset,[lower_percentile_tier2 * 100, upper_percentile_tier2 * 100])
-        bounds_tier3 = np.percentile(subset,[lower_percentile_tier3 * 100, upper_percentile_tier3 * 100])
-        bounds_tier4 = np.percentile(subset,[lower_percentile_tier4 * 100, upper_percentile_tier4 * 100])
-        bounds_tier5 = np.percentile(subset,[lower_percentile_tier5 * 100, upper_percentile_tier5 * 100])
+        # Calculate the percentile bounds of all tiers based on the extracted values and generate the tiers in one go
+        tier_means, bottom_bounds, top_bounds, cells_per_tier = support_functions.generate_bounded_tiers(subset.values,subset_full_values,tier_bands,cell_weights=subset_weights)
 
         print("... Bounds for this geometry:")
-        print("...... Bounds for tier 1:", bounds_tier1)
-        print("...... Bounds for tier 2:", bounds_tier2)
-        print("...... Bounds for tier 3:", bounds_tier3)
-        print("...... Bounds for tier 4:", bounds_tier4)
-        print("...... Bounds for tier 5:", bounds_tier5)
-
-        # extract the bounds:
-        top_bound_tier1 = bounds_tier1[1]
-        top_bound_tier2 = bounds_tier2[1]
-        top_bound_tier3 = bounds_tier3[1]
-        top_bound_tier4 = bounds_tier4[1]
-        top_bound_tier5 = bounds_tier5[1]
-
-        bottom_bound_tier1 = bounds_tier1[0]
-        bottom_bound_tier2 = bounds_tier2[0]
-        bottom_bound_tier3 = bounds_tier3[0]
-        bottom_bound_tier4 = bounds_tier4[0]
-        bottom_bound_tier5 = bounds_tier5[0]
-
-        # Use boolean indexing to select the desired indexes from subset
-        selected_indexes_tier1 = subset.where((subset > bottom_bound_tier1) & (subset < top_bound_tier1))
-        selected_indexes_tier2 = subset.where((subset > bottom_bound_tier2) & (subset < top_bound_tier2))
-        selected_indexes_tier3 = subset.where((subset > bottom_bound_tier3) & (subset < top_bound_tier3))
-        selected_indexes_tier4 = subset.where((subset > bottom_bound_tier4) & (subset < top_bound_tier4))
-        selected_indexes_tier5 = subset.where((subset > bottom_bound_tier5) & (subset < top_bound_tier5))
-
-        # Generate the tiers:
-        bound_tier1 = get_tier_percentage_bound(subset[AVG_ATLITE_LATITUDE_VARIABLE_NAME].values,subset[AVG_ATLITE_LONGITUDE_VARIABLE_NAME].values,copy.deepcopy(subset_full_dataset), selected_indexes_tier1,DATA_VARIABLE_NAME)
-        bound_tier2 = get_tier_percentage_bound(subset[AVG_ATLITE_LATITUDE_VARIABLE_NAME].values,subset[AVG_ATLITE_LONGITUDE_VARIABLE_NAME].values,copy.deepcopy(subset_full_dataset), selected_indexes_tier2,DATA_VARIABLE_NAME)
-        bound_tier3 = get_tier_percentage_bound(subset[AVG_ATLITE_LATITUDE_VARIABLE_NAME].values,subset[AVG_ATLITE_LONGITUDE_VARIABLE_NAME].values,copy.deepcopy(subset_full_dataset), selected_indexes_tier3,DATA_VARIABLE_NAME)
-        bound_tier4 = get_tier_percentage_bound(subset[AVG_ATLITE_LATITUDE_VARIABLE_NAME].values,subset[AVG_ATLITE_LONGITUDE_VARIABLE_NAME].values,copy.deepcopy(subset_full_dataset), selected_indexes_tier4,DATA_VARIABLE_NAME)
-        bound_tier5 = get_tier_percentage_bound(subset[AVG_ATLITE_LATITUDE_VARIABLE_NAME].values,subset[AVG_ATLITE_LONGITUDE_VARIABLE_NAME].values,copy.deepcopy(subset_full_dataset), selected_indexes_tier5,DATA_VARIABLE_NAME)
+        for tier_number in range(len(tier_bands)):
+            print("...... Bounds for tier ",tier_number+1,":", bottom_bounds[tier_number]," - ", top_bounds[tier_number])
 
         # Create a DataFrame
-        tier_dataframe_option_6 = pd.DataFrame({
-            'tier_1': bound_tier1,
-            'tier_2': bound_tier2,
-            'tier_3': bound_tier3,
-            'tier_4': bound_tier4,
-            'tier_5': bound_tier5
-        })
+        tier_dataframe_option_6 = pd.DataFrame(tier_means, columns=['tier_'+str(tier_number+1) for tier_number in range(len(tier_bands))])
         print("... Generated tiers successfully: ")
         print(tier_dataframe_option_6)
         print("#########################################\n")
@@ -357,6 +324,11 @@ def calculate_valid_tiers(atlite_data,atlite_data_avg,points_geometry,geometry,A
 #################################################
 # dash app
 def visualize_geometries(geographical_bounds_atlite_data,geometry_table_list,geometry_layer_list,graph_tier_list):
+    # dash and plotly are only needed when the geometries are viewed
+    import dash
+    from dash import html, dash_table
+    import plotly.express as px
+
     # create app
     app = dash.Dash(__name__)
 
@@ -501,55 +473,30 @@ def visualize_geometries(geographical_bounds_atlite_data,geometry_table_list,geo
 
     app.run_server(debug=True)
 
-################################################################
-# Helper function: Split tiers according to percentage bounds:
-################################################################
-def get_tier_percentage_bound(lats,longs,atlite_data,selected_data,DATA_VARIABLE_NAME):
-    """
-
-    :param lats: list of latitudes
-    :param longs: list of longitudes
-    :param atlite_data: full Atlite data
-    :param selected_data: masked array with geometry
-    :return: final averaged tier for the bounded percentile
-    """
-    # count as the values get added on to take the average at the end
-    number_columns_in_tier = 0
-    # skeleton to hold the values
-    cumulative_average_values = np.zeros((len(atlite_data[DATA_VARIABLE_NAME].values[:,0,0])))
-
-    # loop through and find if nan or data
-    for lat in range(len(lats)):
-        for lon in range(len(longs)):
-            value = selected_data.data[lat][lon]
-            if np.isnan(value):
-                continue
-            else:
-                # Add the new column to the skeleton column
-                cumulative_average_values += atlite_data[DATA_VARIABLE_NAME].values[:, lat, lon]
-                number_columns_in_tier += 1
-
-    # take the average
-    print("... A tier was created.")
-    return cumulative_average_values/number_columns_in_tier
-
 #################################################
 ## Option 6: main function to process geometries
 #################################################
 
-def option_6_process_geometries_into_tiers(ATLITE_CAPACITY_FACTORS_FOLDERS, AVG_ATLITE_LONGITUDE_VARIABLE_NAME, AVG_ATLITE_LATITUDE_VARIABLE_NAME, AVG_ATLITE_DATA_VARIABLE_NAME, PERCENT_UPPER_TIER1_CAPACITY_FACTORS, PERCENT_UPPER_TIER2_CAPACITY_FACTORS, PERCENT_UPPER_TIER3_CAPACITY_FACTORS, PERCENT_UPPER_TIER4_CAPACITY_FACTORS, PERCENT_UPPER_TIER5_CAPACITY_FACTORS, DATA_VARIABLE_NAME, OPTION_6_USER_GEOMETRIES_GEOJSON_FILE, OPTION_6_OUTPUT_FOLDER, ATLITE_DUMMY_DATA, DUMMY_START_DATE, DUMMY_END_DATE, DUMMY_LATITUDE_BOTTOM, DUMMY_LATITUDE_TOP, DUMMY_LONGITUDE_LEFT, DUMMY_LONGITUDE_RIGHT, MAXIMUM_CAPACITY, TIME_VARIABLE_NAME, AVG_ATLITE_CAPACITY_FACTORS_FILE_LOCATION, SCALE_CAPACITY_FACTORS, OPTION_6_OUTPUT_TIERS_FILE, OPTION_6_GEOMETRY_REFERENCE_FILE, OPTION_6_VIEW_VALID_GEOMETRIES):
+def option_6_process_geometries_into_tiers(ATLITE_CAPACITY_FACTORS_FOLDERS, AVG_ATLITE_LONGITUDE_VARIABLE_NAME, AVG_ATLITE_LATITUDE_VARIABLE_NAME, AVG_ATLITE_DATA_VARIABLE_NAME, PERCENT_UPPER_TIER1_CAPACITY_FACTORS, PERCENT_UPPER_TIER2_CAPACITY_FACTORS, PERCENT_UPPER_TIER3_CAPACITY_FACTORS, PERCENT_UPPER_TIER4_CAPACITY_FACTORS, PERCENT_UPPER_TIER5_CAPACITY_FACTORS, DATA_VARIABLE_NAME, OPTION_6_USER_GEOMETRIES_GEOJSON_FILE, OPTION_6_OUTPUT_FOLDER, ATLITE_DUMMY_DATA, DUMMY_START_DATE, DUMMY_END_DATE, DUMMY_LATITUDE_BOTTOM, DUMMY_LATITUDE_TOP, DUMMY_LONGITUDE_LEFT, DUMMY_LONGITUDE_RIGHT, MAXIMUM_CAPACITY, TIME_VARIABLE_NAME, AVG_ATLITE_CAPACITY_FACTORS_FILE_LOCATION, SCALE_CAPACITY_FACTORS, OPTION_6_OUTPUT_TIERS_FILE, OPTION_6_GEOMETRY_REFERENCE_FILE, OPTION_6_VIEW_VALID_GEOMETRIES, ATLITE_TIME_FREQUENCY=None, TIME_WINDOW_START=None, TIME_WINDOW_END=None, TIME_WINDOW_MONTHS=None, TIER_STATISTICS=None, TIER_SPECIFICATION=None, ATLITE_CUBE_FILE=None, STAGE_TIMING_LOG_FILE=None, ROI_BBOX=None, ROI_GEOMETRY_FILE=None, ATLITE_CHUNKS=None, TIER_DASK_SCHEDULER=None, TIER_DASK_NUM_WORKERS=None, ATLITE_PREFETCH_DEPTH=None, ATLITE_FOLDER_MANIFESTS=None, CHECKPOINT_FOLDER=None, RESUME=None, TIER_MASKS_FOLDER=None, TIER_MASK_MODE=None, TIER_MASK_MIN_FRACTION=None, TIER_MASK_CACHE_FOLDER=None):
     """
     Main function for the processing of geometries into tiers
 
     :return: saves the tiers and geometry information
     """
+    support_functions.check_configuration(locals())
+
+    support_functions.start_stage_log("option_6",STAGE_TIMING_LOG_FILE)
+    support_functions.start_pipeline("option_6",locals(),CHECKPOINT_FOLDER,RESUME)
+    support_functions.set_dask_scheduler(TIER_DASK_SCHEDULER,TIER_DASK_NUM_WORKERS)
 
     # Define the path to the GeoJSON file
     geojson_path = OPTION_6_USER_GEOMETRIES_GEOJSON_FILE
 
     # open the file
     try:
-        geojson_data = gpd.read_file(geojson_path)
+        with support_functions.stage_span("read_geometries") as span:
+            geojson_data = gpd.read_file(geojson_path)
+            span['items'] = len(geojson_data)
         print("... Read in geometry file successfully.\n")
     except Exception as e:
         raise ValueError("Could not read the geometry geojson file. Please check the file name and geometry content. Full error: " + str(e))
@@ -558,15 +505,23 @@ def option_6_process_geometries_into_tiers(ATLITE_CAPACITY_FACTORS_FOLDERS, AVG_
     if not os.path.exists(OPTION_6_OUTPUT_FOLDER):
         os.makedirs(OPTION_6_OUTPUT_FOLDER)
 
+    # tier bounds from TIER_SPECIFICATION or the 5 tier variables, the same bounds are used for every geometry (read before the data)
+    tier_bands = support_functions.parse_tier_specification(TIER_SPECIFICATION,[PERCENT_UPPER_TIER1_CAPACITY_FACTORS, PERCENT_UPPER_TIER2_CAPACITY_FACTORS, PERCENT_UPPER_TIER3_CAPACITY_FACTORS, PERCENT_UPPER_TIER4_CAPACITY_FACTORS, PERCENT_UPPER_TIER5_CAPACITY_FACTORS])
+    print("... Generating ",len(tier_bands)," tiers per POLYGON geometry.\n")
+
     ########################################################################
     ## open atlite capacity factor data
     ########################################################################
     # open the averaged atlite capacity factor data
-    atlite_capacity_factors, atlite_capacity_factors_avg = support_functions.create_average_capacity_factor_file_atlite(ATLITE_DUMMY_DATA,ATLITE_CAPACITY_FACTORS_FOLDERS,DUMMY_START_DATE,DUMMY_END_DATE,DUMMY_LATITUDE_BOTTOM,DUMMY_LATITUDE_TOP,DUMMY_LONGITUDE_LEFT,DUMMY_LONGITUDE_RIGHT,MAXIMUM_CAPACITY,DATA_VARIABLE_NAME,TIME_VARIABLE_NAME,AVG_ATLITE_CAPACITY_FACTORS_FILE_LOCATION)
+    atlite_capacity_factors, atlite_capacity_factors_avg = support_functions.create_average_capacity_factor_file_atlite(ATLITE_DUMMY_DATA,ATLITE_CAPACITY_FACTORS_FOLDERS,DUMMY_START_DATE,DUMMY_END_DATE,DUMMY_LATITUDE_BOTTOM,DUMMY_LATITUDE_TOP,DUMMY_LONGITUDE_LEFT,DUMMY_LONGITUDE_RIGHT,MAXIMUM_CAPACITY,DATA_VARIABLE_NAME,TIME_VARIABLE_NAME,AVG_ATLITE_CAPACITY_FACTORS_FILE_LOCATION,ATLITE_TIME_FREQUENCY=ATLITE_TIME_FREQUENCY,TIME_WINDOW_START=TIME_WINDOW_START,TIME_WINDOW_END=TIME_WINDOW_END,TIME_WINDOW_MONTHS=TIME_WINDOW_MONTHS,ATLITE_CUBE_FILE=ATLITE_CUBE_FILE,ROI_BBOX=ROI_BBOX,ROI_GEOMETRY_FILE=ROI_GEOMETRY_FILE,ATLITE_CHUNKS=ATLITE_CHUNKS,ATLITE_PREFETCH_DEPTH=ATLITE_PREFETCH_DEPTH,ATLITE_FOLDER_MANIFESTS=ATLITE_FOLDER_MANIFESTS)
     print("... Read averaged atlite capacity factor data.\n")
 
+    # leave out (or weight) the cells that the tier masks mark as not usable, in the polygon tiers
+    atlite_capacity_factors_avg, tier_mask_weights = support_functions.apply_tier_masks(atlite_capacity_factors_avg,AVG_ATLITE_LATITUDE_VARIABLE_NAME,AVG_ATLITE_LONGITUDE_VARIABLE_NAME,TIER_MASKS_FOLDER,TIER_MASK_MODE,TIER_MASK_MIN_FRACTION,TIER_MASK_CACHE_FOLDER)
+
     # Call the function to check if each geometry is within the bounds
-    inside_or_outside = check_geojson_within_bounds(geojson_data, atlite_capacity_factors, AVG_ATLITE_LONGITUDE_VARIABLE_NAME, AVG_ATLITE_LATITUDE_VARIABLE_NAME)
+    with support_functions.stage_span("selection",len(geojson_data)):
+        inside_or_outside = check_geojson_within_bounds(geojson_data, atlite_capacity_factors, AVG_ATLITE_LONGITUDE_VARIABLE_NAME, AVG_ATLITE_LATITUDE_VARIABLE_NAME)
 
     # Initialize a list to store visualization table data
     geometry_table_list = []
@@ -623,8 +578,10 @@ def option_6_process_geometries_into_tiers(ATLITE_CAPACITY_FACTORS_FOLDERS, AVG_
             if is_within_bounds:
                 print("------------------------------------------------")
                 print(tier_label," is a POLYGON")
-                potential_tier = calculate_valid_tiers(atlite_capacity_factors,atlite_capacity_factors_avg,row['geometry'],geometry_type,AVG_ATLITE_LATITUDE_VARIABLE_NAME, AVG_ATLITE_LONGITUDE_VARIABLE_NAME, AVG_ATLITE_DATA_VARIABLE_NAME, PERCENT_UPPER_TIER1_CAPACITY_FACTORS, PERCENT_UPPER_TIER2_CAPACITY_FACTORS, PERCENT_UPPER_TIER3_CAPACITY_FACTORS, PERCENT_UPPER_TIER4_CAPACITY_FACTORS, PERCENT_UPPER_TIER5_CAPACITY_FACTORS, DATA_VARIABLE_NAME)
+                with support_functions.stage_span("gather",1):
+                    potential_tier = support_functions.pipeline_stage("reduce_"+tier_label,lambda: calculate_valid_tiers(atlite_capacity_factors,atlite_capacity_factors_avg,row['geometry'],geometry_type,AVG_ATLITE_LATITUDE_VARIABLE_NAME, AVG_ATLITE_LONGITUDE_VARIABLE_NAME, AVG_ATLITE_DATA_VARIABLE_NAME, tier_bands, DATA_VARIABLE_NAME, tier_mask_weights))
                 if potential_tier is not None:
+                    potential_tier.index = support_functions.tier_time_index(atlite_capacity_factors,TIME_VARIABLE_NAME)
                     print("... Tier generated successfully for ",tier_label)
                     graph_tier_list.append({tier_label:potential_tier})
 
@@ -638,7 +595,9 @@ def option_6_process_geometries_into_tiers(ATLITE_CAPACITY_FACTORS_FOLDERS, AVG_
                         print("\n... Capacity factors were scaled by division of maximum capacity:",MAXIMUM_CAPACITY)
 
                     # Save tiers to csv file
-                    valid_output_tiers.to_csv(os.path.join(OPTION_6_OUTPUT_FOLDER,str(tier_label)+"_"+OPTION_6_OUTPUT_TIERS_FILE))
+                    with support_functions.stage_span("write",1):
+                        valid_output_tiers.to_csv(os.path.join(OPTION_6_OUTPUT_FOLDER,str(tier_label)+"_"+OPTION_6_OUTPUT_TIERS_FILE))
+                        support_functions.save_tier_statistics(valid_output_tiers,OPTION_6_OUTPUT_FOLDER,str(tier_label)+"_"+OPTION_6_OUTPUT_TIERS_FILE,TIER_STATISTICS)
                     print("\n... Saved output tiers file to:", os.path.join(OPTION_6_OUTPUT_FOLDER,str(tier_label)+"_"+OPTION_6_OUTPUT_TIERS_FILE))
 
                     # otherwise, no tier for this point
@@ -688,8 +647,10 @@ def option_6_process_geometries_into_tiers(ATLITE_CAPACITY_FACTORS_FOLDERS, AVG_
             if is_within_bounds:
                 print("------------------------------------------------")
                 print(tier_label," is a POINT")
-                potential_tier = calculate_valid_tiers(atlite_capacity_factors,atlite_capacity_factors_avg, row['geometry'], geometry_type,AVG_ATLITE_LATITUDE_VARIABLE_NAME, AVG_ATLITE_LONGITUDE_VARIABLE_NAME, AVG_ATLITE_DATA_VARIABLE_NAME, PERCENT_UPPER_TIER1_CAPACITY_FACTORS, PERCENT_UPPER_TIER2_CAPACITY_FACTORS, PERCENT_UPPER_TIER3_CAPACITY_FACTORS, PERCENT_UPPER_TIER4_CAPACITY_FACTORS, PERCENT_UPPER_TIER5_CAPACITY_FACTORS, DATA_VARIABLE_NAME)
+                with support_functions.stage_span("gather",1):
+                    potential_tier = support_functions.pipeline_stage("reduce_"+tier_label,lambda: calculate_valid_tiers(atlite_capacity_factors,atlite_capacity_factors_avg, row['geometry'], geometry_type,AVG_ATLITE_LATITUDE_VARIABLE_NAME, AVG_ATLITE_LONGITUDE_VARIABLE_NAME, AVG_ATLITE_DATA_VARIABLE_NAME, tier_bands, DATA_VARIABLE_NAME, tier_mask_weights))
                 if potential_tier is not None:
+                    potential_tier.index = support_functions.tier_time_index(atlite_capacity_factors,TIME_VARIABLE_NAME)
                     print("... Tier generated successfully for ",tier_label)
                     graph_tier_list.append({tier_label:potential_tier})
 
@@ -704,7 +665,9 @@ def option_6_process_geometries_into_tiers(ATLITE_CAPACITY_FACTORS_FOLDERS, AVG_
 
 
                     # Save tiers to csv file
-                    valid_output_tiers.to_csv(os.path.join(OPTION_6_OUTPUT_FOLDER,str(tier_label)+"_"+OPTION_6_OUTPUT_TIERS_FILE))
+                    with support_functions.stage_span("write",1):
+                        valid_output_tiers.to_csv(os.path.join(OPTION_6_OUTPUT_FOLDER,str(tier_label)+"_"+OPTION_6_OUTPUT_TIERS_FILE))
+                        support_functions.save_tier_statistics(valid_output_tiers,OPTION_6_OUTPUT_FOLDER,str(tier_label)+"_"+OPTION_6_OUTPUT_TIERS_FILE,TIER_STATISTICS)
                     print("... Saved output tiers file to:", os.path.join(OPTION_6_OUTPUT_FOLDER,str(tier_label)+"_"+OPTION_6_OUTPUT_TIERS_FILE))
 
                     # otherwise, no tier for this point
@@ -719,11 +682,14 @@ def option_6_process_geometries_into_tiers(ATLITE_CAPACITY_FACTORS_FOLDERS, AVG_
     geometry_table_df = pd.DataFrame(geometry_table_list)
 
     # Save the DataFrame to a CSV file
-    geometry_table_df.to_csv(os.path.join(OPTION_6_OUTPUT_FOLDER,OPTION_6_GEOMETRY_REFERENCE_FILE))
+    with support_functions.stage_span("write",1):
+        geometry_table_df.to_csv(os.path.join(OPTION_6_OUTPUT_FOLDER,OPTION_6_GEOMETRY_REFERENCE_FILE))
 
 
     print("\n... Saved output reference geometry file to:",os.path.join(OPTION_6_OUTPUT_FOLDER,OPTION_6_GEOMETRY_REFERENCE_FILE))
     print("... Tier generation completed successfully!")
+    support_functions.finish_pipeline()
+    support_functions.print_stage_summary()
     print("\nOption_6 completed successfully!")
     print("----------------------------------------------------------------\n")
 
@@ -741,28 +707,10 @@ def option_6_process_geometries_into_tiers(ATLITE_CAPACITY_FACTORS_FOLDERS, AVG_
 if __name__ == '__main__':
     print("Starting tier processing for Option 6: multiple tier per user defined geometry ...")
     # check args or load env file and run codes
-    try:
-        print("TRYING TO USE ARGUMENTS")
-        args = parse_arguments()
-        print("ARGUMENTS FOUND. USING ARGUMENTS")
+    args = support_functions.script_arguments(parse_arguments(), load_from_env)
 
-        # RUN CODES
-        option_6_process_geometries_into_tiers(**vars(args))
-    except Exception as e:
-        print("ARGUMENTS NOT FOUND: ", e)
-        try:
-            print("TRYING TO LOAD ENV FILE VARIABLES")
-            # Load variables from the .env file
-            args = load_from_env()
-            print("ENV FILE FOUND. USING ENV FILE")
-
-            # RUN CODES
-            option_6_process_geometries_into_tiers(**args)
-
-        except Exception as e:
-            print("ENV FILE NOT FOUND: ", e)
-            print("ERROR ... USER ARGS AND ENV FILE NOT FOUND, ABORTING!")
-            raise ValueError("COULD NOT FIND ARGS OR LOAD ENV FILE. USER ARGS OR ENV FILE MISSING.")
+    # RUN CODES
+    option_6_process_geometries_into_tiers(**args)
 
     # args example use:
     # python Option_6_step2_tier_generation_bounds_per_geometry.py --AVG_ATLITE_LONGITUDE_VARIABLE_NAME longitude --AVG_ATLITE_LATITUDE_VARIABLE_NAME latitude --AVG_ATLITE_DATA_VARIABLE_NAME capacity_factors --PERCENT_UPPER_TIER1_CAPACITY_FACTORS  0,10 --PERCENT_UPPER_TIER2_CAPACITY_FACTORS  10,20 --PERCENT_UPPER_TIER3_CAPACITY_FACTORS  0,40 --PERCENT_UPPER_TIER4_CAPACITY_FACTORS  60,100 --PERCENT_UPPER_TIER5_CAPACITY_FACTORS 40,60 --DATA_VARIABLE_NAME capacity_factors --OPTION_6_USER_GEOMETRIES_GEOJSON_FILE  "assets/user_geometry/example2.geojson" --OPTION_6_OUTPUT_FOLDER "assets/option_6_output"  --ATLITE_DUMMY_DATA True  --DUMMY_START_DATE  '2023-01-01' --DUMMY_END_DATE '2024-01-01'  --DUMMY_LATITUDE_BOTTOM  -32 --DUMMY_LATITUDE_TOP -30  --DUMMY_LONGITUDE_LEFT 26  --DUMMY_LONGITUDE_RIGHT 28   --MAXIMUM_CAPACITY  50  --TIME_VARIABLE_NAME  time --AVG_ATLITE_CAPACITY_FACTORS_FILE_LOCATION "assets/avg_atlite_capacity_factors.nc" --SCALE_CAPACITY_FACTORS True --OPTION_6_OUTPUT_TIERS_FILE  "option_6_multiple_tiers_per_geometry.csv" --OPTION_6_GEOMETRY_REFERENCE_FILE  "option_6_geometry_reference_file.csv"  --OPTION_6_VIEW_VALID_GEOMETRIES False
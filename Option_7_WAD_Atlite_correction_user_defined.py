@@ -1,31 +1,74 @@
 """
 Purpose: Optional
-    User defined function to autocorrect the Atlite time series with the wind atlas data
-    Use at users own risk (untested)
+    Corrects the Atlite time series with the wind atlas data. The WAD long term mean is regridded once onto the Atlite grid
+    (area weighted), per cell scale factors (or a quantile mapping of the long term means) are computed and applied to the
+    hourly cube chunk by chunk. The corrected cube is saved as netcdf, point the other options to it with ATLITE_CUBE_FILE.
+    Use at users own risk
 """
+import numpy as np
 import os
 from dotenv import load_dotenv
+import xarray as xr
+import warnings
 import argparse
 
+import Option_Support_Functions as support_functions
+
 ################################
 # system args section
 ################################
 # used for running the codes
 def parse_arguments():
-    parser = argparse.ArgumentParser(description="(Option 7) Script to calculate average capacity factors.")
-    parser.add_argument('--WIND_ATLAS_CAPACITY_FACTORS_HEATMAP_FILE_LOCATION', default=None, required=False, help="Wind Atlas data")
-    parser.add_argument('--ATLITE_CAPACITY_FACTORS_FOLDERS', default=None, required=False, help="Atlite data.")
+    parser = argparse.ArgumentParser(description="(Option 7) Script to correct the Atlite capacity factors with the wind atlas data.")
+    parser.add_argument('--ATLITE_DUMMY_DATA', default=None, required=False,help="Boolean to use the dummy Atlite data (True) or not.")
+    parser.add_argument('--ATLITE_CAPACITY_FACTORS_FOLDERS', default=None, required=False,help="Folders continaing hourly Atlite data files needing stitching.")
+    parser.add_argument('--DUMMY_START_DATE', default=None, required=False, help="Start date.")
+    parser.add_argument('--DUMMY_END_DATE', default=None, required=False, help="End date.")
+    parser.add_argument('--DUMMY_LATITUDE_BOTTOM', default=None, required=False, help="Latitude bottom.")
+    parser.add_argument('--DUMMY_LATITUDE_TOP', default=None, required=False, help="Latitude top.")
+    parser.add_argument('--DUMMY_LONGITUDE_LEFT', default=None, required=False, help="Longitude left.")
+    parser.add_argument('--DUMMY_LONGITUDE_RIGHT', default=None, required=False, help="Longitude right.")
+    parser.add_argument('--MAXIMUM_CAPACITY', default=None, required=False, help="Maximum capacity.")
+    parser.add_argument('--DATA_VARIABLE_NAME', default=None, required=False, help="Data variable name.")
+    parser.add_argument('--TIME_VARIABLE_NAME', default=None, required=False, help="Time variable name.")
+    parser.add_argument('--AVG_ATLITE_CAPACITY_FACTORS_FILE_LOCATION', default=None, required=False,help="Average ATLITE capacity factors file location.")
+    parser.add_argument('--AVG_ATLITE_LATITUDE_VARIABLE_NAME', default=None, required=False,help="Average ATLITE latitude variable name.")
+    parser.add_argument('--AVG_ATLITE_LONGITUDE_VARIABLE_NAME', default=None, required=False,help="Average ATLITE longitude variable name.")
+    parser.add_argument('--REDUCED_WAD', default=None, required=False, help="Whether to use reduced WAD data.")
+    parser.add_argument('--WIND_ATLAS_RESOLUTION_REDUCTION', default=None, required=False,help="WIND ATLAS resolution reduction.")
+    parser.add_argument('--WIND_ATLAS_CAPACITY_FACTORS_HEATMAP_FILE_LOCATION', default=None, required=False,help="WIND ATLAS capacity factors heatmap file location.")
+    parser.add_argument('--WIND_ATLAS_HEATMAP_LATITUDE_VARIABLE_NAME', default=None, required=False,help="WIND ATLAS heatmap latitude variable name.")
+    parser.add_argument('--WIND_ATLAS_HEATMAP_LONGITUDE_VARIABLE_NAME', default=None, required=False,help="WIND ATLAS heatmap longitude variable name.")
+    parser.add_argument('--WIND_ATLAS_HEATMAP_DATA_VARIABLE_NAME', default=None, required=False,help="WIND ATLAS heatmap data variable name.")
+    parser.add_argument('--OPTION_7_OUTPUT_FOLDER', default=None, required=False, help="Option 7 output folder.")
+    parser.add_argument('--OPTION_7_CORRECTION_METHOD', default=None, required=False, help="Correction method: scale (per cell WAD/Atlite mean ratio) or quantile (quantile mapping of the long term means).")
+    parser.add_argument('--OPTION_7_CORRECTED_CUBE_FILE', default=None, required=False, help="Output netcdf file for the corrected Atlite capacity factors.")
+    parser.add_argument('--OPTION_7_CORRECTION_FACTORS_FILE', default=None, required=False, help="Output netcdf file for the regridded WAD mean and the scale factors.")
+    parser.add_argument('--OPTION_7_CORRECTION_TIME_CHUNK', default=None, required=False, help="Number of time steps read, corrected and written at a time.")
+    parser.add_argument('--ATLITE_TIME_FREQUENCY', default=None, required=False, help="Time step frequency of the Atlite files e.g. h for hourly.")
+    parser.add_argument('--TIME_WINDOW_START', default=None, required=False, help="Start date of the time window to process (inclusive).")
+    parser.add_argument('--TIME_WINDOW_END', default=None, required=False, help="End date of the time window to process (exclusive).")
+    parser.add_argument('--TIME_WINDOW_MONTHS', default=None, required=False, help="Months or seasons to process e.g. 6,7,8 or JJA.")
+    parser.add_argument('--STAGE_TIMING_LOG_FILE', default=None, required=False, help="Optional JSON lines file the stage timings (seconds, peak memory, items) are appended to.")
+    parser.add_argument('--ROI_BBOX', default=None, required=False, help="Region of interest to read, latitude bottom, latitude top, longitude left, longitude right, e.g. --ROI_BBOX=-35,-22,16,33 (with = because of the minus signs, leave empty for the whole domain)")
+    parser.add_argument('--ROI_GEOMETRY_FILE', default=None, required=False, help="GeoJSON file whose geometries bound the region of interest to read (leave empty for the whole domain)")
+    parser.add_argument('--ATLITE_CUBE_FILE', default=None, required=False, help="Netcdf capacity factors (a stitched cube or Atlite cutout output, one file, a comma separated list or a glob pattern) read instead of the Atlite folders.")
+    parser.add_argument('--OPTION_7_CUBE_COMPRESSION', default=None, required=False, help="Compression of the corrected cube: none (default), zlib, zstd, bzip2 or blosc_lz4, blosc_zstd, ... optionally with a level e.g. zstd:3 (see benchmark_cube_store.py).")
+    parser.add_argument('--OPTION_7_CUBE_CHUNK_LAYOUT', default=None, required=False, help="Chunk shape of the corrected cube: spatial (whole maps of OPTION_7_CORRECTION_TIME_CHUNK steps, default), time_series (long series of small tiles, for cell series gathers) or balanced.")
+    parser.add_argument('--ATLITE_PREFETCH_DEPTH', default=None, required=False, help="Number of Atlite csv files read ahead by background threads, e.g. 16 on a network drive (leave empty or 0 to read one file after the other)")
+    parser.add_argument('--ATLITE_FOLDER_MANIFESTS', default=None, required=False, help="True/False: keep a manifest of the csv files (order, sizes, header hashes) in every Atlite folder, unchanged folders are then not listed again. Default False")
+    parser.add_argument('--CHECKPOINT_FOLDER', default=None, required=False, help="Folder for the checkpoints of the finished pipeline stages (ingest, average, reduce), empty for no checkpoints.")
+    parser.add_argument('--RESUME', default=None, required=False, help="True to start a failed run again from its last finished stage in CHECKPOINT_FOLDER (same settings), False to start from the beginning.")
+    parser.add_argument('--WIND_ATLAS_REDUCTION_METHOD', default=None, required=False, help="How a block of WIND ATLAS cells is reduced to one cell: mean, max, quantile or stride.")
+    parser.add_argument('--WIND_ATLAS_REDUCTION_QUANTILE', default=None, required=False, help="Quantile (0 to 1) of the block for WIND_ATLAS_REDUCTION_METHOD quantile.")
+    parser.add_argument('--WIND_ATLAS_PYRAMID_FOLDER', default=None, required=False, help="Folder of the reduced WIND ATLAS files.")
 
     # parse args
     args = parser.parse_args()
 
-    # Check if all arguments are provided
-    if all(arg is None for arg in vars(args).values()):
-        raise ValueError("ERROR: All arguments are None!")
-
-    # Check if any of the arguments are provided
-    if any(arg is None for arg in vars(args).values()):
-        print("Warning only some arguments provided! Code may fail.")
+    # Check if only some of the arguments are provided (none at all: the .env file is used)
+    if any(arg is None for arg in vars(args).values()) and not all(arg is None for arg in vars(args).values()):
+        print("Warning only some arguments provided! The others are read from the .env file.")
 
     return args
 
@@ -34,8 +77,48 @@ def load_from_env():
     # load data from .env file
     load_dotenv()
     env_vars =  {
-        "WIND_ATLAS_DATA" : os.environ.get("WIND_ATLAS_CAPACITY_FACTORS_HEATMAP_FILE_LOCATION"),
-        "ATLITE_DATA" : os.environ.get("ATLITE_CAPACITY_FACTORS_FOLDERS"),
+        "ATLITE_DUMMY_DATA" : os.environ.get("ATLITE_DUMMY_DATA"),
+        "ATLITE_CAPACITY_FACTORS_FOLDERS" : os.environ.get("ATLITE_CAPACITY_FACTORS_FOLDERS"),
+        "DUMMY_START_DATE" : os.environ.get("DUMMY_START_DATE"),
+        "DUMMY_END_DATE" : os.environ.get("DUMMY_END_DATE"),
+        "DUMMY_LATITUDE_BOTTOM" : os.environ.get("DUMMY_LATITUDE_BOTTOM"),
+        "DUMMY_LATITUDE_TOP" : os.environ.get("DUMMY_LATITUDE_TOP"),
+        "DUMMY_LONGITUDE_LEFT" : os.environ.get("DUMMY_LONGITUDE_LEFT"),
+        "DUMMY_LONGITUDE_RIGHT" : os.environ.get("DUMMY_LONGITUDE_RIGHT"),
+        "MAXIMUM_CAPACITY" : os.environ.get("MAXIMUM_CAPACITY"),
+        "DATA_VARIABLE_NAME" : os.environ.get("DATA_VARIABLE_NAME"),
+        "TIME_VARIABLE_NAME" : os.environ.get("TIME_VARIABLE_NAME"),
+        "AVG_ATLITE_CAPACITY_FACTORS_FILE_LOCATION" : os.environ.get("AVG_ATLITE_CAPACITY_FACTORS_FILE_LOCATION"),
+        "AVG_ATLITE_LATITUDE_VARIABLE_NAME" : os.environ.get("AVG_ATLITE_LATITUDE_VARIABLE_NAME"),
+        "AVG_ATLITE_LONGITUDE_VARIABLE_NAME" : os.environ.get("AVG_ATLITE_LONGITUDE_VARIABLE_NAME"),
+        "REDUCED_WAD" : os.environ.get("REDUCED_WAD"),
+        "WIND_ATLAS_RESOLUTION_REDUCTION" : os.environ.get("WIND_ATLAS_RESOLUTION_REDUCTION"),
+        "WIND_ATLAS_CAPACITY_FACTORS_HEATMAP_FILE_LOCATION" : os.environ.get("WIND_ATLAS_CAPACITY_FACTORS_HEATMAP_FILE_LOCATION"),
+        "WIND_ATLAS_HEATMAP_LATITUDE_VARIABLE_NAME" : os.environ.get("WIND_ATLAS_HEATMAP_LATITUDE_VARIABLE_NAME"),
+        "WIND_ATLAS_HEATMAP_LONGITUDE_VARIABLE_NAME" : os.environ.get("WIND_ATLAS_HEATMAP_LONGITUDE_VARIABLE_NAME"),
+        "WIND_ATLAS_HEATMAP_DATA_VARIABLE_NAME" : os.environ.get("WIND_ATLAS_HEATMAP_DATA_VARIABLE_NAME"),
+        "OPTION_7_OUTPUT_FOLDER" : os.environ.get("OPTION_7_OUTPUT_FOLDER"),
+        "OPTION_7_CORRECTION_METHOD" : os.environ.get("OPTION_7_CORRECTION_METHOD"),
+        "OPTION_7_CORRECTED_CUBE_FILE" : os.environ.get("OPTION_7_CORRECTED_CUBE_FILE"),
+        "OPTION_7_CORRECTION_FACTORS_FILE" : os.environ.get("OPTION_7_CORRECTION_FACTORS_FILE"),
+        "OPTION_7_CORRECTION_TIME_CHUNK" : os.environ.get("OPTION_7_CORRECTION_TIME_CHUNK"),
+        "ATLITE_TIME_FREQUENCY" : os.environ.get("ATLITE_TIME_FREQUENCY"),
+        "TIME_WINDOW_START" : os.environ.get("TIME_WINDOW_START"),
+        "TIME_WINDOW_END" : os.environ.get("TIME_WINDOW_END"),
+        "TIME_WINDOW_MONTHS" : os.environ.get("TIME_WINDOW_MONTHS"),
+        "STAGE_TIMING_LOG_FILE" : os.environ.get("STAGE_TIMING_LOG_FILE"),
+        "ROI_BBOX" : os.environ.get("ROI_BBOX"),
+        "ROI_GEOMETRY_FILE" : os.environ.get("ROI_GEOMETRY_FILE"),
+        "ATLITE_CUBE_FILE" : os.environ.get("ATLITE_CUBE_FILE"),
+        "OPTION_7_CUBE_COMPRESSION" : os.environ.get("OPTION_7_CUBE_COMPRESSION"),
+        "OPTION_7_CUBE_CHUNK_LAYOUT" : os.environ.get("OPTION_7_CUBE_CHUNK_LAYOUT"),
+        "ATLITE_PREFETCH_DEPTH" : os.environ.get("ATLITE_PREFETCH_DEPTH"),
+        "ATLITE_FOLDER_MANIFESTS" : os.environ.get("ATLITE_FOLDER_MANIFESTS"),
+        "CHECKPOINT_FOLDER" : os.environ.get("CHECKPOINT_FOLDER"),
+        "RESUME" : os.environ.get("RESUME"),
+        "WIND_ATLAS_REDUCTION_METHOD" : os.environ.get("WIND_ATLAS_REDUCTION_METHOD"),
+        "WIND_ATLAS_REDUCTION_QUANTILE" : os.environ.get("WIND_ATLAS_REDUCTION_QUANTILE"),
+        "WIND_ATLAS_PYRAMID_FOLDER" : os.environ.get("WIND_ATLAS_PYRAMID_FOLDER"),
     }
     # if None in env_vars.values():
     #     # raise ValueError("One or more environment variables are not set in the .env file.")
@@ -59,39 +142,108 @@ def load_from_env():
 ################################################################
 # main codes:
 
-def wind_atlas_correction(WIND_ATLAS_CAPACITY_FACTORS_HEATMAP_FILE_LOCATION,ATLITE_CAPACITY_FACTORS_FOLDERS):
-    # 1. read in current timeseries
-    # 2. read in wind atlas data
-    # 3. do correction
-    # 4. save capacity factor timeseries
-    pass
+def wind_atlas_correction(ATLITE_DUMMY_DATA, ATLITE_CAPACITY_FACTORS_FOLDERS, DUMMY_START_DATE, DUMMY_END_DATE, DUMMY_LATITUDE_BOTTOM, DUMMY_LATITUDE_TOP, DUMMY_LONGITUDE_LEFT, DUMMY_LONGITUDE_RIGHT, MAXIMUM_CAPACITY, DATA_VARIABLE_NAME, TIME_VARIABLE_NAME, AVG_ATLITE_CAPACITY_FACTORS_FILE_LOCATION, AVG_ATLITE_LATITUDE_VARIABLE_NAME, AVG_ATLITE_LONGITUDE_VARIABLE_NAME, REDUCED_WAD, WIND_ATLAS_RESOLUTION_REDUCTION, WIND_ATLAS_CAPACITY_FACTORS_HEATMAP_FILE_LOCATION, WIND_ATLAS_HEATMAP_LATITUDE_VARIABLE_NAME, WIND_ATLAS_HEATMAP_LONGITUDE_VARIABLE_NAME, WIND_ATLAS_HEATMAP_DATA_VARIABLE_NAME, OPTION_7_OUTPUT_FOLDER, OPTION_7_CORRECTION_METHOD=None, OPTION_7_CORRECTED_CUBE_FILE=None, OPTION_7_CORRECTION_FACTORS_FILE=None, OPTION_7_CORRECTION_TIME_CHUNK=None, ATLITE_TIME_FREQUENCY=None, TIME_WINDOW_START=None, TIME_WINDOW_END=None, TIME_WINDOW_MONTHS=None, STAGE_TIMING_LOG_FILE=None, ROI_BBOX=None, ROI_GEOMETRY_FILE=None, ATLITE_CUBE_FILE=None, OPTION_7_CUBE_COMPRESSION=None, OPTION_7_CUBE_CHUNK_LAYOUT=None, ATLITE_PREFETCH_DEPTH=None, ATLITE_FOLDER_MANIFESTS=None, CHECKPOINT_FOLDER=None, RESUME=None, WIND_ATLAS_REDUCTION_METHOD=None, WIND_ATLAS_REDUCTION_QUANTILE=None, WIND_ATLAS_PYRAMID_FOLDER=None):
+    support_functions.check_configuration(locals())
+    # Code block where you want to suppress warnings
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+
+        correction_method = "scale" if OPTION_7_CORRECTION_METHOD is None or str(OPTION_7_CORRECTION_METHOD).strip() == "" else str(OPTION_7_CORRECTION_METHOD).strip().lower()
+        if correction_method not in ("scale", "quantile"):
+            raise ValueError("Unknown OPTION_7_CORRECTION_METHOD: " + str(OPTION_7_CORRECTION_METHOD) + ". Use scale or quantile.")
+        if OPTION_7_CORRECTED_CUBE_FILE is None or str(OPTION_7_CORRECTED_CUBE_FILE).strip() == "":
+            OPTION_7_CORRECTED_CUBE_FILE = "option_7_corrected_atlite_capacity_factors.nc"
+        if OPTION_7_CORRECTION_FACTORS_FILE is None or str(OPTION_7_CORRECTION_FACTORS_FILE).strip() == "":
+            OPTION_7_CORRECTION_FACTORS_FILE = "option_7_correction_factors.nc"
+        # the cube storage settings are checked before the long correction runs
+        support_functions.cube_encoding(OPTION_7_CUBE_COMPRESSION,support_functions.cube_chunk_sizes((1, 1, 1),OPTION_7_CUBE_CHUNK_LAYOUT))
+        if ATLITE_CUBE_FILE is not None and str(ATLITE_CUBE_FILE).strip() != "":
+            if os.path.abspath(os.path.join(OPTION_7_OUTPUT_FOLDER,OPTION_7_CORRECTED_CUBE_FILE)) in [os.path.abspath(cube_file) for cube_file in support_functions.atlite_cube_files(ATLITE_CUBE_FILE)]:
+                raise ValueError("OPTION_7_CORRECTED_CUBE_FILE would overwrite the ATLITE_CUBE_FILE it is corrected from, choose another file name or output folder.")
+
+        support_functions.start_stage_log("option_7",STAGE_TIMING_LOG_FILE)
+        support_functions.start_pipeline("option_7",locals(),CHECKPOINT_FOLDER,RESUME)
+
+        # 1. read in current timeseries, in time chunks of OPTION_7_CORRECTION_TIME_CHUNK so the cube is never loaded whole
+        atlite_capacity_factors, atlite_capacity_factors_avg = support_functions.create_average_capacity_factor_file_atlite(ATLITE_DUMMY_DATA, ATLITE_CAPACITY_FACTORS_FOLDERS,DUMMY_START_DATE,DUMMY_END_DATE,DUMMY_LATITUDE_BOTTOM,DUMMY_LATITUDE_TOP,DUMMY_LONGITUDE_LEFT,DUMMY_LONGITUDE_RIGHT,MAXIMUM_CAPACITY,DATA_VARIABLE_NAME,TIME_VARIABLE_NAME,AVG_ATLITE_CAPACITY_FACTORS_FILE_LOCATION,ATLITE_TIME_FREQUENCY=ATLITE_TIME_FREQUENCY,TIME_WINDOW_START=TIME_WINDOW_START,TIME_WINDOW_END=TIME_WINDOW_END,TIME_WINDOW_MONTHS=TIME_WINDOW_MONTHS,ROI_BBOX=ROI_BBOX,ROI_GEOMETRY_FILE=ROI_GEOMETRY_FILE,ATLITE_CUBE_FILE=ATLITE_CUBE_FILE,ATLITE_PREFETCH_DEPTH=ATLITE_PREFETCH_DEPTH,ATLITE_FOLDER_MANIFESTS=ATLITE_FOLDER_MANIFESTS,ATLITE_CHUNKS=support_functions.parse_correction_time_chunk(OPTION_7_CORRECTION_TIME_CHUNK))
+        atlite_lats = atlite_capacity_factors[AVG_ATLITE_LATITUDE_VARIABLE_NAME].values
+        atlite_lons = atlite_capacity_factors[AVG_ATLITE_LONGITUDE_VARIABLE_NAME].values
+        print("... Read atlite capacity factor data.")
+
+        # 2. read in wind atlas data
+        with support_functions.stage_span("read_wad") as span:
+            if REDUCED_WAD.lower() == "true":
+                latitude_wad,longitude_wad,all_data_wad = support_functions.read_wind_atlas_data_reduced(WIND_ATLAS_RESOLUTION_REDUCTION,WIND_ATLAS_CAPACITY_FACTORS_HEATMAP_FILE_LOCATION,WIND_ATLAS_HEATMAP_LATITUDE_VARIABLE_NAME,WIND_ATLAS_HEATMAP_LONGITUDE_VARIABLE_NAME,WIND_ATLAS_HEATMAP_DATA_VARIABLE_NAME,ROI_BBOX=ROI_BBOX,ROI_GEOMETRY_FILE=ROI_GEOMETRY_FILE,WIND_ATLAS_REDUCTION_METHOD=WIND_ATLAS_REDUCTION_METHOD,WIND_ATLAS_REDUCTION_QUANTILE=WIND_ATLAS_REDUCTION_QUANTILE,WIND_ATLAS_PYRAMID_FOLDER=WIND_ATLAS_PYRAMID_FOLDER)
+            else:
+                latitude_wad, longitude_wad, all_data_wad = support_functions.read_wind_atlas_data_full(WIND_ATLAS_CAPACITY_FACTORS_HEATMAP_FILE_LOCATION,WIND_ATLAS_HEATMAP_LATITUDE_VARIABLE_NAME,WIND_ATLAS_HEATMAP_LONGITUDE_VARIABLE_NAME,WIND_ATLAS_HEATMAP_DATA_VARIABLE_NAME,ROI_BBOX=ROI_BBOX,ROI_GEOMETRY_FILE=ROI_GEOMETRY_FILE)
+            span['items'] = int(all_data_wad.size)
+        print("... Read wind atlas data.")
+
+        # regrid the WAD long term mean onto the atlite grid once, area weighted
+        with support_functions.stage_span("regrid",int(all_data_wad.size)):
+            regrid_index, area_weights = support_functions.area_weighted_regrid_index(latitude_wad,longitude_wad,atlite_lats,atlite_lons)
+            wad_mean_regridded = support_functions.regrid_to_target_grid(all_data_wad.values,regrid_index,area_weights,(len(atlite_lats),len(atlite_lons)))
+        print("... Regridded wind atlas data onto the atlite grid, ",int(np.sum(~np.isnan(wad_mean_regridded)))," out of ",wad_mean_regridded.size," atlite cells covered.")
+
+        # 3. do correction
+        with support_functions.stage_span("quantile"):
+            atlite_mean = atlite_capacity_factors_avg.values
+            if correction_method == "quantile":
+                # map the atlite long term mean of each cell onto the WAD distribution at the same quantile
+                covered = ~np.isnan(wad_mean_regridded)
+                mapping_table = support_functions.quantile_mapping_table(np.where(covered, atlite_mean, np.nan),wad_mean_regridded)
+                target_mean = np.where(covered, np.interp(atlite_mean, mapping_table['atlite_mean'].values, mapping_table['wind_atlas_mean'].values), np.nan)
+            else:
+                mapping_table = None
+                target_mean = wad_mean_regridded
+            scale_factors = support_functions.correction_scale_factors(atlite_mean,target_mean)
+        print("... Computed ",correction_method," correction factors, range: ",float(np.min(scale_factors))," - ",float(np.max(scale_factors)))
+
+        # check if output directories are created
+        if not os.path.exists(OPTION_7_OUTPUT_FOLDER):
+            os.makedirs(OPTION_7_OUTPUT_FOLDER)
+
+        # save the correction so it can be inspected (and the quantile mapping table if used)
+        correction_factors = xr.Dataset(
+            {
+                "wind_atlas_mean_regridded": ([AVG_ATLITE_LATITUDE_VARIABLE_NAME, AVG_ATLITE_LONGITUDE_VARIABLE_NAME], wad_mean_regridded),
+                "atlite_mean": ([AVG_ATLITE_LATITUDE_VARIABLE_NAME, AVG_ATLITE_LONGITUDE_VARIABLE_NAME], atlite_mean),
+                "scale_factors": ([AVG_ATLITE_LATITUDE_VARIABLE_NAME, AVG_ATLITE_LONGITUDE_VARIABLE_NAME], scale_factors),
+            },
+            coords={AVG_ATLITE_LATITUDE_VARIABLE_NAME: atlite_lats, AVG_ATLITE_LONGITUDE_VARIABLE_NAME: atlite_lons},
+            attrs={"correction_method": correction_method},
+        )
+        with support_functions.stage_span("write",1):
+            correction_factors.to_netcdf(os.path.join(OPTION_7_OUTPUT_FOLDER,OPTION_7_CORRECTION_FACTORS_FILE))
+            if mapping_table is not None:
+                mapping_table.to_csv(os.path.join(OPTION_7_OUTPUT_FOLDER,os.path.splitext(OPTION_7_CORRECTION_FACTORS_FILE)[0]+"_quantile_mapping.csv"),index=False)
+
+        # 4. save capacity factor timeseries, corrected and written chunk by chunk
+        print("... Writing the corrected capacity factors.")
+        with support_functions.stage_span("write",1):
+            support_functions.write_corrected_cube(atlite_capacity_factors,scale_factors,os.path.join(OPTION_7_OUTPUT_FOLDER,OPTION_7_CORRECTED_CUBE_FILE),DATA_VARIABLE_NAME,TIME_VARIABLE_NAME,AVG_ATLITE_LATITUDE_VARIABLE_NAME,AVG_ATLITE_LONGITUDE_VARIABLE_NAME,OPTION_7_CORRECTION_TIME_CHUNK,CUBE_COMPRESSION=OPTION_7_CUBE_COMPRESSION,CUBE_CHUNK_LAYOUT=OPTION_7_CUBE_CHUNK_LAYOUT)
+        support_functions.finish_pipeline()
+
+        print("\n... Corrected capacity factor files created:")
+        print("...... Corrected atlite cube located in: "+OPTION_7_CORRECTED_CUBE_FILE)
+        print("...... Correction factors located in: "+OPTION_7_CORRECTION_FACTORS_FILE)
+        print("... Set ATLITE_CUBE_FILE to the corrected cube to use it in the other options.")
+
+        support_functions.print_stage_summary()
+        print("\nOption_7 completed successfully!")
 
 if __name__ == '__main__':
+    print("#########")
+    print("Option 7")
+    print("#########")
+
     # check args or load env file and run codes
-    try:
-        print("TRYING TO USE ARGUMENTS")
-        args = parse_arguments()
-        print("ARGUMENTS FOUND. USING ARGUMENTS")
-
-        # RUN CODES
-        wind_atlas_correction(**vars(args))
-    except Exception as e:
-        print("ARGUMENTS NOT FOUND: ",e)
-        try:
-            print("TRYING TO LOAD ENV FILE VARIABLES")
-            # Load variables from the .env file
-            args = load_from_env()
-            print("ENV FILE FOUND. USING ENV FILE")
-
-            # RUN CODES
-            wind_atlas_correction(**args)
-
-        except Exception as e:
-            print("ENV FILE NOT FOUND: ",e)
-            print("ERROR ... USER ARGS AND ENV FILE NOT FOUND, ABORTING!")
-            raise ValueError("COULD NOT FIND ARGS OR LOAD ENV FILE. USER ARGS OR ENV FILE MISSING.")
+    args = support_functions.script_arguments(parse_arguments(), load_from_env)
+
+    # RUN CODES
+    wind_atlas_correction(**args)
 
 
     # args example use:
-    # python Option_7_WAD_Atlite_correction_user_defined.py --WIND_ATLAS_DATA "path/to/WAD"  --ATLITE_DATA "path/to/Atlite/data"
+    # python Option_7_WAD_Atlite_correction_user_defined.py --ATLITE_DUMMY_DATA True --DUMMY_START_DATE  '2023-01-01' --DUMMY_END_DATE  '2024-01-01' --DUMMY_LATITUDE_BOTTOM  -32.0 --DUMMY_LATITUDE_TOP  -30.0 --DUMMY_LONGITUDE_LEFT  26.0 --DUMMY_LONGITUDE_RIGHT  28.0 --MAXIMUM_CAPACITY  50 --DATA_VARIABLE_NAME  capacity_factors --TIME_VARIABLE_NAME  time --AVG_ATLITE_CAPACITY_FACTORS_FILE_LOCATION  "assets/avg_atlite_capacity_factors.nc" --AVG_ATLITE_LATITUDE_VARIABLE_NAME  latitude --AVG_ATLITE_LONGITUDE_VARIABLE_NAME  longitude --REDUCED_WAD  True --WIND_ATLAS_RESOLUTION_REDUCTION  15 --WIND_ATLAS_CAPACITY_FACTORS_HEATMAP_FILE_LOCATION  "assets/wind_atlas_capacity_factors.nc" --WIND_ATLAS_HEATMAP_LATITUDE_VARIABLE_NAME  lat --WIND_ATLAS_HEATMAP_LONGITUDE_VARIABLE_NAME  lon --WIND_ATLAS_HEATMAP_DATA_VARIABLE_NAME  Band1 --OPTION_7_OUTPUT_FOLDER  "assets/option_7_output" --OPTION_7_CORRECTION_METHOD scale --OPTION_7_CORRECTED_CUBE_FILE "option_7_corrected_atlite_capacity_factors.nc" --OPTION_7_CORRECTION_FACTORS_FILE "option_7_correction_factors.nc" --OPTION_7_CORRECTION_TIME_CHUNK 744
 
@@ -3,35 +3,81 @@ Purpose: Support functions for generating tiers.
 
 Author: Kirodh Boodhraj
 """
+import io
 import os
+import glob
+import json
+import time
+import hashlib
+import contextlib
+from collections import OrderedDict
 import xarray as xr
 import numpy as np
 import pandas as pd
 from dotenv import load_dotenv
-import rasterio
-import folium
-
-from branca.colormap import linear
 
 
 # Load variables from the .env file
 load_dotenv()
 
 
+# names the tier scheduler settings had in older .env files (now TIER_DASK_SCHEDULER and TIER_DASK_NUM_WORKERS)
+OLD_DASK_SETTINGS = ('DASK_SCHEDULER', 'DASK_NUM_WORKERS')
+
+
+def drop_empty_dask_settings():
+    # dask reads every DASK_* environment variable as one of its settings when it is imported: the empty old settings
+    # (DASK_SCHEDULER= of an older .env file) would break every chunked computation. Other DASK_* variables are the user's
+    for name in OLD_DASK_SETTINGS:
+        if name in os.environ and os.environ[name].strip() == "":
+            del os.environ[name]
+
+
+drop_empty_dask_settings()
+
+
+def set_hdf5_plugin_path():
+    # HDF5 looks for its filter plugins (zstd, bzip2 and blosc compression of the netcdf cubes) when netCDF4 is loaded:
+    # point it to the plugins shipped with the netCDF4 package and with hdf5plugin (pip install hdf5plugin), unless
+    # HDF5_PLUGIN_PATH is already set. Only the package folders are looked up, nothing is imported
+    import importlib.util
+    if 'HDF5_PLUGIN_PATH' in os.environ:
+        return os.environ['HDF5_PLUGIN_PATH']
+    plugin_folders = []
+    for package in ('netCDF4', 'hdf5plugin'):
+        spec = importlib.util.find_spec(package)
+        if spec is not None and spec.submodule_search_locations:
+            plugin_folder = os.path.join(list(spec.submodule_search_locations)[0], 'plugins')
+            if os.path.isdir(plugin_folder) and any(name.endswith(('.so', '.dll', '.dylib')) for name in os.listdir(plugin_folder)):
+                plugin_folders.append(plugin_folder)
+    if plugin_folders:
+        os.environ['HDF5_PLUGIN_PATH'] = os.pathsep.join(plugin_folders)
+    return os.environ.get('HDF5_PLUGIN_PATH')
+
+
+set_hdf5_plugin_path()
+
+
 # Atlite data temporary data functions
 # Function to generate random data
 def generate_random_data(latitudes, longitudes,MAXIMUM_CAPACITY):
     maximum_capacity = MAXIMUM_CAPACITY # MW
     return np.random.rand(len(latitudes), len(longitudes)),maximum_capacity
 
-def create_temporary_atlite_dataset(DUMMY_START_DATE,DUMMY_END_DATE,DUMMY_LATITUDE_BOTTOM,DUMMY_LATITUDE_TOP,DUMMY_LONGITUDE_LEFT,DUMMY_LONGITUDE_RIGHT,MAXIMUM_CAPACITY,DATA_VARIABLE_NAME):
+def create_temporary_atlite_dataset(DUMMY_START_DATE,DUMMY_END_DATE,DUMMY_LATITUDE_BOTTOM,DUMMY_LATITUDE_TOP,DUMMY_LONGITUDE_LEFT,DUMMY_LONGITUDE_RIGHT,MAXIMUM_CAPACITY,DATA_VARIABLE_NAME,ATLITE_TIME_FREQUENCY=None,TIME_WINDOW_START=None,TIME_WINDOW_END=None,TIME_WINDOW_MONTHS=None,DUMMY_RESOLUTION=None):
     # Step 1: Create hourly date times in a Pandas series
-    hourly_date_times = pd.date_range(start=DUMMY_START_DATE, end=DUMMY_END_DATE, freq='H')
+    hourly_date_times = pd.date_range(start=DUMMY_START_DATE, end=DUMMY_END_DATE, freq=get_time_frequency(ATLITE_TIME_FREQUENCY))
+
+    # only generate the time steps inside the user time window (if any)
+    hourly_date_times = hourly_date_times[time_window_mask(hourly_date_times,TIME_WINDOW_START,TIME_WINDOW_END,TIME_WINDOW_MONTHS)]
+    if len(hourly_date_times) == 0:
+        raise ValueError("The time window does not overlap the dummy data dates. Check TIME_WINDOW_START, TIME_WINDOW_END and TIME_WINDOW_MONTHS.")
 
     """ temporary fix start """
-    # Step 2: Create equally spaced intervals of 0.1 degrees between latitudes and longitudes
-    latitude_intervals = np.arange(float(DUMMY_LATITUDE_BOTTOM), float(DUMMY_LATITUDE_TOP), 0.1)
-    longitude_intervals = np.arange(float(DUMMY_LONGITUDE_LEFT), float(DUMMY_LONGITUDE_RIGHT), 0.1)
+    # Step 2: Create equally spaced intervals of 0.1 degrees (or DUMMY_RESOLUTION) between latitudes and longitudes
+    resolution = float(DUMMY_RESOLUTION) if DUMMY_RESOLUTION is not None else 0.1
+    latitude_intervals = np.arange(float(DUMMY_LATITUDE_BOTTOM), float(DUMMY_LATITUDE_TOP), resolution)
+    longitude_intervals = np.arange(float(DUMMY_LONGITUDE_LEFT), float(DUMMY_LONGITUDE_RIGHT), resolution)
 
     # Step 3: Create an empty Xarray dataset
     atlite_capacity_factors = xr.Dataset(
@@ -58,48 +104,263 @@ def create_temporary_atlite_dataset(DUMMY_START_DATE,DUMMY_END_DATE,DUMMY_LATITU
     return atlite_capacity_factors
 
 
-def stitch_Atlite_data(ATLITE_CAPACITY_FACTORS_FOLDERS,DUMMY_START_DATE,DATA_VARIABLE_NAME):
+# synthetic input files (benchmarks): same layouts as the real Atlite csv folders, WAD netcdf and user geometries
+def write_temporary_atlite_csv_folders(atlite_capacity_factors,DATA_VARIABLE_NAME,OUTPUT_FOLDER,NUMBER_OF_FOLDERS=1):
+    # one csv per time step, longitudes in the first row, latitudes in the first column, then a blank (zero) row and
+    # column, as read by stitch_Atlite_data. The time steps are split over NUMBER_OF_FOLDERS folders
+    latitudes = atlite_capacity_factors['latitude'].values
+    longitudes = atlite_capacity_factors['longitude'].values
+    values = atlite_capacity_factors[DATA_VARIABLE_NAME].values
+    layout = np.zeros((len(latitudes) + 2, len(longitudes) + 2))
+    layout[0, 2:] = longitudes
+    layout[2:, 0] = latitudes
+
+    folders = []
+    for folder_number, time_steps in enumerate(np.array_split(np.arange(values.shape[0]), int(NUMBER_OF_FOLDERS))):
+        folder = os.path.join(OUTPUT_FOLDER, "atlite_folder_" + str(folder_number + 1))
+        os.makedirs(folder, exist_ok=True)
+        for file_number, time_step in enumerate(time_steps):
+            layout[2:, 2:] = values[time_step]
+            np.savetxt(os.path.join(folder, "capacity_factors_" + str(file_number + 1) + ".csv"), layout, delimiter=",", fmt="%.6g")
+        folders.append(folder)
+    return ",".join(folders)
+
+
+def create_temporary_wind_atlas_file(WIND_ATLAS_FILE,DUMMY_LATITUDE_BOTTOM,DUMMY_LATITUDE_TOP,DUMMY_LONGITUDE_LEFT,DUMMY_LONGITUDE_RIGHT,WIND_ATLAS_RESOLUTION,WIND_ATLAS_HEATMAP_LATITUDE_VARIABLE_NAME="lat",WIND_ATLAS_HEATMAP_LONGITUDE_VARIABLE_NAME="lon",WIND_ATLAS_HEATMAP_DATA_VARIABLE_NAME="Band1"):
+    # random long term capacity factor heatmap on a finer grid than the Atlite data, like the WAD netcdf
+    latitudes = np.arange(float(DUMMY_LATITUDE_BOTTOM), float(DUMMY_LATITUDE_TOP), float(WIND_ATLAS_RESOLUTION))
+    longitudes = np.arange(float(DUMMY_LONGITUDE_LEFT), float(DUMMY_LONGITUDE_RIGHT), float(WIND_ATLAS_RESOLUTION))
+    wind_atlas = xr.Dataset(
+        {WIND_ATLAS_HEATMAP_DATA_VARIABLE_NAME: ([WIND_ATLAS_HEATMAP_LATITUDE_VARIABLE_NAME, WIND_ATLAS_HEATMAP_LONGITUDE_VARIABLE_NAME], np.random.rand(len(latitudes), len(longitudes)).astype(np.float32))},
+        coords={WIND_ATLAS_HEATMAP_LATITUDE_VARIABLE_NAME: latitudes, WIND_ATLAS_HEATMAP_LONGITUDE_VARIABLE_NAME: longitudes},
+    )
+    wind_atlas.to_netcdf(WIND_ATLAS_FILE)
+    return WIND_ATLAS_FILE
+
+
+def create_temporary_geometry_file(GEOJSON_FILE,DUMMY_LATITUDE_BOTTOM,DUMMY_LATITUDE_TOP,DUMMY_LONGITUDE_LEFT,DUMMY_LONGITUDE_RIGHT,NUMBER_OF_GEOMETRIES,POLYGON_SIZE=0.5):
+    # random inventory of points and square polygons (every third geometry is a point) inside the bounds, as GeoJSON
+    features = []
+    for geometry_number in range(int(NUMBER_OF_GEOMETRIES)):
+        longitude = np.random.uniform(float(DUMMY_LONGITUDE_LEFT), float(DUMMY_LONGITUDE_RIGHT) - float(POLYGON_SIZE))
+        latitude = np.random.uniform(float(DUMMY_LATITUDE_BOTTOM), float(DUMMY_LATITUDE_TOP) - float(POLYGON_SIZE))
+        if geometry_number % 3 == 2:
+            geometry = {"type": "Point", "coordinates": [longitude, latitude]}
+        else:
+            size = float(POLYGON_SIZE) * np.random.uniform(0.5, 1.0)
+            corners = [[longitude, latitude], [longitude + size, latitude], [longitude + size, latitude + size], [longitude, latitude + size], [longitude, latitude]]
+            geometry = {"type": "Polygon", "coordinates": [corners]}
+        features.append({"type": "Feature", "properties": {}, "geometry": geometry})
+    with open(GEOJSON_FILE, "w") as geojson_file:
+        json.dump({"type": "FeatureCollection", "features": features}, geojson_file)
+    return GEOJSON_FILE
+
+
+# Atlite time axis functions
+def get_time_frequency(ATLITE_TIME_FREQUENCY):
+    # Atlite writes one file per time step, hourly unless the user says otherwise
+    if ATLITE_TIME_FREQUENCY is None or str(ATLITE_TIME_FREQUENCY).strip() == "":
+        return 'h'
+    return str(ATLITE_TIME_FREQUENCY).strip()
+
+
+def parse_time_window_months(TIME_WINDOW_MONTHS):
+    # accepts month numbers "6,7,8" or season names "DJF,MAM" (or a mix), returns a sorted list of month numbers
+    seasons = {"DJF": [12, 1, 2], "MAM": [3, 4, 5], "JJA": [6, 7, 8], "SON": [9, 10, 11]}
+    if TIME_WINDOW_MONTHS is None or str(TIME_WINDOW_MONTHS).strip() == "":
+        return None
+
+    months = set()
+    for entry in str(TIME_WINDOW_MONTHS).split(','):
+        entry = entry.strip().upper()
+        if entry == "":
+            continue
+        if entry in seasons:
+            months.update(seasons[entry])
+        else:
+            try:
+                month = int(entry)
+            except ValueError:
+                raise ValueError("Unknown month or season in TIME_WINDOW_MONTHS: " + entry + ". Use month numbers 1-12 or DJF, MAM, JJA, SON.")
+            if month < 1 or month > 12:
+                raise ValueError("Month in TIME_WINDOW_MONTHS must be between 1 and 12, got: " + entry)
+            months.add(month)
+    return sorted(months)
+
+
+def time_window_mask(time_index,TIME_WINDOW_START,TIME_WINDOW_END,TIME_WINDOW_MONTHS):
+    # boolean array of the time steps to keep, the start date is inclusive and the end date is exclusive
+    keep = np.ones(len(time_index), dtype=bool)
+    if TIME_WINDOW_START is not None and str(TIME_WINDOW_START).strip() != "":
+        keep &= np.asarray(time_index >= pd.Timestamp(TIME_WINDOW_START))
+    if TIME_WINDOW_END is not None and str(TIME_WINDOW_END).strip() != "":
+        keep &= np.asarray(time_index < pd.Timestamp(TIME_WINDOW_END))
+    months = parse_time_window_months(TIME_WINDOW_MONTHS)
+    if months is not None:
+        keep &= np.isin(time_index.month, months)
+    return keep
+
+
+# Region of interest functions
+def region_of_interest(ROI_BBOX=None,ROI_GEOMETRY_FILE=None):
+    # (latitude bottom, latitude top, longitude left, longitude right) of the region to read, from a bounding box string
+    # "bottom,top,left,right" and/or the bounds of all the geometries in a GeoJSON file (both given: their overlap).
+    # None when no region is set, then the whole domain is read
+    bounds = []
+    if ROI_BBOX is not None and str(ROI_BBOX).strip() != "":
+        try:
+            bbox = [float(value) for value in str(ROI_BBOX).split(',')]
+        except ValueError:
+            raise ValueError("ROI_BBOX must be four numbers: latitude bottom, latitude top, longitude left, longitude right, got: " + str(ROI_BBOX))
+        if len(bbox) != 4 or bbox[0] >= bbox[1] or bbox[2] >= bbox[3]:
+            raise ValueError("ROI_BBOX must be four numbers: latitude bottom, latitude top, longitude left, longitude right, got: " + str(ROI_BBOX))
+        bounds.append(bbox)
+    if ROI_GEOMETRY_FILE is not None and str(ROI_GEOMETRY_FILE).strip() != "":
+        from shapely.geometry import shape
+        if not os.path.isfile(str(ROI_GEOMETRY_FILE).strip()):
+            raise ValueError("ROI geometry file does not exist: " + str(ROI_GEOMETRY_FILE))
+        with open(str(ROI_GEOMETRY_FILE).strip()) as geojson_file:
+            geojson = json.load(geojson_file)
+        features = geojson['features'] if geojson.get('type') == 'FeatureCollection' else [geojson]
+        geometry_bounds = np.array([shape(feature.get('geometry', feature)).bounds for feature in features])
+        bounds.append([geometry_bounds[:, 1].min(), geometry_bounds[:, 3].max(), geometry_bounds[:, 0].min(), geometry_bounds[:, 2].max()])
+    if len(bounds) == 0:
+        return None
+    bounds = np.array(bounds, dtype=float)
+    region = (bounds[:, 0].max(), bounds[:, 1].min(), bounds[:, 2].max(), bounds[:, 3].min())
+    if region[0] > region[1] or region[2] > region[3]:
+        raise ValueError("ROI_BBOX and ROI_GEOMETRY_FILE do not overlap.")
+    return region
+
+
+def region_index_slice(coordinates,bottom,top):
+    # index slice of the (ascending or descending) coordinates between bottom and top, padded with one cell on both
+    # sides so the nearest cell of a point on the edge of the region is still kept
+    coordinates = np.asarray(coordinates, dtype=float)
+    inside = np.flatnonzero((coordinates >= bottom) & (coordinates <= top))
+    if len(inside) == 0:
+        # region smaller than a cell: keep the nearest cell
+        inside = np.array([np.abs(coordinates - (bottom + top) / 2).argmin()])
+    return slice(max(int(inside.min()) - 1, 0), min(int(inside.max()) + 2, len(coordinates)))
+
+
+def subset_region_of_interest(dataset,region,latitude_name='latitude',longitude_name='longitude'):
+    # cut a (lazily opened) dataset down to the region of interest before its values are read
+    if region is None:
+        return dataset
+    latitude_slice = region_index_slice(dataset[latitude_name].values,region[0],region[1])
+    longitude_slice = region_index_slice(dataset[longitude_name].values,region[2],region[3])
+    subset = dataset.isel({latitude_name: latitude_slice, longitude_name: longitude_slice})
+    print("... Region of interest selected ",subset.sizes[latitude_name]*subset.sizes[longitude_name]," out of ",dataset.sizes[latitude_name]*dataset.sizes[longitude_name]," grid cells.")
+    return subset
+
+
+def stitch_Atlite_data(ATLITE_CAPACITY_FACTORS_FOLDERS,DUMMY_START_DATE,DATA_VARIABLE_NAME,ATLITE_TIME_FREQUENCY=None,TIME_WINDOW_START=None,TIME_WINDOW_END=None,TIME_WINDOW_MONTHS=None,region=None,ATLITE_PREFETCH_DEPTH=None,ATLITE_FOLDER_MANIFESTS=None):
     # Split the folder string by commas to get individual folder paths
     folders = ATLITE_CAPACITY_FACTORS_FOLDERS.split(',')
+    prefetch_depth = parse_prefetch_depth(ATLITE_PREFETCH_DEPTH)
+    use_manifests = str(ATLITE_FOLDER_MANIFESTS).strip().lower() == 'true'
 
     # # Create an empty list to store all data arrays before stitchingthem together in xarray
     data_array = []
 
-    def sort_filenames(filename):
-        # Extract the numerical part of the filename, because it sorts 0, 1, 10, 100 etc. but we want 1, 2, 3, 4 ...
-        return int(filename.split('_')[-1].split('.')[0])
+    # the folder manifests and their file sizes, to plan the read ahead
+    folder_manifests = {}
+    manifest_file_sizes = {}
+
+    def list_csv_files(folder):
+        # Get all CSV files in the folder, sorted numerically (from the folder manifest while the folder is unchanged)
+        if use_manifests:
+            manifest = atlite_folder_manifest(folder)
+            check_atlite_manifest(manifest)
+            folder_manifests[folder] = manifest
+            manifest_file_sizes.update({os.path.join(folder, entry['name']): entry['size'] for entry in manifest['files']})
+            csv_files = [entry['name'] for entry in manifest['files']]
+        else:
+            csv_files = [file for file in os.listdir(folder) if file.endswith('.csv')]
+            csv_files.sort(key=atlite_file_number)
+        # a missing hour would shift the time stamps of all the later files
+        check_atlite_file_numbers(folder, [atlite_file_number(csv_file) for csv_file in csv_files])
+        return csv_files
+
+    # List the files of all folders first, each file is one time step, so the time axis is known before reading any data
+    # (with prefetching the folders are listed at the same time, a listing is a round trip on a network drive)
+    if prefetch_depth > 0 and len(folders) > 1:
+        from concurrent.futures import ThreadPoolExecutor
+        with ThreadPoolExecutor(max_workers=min(prefetch_depth, len(folders))) as listers:
+            folder_csv_files = list(listers.map(list_csv_files, folders))
+    else:
+        folder_csv_files = [list_csv_files(folder) for folder in folders]
+    for folder in folders:
+        if folder in folder_manifests:
+            print("... Folder manifest: " + str(len(folder_manifests[folder]['files'])) + " files, " + str(round(folder_manifests[folder]['total_bytes'] / 1e6, 1)) + " MB in " + folder_manifests[folder]['folder'])
+
+    # Build the calendar time axis from the start date and the time step frequency
+    number_of_time_steps = sum(len(csv_files) for csv_files in folder_csv_files)
+    time_index = pd.date_range(start=DUMMY_START_DATE, periods=number_of_time_steps, freq=get_time_frequency(ATLITE_TIME_FREQUENCY))
+
+    # Only read in the files inside the user time window
+    keep = time_window_mask(time_index,TIME_WINDOW_START,TIME_WINDOW_END,TIME_WINDOW_MONTHS)
+    if not keep.any():
+        raise ValueError("No Atlite files fall inside the time window. Check TIME_WINDOW_START, TIME_WINDOW_END and TIME_WINDOW_MONTHS.")
+    if not keep.all():
+        print("... Time window selected ",int(keep.sum())," out of ",len(keep)," time steps.")
 
-    # Iterate through each folder
-    for index,folder in enumerate(folders):
-        print("... Busy reading files of folder ",index+1, " out of ",len(folders))
-        # Get all CSV files in the folder
-        csv_files = [file for file in os.listdir(folder) if file.endswith('.csv')]
+    # Read the grid from the first file, all files share it. Extract longitude from the first row and latitude from the first column
+    ## Notes:
+    # - remove the first two values from the data as it is the header and there is a blank line od nan or 0's in the second row and column,
+    # - and type cast all to float because the header makes it all strings and not numbers
+    first_file = os.path.join(folders[0], folder_csv_files[0][0])
+    lon = [float(x) for x in pd.read_csv(first_file, header=None, nrows=1).values[0][2:]]
+    lat = [float(x) for x in pd.read_csv(first_file, header=None, usecols=[0]).values[2:, 0]]
 
-        # Sort CSV files numerically
-        csv_files.sort(key=sort_filenames)
+    # Only parse the rows and columns inside the region of interest (all of them if no region is set)
+    latitude_slice = slice(0, len(lat)) if region is None else region_index_slice(lat,region[0],region[1])
+    longitude_slice = slice(0, len(lon)) if region is None else region_index_slice(lon,region[2],region[3])
+    if region is not None:
+        print("... Region of interest selected ",(latitude_slice.stop-latitude_slice.start)*(longitude_slice.stop-longitude_slice.start)," out of ",len(lat)*len(lon)," grid cells.")
+    lat = lat[latitude_slice]
+    lon = lon[longitude_slice]
+    # skip the header row, the blank row and the rows above the region, only read the columns of the region
+    skip_rows = 2 + latitude_slice.start
+    columns = list(range(2 + longitude_slice.start, 2 + longitude_slice.stop))
 
-        # Iterate through each CSV file
+    # The files to read in time order (skip files outside the time window), with the folder number of each file
+    csv_paths = []
+    csv_folder_numbers = []
+    position = 0
+    for index,(folder,csv_files) in enumerate(zip(folders,folder_csv_files)):
         for csv_file in csv_files:
-            # Read CSV file into a pandas DataFrame
-            df = pd.read_csv(os.path.join(folder, csv_file), header=None)
-            # print(df)
-
-            # Extract longitude from the first row and latitude from the first column
-            ## Notes:
-            # - get the first row, then get values otherwise same name as dimension error,
-            # - remove the first two values from the data as it is the header and there is a blank line od nan or 0's in the second row and column,
-            # - and type cast all to float because the header makes it all strings and not numbers
-            lon = [float(x) for x in df.iloc[0,:].values[2:]]
-            lat = [float(x) for x in df.iloc[:,0].values[2:]]
-            # print(lon, lat)
-            # 1/0
-
-            # Remove the first two rows and columns (latitude and longitude) and (empty lines for data second row and column)
-            df = df.iloc[2:, 2:]
-            # get the remaining values
-            data_slice = df.values
-            # append to list before pulling all values together
-            data_array.append(data_slice)
+            position += 1
+            if keep[position-1]:
+                csv_paths.append(os.path.join(folder, csv_file))
+                csv_folder_numbers.append(index)
+
+    def read_data_block(csv_source):
+        # Read the data block of the CSV file into a pandas DataFrame, without the header rows and columns, and get the values
+        return pd.read_csv(csv_source, header=None, skiprows=skip_rows, nrows=len(lat), usecols=columns).values
+
+    if prefetch_depth > 0:
+        if manifest_file_sizes:
+            # the largest files to read bound the memory held by the files in flight
+            in_flight_bytes = sum(sorted((manifest_file_sizes[csv_path] for csv_path in csv_paths), reverse=True)[:prefetch_depth])
+            print("... Reading ahead up to ",prefetch_depth," files, at most ",round(in_flight_bytes / 1e6, 1)," MB in flight, ",round(sum(manifest_file_sizes[csv_path] for csv_path in csv_paths) / 1e6, 1)," MB to read.")
+        else:
+            print("... Reading ahead up to ",prefetch_depth," files.")
+        data_slices = prefetched_files(csv_paths, lambda raw_bytes: read_data_block(io.BytesIO(raw_bytes)), prefetch_depth)
+    else:
+        data_slices = (read_data_block(csv_path) for csv_path in csv_paths)
+
+    # Iterate through each CSV file
+    report_progress = progress_reporter(len(csv_paths),"Files read")
+    folder_number = None
+    for index,data_slice in zip(csv_folder_numbers,data_slices):
+        if index != folder_number:
+            folder_number = index
+            print("... Busy reading files of folder ",index+1, " out of ",len(folders))
+        # append to list before pulling all values together
+        data_array.append(data_slice)
+        report_progress(len(data_array))
 
 
     # Concatenate the list of arrays along a new axis
@@ -113,7 +374,7 @@ def stitch_Atlite_data(ATLITE_CAPACITY_FACTORS_FOLDERS,DUMMY_START_DATE,DATA_VAR
             DATA_VARIABLE_NAME: (["time", "latitude", "longitude"], np.transpose(concatenated_data, (2, 0, 1))),
         },
         coords={
-            "time": range(0, len(concatenated_data[0,0,:])),
+            "time": time_index[keep],
             "latitude": lat,
             "longitude": lon,
         },
@@ -124,32 +385,531 @@ def stitch_Atlite_data(ATLITE_CAPACITY_FACTORS_FOLDERS,DUMMY_START_DATE,DATA_VAR
 
     return Atlite_data
 
+# Read ahead of the Atlite csv files: on a network drive (NFS, SMB) a plain read loop mostly waits for the round trip of
+# every file. With ATLITE_PREFETCH_DEPTH threads read the raw bytes of the next files (also of the next folders) while
+# ATLITE_PARSE_WORKERS threads parse the files already read, at most ATLITE_PREFETCH_DEPTH files are in flight
+ATLITE_PARSE_WORKERS = min(2, os.cpu_count() or 1)
+
+
+def parse_prefetch_depth(ATLITE_PREFETCH_DEPTH):
+    # number of files read ahead, 0 (the default) reads the files one after the other
+    if ATLITE_PREFETCH_DEPTH is None or str(ATLITE_PREFETCH_DEPTH).strip() == "":
+        return 0
+    try:
+        prefetch_depth = int(ATLITE_PREFETCH_DEPTH)
+    except ValueError:
+        raise ValueError("ATLITE_PREFETCH_DEPTH must be a whole number of files to read ahead, got: " + str(ATLITE_PREFETCH_DEPTH))
+    if prefetch_depth < 0:
+        raise ValueError("ATLITE_PREFETCH_DEPTH can't be negative, got: " + str(ATLITE_PREFETCH_DEPTH))
+    return prefetch_depth
+
+
+def prefetched_files(paths, parse, prefetch_depth):
+    # parse(raw bytes) of every file, yielded in the order of the paths
+    from collections import deque
+    from concurrent.futures import ThreadPoolExecutor
+
+    def read_bytes(path):
+        with open(path, 'rb') as file:
+            return file.read()
+
+    in_flight = deque()
+    with ThreadPoolExecutor(max_workers=prefetch_depth) as readers, ThreadPoolExecutor(max_workers=ATLITE_PARSE_WORKERS) as parsers:
+        try:
+            for path in paths:
+                # the parse of a file waits for its read, the parses are queued in file order so none waits on a later read
+                read = readers.submit(read_bytes, path)
+                in_flight.append(parsers.submit(lambda read=read: parse(read.result())))
+                if len(in_flight) >= prefetch_depth:
+                    yield in_flight.popleft().result()
+            while in_flight:
+                yield in_flight.popleft().result()
+        finally:
+            # on an error (or when the reader is closed early) the files not started yet are not read anymore
+            for parsed in in_flight:
+                parsed.cancel()
+
+
+# Folder manifests (ATLITE_FOLDER_MANIFESTS): every Atlite csv folder gets a JSON file with its csv files in time order,
+# their sizes, modification times and a hash of their header row (the longitudes of the grid). While the modification
+# time of the folder is unchanged (no file added, removed or renamed) the manifest is used instead of listing and
+# sorting the folder again. A file rewritten in place keeps the folder time, delete the manifest to rebuild it then
+ATLITE_MANIFEST_FILE_NAME = "atlite_folder_manifest.json"
+ATLITE_MANIFEST_VERSION = 1
+
+
+def atlite_file_number(filename):
+    # Extract the numerical part of the filename, because it sorts 0, 1, 10, 100 etc. but we want 1, 2, 3, 4 ...
+    return int(filename.split('_')[-1].split('.')[0])
+
+
+def check_atlite_file_numbers(folder, file_numbers):
+    # the numbers of the csv files of a folder must run on without gaps or doubles, each file is one time step
+    if len(file_numbers) == 0:
+        raise ValueError("No Atlite csv files found in folder: " + str(folder))
+    expected = np.arange(file_numbers[0], file_numbers[0] + len(file_numbers))
+    if not np.array_equal(np.asarray(file_numbers), expected):
+        present = set(file_numbers)
+        missing = [int(number) for number in range(file_numbers[0], file_numbers[-1] + 1) if number not in present]
+        doubles = sorted(set(number for number in file_numbers if file_numbers.count(number) > 1))
+        raise ValueError("The Atlite csv files of folder " + str(folder) + " do not run on from " + str(file_numbers[0]) + " to " + str(file_numbers[-1]) + ", missing file numbers: " + str(missing[:20]) + (" ..." if len(missing) > 20 else "") + ", double file numbers: " + str(doubles[:20]) + ". Every file is one time step, so the time axis would be shifted.")
+
+
+def atlite_folder_manifest(folder):
+    # the folder manifest, rebuilt (and saved in the folder) when the folder changed since it was written
+    manifest_file = os.path.join(folder, ATLITE_MANIFEST_FILE_NAME)
+    folder_time = os.stat(folder).st_mtime_ns
+    if os.path.isfile(manifest_file):
+        try:
+            with open(manifest_file) as json_file:
+                manifest = json.load(json_file)
+            if manifest.get('version') == ATLITE_MANIFEST_VERSION and manifest.get('folder_mtime_ns') == folder_time:
+                return manifest
+        except (OSError, ValueError):
+            pass
+        print("... Folder changed since its manifest was written, rebuilding the manifest of: " + str(folder))
+
+    files = []
+    with os.scandir(folder) as entries:
+        for entry in entries:
+            if not entry.name.endswith('.csv'):
+                continue
+            entry_stat = entry.stat()
+            with open(entry.path, 'rb') as csv_file:
+                header_hash = hashlib.blake2b(csv_file.readline(), digest_size=8).hexdigest()
+            files.append({'name': entry.name, 'number': atlite_file_number(entry.name), 'size': entry_stat.st_size, 'mtime_ns': entry_stat.st_mtime_ns, 'header_hash': header_hash})
+    files.sort(key=lambda file_entry: file_entry['number'])
+    manifest = {'version': ATLITE_MANIFEST_VERSION, 'folder': os.path.abspath(folder), 'folder_mtime_ns': folder_time, 'total_bytes': sum(file_entry['size'] for file_entry in files), 'files': files}
+
+    try:
+        # writing the manifest the first time adds it to the folder (a new folder time), writing it again in place does not
+        for _ in range(2):
+            with open(manifest_file, 'w') as json_file:
+                json.dump(manifest, json_file)
+            manifest['folder_mtime_ns'] = os.stat(folder).st_mtime_ns
+    except OSError as e:
+        print("... Could not save the manifest of folder " + str(folder) + " (" + str(e) + "), it is only used for this run.")
+    return manifest
+
+
+def check_atlite_manifest(manifest):
+    # empty files and files of another grid (a different header row) show up in the manifest without reading the data
+    empty_files = [file_entry['name'] for file_entry in manifest['files'] if file_entry['size'] == 0]
+    if empty_files:
+        raise ValueError("Empty Atlite csv files in folder " + manifest['folder'] + ": " + ", ".join(empty_files[:20]))
+    header_hashes = [file_entry['header_hash'] for file_entry in manifest['files']]
+    if len(set(header_hashes)) > 1:
+        grid_hash = max(set(header_hashes), key=header_hashes.count)
+        other_grid = [file_entry['name'] for file_entry in manifest['files'] if file_entry['header_hash'] != grid_hash]
+        raise ValueError("Atlite csv files with a different grid (header row) in folder " + manifest['folder'] + ": " + ", ".join(other_grid[:20]))
+
+
+def tier_time_index(atlite_capacity_factors,TIME_VARIABLE_NAME):
+    # datetime index for the tier files, so the tiers keep the calendar information of the atlite data
+    return pd.Index(pd.to_datetime(atlite_capacity_factors[TIME_VARIABLE_NAME].values), name=TIME_VARIABLE_NAME)
+
+
+# Chunked (out-of-core) processing: with ATLITE_CHUNKS the Atlite data is held as dask chunks of time steps, a cube file
+# is then opened lazily, and the tier reductions run chunk by chunk on the TIER_DASK_SCHEDULER, so only the chunks being
+# worked on and the tier series are held in memory. dask is only imported when chunking is switched on
+def parse_atlite_chunks(ATLITE_CHUNKS):
+    # number of time steps per chunk, "auto" lets dask choose, None when the data is held in memory as one array
+    if ATLITE_CHUNKS is None or str(ATLITE_CHUNKS).strip() == "":
+        return None
+    if str(ATLITE_CHUNKS).strip().lower() == "auto":
+        return "auto"
+    try:
+        time_steps = int(ATLITE_CHUNKS)
+    except ValueError:
+        raise ValueError("ATLITE_CHUNKS must be a number of time steps per chunk or auto, got: " + str(ATLITE_CHUNKS))
+    if time_steps < 1:
+        raise ValueError("ATLITE_CHUNKS must be at least 1 time step, got: " + str(ATLITE_CHUNKS))
+    return time_steps
+
+
+# distributed client of the process, kept so later runs (batch runner) with the same scheduler reuse the cluster
+dask_client = {'scheduler': None, 'client': None}
+
+
+def set_dask_scheduler(TIER_DASK_SCHEDULER=None,TIER_DASK_NUM_WORKERS=None):
+    # scheduler of all the chunked computations of the run: threads (default, all cores), processes or synchronous on
+    # this machine, local for a dask distributed LocalCluster, or the address of a running dask distributed scheduler
+    if (TIER_DASK_SCHEDULER is None or str(TIER_DASK_SCHEDULER).strip() == "") and (TIER_DASK_NUM_WORKERS is None or str(TIER_DASK_NUM_WORKERS).strip() == ""):
+        return
+    try:
+        import dask
+    except ImportError:
+        raise ValueError("TIER_DASK_SCHEDULER and ATLITE_CHUNKS need dask, install it with: pip install dask")
+    scheduler = str(TIER_DASK_SCHEDULER).strip() if TIER_DASK_SCHEDULER is not None and str(TIER_DASK_SCHEDULER).strip() != "" else "threads"
+    if scheduler.lower() == "local" or "://" in scheduler:
+        start_dask_client(scheduler,TIER_DASK_NUM_WORKERS)
+        return
+    scheduler = scheduler.lower()
+    if scheduler not in ("threads", "processes", "synchronous"):
+        raise ValueError("TIER_DASK_SCHEDULER must be threads, processes, synchronous, local or a scheduler address (e.g. tcp://10.0.0.1:8786), got: " + str(TIER_DASK_SCHEDULER))
+    settings = {"scheduler": scheduler}
+    if TIER_DASK_NUM_WORKERS is not None and str(TIER_DASK_NUM_WORKERS).strip() != "":
+        settings["num_workers"] = int(TIER_DASK_NUM_WORKERS)
+    dask.config.set(settings)
+    print("... Chunked computations run on the dask", scheduler, "scheduler" + (" with " + str(settings["num_workers"]) + " workers." if "num_workers" in settings else "."))
+
+
+def start_dask_client(TIER_DASK_SCHEDULER,TIER_DASK_NUM_WORKERS=None):
+    # dask distributed client, the time chunks are then reduced on the workers of the cluster and only the (time, tiers)
+    # blocks are sent back. local starts a LocalCluster of worker processes on this machine (TIER_DASK_NUM_WORKERS of them),
+    # an address connects to a scheduler whose workers can be on other nodes: they must see the ATLITE_CUBE_FILE (and
+    # these codes) under the same paths, e.g. on a shared file system
+    import dask
+    try:
+        from dask.distributed import Client, LocalCluster
+    except ImportError:
+        raise ValueError("TIER_DASK_SCHEDULER " + str(TIER_DASK_SCHEDULER) + " needs dask distributed, install it with: pip install distributed")
+    scheduler = (str(TIER_DASK_SCHEDULER).strip(), TIER_DASK_NUM_WORKERS)
+    if dask_client['client'] is not None and dask_client['scheduler'] == scheduler:
+        dask.config.set(scheduler="dask.distributed")
+        print("... Chunked computations run on the dask distributed cluster already started.")
+        return dask_client['client']
+    if dask_client['client'] is not None:
+        dask_client['client'].close()
+
+    if scheduler[0].lower() == "local":
+        number_of_workers = int(TIER_DASK_NUM_WORKERS) if TIER_DASK_NUM_WORKERS is not None and str(TIER_DASK_NUM_WORKERS).strip() != "" else None
+        client = Client(LocalCluster(n_workers=number_of_workers, dashboard_address=None))
+    else:
+        client = Client(scheduler[0])
+    dask_client['scheduler'] = scheduler
+    dask_client['client'] = client
+    print("... Chunked computations run on the dask distributed cluster at", client.scheduler.address, "with", len(client.scheduler_info()['workers']), "workers.")
+    return client
+
+
+def is_chunked(values):
+    # True for a dask array (lazy chunks), False for an in memory numpy array
+    return hasattr(values, '__dask_graph__') and values.__dask_graph__() is not None
+
+
+def reduce_time_chunks(block_function,full_values,number_of_columns):
+    # applies block_function to (time, lat, lon) or (time, cell) blocks of full_values, each returning a
+    # (time, number_of_columns) block, and puts the blocks back together along time. A numpy array is one block, a dask
+    # array is done chunk by chunk
+    if not is_chunked(full_values):
+        return block_function(np.asarray(full_values))
+    # whole lat/lon planes (all cells) per chunk, the chunks only split the time axis
+    full_values = full_values.rechunk({axis: -1 for axis in range(1, full_values.ndim)})
+    return full_values.map_blocks(block_function, drop_axis=list(range(2, full_values.ndim)), chunks=(full_values.chunks[0], (number_of_columns,)), dtype=float).compute()
+
+
+def gather_cell_series(full_values,flat_cell_index):
+    # (time, cells) series of the grid cells at the flat (lat, lon) indices, without reading the other cells into memory
+    # full_values can also be land cells (tier_values), the cells that are not kept are missing (NaN)
+    values, columns = cell_columns(full_values,np.asarray(flat_cell_index, dtype=int).ravel())
+
+    def gather_block(block):
+        return select_columns(block,columns)
+
+    # column (cell) major like the numpy fancy index, so later row reductions add up in the same order either way
+    return np.asfortranarray(reduce_time_chunks(gather_block,values,len(columns)))
+
+
+def weighted_cell_sums(full_values,weights):
+    # (time, N) sums of the cell series weighted by the (N, grid cells) weights, one matrix product per block over the
+    # cells that have a weight. A missing value in a weighted cell makes that sum missing, same as adding the series up
+    # one by one
+    used_cells = weights.any(axis=0)
+    weights = weights[:, used_cells].astype(float)
+    values, columns = cell_columns(full_values,np.flatnonzero(used_cells))
+
+    def sum_block(block):
+        series = select_columns(block,columns)
+        missing = np.isnan(series)
+        sums = np.where(missing, 0.0, series) @ weights.T
+        sums[(missing.astype(float) @ weights.T) > 0] = np.nan
+        return sums
+
+    return reduce_time_chunks(sum_block,values,weights.shape[0])
+
+
+# Land cell functions: most of the bounding box of a national cube is sea or outside the border, cells without any
+# capacity factor (NaN average). The land cells form of the cube keeps only the cells with a valid average as a
+# (time, cell) matrix and a table of their latitude and longitude index, so the memory and the tier reductions scale
+# with the land area. The reductions take both forms, they are told apart by the cell dimension
+LAND_CELL_DIMENSION = 'cell'
+# time steps (a week of hours) copied at a time from a cube in memory, and the time chunks a cube file is read in for
+# the land cells
+LAND_CELL_TIME_BLOCK = 168
+
+
+def land_cell_series(full_values,land_cells):
+    # (time, cell) series of the flat (lat, lon) land cells. A chunked (dask) cube stays lazy: the cells are picked out
+    # of every time chunk as it is read, the whole cube is never in memory. A cube in memory is copied
+    # LAND_CELL_TIME_BLOCK time steps at a time straight into the (time, cell) matrix, without other copies of it
+    if is_chunked(full_values):
+        full_values = full_values.rechunk({1: -1, 2: -1})
+        return full_values.reshape(full_values.shape[0], -1)[:, land_cells]
+    series = np.empty((full_values.shape[0], len(land_cells)), dtype=full_values.dtype)
+    for start in range(0, full_values.shape[0], LAND_CELL_TIME_BLOCK):
+        block = full_values[start:start + LAND_CELL_TIME_BLOCK]
+        series[start:start + len(block)] = block.reshape(len(block), -1)[:, land_cells]
+    return series
+
+
+def to_land_cells(atlite_capacity_factors,atlite_capacity_factors_avg,DATA_VARIABLE_NAME,TIME_VARIABLE_NAME):
+    # (time, lat, lon) dataset -> (time, cell) dataset of the cells with a valid average, lazy (chunked) for chunked
+    # data. The latitude and longitude coordinates of the whole grid are kept, so the cells can be put back
+    latitude_name, longitude_name = atlite_capacity_factors[DATA_VARIABLE_NAME].dims[1:]
+    average_values = np.asarray(atlite_capacity_factors_avg.values, dtype=float)
+    land_cells = np.flatnonzero(~np.isnan(average_values.ravel()))
+    series = land_cell_series(atlite_capacity_factors[DATA_VARIABLE_NAME].data,land_cells)
+    latitude_index, longitude_index = np.unravel_index(land_cells, average_values.shape)
+    return xr.Dataset(
+        {DATA_VARIABLE_NAME: ((TIME_VARIABLE_NAME, LAND_CELL_DIMENSION), series)},
+        coords={
+            TIME_VARIABLE_NAME: atlite_capacity_factors[TIME_VARIABLE_NAME].values,
+            latitude_name: atlite_capacity_factors[latitude_name].values,
+            longitude_name: atlite_capacity_factors[longitude_name].values,
+            'cell_latitude_index': (LAND_CELL_DIMENSION, latitude_index.astype(np.int32), {'dimension': latitude_name}),
+            'cell_longitude_index': (LAND_CELL_DIMENSION, longitude_index.astype(np.int32), {'dimension': longitude_name}),
+        },
+        attrs=atlite_capacity_factors.attrs,
+    )
+
+
+def is_land_cells(atlite_capacity_factors):
+    return LAND_CELL_DIMENSION in atlite_capacity_factors.dims
+
+
+def land_cell_table(atlite_capacity_factors):
+    # one row per kept cell: its column in the (time, cell) matrix, grid indices and coordinates
+    latitude_name = atlite_capacity_factors['cell_latitude_index'].attrs['dimension']
+    longitude_name = atlite_capacity_factors['cell_longitude_index'].attrs['dimension']
+    latitude_index = atlite_capacity_factors['cell_latitude_index'].values
+    longitude_index = atlite_capacity_factors['cell_longitude_index'].values
+    return pd.DataFrame({'column': np.arange(len(latitude_index)), 'latitude_index': latitude_index, 'longitude_index': longitude_index, 'latitude': atlite_capacity_factors[latitude_name].values[latitude_index], 'longitude': atlite_capacity_factors[longitude_name].values[longitude_index]})
+
+
+def from_land_cells(atlite_capacity_factors,DATA_VARIABLE_NAME,TIME_VARIABLE_NAME,LATITUDE_VARIABLE_NAME,LONGITUDE_VARIABLE_NAME):
+    # (time, cell) dataset -> (time, lat, lon) dataset, the cells that were not kept are NaN
+    latitudes = atlite_capacity_factors[LATITUDE_VARIABLE_NAME].values
+    longitudes = atlite_capacity_factors[LONGITUDE_VARIABLE_NAME].values
+    series = atlite_capacity_factors[DATA_VARIABLE_NAME].values
+    full_values = np.full((series.shape[0], len(latitudes), len(longitudes)), np.nan, dtype=np.result_type(series.dtype, np.float32))
+    full_values[:, atlite_capacity_factors['cell_latitude_index'].values, atlite_capacity_factors['cell_longitude_index'].values] = series
+    return xr.Dataset(
+        {DATA_VARIABLE_NAME: ((TIME_VARIABLE_NAME, LATITUDE_VARIABLE_NAME, LONGITUDE_VARIABLE_NAME), full_values)},
+        coords={TIME_VARIABLE_NAME: atlite_capacity_factors[TIME_VARIABLE_NAME].values, LATITUDE_VARIABLE_NAME: latitudes, LONGITUDE_VARIABLE_NAME: longitudes},
+        attrs=atlite_capacity_factors.attrs,
+    )
+
+
+def tier_values(atlite_capacity_factors,DATA_VARIABLE_NAME):
+    # the time series for the tier reductions: the (time, lat, lon) values (numpy or dask), or for land cells the
+    # (time, cell) matrix with the column of every grid cell (-1 for the cells that were not kept)
+    if not is_land_cells(atlite_capacity_factors):
+        return atlite_capacity_factors[DATA_VARIABLE_NAME].data
+    cell_table = land_cell_table(atlite_capacity_factors)
+    grid_shape = (atlite_capacity_factors.sizes[atlite_capacity_factors['cell_latitude_index'].attrs['dimension']], atlite_capacity_factors.sizes[atlite_capacity_factors['cell_longitude_index'].attrs['dimension']])
+    column_of_cell = np.full(grid_shape, -1, dtype=np.int64)
+    column_of_cell[cell_table['latitude_index'].values, cell_table['longitude_index'].values] = cell_table['column'].values
+    return {'series': atlite_capacity_factors[DATA_VARIABLE_NAME].data, 'column_of_cell': column_of_cell.ravel(), 'grid_shape': grid_shape}
+
+
+def cell_columns(full_values,flat_cell_index):
+    # the array to read and the columns of its flattened (lat, lon) or cell axis for the flat grid cell indices
+    if isinstance(full_values, dict):
+        return full_values['series'], full_values['column_of_cell'][flat_cell_index]
+    return full_values, flat_cell_index
+
+
+def select_columns(block,columns):
+    # columns of a (time, ...) block, the columns of cells that were not kept (-1) are missing
+    series = block.reshape(block.shape[0], -1)[:, columns]
+    if np.any(columns < 0):
+        series = series.astype(np.result_type(series.dtype, np.float32), copy=False)
+        series[:, columns < 0] = np.nan
+    return series
+
+
+def grid_cell_count(full_values):
+    # number of (lat, lon) grid cells of the time series, in either form
+    if isinstance(full_values, dict):
+        return len(full_values['column_of_cell'])
+    return full_values.shape[1] * full_values.shape[2]
+
+
+def time_step_count(full_values):
+    if isinstance(full_values, dict):
+        return full_values['series'].shape[0]
+    return np.shape(full_values)[0]
+
+
 # Atlite data
-def create_average_capacity_factor_file_atlite(ATLITE_DUMMY_DATA, ATLITE_CAPACITY_FACTORS_FOLDERS,DUMMY_START_DATE,DUMMY_END_DATE,DUMMY_LATITUDE_BOTTOM,DUMMY_LATITUDE_TOP,DUMMY_LONGITUDE_LEFT,DUMMY_LONGITUDE_RIGHT,MAXIMUM_CAPACITY,DATA_VARIABLE_NAME,TIME_VARIABLE_NAME,AVG_ATLITE_CAPACITY_FACTORS_FILE_LOCATION):
-    # Read in the capacity factors after running WP3 codes:
+# Native netcdf input: Atlite cutout output (e.g. cutout.wind(..., capacity_factor=True).to_netcdf(...)) and other CF
+# style (time, y, x) files name their dimensions and variable their own way, these are mapped onto the names used here
+ATLITE_LATITUDE_NAMES = ('latitude', 'lat', 'y')
+ATLITE_LONGITUDE_NAMES = ('longitude', 'lon', 'x')
+
+
+def atlite_cube_files(ATLITE_CUBE_FILE):
+    # netcdf files of ATLITE_CUBE_FILE: one file, or a comma separated list of files and/or glob patterns (e.g.
+    # assets/atlite_cutout/*.nc), in sorted order
+    cube_files = []
+    for pattern in str(ATLITE_CUBE_FILE).split(','):
+        pattern = pattern.strip()
+        if pattern == "":
+            continue
+        matches = sorted(glob.glob(pattern)) if glob.has_magic(pattern) else [pattern]
+        if len(matches) == 0 or not all(os.path.isfile(cube_file) for cube_file in matches):
+            raise ValueError("Atlite cube file does not exist: " + pattern)
+        cube_files.extend(matches)
+    if len(cube_files) == 0:
+        raise ValueError("Atlite cube file does not exist: " + str(ATLITE_CUBE_FILE))
+    return cube_files
+
+
+def normalize_atlite_cube(dataset,DATA_VARIABLE_NAME,TIME_VARIABLE_NAME):
+    # renames the time dimension to TIME_VARIABLE_NAME, the grid dimensions (y/x, lat/lon) to latitude/longitude and,
+    # when the file holds a single (time, y, x) variable under another name (Atlite's "capacity factor" or an unnamed
+    # data array), that variable to DATA_VARIABLE_NAME. Returns just that variable in (time, latitude, longitude) order
+    if TIME_VARIABLE_NAME not in dataset.dims and 'time' in dataset.dims:
+        dataset = dataset.rename({'time': TIME_VARIABLE_NAME})
+    if TIME_VARIABLE_NAME not in dataset.dims:
+        raise ValueError("Time dimension " + TIME_VARIABLE_NAME + " not found in the Atlite cube file, its dimensions are: " + ", ".join(str(dimension) for dimension in dataset.dims))
+    dimension_names = {}
+    for grid_name, alternative_names in (('latitude', ATLITE_LATITUDE_NAMES), ('longitude', ATLITE_LONGITUDE_NAMES)):
+        found = [name for name in alternative_names if name in dataset.dims]
+        if len(found) == 0:
+            raise ValueError("No " + grid_name + " dimension (" + ", ".join(alternative_names) + ") found in the Atlite cube file, its dimensions are: " + ", ".join(str(dimension) for dimension in dataset.dims))
+        if found[0] != grid_name:
+            dimension_names[found[0]] = grid_name
+    if dimension_names:
+        # coordinates that already carry the new names (e.g. Atlite's lat/lon next to y/x) would clash
+        dataset = dataset.drop_vars([name for name in dimension_names.values() if name in dataset.variables]).rename(dimension_names)
+
+    if DATA_VARIABLE_NAME not in dataset.data_vars:
+        cube_variables = [name for name, variable in dataset.data_vars.items() if set(variable.dims) == {TIME_VARIABLE_NAME, 'latitude', 'longitude'}]
+        if len(cube_variables) != 1:
+            raise ValueError("Variable " + DATA_VARIABLE_NAME + " not found in the Atlite cube file, its (time, y, x) variables are: " + ", ".join(str(name) for name in cube_variables))
+        print("... Using variable '" + str(cube_variables[0]) + "' of the Atlite cube file as " + DATA_VARIABLE_NAME)
+        dataset = dataset.rename({cube_variables[0]: DATA_VARIABLE_NAME})
+    # the extra coordinates (e.g. Atlite's lat/lon copies of y/x) are dropped, like in the stitched data
+    return dataset[[DATA_VARIABLE_NAME]].reset_coords(drop=True).transpose(TIME_VARIABLE_NAME, 'latitude', 'longitude')
+
+
+def open_atlite_cube(ATLITE_CUBE_FILE,DATA_VARIABLE_NAME,TIME_VARIABLE_NAME,TIME_WINDOW_START=None,TIME_WINDOW_END=None,TIME_WINDOW_MONTHS=None,region=None,chunks=None):
+    # open netcdf capacity factors directly (a stitched or Option 7 corrected cube, or Atlite's own cutout output)
+    # instead of stitching the hourly csv files. Only the metadata is read here, the values of the time window and the
+    # region of interest are read at the end, or chunk by chunk when the tiers are computed (chunked)
+    cube_files = atlite_cube_files(ATLITE_CUBE_FILE)
+    if len(cube_files) == 1:
+        atlite_capacity_factors = xr.open_dataset(cube_files[0])
+    else:
+        # e.g. one file per month or year of the cutout, joined along time
+        print("... Opening ",len(cube_files)," Atlite netcdf files.")
+        atlite_capacity_factors = xr.open_mfdataset(cube_files, combine='by_coords', data_vars='minimal', coords='minimal', compat='override')
+    atlite_capacity_factors = normalize_atlite_cube(atlite_capacity_factors,DATA_VARIABLE_NAME,TIME_VARIABLE_NAME)
+
+    # same time window selection as the stitched data
+    keep = time_window_mask(pd.DatetimeIndex(atlite_capacity_factors[TIME_VARIABLE_NAME].values),TIME_WINDOW_START,TIME_WINDOW_END,TIME_WINDOW_MONTHS)
+    if not keep.any():
+        raise ValueError("No time steps of the Atlite cube fall inside the time window. Check TIME_WINDOW_START, TIME_WINDOW_END and TIME_WINDOW_MONTHS.")
+    if not keep.all():
+        print("... Time window selected ",int(keep.sum())," out of ",len(keep)," time steps.")
+        atlite_capacity_factors = atlite_capacity_factors.isel({TIME_VARIABLE_NAME: np.flatnonzero(keep)})
+
+    # only the region of interest is read from disk
+    atlite_capacity_factors = subset_region_of_interest(atlite_capacity_factors,region)
+
+    if chunks is not None:
+        return atlite_capacity_factors.chunk({TIME_VARIABLE_NAME: chunks})
+    return atlite_capacity_factors.load()
+
+
+# options run one after the other in the same process (batch runner) share the loaded Atlite data and WAD field instead
+# of reading them again, keyed by the loading parameters. The shared data must not be modified in place.
+LOADED_DATA_CACHE_SIZE = 2
+loaded_data_cache = OrderedDict()
+
+
+def ingest_atlite_data(ATLITE_DUMMY_DATA,ATLITE_CAPACITY_FACTORS_FOLDERS,DUMMY_START_DATE,DUMMY_END_DATE,DUMMY_LATITUDE_BOTTOM,DUMMY_LATITUDE_TOP,DUMMY_LONGITUDE_LEFT,DUMMY_LONGITUDE_RIGHT,MAXIMUM_CAPACITY,DATA_VARIABLE_NAME,ATLITE_TIME_FREQUENCY,TIME_WINDOW_START,TIME_WINDOW_END,TIME_WINDOW_MONTHS,region,ATLITE_PREFETCH_DEPTH=None,ATLITE_FOLDER_MANIFESTS=None):
     if ATLITE_DUMMY_DATA.lower() == 'true':
         ## use temp data for now:
-        atlite_capacity_factors = create_temporary_atlite_dataset(DUMMY_START_DATE,DUMMY_END_DATE,DUMMY_LATITUDE_BOTTOM,DUMMY_LATITUDE_TOP,DUMMY_LONGITUDE_LEFT,DUMMY_LONGITUDE_RIGHT,MAXIMUM_CAPACITY,DATA_VARIABLE_NAME)
+        atlite_capacity_factors = create_temporary_atlite_dataset(DUMMY_START_DATE,DUMMY_END_DATE,DUMMY_LATITUDE_BOTTOM,DUMMY_LATITUDE_TOP,DUMMY_LONGITUDE_LEFT,DUMMY_LONGITUDE_RIGHT,MAXIMUM_CAPACITY,DATA_VARIABLE_NAME,ATLITE_TIME_FREQUENCY,TIME_WINDOW_START,TIME_WINDOW_END,TIME_WINDOW_MONTHS)
+        atlite_capacity_factors = subset_region_of_interest(atlite_capacity_factors,region)
         print("... Opened DUMMY atlite capacity factor data.")
     else:
         # use real data
-        atlite_capacity_factors = stitch_Atlite_data(ATLITE_CAPACITY_FACTORS_FOLDERS,DUMMY_START_DATE,DATA_VARIABLE_NAME)
+        atlite_capacity_factors = stitch_Atlite_data(ATLITE_CAPACITY_FACTORS_FOLDERS,DUMMY_START_DATE,DATA_VARIABLE_NAME,ATLITE_TIME_FREQUENCY,TIME_WINDOW_START,TIME_WINDOW_END,TIME_WINDOW_MONTHS,region,ATLITE_PREFETCH_DEPTH,ATLITE_FOLDER_MANIFESTS)
         print("... Opened atlite capacity factor data.")
+    return atlite_capacity_factors
+
+
+def create_average_capacity_factor_file_atlite(ATLITE_DUMMY_DATA, ATLITE_CAPACITY_FACTORS_FOLDERS,DUMMY_START_DATE,DUMMY_END_DATE,DUMMY_LATITUDE_BOTTOM,DUMMY_LATITUDE_TOP,DUMMY_LONGITUDE_LEFT,DUMMY_LONGITUDE_RIGHT,MAXIMUM_CAPACITY,DATA_VARIABLE_NAME,TIME_VARIABLE_NAME,AVG_ATLITE_CAPACITY_FACTORS_FILE_LOCATION,ATLITE_TIME_FREQUENCY=None,TIME_WINDOW_START=None,TIME_WINDOW_END=None,TIME_WINDOW_MONTHS=None,ATLITE_CUBE_FILE=None,ROI_BBOX=None,ROI_GEOMETRY_FILE=None,ATLITE_CHUNKS=None,ATLITE_PREFETCH_DEPTH=None,ATLITE_FOLDER_MANIFESTS=None,ATLITE_LAND_CELLS=None):
+    region = region_of_interest(ROI_BBOX,ROI_GEOMETRY_FILE)
+    chunks = parse_atlite_chunks(ATLITE_CHUNKS)
+    land_cells = str(ATLITE_LAND_CELLS).strip().lower() == 'true'
+    load_key = ('atlite', str(ATLITE_DUMMY_DATA), ATLITE_CAPACITY_FACTORS_FOLDERS, DUMMY_START_DATE, DUMMY_END_DATE, DUMMY_LATITUDE_BOTTOM, DUMMY_LATITUDE_TOP, DUMMY_LONGITUDE_LEFT, DUMMY_LONGITUDE_RIGHT, MAXIMUM_CAPACITY, DATA_VARIABLE_NAME, TIME_VARIABLE_NAME, ATLITE_TIME_FREQUENCY, TIME_WINDOW_START, TIME_WINDOW_END, TIME_WINDOW_MONTHS, ATLITE_CUBE_FILE, region, chunks, land_cells)
+    if recall(loaded_data_cache, load_key) is not None:
+        atlite_capacity_factors, atlite_capacity_factors_avg = loaded_data_cache[load_key]
+        print("... Using the atlite capacity factor data already loaded.")
+        atlite_capacity_factors_avg.to_netcdf(AVG_ATLITE_CAPACITY_FACTORS_FILE_LOCATION)
+        return atlite_capacity_factors, atlite_capacity_factors_avg
 
-    # average the capacity factors according to time:
-    atlite_capacity_factors_avg = atlite_capacity_factors[DATA_VARIABLE_NAME].mean(dim=TIME_VARIABLE_NAME)
+    # Read in the capacity factors after running WP3 codes:
+    with stage_span("stitch") as span:
+        if ATLITE_CUBE_FILE is not None and str(ATLITE_CUBE_FILE).strip() != "":
+            # use a stitched netcdf cube, e.g. the Option 7 corrected cube
+            # for the land cells the cube is read in time chunks even when it is not held in chunks, so the whole
+            # (time, lat, lon) cube is never in memory
+            atlite_capacity_factors = open_atlite_cube(str(ATLITE_CUBE_FILE).strip(),DATA_VARIABLE_NAME,TIME_VARIABLE_NAME,TIME_WINDOW_START,TIME_WINDOW_END,TIME_WINDOW_MONTHS,region,LAND_CELL_TIME_BLOCK if land_cells and chunks is None else chunks)
+            print("... Opened atlite capacity factor cube: "+str(ATLITE_CUBE_FILE).strip())
+        else:
+            # the stitched (or dummy) data is checkpointed as a netcdf cube, a resumed run does not stitch again
+            atlite_capacity_factors = pipeline_stage("ingest", lambda: ingest_atlite_data(ATLITE_DUMMY_DATA,ATLITE_CAPACITY_FACTORS_FOLDERS,DUMMY_START_DATE,DUMMY_END_DATE,DUMMY_LATITUDE_BOTTOM,DUMMY_LATITUDE_TOP,DUMMY_LONGITUDE_LEFT,DUMMY_LONGITUDE_RIGHT,MAXIMUM_CAPACITY,DATA_VARIABLE_NAME,ATLITE_TIME_FREQUENCY,TIME_WINDOW_START,TIME_WINDOW_END,TIME_WINDOW_MONTHS,region,ATLITE_PREFETCH_DEPTH,ATLITE_FOLDER_MANIFESTS), save=lambda dataset, path: dataset.to_netcdf(path), load=lambda path: xr.open_dataset(path, engine='netcdf4').load())
+        span['items'] = int(atlite_capacity_factors.sizes[TIME_VARIABLE_NAME])
+
+    # data already in memory (csv or dummy data) is split into chunks too, so the tier reductions run on all cores. The
+    # land cells of it are split after they are picked, the chunks would otherwise keep the whole cube in memory
+    if chunks is not None and not land_cells and not is_chunked(atlite_capacity_factors[DATA_VARIABLE_NAME].data):
+        atlite_capacity_factors = atlite_capacity_factors.chunk({TIME_VARIABLE_NAME: chunks})
+    if chunks is not None and is_chunked(atlite_capacity_factors[DATA_VARIABLE_NAME].data):
+        print("... Atlite capacity factors held in chunks of",atlite_capacity_factors[DATA_VARIABLE_NAME].data.chunksize[0],"time steps.")
+
+    # average the capacity factors according to time (chunk by chunk for chunked data):
+    with stage_span("average"):
+        atlite_capacity_factors_avg = pipeline_stage("average", lambda: atlite_capacity_factors[DATA_VARIABLE_NAME].mean(dim=TIME_VARIABLE_NAME).compute(), save=lambda average, path: average.to_netcdf(path), load=lambda path: xr.open_dataarray(path, engine='netcdf4').load())
     print("... Averaged atlite capacity factor data.")
 
     # save file to assets folder:
-    atlite_capacity_factors_avg.to_netcdf(AVG_ATLITE_CAPACITY_FACTORS_FILE_LOCATION)
+    with stage_span("write",1):
+        atlite_capacity_factors_avg.to_netcdf(AVG_ATLITE_CAPACITY_FACTORS_FILE_LOCATION)
     print("... Saved average atlite capacity factor data.")
 
+    # keep only the cells with a valid average (land cells), the cells outside the border or at sea are dropped
+    if land_cells:
+        with stage_span("land_cells") as span:
+            dense_bytes = atlite_capacity_factors[DATA_VARIABLE_NAME].nbytes
+            atlite_capacity_factors = to_land_cells(atlite_capacity_factors,atlite_capacity_factors_avg,DATA_VARIABLE_NAME,TIME_VARIABLE_NAME)
+            if chunks is None:
+                # read chunk by chunk, only the land cells are kept in memory
+                atlite_capacity_factors = atlite_capacity_factors.load()
+            elif not is_chunked(atlite_capacity_factors[DATA_VARIABLE_NAME].data):
+                atlite_capacity_factors = atlite_capacity_factors.chunk({TIME_VARIABLE_NAME: chunks})
+                print("... Atlite land cells held in chunks of",atlite_capacity_factors[DATA_VARIABLE_NAME].data.chunksize[0],"time steps.")
+            span['items'] = int(atlite_capacity_factors.sizes[LAND_CELL_DIMENSION])
+        print("... Kept",atlite_capacity_factors.sizes[LAND_CELL_DIMENSION],"of",atlite_capacity_factors_avg.size,"atlite cells (land cells),",round((dense_bytes - atlite_capacity_factors[DATA_VARIABLE_NAME].nbytes) / 1e6, 1),"MB less in memory.")
+
+    remember(loaded_data_cache, load_key, (atlite_capacity_factors, atlite_capacity_factors_avg), LOADED_DATA_CACHE_SIZE)
     return atlite_capacity_factors, atlite_capacity_factors_avg
 
 
-def read_wind_atlas_data_full(WIND_ATLAS_CAPACITY_FACTORS_HEATMAP_FILE_LOCATION,WIND_ATLAS_HEATMAP_LATITUDE_VARIABLE_NAME,WIND_ATLAS_HEATMAP_LONGITUDE_VARIABLE_NAME,WIND_ATLAS_HEATMAP_DATA_VARIABLE_NAME):
-    # open wind atlas netcdf
-    wind_atlas_netcdf = xr.open_dataset(WIND_ATLAS_CAPACITY_FACTORS_HEATMAP_FILE_LOCATION)
+def read_wind_atlas_data_full(WIND_ATLAS_CAPACITY_FACTORS_HEATMAP_FILE_LOCATION,WIND_ATLAS_HEATMAP_LATITUDE_VARIABLE_NAME,WIND_ATLAS_HEATMAP_LONGITUDE_VARIABLE_NAME,WIND_ATLAS_HEATMAP_DATA_VARIABLE_NAME,ROI_BBOX=None,ROI_GEOMETRY_FILE=None):
+    region = region_of_interest(ROI_BBOX,ROI_GEOMETRY_FILE)
+    load_key = ('wind_atlas', None, WIND_ATLAS_CAPACITY_FACTORS_HEATMAP_FILE_LOCATION, WIND_ATLAS_HEATMAP_LATITUDE_VARIABLE_NAME, WIND_ATLAS_HEATMAP_LONGITUDE_VARIABLE_NAME, WIND_ATLAS_HEATMAP_DATA_VARIABLE_NAME, region)
+    if recall(loaded_data_cache, load_key) is not None:
+        return loaded_data_cache[load_key]
+
+    # open wind atlas netcdf, only the region of interest is read
+    wind_atlas_netcdf = subset_region_of_interest(xr.open_dataset(WIND_ATLAS_CAPACITY_FACTORS_HEATMAP_FILE_LOCATION),region,WIND_ATLAS_HEATMAP_LATITUDE_VARIABLE_NAME,WIND_ATLAS_HEATMAP_LONGITUDE_VARIABLE_NAME)
 
     # # Select every wind_atlas_resolution_reduction latitude and longitude along with capacity_factor
     # capacity_factor_subset = wind_atlas_netcdf.sel(
@@ -162,19 +922,30 @@ def read_wind_atlas_data_full(WIND_ATLAS_CAPACITY_FACTORS_HEATMAP_FILE_LOCATION,
     all_data_wa = wind_atlas_netcdf[WIND_ATLAS_HEATMAP_DATA_VARIABLE_NAME] #.values.astype(float)
     # all_data_wa[np.isnan(all_data_wa)] = 0.0  # Replace NaN with 0.0, you can choose a different value if needed
     # lon_wa, lat_wa = np.meshgrid(longitude_wa, latitude_wa)
-    return latitude_wa,longitude_wa,all_data_wa
+    return remember(loaded_data_cache, load_key, (latitude_wa,longitude_wa,all_data_wa), LOADED_DATA_CACHE_SIZE)
 
 
-def read_wind_atlas_data_reduced(WIND_ATLAS_RESOLUTION_REDUCTION,WIND_ATLAS_CAPACITY_FACTORS_HEATMAP_FILE_LOCATION,WIND_ATLAS_HEATMAP_LATITUDE_VARIABLE_NAME,WIND_ATLAS_HEATMAP_LONGITUDE_VARIABLE_NAME,WIND_ATLAS_HEATMAP_DATA_VARIABLE_NAME):
-    # get down scaling resolution of wind atlas netcdf i.e. number of points to skip for lat lon values in array, to make things render faster
+def read_wind_atlas_data_reduced(WIND_ATLAS_RESOLUTION_REDUCTION,WIND_ATLAS_CAPACITY_FACTORS_HEATMAP_FILE_LOCATION,WIND_ATLAS_HEATMAP_LATITUDE_VARIABLE_NAME,WIND_ATLAS_HEATMAP_LONGITUDE_VARIABLE_NAME,WIND_ATLAS_HEATMAP_DATA_VARIABLE_NAME,ROI_BBOX=None,ROI_GEOMETRY_FILE=None,WIND_ATLAS_REDUCTION_METHOD=None,WIND_ATLAS_REDUCTION_QUANTILE=None,WIND_ATLAS_PYRAMID_FOLDER=None):
+    # get down scaling resolution of wind atlas netcdf i.e. the size of the blocks of lat lon cells that become one cell, to make things render and run faster
     wind_atlas_resolution_reduction = int(WIND_ATLAS_RESOLUTION_REDUCTION)
-    # open wind atlas netcdf
-    wind_atlas_netcdf = xr.open_dataset(WIND_ATLAS_CAPACITY_FACTORS_HEATMAP_FILE_LOCATION)
+    method, quantile = parse_wind_atlas_reduction(WIND_ATLAS_REDUCTION_METHOD,WIND_ATLAS_REDUCTION_QUANTILE)
+    region = region_of_interest(ROI_BBOX,ROI_GEOMETRY_FILE)
+    load_key = ('wind_atlas', wind_atlas_resolution_reduction, method, quantile, WIND_ATLAS_CAPACITY_FACTORS_HEATMAP_FILE_LOCATION, WIND_ATLAS_HEATMAP_LATITUDE_VARIABLE_NAME, WIND_ATLAS_HEATMAP_LONGITUDE_VARIABLE_NAME, WIND_ATLAS_HEATMAP_DATA_VARIABLE_NAME, region)
+    if recall(loaded_data_cache, load_key) is not None:
+        return loaded_data_cache[load_key]
 
-    # Select every wind_atlas_resolution_reduction latitude and longitude along with capacity_factor
-    capacity_factor_subset = wind_atlas_netcdf.sel(
-        lat=wind_atlas_netcdf.lat.values[::wind_atlas_resolution_reduction],
-        lon=wind_atlas_netcdf.lon.values[::wind_atlas_resolution_reduction])
+    if method == 'stride' or wind_atlas_resolution_reduction == 1:
+        # open wind atlas netcdf, only the region of interest is read
+        wind_atlas_netcdf = subset_region_of_interest(xr.open_dataset(WIND_ATLAS_CAPACITY_FACTORS_HEATMAP_FILE_LOCATION),region,WIND_ATLAS_HEATMAP_LATITUDE_VARIABLE_NAME,WIND_ATLAS_HEATMAP_LONGITUDE_VARIABLE_NAME)
+
+        # Select every wind_atlas_resolution_reduction latitude and longitude along with capacity_factor
+        capacity_factor_subset = wind_atlas_netcdf.isel({
+            WIND_ATLAS_HEATMAP_LATITUDE_VARIABLE_NAME: slice(None, None, wind_atlas_resolution_reduction),
+            WIND_ATLAS_HEATMAP_LONGITUDE_VARIABLE_NAME: slice(None, None, wind_atlas_resolution_reduction)})
+    else:
+        # one cell per block of cells (the block mean, max or quantile) from the pyramid of reduced files on disk, the
+        # blocks are taken over the whole file so a level serves every region of interest
+        capacity_factor_subset = subset_region_of_interest(wind_atlas_pyramid_level(wind_atlas_resolution_reduction,method,quantile,WIND_ATLAS_CAPACITY_FACTORS_HEATMAP_FILE_LOCATION,WIND_ATLAS_HEATMAP_LATITUDE_VARIABLE_NAME,WIND_ATLAS_HEATMAP_LONGITUDE_VARIABLE_NAME,WIND_ATLAS_HEATMAP_DATA_VARIABLE_NAME,WIND_ATLAS_PYRAMID_FOLDER),region,WIND_ATLAS_HEATMAP_LATITUDE_VARIABLE_NAME,WIND_ATLAS_HEATMAP_LONGITUDE_VARIABLE_NAME)
 
     # Access the capacity_factor variable from the subset
     latitude_wa = capacity_factor_subset[WIND_ATLAS_HEATMAP_LATITUDE_VARIABLE_NAME].values.astype(float)
@@ -183,11 +954,113 @@ def read_wind_atlas_data_reduced(WIND_ATLAS_RESOLUTION_REDUCTION,WIND_ATLAS_CAPA
     # values_wa[np.isnan(values_wa)] = 0.0  # Replace NaN with 0.0, you can choose a different value if needed
     # lon_wa, lat_wa = np.meshgrid(longitude_wa, latitude_wa)
 
-    return latitude_wa,longitude_wa,values_wa
+    return remember(loaded_data_cache, load_key, (latitude_wa,longitude_wa,values_wa), LOADED_DATA_CACHE_SIZE)
+
+
+# Wind atlas pyramid functions (reduced WAD): WIND_ATLAS_RESOLUTION_REDUCTION x WIND_ATLAS_RESOLUTION_REDUCTION blocks
+# of wind atlas cells become one cell, with the mean, max or a quantile of the block instead of only its first cell.
+# Every reduced level is written once to WIND_ATLAS_PYRAMID_FOLDER, and a mean or max level is made from the nearest
+# finer level on disk whose block size divides its own (a 30 level from the 15 level), so the full resolution file
+# is read once per method. The blocks start at the first row and column of the file and the last ones are partial
+WIND_ATLAS_REDUCTION_METHODS = ('mean', 'max', 'quantile', 'stride')
+WIND_ATLAS_VALID_COUNT_NAME = 'valid_cell_count'
+
+
+def parse_wind_atlas_reduction(WIND_ATLAS_REDUCTION_METHOD,WIND_ATLAS_REDUCTION_QUANTILE=None):
+    # mean (default): the block average, max: the best cell of the block, quantile: the WIND_ATLAS_REDUCTION_QUANTILE
+    # (0 to 1, default 0.9) of the block, stride: every WIND_ATLAS_RESOLUTION_REDUCTION-th cell (no aggregation)
+    # returns (method, quantile), the quantile is None for the other methods
+    method = 'mean' if WIND_ATLAS_REDUCTION_METHOD is None or str(WIND_ATLAS_REDUCTION_METHOD).strip() == "" else str(WIND_ATLAS_REDUCTION_METHOD).strip().lower()
+    if method not in WIND_ATLAS_REDUCTION_METHODS:
+        raise ValueError("WIND_ATLAS_REDUCTION_METHOD must be mean, max, quantile or stride, got: " + str(WIND_ATLAS_REDUCTION_METHOD))
+    if method != 'quantile':
+        return method, None
+    quantile = 0.9 if WIND_ATLAS_REDUCTION_QUANTILE is None or str(WIND_ATLAS_REDUCTION_QUANTILE).strip() == "" else float(WIND_ATLAS_REDUCTION_QUANTILE)
+    if not 0 <= quantile <= 1:
+        raise ValueError("WIND_ATLAS_REDUCTION_QUANTILE must be a fraction from 0 to 1, got: " + str(WIND_ATLAS_REDUCTION_QUANTILE))
+    return method, quantile
+
+
+def block_centres(coordinates,block_size):
+    # centre coordinate of every block of block_size coordinates (the mean of the coordinates in the block)
+    coordinates = np.asarray(coordinates, dtype=float)
+    starts = np.arange(0, len(coordinates), block_size)
+    return np.add.reduceat(coordinates, starts) / np.diff(np.append(starts, len(coordinates)))
+
+
+def coarsen_wind_atlas(dataset,block_size,method,quantile,LATITUDE_VARIABLE_NAME,LONGITUDE_VARIABLE_NAME,DATA_VARIABLE_NAME):
+    # reduce (lat, lon) blocks of block_size x block_size cells to one cell, NaN cells are left out of the blocks (the
+    # coordinates are set by the caller, see block_centres). A mean level keeps the number of valid cells of every block, so a coarser mean level can be made from it
+    blocks = {LATITUDE_VARIABLE_NAME: block_size, LONGITUDE_VARIABLE_NAME: block_size}
+    values = dataset[DATA_VARIABLE_NAME]
+    if method == 'mean':
+        # the cell counts of a finer level weight its means, at full resolution every valid cell counts once
+        counts = dataset[WIND_ATLAS_VALID_COUNT_NAME] if WIND_ATLAS_VALID_COUNT_NAME in dataset else values.notnull().astype(np.float32)
+        count_sums = counts.where(values.notnull(), 0).coarsen(blocks, boundary='pad').sum()
+        value_sums = (values * counts).coarsen(blocks, boundary='pad').sum()
+        reduced = xr.Dataset({DATA_VARIABLE_NAME: (value_sums / count_sums).where(count_sums > 0).astype(values.dtype), WIND_ATLAS_VALID_COUNT_NAME: count_sums.astype(np.float32)})
+    elif method == 'max':
+        reduced = values.coarsen(blocks, boundary='pad').max().to_dataset(name=DATA_VARIABLE_NAME)
+    else:
+        block_cells = values.coarsen(blocks, boundary='pad').construct({LATITUDE_VARIABLE_NAME: (LATITUDE_VARIABLE_NAME, 'latitude_in_block'), LONGITUDE_VARIABLE_NAME: (LONGITUDE_VARIABLE_NAME, 'longitude_in_block')})
+        reduced = block_cells.quantile(quantile, dim=['latitude_in_block', 'longitude_in_block'], skipna=True).drop_vars('quantile').astype(values.dtype).to_dataset(name=DATA_VARIABLE_NAME)
+    return reduced
+
+
+def wind_atlas_pyramid_level(WIND_ATLAS_RESOLUTION_REDUCTION,method,quantile,WIND_ATLAS_CAPACITY_FACTORS_HEATMAP_FILE_LOCATION,WIND_ATLAS_HEATMAP_LATITUDE_VARIABLE_NAME,WIND_ATLAS_HEATMAP_LONGITUDE_VARIABLE_NAME,WIND_ATLAS_HEATMAP_DATA_VARIABLE_NAME,WIND_ATLAS_PYRAMID_FOLDER=None):
+    # the reduced wind atlas dataset of one level of the pyramid (read from disk, or made and written)
+    block_size = int(WIND_ATLAS_RESOLUTION_REDUCTION)
+    wind_atlas_file = str(WIND_ATLAS_CAPACITY_FACTORS_HEATMAP_FILE_LOCATION)
+    pyramid_folder = os.path.join(os.path.dirname(os.path.abspath(wind_atlas_file)), "wind_atlas_pyramid") if WIND_ATLAS_PYRAMID_FOLDER is None or str(WIND_ATLAS_PYRAMID_FOLDER).strip() == "" else str(WIND_ATLAS_PYRAMID_FOLDER).strip()
+    os.makedirs(pyramid_folder, exist_ok=True)
+    # the levels of a changed wind atlas file (size or modification time) are not used
+    file_stat = os.stat(wind_atlas_file)
+    source_key = hashlib.blake2b(json.dumps([file_stat.st_size, file_stat.st_mtime_ns, WIND_ATLAS_HEATMAP_LATITUDE_VARIABLE_NAME, WIND_ATLAS_HEATMAP_LONGITUDE_VARIABLE_NAME, WIND_ATLAS_HEATMAP_DATA_VARIABLE_NAME]).encode(), digest_size=8).hexdigest()
+    method_name = method if quantile is None else method + str(quantile)
+
+    def level_file(level_block_size):
+        return os.path.join(pyramid_folder, os.path.splitext(os.path.basename(wind_atlas_file))[0] + "_" + method_name + "_x" + str(level_block_size) + "_" + source_key + ".nc")
+
+    if os.path.isfile(level_file(block_size)):
+        print("... Reduced wind atlas ( x",block_size,method_name,") read from the pyramid.")
+        with xr.open_dataset(level_file(block_size)) as level:
+            return level.load()
+
+    # the nearest finer level on disk, a quantile of quantiles is not the quantile of the cells so quantile levels
+    # are always made from the full resolution file
+    finer_block_size = 1
+    if method != 'quantile':
+        for level_block_size in range(block_size // 2, 1, -1):
+            if block_size % level_block_size == 0 and os.path.isfile(level_file(level_block_size)):
+                finer_block_size = level_block_size
+                break
+    finer_file = wind_atlas_file if finer_block_size == 1 else level_file(finer_block_size)
+    with stage_span("wad_pyramid") as span:
+        # the finer level (or the full resolution file) is read into memory and reduced there, without dask chunks
+        with xr.open_dataset(finer_file) as finer:
+            reduced = coarsen_wind_atlas(finer.load(),block_size // finer_block_size,method,quantile,WIND_ATLAS_HEATMAP_LATITUDE_VARIABLE_NAME,WIND_ATLAS_HEATMAP_LONGITUDE_VARIABLE_NAME,WIND_ATLAS_HEATMAP_DATA_VARIABLE_NAME)
+            # the block centres from the full resolution coordinates, the centres of a finer level are off in the last (partial) block
+            with xr.open_dataset(wind_atlas_file) as wind_atlas_netcdf:
+                reduced = reduced.assign_coords({
+                    WIND_ATLAS_HEATMAP_LATITUDE_VARIABLE_NAME: block_centres(wind_atlas_netcdf[WIND_ATLAS_HEATMAP_LATITUDE_VARIABLE_NAME].values, block_size),
+                    WIND_ATLAS_HEATMAP_LONGITUDE_VARIABLE_NAME: block_centres(wind_atlas_netcdf[WIND_ATLAS_HEATMAP_LONGITUDE_VARIABLE_NAME].values, block_size)})
+            # written next to the final name and moved into place, so a broken write is never used
+            reduced.to_netcdf(level_file(block_size) + ".partial")
+        os.replace(level_file(block_size) + ".partial", level_file(block_size))
+        with xr.open_dataset(level_file(block_size)) as level:
+            reduced = level.load()
+        span['items'] = int(reduced[WIND_ATLAS_HEATMAP_DATA_VARIABLE_NAME].size)
+    print("... Reduced wind atlas ( x",block_size,method_name,") made from the","full resolution file" if finer_block_size == 1 else "x " + str(finer_block_size) + " level","and written to the pyramid.")
+    return reduced
+
 
 # option 5 and 6: read in the masks single band tif files
 def read_masks_as_folium_layers(MASKS_FOLDER):
     # Read the tiff mask files and return as folium map layers
+    # the GIS and map packages are only imported here, the batch options never load them
+    import rasterio
+    import folium
+    from branca.colormap import linear
 
     # Path to your TIFF folder
     tiff_folder_path = MASKS_FOLDER
@@ -270,6 +1143,1119 @@ def read_masks_as_folium_layers(MASKS_FOLDER):
 
     return final_layers
 
+
+# Tier mask functions (Options 1-6): the single band .tif masks in TIER_MASKS_FOLDER (the same kind of files as the
+# MASKS_FOLDER overlays, a value above 0 is land that can be used) are reprojected once onto the grid of the averaged
+# field as the fraction of every cell that can be used. The fractions are cached in TIER_MASK_CACHE_FOLDER, keyed by a
+# hash of the .tif file and of the grid, so later runs do not read the rasters again. With more masks a cell must be
+# usable in all of them, their fractions are multiplied
+TIER_MASK_MODES = ('exclude', 'weight')
+TIER_MASK_CACHE_SIZE = 8
+tier_mask_cache = OrderedDict()
+
+
+def parse_tier_mask_mode(TIER_MASK_MODE):
+    # exclude (default): cells below the minimum usable fraction are left out, weight: the cells are also weighted by
+    # their usable fraction in the tier means
+    if TIER_MASK_MODE is None or str(TIER_MASK_MODE).strip() == "":
+        return 'exclude'
+    mode = str(TIER_MASK_MODE).strip().lower()
+    if mode not in TIER_MASK_MODES:
+        raise ValueError("TIER_MASK_MODE must be exclude or weight, got: " + str(TIER_MASK_MODE))
+    return mode
+
+
+def file_content_hash(file_path):
+    # hash of the whole file, read in blocks
+    digest = hashlib.blake2b(digest_size=16)
+    with open(file_path, 'rb') as opened_file:
+        for block in iter(lambda: opened_file.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def regular_grid_transform(latitudes,longitudes):
+    # north up affine transform of a regular grid from its cell centre coordinates, and whether the latitudes ascend
+    from rasterio.transform import from_origin
+    latitudes = np.asarray(latitudes, dtype=float)
+    longitudes = np.asarray(longitudes, dtype=float)
+    if len(latitudes) < 2 or len(longitudes) < 2:
+        raise ValueError("Tier masks need a grid of at least 2 x 2 cells.")
+    latitude_step = np.diff(latitudes)
+    longitude_step = np.diff(longitudes)
+    if not (np.allclose(latitude_step, latitude_step[0], rtol=1e-3) and np.allclose(longitude_step, longitude_step[0], rtol=1e-3)) or longitude_step[0] <= 0:
+        raise ValueError("Tier masks need a regular latitude/longitude grid (sorted, evenly spaced coordinates).")
+    latitude_resolution = abs(latitude_step.mean())
+    longitude_resolution = longitude_step.mean()
+    transform = from_origin(longitudes[0] - longitude_resolution / 2.0, latitudes.max() + latitude_resolution / 2.0, longitude_resolution, latitude_resolution)
+    return transform, latitude_step[0] > 0
+
+
+def mask_fraction(tif_file_path,latitudes,longitudes):
+    # (lat, lon) fraction of every grid cell that is usable in one mask, the average of the usable (value above 0)
+    # pixels reprojected onto the grid. Nodata pixels and cells outside the raster count as not usable
+    import rasterio
+    from rasterio.warp import reproject, Resampling
+    transform, ascending_latitudes = regular_grid_transform(latitudes,longitudes)
+    fraction = np.zeros((len(latitudes), len(longitudes)), dtype=np.float32)
+    with rasterio.open(tif_file_path) as src:
+        if src.crs is None:
+            raise ValueError("Tier mask has no coordinate reference system: " + tif_file_path)
+        mask_data = src.read(1, masked=True)
+        usable = np.where(np.ma.getmaskarray(mask_data), 0.0, np.asarray(mask_data.filled(0), dtype=float) > 0).astype(np.float32)
+        reproject(usable, fraction, src_transform=src.transform, src_crs=src.crs, dst_transform=transform, dst_crs='EPSG:4326', resampling=Resampling.average, src_nodata=None, dst_nodata=0.0)
+    # the rows of the transform run from north to south
+    return fraction[::-1] if ascending_latitudes else fraction
+
+
+def tier_mask_fractions(TIER_MASKS_FOLDER,latitudes,longitudes,TIER_MASK_CACHE_FOLDER=None):
+    # (lat, lon) usable fraction of the grid cells over all the masks in TIER_MASKS_FOLDER, None without masks
+    if TIER_MASKS_FOLDER is None or str(TIER_MASKS_FOLDER).strip() == "":
+        return None
+    masks_folder = str(TIER_MASKS_FOLDER).strip()
+    tif_files = sorted(f for f in os.listdir(masks_folder) if f.endswith('.tif'))
+    if len(tif_files) == 0:
+        raise ValueError("No .tif masks found in TIER_MASKS_FOLDER: " + masks_folder)
+    cache_folder = os.path.join(masks_folder, "grid_cache") if TIER_MASK_CACHE_FOLDER is None or str(TIER_MASK_CACHE_FOLDER).strip() == "" else str(TIER_MASK_CACHE_FOLDER).strip()
+    os.makedirs(cache_folder, exist_ok=True)
+    grid_key = hashlib.blake2b(np.asarray(latitudes, dtype=float).tobytes() + np.asarray(longitudes, dtype=float).tobytes(), digest_size=8).hexdigest()
+
+    fractions = np.ones((len(latitudes), len(longitudes)), dtype=np.float32)
+    for tif_file in tif_files:
+        tif_file_path = os.path.join(masks_folder, tif_file)
+        # unchanged files are not hashed again in the same process (tier service, batch runs)
+        file_stat = os.stat(tif_file_path)
+        memory_key = (os.path.abspath(tif_file_path), file_stat.st_size, file_stat.st_mtime_ns, grid_key)
+        fraction = recall(tier_mask_cache, memory_key)
+        if fraction is None:
+            cache_file = os.path.join(cache_folder, os.path.splitext(tif_file)[0] + "_" + file_content_hash(tif_file_path) + "_" + grid_key + ".npy")
+            if os.path.isfile(cache_file):
+                fraction = np.load(cache_file)
+                print("... Tier mask ",tif_file," read from the grid cache.")
+            else:
+                with stage_span("mask_regrid",1):
+                    fraction = mask_fraction(tif_file_path,latitudes,longitudes)
+                # written next to the final name and moved into place, so a broken write is never used
+                np.save(cache_file + ".partial.npy", fraction)
+                os.replace(cache_file + ".partial.npy", cache_file)
+                print("... Tier mask ",tif_file," reprojected onto the ",len(latitudes)," x ",len(longitudes)," grid and cached.")
+            remember(tier_mask_cache, memory_key, fraction, TIER_MASK_CACHE_SIZE)
+        fractions = fractions * fraction
+    return fractions
+
+
+def apply_tier_masks(average_field,LATITUDE_VARIABLE_NAME,LONGITUDE_VARIABLE_NAME,TIER_MASKS_FOLDER=None,TIER_MASK_MODE=None,TIER_MASK_MIN_FRACTION=None,TIER_MASK_CACHE_FOLDER=None):
+    # the averaged (lat, lon) field with the cells that are left out set to NaN, so they are never selected, and the
+    # (lat, lon) weight of every cell in the tier means (1 or the usable fraction, 0 for the cells left out).
+    # Without masks the field is returned as it is and the weights are None
+    fractions = tier_mask_fractions(TIER_MASKS_FOLDER,average_field[LATITUDE_VARIABLE_NAME].values,average_field[LONGITUDE_VARIABLE_NAME].values,TIER_MASK_CACHE_FOLDER)
+    if fractions is None:
+        return average_field, None
+    mode = parse_tier_mask_mode(TIER_MASK_MODE)
+    if TIER_MASK_MIN_FRACTION is not None and str(TIER_MASK_MIN_FRACTION).strip() != "":
+        kept = fractions >= float(TIER_MASK_MIN_FRACTION)
+    else:
+        # by default half of a cell must be usable to keep it, when weighting any usable part is enough
+        kept = fractions >= 0.5 if mode == 'exclude' else fractions > 0
+    kept = kept & (fractions > 0)
+    cell_weights = np.where(kept, fractions if mode == 'weight' else 1.0, 0.0)
+    print("... Tier masks (",mode,"): ",int(kept.sum())," of ",kept.size," cells kept, ",round(float(fractions.mean()) * 100, 1),"% of the area usable.")
+    return average_field.where(xr.DataArray(kept, dims=average_field.dims[-2:])), cell_weights
+
+
+# Tier specification and bounded tier functions (Options 3, 4, 6)
+def parse_tier_specification(TIER_SPECIFICATION,LEGACY_TIERS=None):
+    # returns an (N, 2) array of [lower, upper] upper percentages per tier, e.g. [0, 10] is the upper 10 percent
+    # the specification is inline "0,10;10,20;20,40", or a .json/.yaml file holding a list of [lower, upper] pairs
+    # (optionally under a "tiers" key), if it is empty the legacy PERCENT_UPPER_TIER1..5_CAPACITY_FACTORS are used
+    if TIER_SPECIFICATION is None or str(TIER_SPECIFICATION).strip() == "":
+        entries = [tier for tier in (LEGACY_TIERS or []) if tier is not None and str(tier).strip() != ""]
+    elif str(TIER_SPECIFICATION).strip().lower().endswith(('.json', '.yaml', '.yml')):
+        tier_file = str(TIER_SPECIFICATION).strip()
+        if not os.path.exists(tier_file):
+            raise ValueError("Tier specification file does not exist: " + tier_file)
+        with open(tier_file) as file:
+            if tier_file.lower().endswith('.json'):
+                entries = json.load(file)
+            else:
+                try:
+                    import yaml
+                except ImportError:
+                    raise ImportError("Reading a YAML tier specification needs the pyyaml package (pip install pyyaml), or use a .json file.")
+                entries = yaml.safe_load(file)
+        if isinstance(entries, dict):
+            entries = entries.get('tiers', [])
+    else:
+        entries = [entry for entry in str(TIER_SPECIFICATION).split(';') if entry.strip() != ""]
+
+    tier_bands = []
+    for entry in entries:
+        if isinstance(entry, str):
+            entry = entry.split(',')
+        try:
+            band = [float(x) for x in entry]
+        except (TypeError, ValueError):
+            raise ValueError("Could not read tier bounds: " + str(entry) + ". Use lower,upper percentages e.g. 0,10")
+        if len(band) != 2:
+            raise ValueError("A tier needs exactly two bounds (lower,upper), got: " + str(entry))
+        if min(band) < 0 or max(band) > 100:
+            raise ValueError("Tier bounds must be percentages between 0 and 100, got: " + str(entry))
+        # sorts out user swapping max and min
+        tier_bands.append([min(band), max(band)])
+
+    if len(tier_bands) == 0:
+        raise ValueError("No tiers specified. Set TIER_SPECIFICATION or the PERCENT_UPPER_TIER*_CAPACITY_FACTORS variables.")
+    return np.array(tier_bands)
+
+
+# Percentile service: percentiles straight from the flattened numpy buffer of a field, memoized per field contents so
+# repeated bounds, tiers and sweeps on the same field only sort it once
+PERCENTILE_CACHE_SIZE = 8
+sorted_field_cache = OrderedDict()
+percentile_cache = OrderedDict()
+
+
+def field_key(values):
+    # identifies a field by its contents, shape and type
+    values = np.ascontiguousarray(values)
+    return hashlib.blake2b(values.view(np.uint8).ravel(), digest_size=16).hexdigest() + str(values.shape) + str(values.dtype)
+
+
+def remember(cache,key,value,cache_size=PERCENTILE_CACHE_SIZE):
+    # keep only the most recently used fields, the sorted copies can be large
+    cache[key] = value
+    cache.move_to_end(key)
+    while len(cache) > cache_size:
+        cache.popitem(last=False)
+    return value
+
+
+def recall(cache,key):
+    # the cached value (None when it is not cached), a hit makes it the most recently used
+    if key not in cache:
+        return None
+    cache.move_to_end(key)
+    return cache[key]
+
+
+def read_only(array):
+    # cached arrays are shared by every later caller, an edit in place would change all of them
+    array.setflags(write=False)
+    return array
+
+
+def sorted_valid_values(values,key=None):
+    # flat indices of the non NaN cells in ascending order of value, and the sorted values
+    key = key or field_key(values)
+    cached = recall(sorted_field_cache, key)
+    if cached is None:
+        values_flat = np.asarray(values, dtype=float).ravel()
+        valid_cells = np.flatnonzero(~np.isnan(values_flat))
+        order = valid_cells[np.argsort(values_flat[valid_cells], kind='stable')]
+        cached = remember(sorted_field_cache, key, (read_only(order), read_only(values_flat[order])))
+    return cached
+
+
+def field_percentiles(values,quantiles):
+    # quantiles (0-1) of the non NaN values of a field, linear interpolation like xarray/numpy, all quantiles at once
+    values = np.asarray(values)
+    key = field_key(values)
+    quantiles = tuple(float(q) for q in np.atleast_1d(quantiles))
+    result = recall(percentile_cache, (key, quantiles))
+    if result is None:
+        sorted_field = recall(sorted_field_cache, key)
+        if sorted_field is not None:
+            result = sorted_quantiles(sorted_field[1], quantiles)
+        else:
+            # no sorted copy yet, a partition based nanquantile on the raw buffer is enough
+            result = np.nanquantile(values.astype(float).ravel(), quantiles)
+        result = remember(percentile_cache, (key, quantiles), read_only(np.array(result, dtype=float)))
+    return result
+
+
+def sorted_quantiles(sorted_values,quantiles):
+    # linear interpolation quantiles (same as numpy/xarray default) on already sorted values, all quantiles at once
+    quantiles = np.asarray(quantiles, dtype=float)
+    position = quantiles * (len(sorted_values) - 1)
+    lower = np.floor(position).astype(int)
+    upper = np.minimum(lower + 1, len(sorted_values) - 1)
+    return sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * (position - lower)
+
+
+def nearest_cell_index(source_latitudes,source_longitudes,target_latitudes,target_longitudes):
+    # flat index of the closest target grid cell (e.g. Atlite) for every cell of a source grid (e.g. WAD)
+    closest_lat_index = np.argmin(np.abs(np.asarray(source_latitudes)[:, np.newaxis] - np.asarray(target_latitudes)[np.newaxis, :]), axis=1)
+    closest_lon_index = np.argmin(np.abs(np.asarray(source_longitudes)[:, np.newaxis] - np.asarray(target_longitudes)[np.newaxis, :]), axis=1)
+    return (closest_lat_index[:, np.newaxis] * len(target_longitudes) + closest_lon_index[np.newaxis, :]).ravel()
+
+
+def generate_bounded_tiers(average_values,full_values,tier_bands,cell_index=None,cell_weights=None):
+    # average_values: 2D averaged field used for the bounds, full_values: (time, lat, lon) series averaged into tiers
+    # cell_index: optional flat index into the lat/lon grid of full_values for every cell of average_values (e.g. nearest
+    # Atlite cell of each WAD cell), by default the two grids are the same
+    # cell_weights: optional weight of every cell of average_values in the tier means (apply_tier_masks)
+    # returns (time, N) tier means, the bottom and top capacity factor bounds and the number of cells per tier
+    # one (memoized) sort of the field gives all bounds, and every tier is a contiguous range of the sorted cells
+    order, sorted_values = sorted_valid_values(average_values)
+    if len(order) == 0:
+        raise ValueError("No valid (non NaN) capacity factors to compute tier bounds from.")
+    bottom_bounds = sorted_quantiles(sorted_values, 1.0 - tier_bands[:, 1] / 100.0)
+    top_bounds = sorted_quantiles(sorted_values, 1.0 - tier_bands[:, 0] / 100.0)
+    # strictly between the bounds, as before
+    start = np.searchsorted(sorted_values, bottom_bounds, side='right')
+    stop = np.maximum(np.searchsorted(sorted_values, top_bounds, side='left'), start)
+
+    # (tier, grid cell) weights: how many selected cells of each tier land on each cell of the time series grid
+    # full_values can be a numpy array, a (chunked) dask array or land cells (tier_values)
+    number_of_grid_cells = grid_cell_count(full_values)
+    if cell_index is None:
+        cell_index = np.arange(number_of_grid_cells)
+    lengths = stop - start
+    tier_ids = np.repeat(np.arange(len(tier_bands)), lengths)
+    positions = np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths - start, lengths)
+    selected_weights = None if cell_weights is None else np.asarray(cell_weights, dtype=float).ravel()[order[positions]]
+    weights = np.bincount(tier_ids * number_of_grid_cells + np.asarray(cell_index).ravel()[order[positions]], weights=selected_weights, minlength=len(tier_bands) * number_of_grid_cells).reshape(len(tier_bands), number_of_grid_cells)
+
+    # all tiers in one matrix product over the cells that are used by any tier
+    tier_sums = weighted_cell_sums(full_values,weights)
+    tier_weights = lengths if cell_weights is None else np.bincount(tier_ids, weights=selected_weights, minlength=len(tier_bands))
+    with np.errstate(invalid='ignore', divide='ignore'):
+        tier_means = tier_sums / tier_weights
+
+    for tier_number in np.flatnonzero(lengths == 0):
+        print("... WARNING: tier ", tier_number + 1, " (", tier_bands[tier_number][0], " - ", tier_bands[tier_number][1], ") has no cells, its time series is empty (NaN).")
+
+    return tier_means, bottom_bounds, top_bounds, lengths
+
+
+# Upper percentage sweep functions (Options 1, 2)
+def parse_percentage_sweep(PERCENT_UPPER_SWEEP):
+    # upper percentages for a sweep, e.g. "1,2,5,10" or "1:50:1" (start:stop:step, stop included) or a mix "1:10:1,20,50"
+    percentages = []
+    for entry in str(PERCENT_UPPER_SWEEP).split(','):
+        entry = entry.strip()
+        if entry == "":
+            continue
+        try:
+            if ':' in entry:
+                start, stop, step = [float(x) for x in entry.split(':')]
+                percentages.extend(np.arange(start, stop + step / 2.0, step))
+            else:
+                percentages.append(float(entry))
+        except ValueError:
+            raise ValueError("Could not read the percentage sweep entry: " + entry + ". Use e.g. 1,2,5,10 or 1:50:1")
+    percentages = np.unique(np.round(percentages, 6))
+    if len(percentages) == 0:
+        raise ValueError("The percentage sweep is empty.")
+    if percentages.min() <= 0 or percentages.max() > 100:
+        raise ValueError("The sweep percentages must be larger than 0 and at most 100.")
+    return percentages
+
+
+def generate_upper_percentage_sweep(average_values,full_values,percentages,cell_index=None,cell_weights=None):
+    # mean time series of the cells above the (100 - percentage) percentile of the averaged field, for every percentage
+    # at once: the field is sorted once and the sweep tiers are prefix sums of the time series in sorted cell order
+    # cell_index: optional flat index into the lat/lon grid of full_values for every cell of average_values
+    # cell_weights: optional weight of every cell of average_values in the sweep means (apply_tier_masks)
+    # returns the (time, N) sweep tier means and the number of cells per percentage
+    # cells from the highest to the lowest average capacity factor, from the (memoized) sort of the field
+    ascending_order, ascending_values = sorted_valid_values(average_values)
+    if len(ascending_order) == 0:
+        raise ValueError("No valid (non NaN) capacity factors to compute the percentage sweep from.")
+    descending_order = ascending_order[::-1]
+    thresholds = sorted_quantiles(ascending_values, 1.0 - np.asarray(percentages) / 100.0)
+    # number of cells strictly above each threshold, i.e. the length of each prefix
+    cells_per_percentage = len(ascending_values) - np.searchsorted(ascending_values, thresholds, side='right')
+
+    # split the largest prefix into segments between consecutive prefix lengths, sum the series of each segment and
+    # accumulate, so no (time, cells) copy of the sorted field is needed
+    number_of_grid_cells = grid_cell_count(full_values)
+    if cell_index is None:
+        cell_index = np.arange(number_of_grid_cells)
+    segment_ends = np.unique(cells_per_percentage)
+    segment_ids = np.searchsorted(segment_ends, np.arange(segment_ends[-1]), side='right')
+    targets = np.asarray(cell_index).ravel()[descending_order[:segment_ends[-1]]]
+    selected_weights = None if cell_weights is None else np.asarray(cell_weights, dtype=float).ravel()[descending_order[:segment_ends[-1]]]
+    weights = np.bincount(segment_ids * number_of_grid_cells + targets, weights=selected_weights, minlength=len(segment_ends) * number_of_grid_cells).reshape(len(segment_ends), number_of_grid_cells)
+
+    segment_sums = weighted_cell_sums(full_values,weights)
+    prefix_sums = np.cumsum(segment_sums, axis=1)
+    prefix_weights = cells_per_percentage if cell_weights is None else np.cumsum(np.bincount(segment_ids, weights=selected_weights, minlength=len(segment_ends)))[np.searchsorted(segment_ends, cells_per_percentage)]
+
+    # pick the prefix of every percentage and turn the sums into means
+    with np.errstate(invalid='ignore', divide='ignore'):
+        sweep_means = prefix_sums[:, np.searchsorted(segment_ends, cells_per_percentage)] / prefix_weights
+    sweep_means[:, cells_per_percentage == 0] = np.nan
+
+    return sweep_means, cells_per_percentage
+
+
+def percentage_sweep_column_names(percentages):
+    # e.g. top_10_percent, top_2.5_percent
+    return ['top_' + ('%g' % percentage) + '_percent' for percentage in percentages]
+
+
+# Tier statistics functions
+def compute_tier_statistics(tier_dataframe):
+    # grouped reductions over the datetime index of the tiers: monthly means, hour of day profile, P50/P90 and ramps
+    # note P90 is the capacity factor exceeded 90% of the time, i.e. the 10th percentile of the series
+    time_index = pd.DatetimeIndex(tier_dataframe.index)
+
+    monthly_means = tier_dataframe.groupby(time_index.month).mean()
+    monthly_means.index.name = 'month'
+
+    hour_of_day_profile = tier_dataframe.groupby(time_index.hour).mean()
+    hour_of_day_profile.index.name = 'hour'
+
+    # ramps between consecutive time steps only, a time window can leave gaps (e.g. February to December for DJF)
+    ramps = tier_dataframe.diff()
+    if len(time_index) > 1:
+        time_steps = time_index.to_series().diff()
+        ramps[(time_steps != time_steps.median()).values] = np.nan
+
+    summary = pd.DataFrame({
+        'mean': tier_dataframe.mean(),
+        'P50': tier_dataframe.quantile(0.5),
+        'P90': tier_dataframe.quantile(0.1),
+        'mean_absolute_ramp': ramps.abs().mean(),
+        'max_ramp_up': ramps.max(),
+        'max_ramp_down': ramps.min(),
+        'ramp_standard_deviation': ramps.std(),
+    }).T
+    summary.index.name = 'statistic'
+
+    return {'monthly_means': monthly_means, 'hour_of_day_profile': hour_of_day_profile, 'summary_statistics': summary}
+
+
+def save_tier_statistics(tier_dataframe,OUTPUT_FOLDER,TIER_FILE_NAME,TIER_STATISTICS):
+    # writes the tier statistics beside the tier file, e.g. tiers.csv -> tiers_monthly_means.csv
+    if TIER_STATISTICS is None or str(TIER_STATISTICS).lower() != "true":
+        return None
+
+    tier_statistics = compute_tier_statistics(tier_dataframe)
+    file_stem = os.path.splitext(TIER_FILE_NAME)[0]
+    for statistic_name, statistic_dataframe in tier_statistics.items():
+        statistic_dataframe.to_csv(os.path.join(OUTPUT_FOLDER,file_stem+"_"+statistic_name+".csv"))
+    print("... Tier statistics (monthly means, hour of day profile, P50/P90 and ramps) saved beside: "+TIER_FILE_NAME)
+
+    return tier_statistics
+
+
+# Geometry functions (Options 5, 6)
+def geometry_cell_mask(geometry,latitudes,longitudes):
+    # (lat, lon) boolean mask of the grid cell centres strictly inside a shapely geometry, one vectorized call
+    import shapely
+    longitude_grid, latitude_grid = np.meshgrid(np.asarray(longitudes, dtype=float), np.asarray(latitudes, dtype=float))
+    return shapely.contains_xy(geometry, longitude_grid, latitude_grid)
+
+
+# Summed area tables (Option 5 rectangles): running sums of the values and of the valid cells over both spatial axes, so
+# the mean series of any axis aligned rectangle comes from four corner series instead of a scan of every covered cell
+SUMMED_AREA_TABLE_CACHE_SIZE = 2
+SUMMED_AREA_TABLE_MAX_MB = 4096
+summed_area_cache = OrderedDict()
+
+
+def summed_area_tables(full_values):
+    # (lat + 1, lon + 1, time) running sums of the non NaN values and counts of the valid cells of an in memory cube,
+    # time last so the corner series are contiguous. Built once per cube and kept while it is in use, None for chunked
+    # cubes or when the tables would not fit in SUMMED_AREA_TABLE_MAX_MB
+    if is_chunked(full_values) or np.ndim(full_values) != 3:
+        return None
+    cached = recall(summed_area_cache, id(full_values))
+    if cached is not None and cached[0] is full_values:
+        return cached[1]
+    number_of_times, number_of_latitudes, number_of_longitudes = np.shape(full_values)
+    # float64 sums and int32 counts
+    if number_of_times * (number_of_latitudes + 1) * (number_of_longitudes + 1) * 12 / 1e6 > SUMMED_AREA_TABLE_MAX_MB:
+        return None
+    values = np.asarray(full_values).transpose(1, 2, 0)
+    valid = ~np.isnan(values)
+    value_sums = np.zeros((number_of_latitudes + 1, number_of_longitudes + 1, number_of_times))
+    np.cumsum(np.where(valid, values, 0), axis=0, dtype=float, out=value_sums[1:, 1:])
+    np.cumsum(value_sums[1:, 1:], axis=1, out=value_sums[1:, 1:])
+    cell_counts = np.zeros((number_of_latitudes + 1, number_of_longitudes + 1, number_of_times), dtype=np.int32)
+    np.cumsum(valid, axis=0, dtype=np.int32, out=cell_counts[1:, 1:])
+    np.cumsum(cell_counts[1:, 1:], axis=1, out=cell_counts[1:, 1:])
+    remember(summed_area_cache, id(full_values), (full_values, (value_sums, cell_counts)), SUMMED_AREA_TABLE_CACHE_SIZE)
+    return value_sums, cell_counts
+
+
+def rectangle_cell_range(geometry,latitudes,longitudes):
+    # (lat start, lat stop, lon start, lon stop) index range of the cell centres strictly inside an axis aligned
+    # rectangle (the same cells as geometry_cell_mask), None for any other geometry or unsorted coordinates
+    if geometry.geom_type != 'Polygon' or len(geometry.interiors) > 0 or not geometry.is_valid:
+        return None
+    minimum_longitude, minimum_latitude, maximum_longitude, maximum_latitude = geometry.bounds
+    corners = np.unique(np.asarray(geometry.exterior.coords), axis=0)
+    if len(corners) != 4 or not (np.isin(corners[:, 0], (minimum_longitude, maximum_longitude)).all() and np.isin(corners[:, 1], (minimum_latitude, maximum_latitude)).all()):
+        return None
+
+    cell_range = []
+    for coordinates, bottom, top in ((latitudes, minimum_latitude, maximum_latitude), (longitudes, minimum_longitude, maximum_longitude)):
+        inside = np.flatnonzero((np.asarray(coordinates, dtype=float) > bottom) & (np.asarray(coordinates, dtype=float) < top))
+        if len(inside) == 0:
+            cell_range.extend([0, 0])
+        elif inside[-1] - inside[0] + 1 != len(inside):
+            return None
+        else:
+            cell_range.extend([int(inside[0]), int(inside[-1]) + 1])
+    return tuple(cell_range)
+
+
+def rectangle_mean_series(tables,lat_start,lat_stop,lon_start,lon_stop):
+    # mean series of the non NaN cells in [lat_start, lat_stop) x [lon_start, lon_stop) from four corner series
+    value_sums, cell_counts = tables
+
+    def rectangle_total(table):
+        return table[lat_stop, lon_stop] - table[lat_start, lon_stop] - table[lat_stop, lon_start] + table[lat_start, lon_start]
+
+    valid_cells = rectangle_total(cell_counts)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(valid_cells > 0, rectangle_total(value_sums) / valid_cells, np.nan)
+
+
+def weighted_row_mean(series,weights):
+    # weighted mean of the non NaN values of every row of a (time, cells) series, NaN for rows without a weighted value
+    series = np.asarray(series, dtype=float)
+    valid = ~np.isnan(series)
+    valid_weights = valid @ weights
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(valid_weights > 0, np.where(valid, series, 0.0) @ weights / valid_weights, np.nan)
+
+
+def geometry_tier_series(geometry,latitudes,longitudes,average_values,full_values,tier_bands=None,cell_weights=None):
+    # Point: series of the closest cell, Polygon: mean series of the cells inside it (Option 5) or the bounded tiers of
+    # the cells inside it (Option 6, when tier_bands are given), returns {tier label: series} and the cells per tier
+    # full_values can be a numpy array or a (chunked) dask array
+    # cell_weights: optional (lat, lon) weight of every cell in the polygon means, cells with weight 0 are left out
+    if geometry.geom_type == 'Point':
+        lat_index = int(np.abs(np.asarray(latitudes) - geometry.y).argmin())
+        lon_index = int(np.abs(np.asarray(longitudes) - geometry.x).argmin())
+        return {'tier_1': gather_cell_series(full_values,[lat_index * len(longitudes) + lon_index])[:, 0]}, 1
+    if geometry.geom_type not in ('Polygon', 'MultiPolygon'):
+        raise ValueError("Unsupported geometry type: " + geometry.geom_type + ". Use Point or Polygon.")
+
+    if tier_bands is None and cell_weights is None:
+        # axis aligned rectangles of an in memory cube are read off the summed area tables
+        rectangle = rectangle_cell_range(geometry,latitudes,longitudes)
+        tables = summed_area_tables(full_values) if rectangle is not None else None
+        if tables is not None:
+            number_of_cells = (rectangle[1] - rectangle[0]) * (rectangle[3] - rectangle[2])
+            if number_of_cells == 0:
+                return {'tier_1': np.full(time_step_count(full_values), np.nan)}, 0
+            return {'tier_1': rectangle_mean_series(tables,*rectangle)}, number_of_cells
+
+    inside = geometry_cell_mask(geometry,latitudes,longitudes)
+    if cell_weights is not None:
+        inside = inside & (np.asarray(cell_weights) > 0)
+    if tier_bands is None:
+        if not inside.any():
+            return {'tier_1': np.full(time_step_count(full_values), np.nan)}, 0
+        values, inside_cells = cell_columns(full_values,np.flatnonzero(inside.ravel()))
+        inside_weights = None if cell_weights is None else np.asarray(cell_weights, dtype=float)[inside]
+
+        def mean_block(block):
+            # mean of the non NaN cells inside the geometry at every time step (weighted with cell_weights)
+            selected = select_columns(block,inside_cells)
+            if inside_weights is not None:
+                return weighted_row_mean(selected,inside_weights)[:, np.newaxis]
+            valid_cells = (~np.isnan(selected)).sum(axis=1)
+            with np.errstate(invalid='ignore', divide='ignore'):
+                return np.where(valid_cells > 0, np.nansum(selected, axis=1) / valid_cells, np.nan)[:, np.newaxis]
+
+        return {'tier_1': reduce_time_chunks(mean_block,values,1)[:, 0]}, int(inside.sum())
+    tier_means, bottom_bounds, top_bounds, lengths = generate_bounded_tiers(np.where(inside, np.asarray(average_values, dtype=float), np.nan),full_values,tier_bands,cell_weights=cell_weights)
+    return {'tier_'+str(tier_number+1): tier_means[:, tier_number] for tier_number in range(len(tier_bands))}, lengths.tolist()
+
+
+# Site ranking functions (site_ranking.py, tier service): maxima of an averaged field over blocks of cells, blocks of
+# blocks and so on, so the best K cells are found by opening only the blocks that can still beat the sites found so far
+SITE_RANKING_BLOCK_SIZE = 8
+SITE_RANKING_CACHE_SIZE = 2
+EARTH_RADIUS_KM = 6371.0
+block_max_cache = OrderedDict()
+
+
+def block_max_pyramid(values,block_size=SITE_RANKING_BLOCK_SIZE):
+    # [cells, maxima of block_size x block_size cells, maxima of block_size x block_size of those, ..., one block] of a
+    # (lat, lon) field, NaN cells count as -inf. Built once per field and kept while it is in use
+    cached = recall(block_max_cache, id(values))
+    if cached is not None and cached[0] is values:
+        return cached[1]
+    level = np.asarray(values)
+    level = np.where(np.isnan(level), -np.inf, level)
+    pyramid = [level]
+    while level.shape[0] > 1 or level.shape[1] > 1:
+        rows = -(-level.shape[0] // block_size) * block_size
+        columns = -(-level.shape[1] // block_size) * block_size
+        padded = np.full((rows, columns), -np.inf, dtype=level.dtype)
+        padded[:level.shape[0], :level.shape[1]] = level
+        level = padded.reshape(rows // block_size, block_size, columns // block_size, block_size).max(axis=(1, 3))
+        pyramid.append(level)
+    remember(block_max_cache, id(values), (values, pyramid), SITE_RANKING_CACHE_SIZE)
+    return pyramid
+
+
+def distance_km(latitude,longitude,latitudes,longitudes):
+    # great circle (haversine) distance from one point to an array of points
+    latitude, longitude, latitudes, longitudes = (np.radians(np.asarray(angle, dtype=float)) for angle in (latitude, longitude, latitudes, longitudes))
+    haversine = np.sin((latitudes - latitude) / 2) ** 2 + np.cos(latitude) * np.cos(latitudes) * np.sin((longitudes - longitude) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(haversine))
+
+
+def top_k_sites(values,latitudes,longitudes,number_of_sites,minimum_distance_km=None,region=None,block_size=SITE_RANKING_BLOCK_SIZE):
+    # flat (lat, lon) indices of the number_of_sites highest non NaN cells of a (lat, lon) field, best first, inside the
+    # region (latitude bottom, latitude top, longitude left, longitude right) and at least minimum_distance_km apart
+    # (greedy: a cell is taken when it is far enough from all the better sites already taken).
+    # Best first branch and bound over the block max pyramid: blocks come off a heap in order of their maximum, so a
+    # block is only opened when it can still beat the sites found so far, the cells of a block are picked with argpartition
+    import heapq
+    pyramid = block_max_pyramid(values,block_size)
+    latitudes = np.asarray(latitudes, dtype=float)
+    longitudes = np.asarray(longitudes, dtype=float)
+    number_of_sites = int(number_of_sites)
+    spacing = minimum_distance_km is not None and float(minimum_distance_km) > 0
+    if region is None:
+        latitude_inside = np.ones(len(latitudes), dtype=bool)
+        longitude_inside = np.ones(len(longitudes), dtype=bool)
+    else:
+        latitude_inside = (latitudes >= region[0]) & (latitudes <= region[1])
+        longitude_inside = (longitudes >= region[2]) & (longitudes <= region[3])
+    # running counts of the region rows and columns, a block outside the region is never opened
+    latitude_count = np.concatenate([[0], np.cumsum(latitude_inside)])
+    longitude_count = np.concatenate([[0], np.cumsum(longitude_inside)])
+
+    def in_region(level,row,column):
+        size = block_size ** level
+        return latitude_count[min((row + 1) * size, len(latitudes))] > latitude_count[row * size] and longitude_count[min((column + 1) * size, len(longitudes))] > longitude_count[column * size]
+
+    top_level = len(pyramid) - 1
+    heap = [(-pyramid[top_level][0, 0], top_level, 0, 0)] if number_of_sites > 0 and in_region(top_level, 0, 0) else []
+    sites = []
+    while heap and len(sites) < number_of_sites:
+        negative_maximum, level, row, column = heapq.heappop(heap)
+        if negative_maximum == np.inf:
+            # only NaN cells left
+            break
+        if level == 0:
+            if spacing and sites and distance_km(latitudes[row], longitudes[column], latitudes[[site // len(longitudes) for site in sites]], longitudes[[site % len(longitudes) for site in sites]]).min() < float(minimum_distance_km):
+                continue
+            sites.append(row * len(longitudes) + column)
+        elif level == 1:
+            rows = slice(row * block_size, min((row + 1) * block_size, len(latitudes)))
+            columns = slice(column * block_size, min((column + 1) * block_size, len(longitudes)))
+            block = np.where(latitude_inside[rows, np.newaxis] & longitude_inside[np.newaxis, columns], pyramid[0][rows, columns], -np.inf).ravel()
+            # without spacing only the best cells of the block still needed can make it, with spacing any of them can
+            keep = min(len(block), number_of_sites - len(sites)) if not spacing else len(block)
+            candidates = np.argpartition(-block, keep - 1)[:keep] if keep < len(block) else np.arange(len(block))
+            for candidate in candidates:
+                if block[candidate] > -np.inf:
+                    heapq.heappush(heap, (-block[candidate], 0, rows.start + candidate // (columns.stop - columns.start), columns.start + candidate % (columns.stop - columns.start)))
+        else:
+            child_level = pyramid[level - 1]
+            for child_row in range(row * block_size, min((row + 1) * block_size, child_level.shape[0])):
+                for child_column in range(column * block_size, min((column + 1) * block_size, child_level.shape[1])):
+                    if child_level[child_row, child_column] > -np.inf and in_region(level - 1, child_row, child_column):
+                        heapq.heappush(heap, (-child_level[child_row, child_column], level - 1, child_row, child_column))
+    return np.array(sites, dtype=int)
+
+
+# Wind atlas bias correction functions (Option 7)
+def area_weighted_regrid_index(source_latitudes,source_longitudes,target_latitudes,target_longitudes):
+    # aggregation index from a fine grid (e.g. WAD) onto a coarse grid (e.g. Atlite): the flat target cell of every source
+    # cell and its area weight (cos of the latitude, the cells of a regular lat/lon grid shrink towards the poles).
+    # Source cells outside every target cell (more than half a target spacing from the closest target centre, e.g. the
+    # WAD around the Atlite domain) get -1 and are left out, otherwise they would all be averaged into the edge cells
+    inside = []
+    for source_coordinates, target_coordinates in ((source_latitudes, target_latitudes), (source_longitudes, target_longitudes)):
+        source_coordinates = np.asarray(source_coordinates, dtype=float)
+        target_coordinates = np.asarray(target_coordinates, dtype=float)
+        closest = np.argmin(np.abs(source_coordinates[:, np.newaxis] - target_coordinates[np.newaxis, :]), axis=1)
+        half_spacing = np.abs(np.gradient(target_coordinates))[closest] / 2.0 if len(target_coordinates) > 1 else np.inf
+        # a source centre on the border between two target cells still counts as inside
+        inside.append(np.abs(source_coordinates - target_coordinates[closest]) <= half_spacing * (1 + 1e-6))
+    cell_index = nearest_cell_index(source_latitudes,source_longitudes,target_latitudes,target_longitudes)
+    cell_index[~(inside[0][:, np.newaxis] & inside[1][np.newaxis, :]).ravel()] = -1
+    area_weights = np.repeat(np.cos(np.deg2rad(np.asarray(source_latitudes, dtype=float))), len(source_longitudes))
+    return cell_index, area_weights
+
+
+def regrid_to_target_grid(source_values,cell_index,area_weights,target_shape):
+    # area weighted mean of the (non NaN) source cells in every target cell, NaN for target cells without source cells
+    # source cells outside the target grid (index -1) are left out
+    source_flat = np.asarray(source_values, dtype=float).ravel()
+    valid = ~np.isnan(source_flat) & (cell_index >= 0)
+    number_of_target_cells = target_shape[0] * target_shape[1]
+    weighted_sums = np.bincount(cell_index[valid], weights=source_flat[valid] * area_weights[valid], minlength=number_of_target_cells)
+    weight_sums = np.bincount(cell_index[valid], weights=area_weights[valid], minlength=number_of_target_cells)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        regridded = weighted_sums / weight_sums
+    regridded[weight_sums == 0] = np.nan
+    return regridded.reshape(target_shape)
+
+
+def quantile_mapping_table(model_values,reference_values,number_of_quantiles=101):
+    # quantiles of the model (Atlite) and reference (WAD) long term mean fields at the same levels, a model value is
+    # mapped onto the reference value at the same quantile, keeping the model ranking of the cells
+    quantiles = np.linspace(0, 1, int(number_of_quantiles))
+    model_quantiles = sorted_quantiles(sorted_valid_values(model_values)[1], quantiles)
+    reference_quantiles = sorted_quantiles(sorted_valid_values(reference_values)[1], quantiles)
+    return pd.DataFrame({'quantile': quantiles, 'atlite_mean': model_quantiles, 'wind_atlas_mean': reference_quantiles})
+
+
+def correction_scale_factors(atlite_mean,target_mean):
+    # per cell multiplicative factors that move the Atlite long term mean onto the target mean, cells without a target or
+    # with a zero Atlite mean are left unchanged (factor 1)
+    atlite_mean = np.asarray(atlite_mean, dtype=float)
+    target_mean = np.asarray(target_mean, dtype=float)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        scale_factors = target_mean / atlite_mean
+    scale_factors[~np.isfinite(scale_factors)] = 1.0
+    return scale_factors
+
+
+def parse_correction_time_chunk(CORRECTION_TIME_CHUNK):
+    # number of time steps corrected and written at a time, also the time chunk the Atlite input is read in (default 744, a month of hours)
+    time_chunk = int(CORRECTION_TIME_CHUNK) if CORRECTION_TIME_CHUNK is not None and str(CORRECTION_TIME_CHUNK).strip() != "" else 744
+    if time_chunk < 1:
+        raise ValueError("CORRECTION_TIME_CHUNK must be at least 1, got: " + str(CORRECTION_TIME_CHUNK))
+    return time_chunk
+
+
+def write_corrected_cube(atlite_capacity_factors,scale_factors,CORRECTED_CUBE_FILE,DATA_VARIABLE_NAME,TIME_VARIABLE_NAME,LATITUDE_VARIABLE_NAME,LONGITUDE_VARIABLE_NAME,CORRECTION_TIME_CHUNK=None,CUBE_COMPRESSION=None,CUBE_CHUNK_LAYOUT=None):
+    # applies the scale factors chunk by chunk along time and streams every chunk straight into the netcdf file, so only
+    # one chunk of the corrected cube is in memory at a time. Scaled capacity factors above 1 (or below 0) are clipped
+    import netCDF4
+
+    time_chunk = parse_correction_time_chunk(CORRECTION_TIME_CHUNK)
+    data = atlite_capacity_factors[DATA_VARIABLE_NAME]
+    time_index = pd.DatetimeIndex(atlite_capacity_factors[TIME_VARIABLE_NAME].values)
+    latitudes = atlite_capacity_factors[LATITUDE_VARIABLE_NAME].values
+    longitudes = atlite_capacity_factors[LONGITUDE_VARIABLE_NAME].values
+    # the time chunk of the file is the correction time chunk for the spatial layout (the default)
+    cube_storage = cube_encoding(CUBE_COMPRESSION,cube_chunk_sizes((len(time_index), len(latitudes), len(longitudes)),CUBE_CHUNK_LAYOUT,time_chunk))
+
+    with netCDF4.Dataset(CORRECTED_CUBE_FILE, 'w') as cube:
+        cube.createDimension(TIME_VARIABLE_NAME, None)
+        cube.createDimension(LATITUDE_VARIABLE_NAME, len(latitudes))
+        cube.createDimension(LONGITUDE_VARIABLE_NAME, len(longitudes))
+        times = cube.createVariable(TIME_VARIABLE_NAME, 'f8', (TIME_VARIABLE_NAME,))
+        times.units = "hours since " + str(time_index[0])
+        times.calendar = "standard"
+        cube.createVariable(LATITUDE_VARIABLE_NAME, 'f8', (LATITUDE_VARIABLE_NAME,))[:] = latitudes
+        cube.createVariable(LONGITUDE_VARIABLE_NAME, 'f8', (LONGITUDE_VARIABLE_NAME,))[:] = longitudes
+        corrected = cube.createVariable(DATA_VARIABLE_NAME, 'f4', (TIME_VARIABLE_NAME, LATITUDE_VARIABLE_NAME, LONGITUDE_VARIABLE_NAME), fill_value=np.float32(np.nan), **cube_storage)
+        corrected.long_name = "wind atlas corrected " + DATA_VARIABLE_NAME
+
+        clipped_values = 0
+        for start in range(0, len(time_index), time_chunk):
+            stop = min(start + time_chunk, len(time_index))
+            times[start:stop] = (time_index[start:stop] - time_index[0]) / pd.Timedelta(hours=1)
+            corrected_chunk = np.asarray(data[start:stop].values, dtype=float) * scale_factors[np.newaxis, :, :]
+            clipped_values += int(np.count_nonzero((corrected_chunk > 1) | (corrected_chunk < 0)))
+            corrected[start:stop, :, :] = np.clip(corrected_chunk, 0, 1)
+            print("...... Corrected time steps ",stop," out of ",len(time_index))
+    print("...... Clipped ",clipped_values," corrected capacity factors outside [0, 1] out of ",len(time_index) * len(latitudes) * len(longitudes))
+
+    return CORRECTED_CUBE_FILE
+
+
+# Cube store functions (Option 7 corrected cube, benchmark_cube_store.py): compression and chunk shape of the netcdf
+# cubes. zlib is always there, zstd and bzip2 need the HDF5 filter plugins (pip install hdf5plugin) and the blosc
+# codecs the netcdf-c blosc plugin (conda install netcdf4), compression_available tells which ones can be used
+CUBE_COMPRESSIONS = ('none', 'zlib', 'zstd', 'bzip2', 'blosc_lz4', 'blosc_lz4hc', 'blosc_zstd', 'blosc_lz', 'blosc_zlib')
+CUBE_CHUNK_LAYOUTS = ('spatial', 'time_series', 'balanced')
+CUBE_CHUNK_TARGET_VALUES = 1000000
+compression_check_cache = {}
+
+
+def parse_cube_compression(CUBE_COMPRESSION):
+    # "codec" or "codec:level" (level 1 to 9, default 4), e.g. zlib, zstd:3 or blosc_lz4:5, empty is no compression
+    if CUBE_COMPRESSION is None or str(CUBE_COMPRESSION).strip() == "":
+        return 'none', 0
+    codec, _, level = str(CUBE_COMPRESSION).strip().lower().partition(':')
+    if codec not in CUBE_COMPRESSIONS:
+        raise ValueError("Unknown cube compression: " + str(CUBE_COMPRESSION) + ". Choose from: " + ", ".join(CUBE_COMPRESSIONS) + " (optionally with :level, e.g. zstd:3)")
+    try:
+        level = int(level) if level != "" else 4
+    except ValueError:
+        raise ValueError("The cube compression level must be a whole number from 1 to 9, got: " + str(CUBE_COMPRESSION))
+    if not 1 <= level <= 9:
+        raise ValueError("The cube compression level must be a whole number from 1 to 9, got: " + str(CUBE_COMPRESSION))
+    return codec, level
+
+
+def cube_chunk_sizes(shape,CUBE_CHUNK_LAYOUT=None,time_chunk=744):
+    # (time, lat, lon) chunk shape of a cube for its main access pattern, about CUBE_CHUNK_TARGET_VALUES values each:
+    # spatial: whole lat/lon planes of time_chunk steps, for time averaging and geometry (spatial) averages (default)
+    # time_series: long series of small lat/lon tiles, for gathering the series of single cells (Options 1, 2, sites)
+    # balanced: a week of hours on mid sized tiles, in between the two
+    number_of_times, number_of_latitudes, number_of_longitudes = (int(size) for size in shape)
+    layout = 'spatial' if CUBE_CHUNK_LAYOUT is None or str(CUBE_CHUNK_LAYOUT).strip() == "" else str(CUBE_CHUNK_LAYOUT).strip().lower()
+    if layout not in CUBE_CHUNK_LAYOUTS:
+        raise ValueError("Unknown cube chunk layout: " + str(CUBE_CHUNK_LAYOUT) + ". Choose from: " + ", ".join(CUBE_CHUNK_LAYOUTS))
+    if layout == 'spatial':
+        return max(min(int(time_chunk), number_of_times), 1), number_of_latitudes, number_of_longitudes
+    chunk_time = min(number_of_times, 8760 if layout == 'time_series' else 168)
+    tile = max(int(np.sqrt(CUBE_CHUNK_TARGET_VALUES / chunk_time)), 1)
+
+    # equal tiles that cover the grid without a mostly empty last tile (which would still be stored in full)
+    def even_tile(size):
+        return int(np.ceil(size / np.ceil(size / tile)))
+    return max(chunk_time, 1), even_tile(number_of_latitudes), even_tile(number_of_longitudes)
+
+
+def cube_encoding(CUBE_COMPRESSION,chunk_sizes):
+    # netCDF4 variable settings (also valid as xarray netcdf encoding) for the codec and the chunk shape. The bytes are
+    # shuffled in front of zlib (HDF5 shuffle filter) and inside blosc (blosc byte shuffle), netCDF4 has no shuffle for
+    # zstd and bzip2
+    codec, level = parse_cube_compression(CUBE_COMPRESSION)
+    cube_storage = {'chunksizes': tuple(int(size) for size in chunk_sizes)}
+    if codec == 'none':
+        return cube_storage
+    if not compression_available(codec):
+        raise ValueError("Cube compression " + codec + " is not available in this netCDF4/HDF5 installation. zstd and bzip2 need pip install hdf5plugin, the blosc codecs the conda netcdf4 package, zlib always works.")
+    cube_storage.update({'compression': codec, 'complevel': level, 'shuffle': codec == 'zlib'})
+    if codec.startswith('blosc'):
+        cube_storage['blosc_shuffle'] = 1
+    return cube_storage
+
+
+def compression_available(codec):
+    # True when a small variable can be written with the codec, tried once per codec in an in-memory netcdf file
+    import netCDF4
+    if codec in ('none', 'zlib'):
+        return True
+    if codec not in compression_check_cache:
+        try:
+            with netCDF4.Dataset('compression_check.nc', 'w', diskless=True, persist=False) as check:
+                check.createDimension('value', 16)
+                check.createVariable('check', 'f4', ('value',), compression=codec, chunksizes=(16,))[:] = np.arange(16, dtype=np.float32)
+            compression_check_cache[codec] = True
+        except Exception:
+            compression_check_cache[codec] = False
+    return compression_check_cache[codec]
+
+
+# Startup cost functions
+def profile_imports(module_names):
+    # import time of every module in a fresh interpreter (python -X importtime) and its heaviest direct imports
+    import subprocess
+    import sys
+
+    import_profile = {}
+    for module_name in module_names:
+        completed = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import ' + module_name], capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__)))
+        if completed.returncode != 0:
+            import_profile[module_name] = {'error': completed.stderr.strip().splitlines()[-1]}
+            continue
+
+        # lines look like "import time:       468 |    1035100 |   package", two spaces of indent per nesting level
+        entries = []
+        for line in completed.stderr.splitlines():
+            if not line.startswith('import time:') or 'self [us]' in line:
+                continue
+            self_us, cumulative_us, name = line[len('import time:'):].split('|')
+            entries.append(((len(name) - len(name.lstrip()) - 1) // 2, name.strip(), int(cumulative_us)))
+
+        # the module is listed after everything it imported, its direct imports are the entries one level deeper
+        module_position = max(position for position, entry in enumerate(entries) if entry[1] == module_name)
+        module_depth = entries[module_position][0]
+        direct_imports = []
+        for depth, name, cumulative_us in reversed(entries[:module_position]):
+            if depth <= module_depth:
+                break
+            if depth == module_depth + 1:
+                direct_imports.append((name, cumulative_us / 1000.0))
+        import_profile[module_name] = {
+            'total_ms': entries[module_position][2] / 1000.0,
+            'heaviest_imports_ms': sorted(direct_imports, key=lambda entry: entry[1], reverse=True)[:5],
+        }
+    return import_profile
+
+
+def print_import_profile(import_profile):
+    print("\nStartup (import) cost per module:")
+    for module_name, module_profile in import_profile.items():
+        if 'error' in module_profile:
+            print("... ", module_name, ": could not be imported: ", module_profile['error'])
+            continue
+        print("... ", module_name, ": ", round(module_profile['total_ms']), " ms")
+        for name, milliseconds in module_profile['heaviest_imports_ms']:
+            print("......   ", name, ": ", round(milliseconds), " ms")
+
+
+
+# Stage timing functions: spans around the main stages of an option (stitch, average, quantile, selection, gather,
+# write, render) record their duration, the process peak memory and an item count. At the end of a run the spans are
+# summed per stage into a summary table, and appended to a JSON lines file if one is set
+PROGRESS_INTERVAL_SECONDS = 10
+stage_records = []
+stage_log = {'run': None, 'file': None}
+
+
+def peak_memory_mb():
+    # peak resident memory of the process so far, None where the resource module does not exist (Windows)
+    try:
+        import resource
+        import sys
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on linux, bytes on mac
+    return peak / 1e6 if sys.platform == 'darwin' else peak / 1e3
+
+
+def start_stage_log(RUN_NAME,STAGE_TIMING_LOG_FILE=None):
+    # start recording the stages of a run, the summary is also appended to STAGE_TIMING_LOG_FILE (JSON lines) if set
+    stage_records.clear()
+    stage_log['run'] = RUN_NAME
+    # a new run has no checkpoints until it starts its pipeline (start_pipeline)
+    pipeline_run['folder'] = None
+    pipeline_run['resume'] = False
+    stage_log['file'] = STAGE_TIMING_LOG_FILE if STAGE_TIMING_LOG_FILE is not None and str(STAGE_TIMING_LOG_FILE).strip() != "" else None
+
+
+@contextlib.contextmanager
+def stage_span(stage,items=None):
+    # with stage_span("gather") as span: ... span['items'] = number of cells/files/geometries handled
+    span = {'stage': stage, 'items': items}
+    peak_before = peak_memory_mb()
+    start = time.perf_counter()
+    try:
+        yield span
+    finally:
+        span['seconds'] = round(time.perf_counter() - start, 6)
+        span['peak_memory_mb'] = None if peak_before is None else round(peak_memory_mb(), 3)
+        span['peak_memory_increase_mb'] = None if peak_before is None else round(span['peak_memory_mb'] - peak_before, 3)
+        stage_records.append(span)
+
+
+def stage_summary():
+    # spans of the same stage (e.g. one per geometry) added up, in the order the stages first ran
+    summary = {}
+    for span in stage_records:
+        stage = summary.setdefault(span['stage'], {'run': stage_log['run'], 'stage': span['stage'], 'calls': 0, 'seconds': 0.0, 'items': None, 'peak_memory_mb': span['peak_memory_mb'], 'peak_memory_increase_mb': span['peak_memory_increase_mb']})
+        stage['calls'] += 1
+        stage['seconds'] = round(stage['seconds'] + span['seconds'], 6)
+        if span['items'] is not None:
+            stage['items'] = (stage['items'] or 0) + int(span['items'])
+        if span['peak_memory_mb'] is not None:
+            stage['peak_memory_mb'] = max(stage['peak_memory_mb'], span['peak_memory_mb'])
+            stage['peak_memory_increase_mb'] = max(stage['peak_memory_increase_mb'], span['peak_memory_increase_mb'])
+    return list(summary.values())
+
+
+def print_stage_summary():
+    # table of the stages recorded since start_stage_log, also appended to the JSON lines file if set
+    summary = stage_summary()
+    if not summary:
+        return
+    print("\n... Stage timings:")
+    print("...... {:<16} {:>6} {:>10} {:>10} {:>16} {:>12}".format("stage", "calls", "seconds", "items", "peak memory MB", "increase MB"))
+    for stage in summary:
+        print("...... {:<16} {:>6} {:>10.3f} {:>10} {:>16} {:>12}".format(stage['stage'], stage['calls'], stage['seconds'], "-" if stage['items'] is None else stage['items'], "-" if stage['peak_memory_mb'] is None else round(stage['peak_memory_mb']), "-" if stage['peak_memory_increase_mb'] is None else round(stage['peak_memory_increase_mb'], 1)))
+    if stage_log['file'] is not None:
+        with open(stage_log['file'], 'a') as log_file:
+            for stage in summary:
+                log_file.write(json.dumps(dict(stage, time=time.strftime('%Y-%m-%dT%H:%M:%S'))) + "\n")
+        print("... Stage timings appended to: " + stage_log['file'])
+
+
+def progress_reporter(total,message,interval=PROGRESS_INTERVAL_SECONDS):
+    # replaces a print per item in long loops: report(done) prints at most every interval seconds, and the last item
+    last_print = [time.perf_counter()]
+
+    def report(done):
+        now = time.perf_counter()
+        if done == total or now - last_print[0] >= interval:
+            last_print[0] = now
+            print("... " + message + ": " + str(done) + " out of " + str(total))
+    return report
+
+
+# Run set up functions: the arguments of a script are the command line arguments on top of the .env file values, and
+# they are all checked before any data is read, so a wrong value fails the run at once instead of after the stitching
+def script_arguments(args, load_from_env):
+    # A run is started once with these arguments, an error in the run is raised (it used to start the whole run again
+    # with the .env file values)
+    given = {name: value for name, value in vars(args).items() if value is not None}
+    if len(given) == 0:
+        print("NO ARGUMENTS FOUND. USING ENV FILE")
+        env_vars = load_from_env()
+        drop_empty_dask_settings()
+        return env_vars
+    print("ARGUMENTS FOUND. USING ARGUMENTS (" + str(len(given)) + "), THE OTHER VARIABLES FROM THE ENV FILE")
+    # the .env warnings about variables that are not set are left out, the arguments may set them
+    with contextlib.redirect_stdout(io.StringIO()):
+        env_vars = load_from_env()
+    drop_empty_dask_settings()
+    arguments = dict(env_vars)
+    arguments.update(given)
+    return arguments
+
+
+TRUE_FALSE_PARAMETERS = ('ATLITE_DUMMY_DATA', 'SCALE_CAPACITY_FACTORS', 'REDUCED_WAD', 'TIER_STATISTICS', 'ATLITE_FOLDER_MANIFESTS', 'ATLITE_LAND_CELLS', 'RESUME', 'OPTION_5_VIEW_VALID_GEOMETRIES', 'OPTION_6_VIEW_VALID_GEOMETRIES')
+# parameter: (check of the value, what the value must be)
+NUMBER_PARAMETERS = {
+    'MAXIMUM_CAPACITY': (lambda value: float(value) > 0, "a number above 0"),
+    'DUMMY_LATITUDE_BOTTOM': (lambda value: -90 <= float(value) <= 90, "a latitude"),
+    'DUMMY_LATITUDE_TOP': (lambda value: -90 <= float(value) <= 90, "a latitude"),
+    'DUMMY_LONGITUDE_LEFT': (lambda value: -180 <= float(value) <= 360, "a longitude"),
+    'DUMMY_LONGITUDE_RIGHT': (lambda value: -180 <= float(value) <= 360, "a longitude"),
+    'DUMMY_RESOLUTION': (lambda value: float(value) > 0, "a number of degrees above 0"),
+    'WIND_ATLAS_RESOLUTION_REDUCTION': (lambda value: int(value) >= 1, "a whole number of at least 1"),
+    'PERCENT_UPPER_CAPACITY_FACTORS_1': (lambda value: 0 <= float(value) <= 100, "a percentage from 0 to 100"),
+    'PERCENT_UPPER_CAPACITY_FACTORS_2': (lambda value: 0 <= float(value) <= 100, "a percentage from 0 to 100"),
+    'OPTION_7_CORRECTION_TIME_CHUNK': (lambda value: int(value) >= 1, "a whole number of at least 1"),
+    'SITE_RANKING_TOP_K': (lambda value: int(value) >= 1, "a whole number of at least 1"),
+    'SITE_RANKING_MIN_DISTANCE_KM': (lambda value: float(value) >= 0, "a distance of at least 0"),
+    'DUMMY_START_DATE': (lambda value: pd.Timestamp(value) is not pd.NaT, "a date, e.g. 2023-01-01"),
+    'DUMMY_END_DATE': (lambda value: pd.Timestamp(value) is not pd.NaT, "a date, e.g. 2023-01-01"),
+    'TIME_WINDOW_START': (lambda value: pd.Timestamp(value) is not pd.NaT, "a date, e.g. 2023-01-01"),
+    'TIME_WINDOW_END': (lambda value: pd.Timestamp(value) is not pd.NaT, "a date, e.g. 2023-01-01"),
+    'TIER_MASK_MIN_FRACTION': (lambda value: 0 <= float(value) <= 1, "a fraction from 0 to 1"),
+    'WIND_ATLAS_REDUCTION_QUANTILE': (lambda value: 0 <= float(value) <= 1, "a fraction from 0 to 1"),
+}
+# parameters read by a parse function, which raises a ValueError that says what is wrong
+PARSED_PARAMETERS = {
+    'ATLITE_CUBE_FILE': lambda value: atlite_cube_files(value),
+    'ATLITE_CHUNKS': lambda value: parse_atlite_chunks(value),
+    'ATLITE_PREFETCH_DEPTH': lambda value: parse_prefetch_depth(value),
+    'TIME_WINDOW_MONTHS': lambda value: parse_time_window_months(value),
+    'ROI_BBOX': lambda value: region_of_interest(value),
+    'ROI_GEOMETRY_FILE': lambda value: region_of_interest(None, value),
+    'SITE_RANKING_BBOX': lambda value: region_of_interest(value),
+    'TIER_SPECIFICATION': lambda value: parse_tier_specification(value),
+    'PERCENT_UPPER_SWEEP_1': lambda value: parse_percentage_sweep(value),
+    'PERCENT_UPPER_SWEEP_2': lambda value: parse_percentage_sweep(value),
+    'OPTION_7_CUBE_COMPRESSION': lambda value: parse_cube_compression(value),
+    'OPTION_7_CUBE_CHUNK_LAYOUT': lambda value: cube_chunk_sizes((1, 1, 1), value),
+    'TIER_MASK_MODE': lambda value: parse_tier_mask_mode(value),
+    'WIND_ATLAS_REDUCTION_METHOD': lambda value: parse_wind_atlas_reduction(value),
+}
+INPUT_FILE_PARAMETERS = ('WIND_ATLAS_CAPACITY_FACTORS_HEATMAP_FILE_LOCATION', 'BATCH_CONFIG_FILE')
+
+
+def check_configuration(arguments):
+    # check the arguments of a run (check_configuration(locals()) as the first line of a run), all problems are listed
+    # in one error. Empty values are left to the defaults of the run
+    problems = []
+    given = {name: str(value).strip() for name, value in arguments.items() if value is not None and str(value).strip() != ""}
+    # the site ranking only reads the wind atlas file when it ranks on the WAD field
+    if 'SITE_RANKING_FIELD' in arguments and given.get('SITE_RANKING_FIELD', 'atlite').lower() != 'wad':
+        given.pop('WIND_ATLAS_CAPACITY_FACTORS_HEATMAP_FILE_LOCATION', None)
+    for name, value in given.items():
+        try:
+            if name in TRUE_FALSE_PARAMETERS and value.lower() not in ('true', 'false'):
+                problems.append(name + " must be True or False, got: " + value)
+            elif name in NUMBER_PARAMETERS and not NUMBER_PARAMETERS[name][0](value):
+                problems.append(name + " must be " + NUMBER_PARAMETERS[name][1] + ", got: " + value)
+            elif name in PARSED_PARAMETERS:
+                PARSED_PARAMETERS[name](value)
+            elif name in INPUT_FILE_PARAMETERS and not os.path.isfile(value):
+                problems.append(name + " file does not exist: " + value)
+        except (ValueError, TypeError) as e:
+            if name in NUMBER_PARAMETERS:
+                problems.append(name + " must be " + NUMBER_PARAMETERS[name][1] + ", got: " + value)
+            else:
+                problems.append(str(e))
+
+    # the Atlite csv folders are read when there is no cube file and no dummy data
+    if given.get('ATLITE_DUMMY_DATA', '').lower() == 'false' and 'ATLITE_CUBE_FILE' not in given and 'ATLITE_CAPACITY_FACTORS_FOLDERS' in arguments:
+        folders = [folder for folder in given.get('ATLITE_CAPACITY_FACTORS_FOLDERS', '').split(',') if folder.strip() != ""]
+        if len(folders) == 0:
+            problems.append("ATLITE_CAPACITY_FACTORS_FOLDERS is not set (or set ATLITE_CUBE_FILE, or ATLITE_DUMMY_DATA=True).")
+        problems.extend("Atlite folder does not exist: " + folder for folder in folders if not os.path.isdir(folder))
+    if 'TIER_MASKS_FOLDER' in given and not os.path.isdir(given['TIER_MASKS_FOLDER']):
+        problems.append("TIER_MASKS_FOLDER does not exist: " + given['TIER_MASKS_FOLDER'])
+    if given.get('RESUME', '').lower() == 'true' and 'CHECKPOINT_FOLDER' not in given:
+        problems.append("RESUME=True needs the CHECKPOINT_FOLDER of the failed run.")
+
+    # the output folders must be writable (they are made if they do not exist yet)
+    for name, value in given.items():
+        if name.endswith('_OUTPUT_FOLDER') or name == 'CHECKPOINT_FOLDER':
+            try:
+                os.makedirs(value, exist_ok=True)
+                if not os.access(value, os.W_OK):
+                    problems.append(name + " is not writable: " + value)
+            except OSError as e:
+                problems.append(name + " can't be made: " + value + " (" + str(e) + ")")
+    if 'AVG_ATLITE_CAPACITY_FACTORS_FILE_LOCATION' in given:
+        average_folder = os.path.dirname(given['AVG_ATLITE_CAPACITY_FACTORS_FILE_LOCATION']) or "."
+        if not os.path.isdir(average_folder):
+            problems.append("The folder of AVG_ATLITE_CAPACITY_FACTORS_FILE_LOCATION does not exist: " + average_folder)
+
+    if problems:
+        raise ValueError("The configuration has " + str(len(problems)) + " problem(s), nothing was run:\n - " + "\n - ".join(problems))
+    print("... Configuration checked.")
+
+
+# Pipeline checkpoint functions: with CHECKPOINT_FOLDER set the result of every finished heavy stage of a run (ingest,
+# average, reduce, or the tier of every geometry in Options 5 and 6) is saved, and RESUME=True starts a failed run again
+# from its last finished stage. The checkpoints of a run are kept in a folder named after the run and a hash of its
+# arguments, so they are only used by a run with the same settings, and they are deleted when the run completes
+# arguments that do not change the results of the stages
+PIPELINE_KEY_IGNORED = ('RESUME', 'CHECKPOINT_FOLDER', 'STAGE_TIMING_LOG_FILE', 'TIER_DASK_SCHEDULER', 'TIER_DASK_NUM_WORKERS', 'ATLITE_PREFETCH_DEPTH', 'ATLITE_FOLDER_MANIFESTS', 'TIER_MASK_CACHE_FOLDER', 'WIND_ATLAS_PYRAMID_FOLDER')
+pipeline_run = {'folder': None, 'resume': False}
+
+
+def start_pipeline(RUN_NAME, arguments, CHECKPOINT_FOLDER=None, RESUME=None):
+    pipeline_run['folder'] = None
+    pipeline_run['resume'] = False
+    if CHECKPOINT_FOLDER is None or str(CHECKPOINT_FOLDER).strip() == "":
+        return
+    key_arguments = {name: None if value is None else str(value) for name, value in arguments.items() if name not in PIPELINE_KEY_IGNORED}
+    run_key = hashlib.blake2b(json.dumps(key_arguments, sort_keys=True).encode(), digest_size=8).hexdigest()
+    pipeline_run['folder'] = os.path.join(str(CHECKPOINT_FOLDER).strip(), RUN_NAME + "_" + run_key)
+    pipeline_run['resume'] = str(RESUME).strip().lower() == 'true'
+    os.makedirs(pipeline_run['folder'], exist_ok=True)
+    # finished stages in the order they finished
+    done_files = sorted(glob.glob(os.path.join(pipeline_run['folder'], "*.done")), key=os.path.getmtime)
+    if pipeline_run['resume']:
+        finished = [os.path.splitext(os.path.basename(done_file))[0] for done_file in done_files]
+        print("... Resuming from the checkpoints in " + pipeline_run['folder'] + ", finished stages: " + (", ".join(finished) if finished else "none"))
+    else:
+        # a run without RESUME starts from the beginning, old checkpoints of the same settings are replaced
+        for done_file in done_files:
+            os.remove(done_file)
+        print("... Checkpoints of the finished stages are saved in " + pipeline_run['folder'])
+
+
+def pipeline_stage(stage, compute, save=None, load=None):
+    # compute() the stage, or load its checkpoint when resuming. save(result, path) and load(path) default to pickle,
+    # a stage without a result only records that it finished
+    if pipeline_run['folder'] is None:
+        return compute()
+    done_file = os.path.join(pipeline_run['folder'], stage + ".done")
+    checkpoint_file = os.path.join(pipeline_run['folder'], stage + ".checkpoint")
+    if pipeline_run['resume'] and os.path.isfile(done_file):
+        print("... Stage " + stage + " finished in the failed run, using its checkpoint.")
+        if not os.path.isfile(checkpoint_file):
+            return None
+        return load(checkpoint_file) if load is not None else pd.read_pickle(checkpoint_file)
+
+    result = compute()
+    if result is not None:
+        with stage_span("checkpoint"):
+            # written under another name first, so a run that stops while saving leaves no half checkpoint
+            (save or (lambda value, path: pd.to_pickle(value, path)))(result, checkpoint_file + ".partial")
+            os.replace(checkpoint_file + ".partial", checkpoint_file)
+    with open(done_file, 'w') as done:
+        done.write(time.strftime("%Y-%m-%dT%H:%M:%S"))
+    return result
+
+
+def finish_pipeline():
+    # the run completed, its checkpoints are not needed anymore
+    if pipeline_run['folder'] is not None and os.path.isdir(pipeline_run['folder']):
+        import shutil
+        shutil.rmtree(pipeline_run['folder'], ignore_errors=True)
+        print("... Run completed, removed its checkpoints.")
+    pipeline_run['folder'] = None
+    pipeline_run['resume'] = False
+
 # if __name__ == '__main__':
 #     test_stitch = stitch_Atlite_data("atlite_output_data\output_month_1_Jan_2023\hourly_capacity_factors,atlite_output_data\output_month_2_Jan_2023\hourly_capacity_factors,atlite_output_data\output_month_3_Jan_2023\hourly_capacity_factors,atlite_output_data\output_month_4_Jan_2023\hourly_capacity_factors,atlite_output_data\output_month_5_Jan_2023\hourly_capacity_factors,atlite_output_data\output_month_6_Jan_2023\hourly_capacity_factors,atlite_output_data\output_month_7_Jan_2023\hourly_capacity_factors,atlite_output_data\output_month_8_Jan_2023\hourly_capacity_factors,atlite_output_data\output_month_9_Jan_2023\hourly_capacity_factors,atlite_output_data\output_month_10_Jan_2023\hourly_capacity_factors,atlite_output_data\output_month_11_Jan_2023\hourly_capacity_factors,atlite_output_data\output_month_12_Jan_2023\hourly_capacity_factors",'2023-01-01',"capacity_factors")
 #     # test_stitch = stitch_Atlite_data("atlite_output_data\output_month_9_Jan_2023\hourly_capacity_factors,atlite_output_data\output_month_10_Jan_2023\hourly_capacity_factors,atlite_output_data\output_month_11_Jan_2023\hourly_capacity_factors,atlite_output_data\output_month_12_Jan_2023\hourly_capacity_factors",'2023-01-01',"capacity_factors")
@@ -0,0 +1,178 @@
+"""
+Purpose: Batch runner. Runs several options one after the other in a single process so that the Atlite capacity factors
+and the Wind Atlas data are loaded once and shared by all the runs (together with the sorted fields used for the
+percentile bounds). The runs are listed in a JSON batch config file:
+
+    {
+        "common": {"ATLITE_DUMMY_DATA": "True", "MAXIMUM_CAPACITY": 50, ...},
+        "runs": [
+            {"option": "1", "PERCENT_UPPER_CAPACITY_FACTORS_1": 10},
+            {"option": "3", "PERCENT_UPPER_TIER1_CAPACITY_FACTORS": "0,10"},
+            {"option": "6_step2"}
+        ]
+    }
+
+Each run starts from the option's .env values, then the "common" values, then the values given in the run itself.
+Options 5 and 6 step 1 (geometry selection apps) can't be batched, the step 2 visualizations are switched off.
+
+Author: Kirodh Boodhraj
+"""
+import importlib
+import json
+import os
+import time
+from dotenv import load_dotenv
+import argparse
+import Option_Support_Functions as support_functions
+
+
+################################
+# system args section
+################################
+# used for running the codes
+def parse_arguments():
+    parser = argparse.ArgumentParser(description="Batch runner: runs several options in one process sharing the loaded data.")
+    parser.add_argument('--BATCH_CONFIG_FILE', default=None, required=False, help="JSON file listing the option runs, e.g. assets/batch_config_example.json")
+
+    # parse args
+    args = parser.parse_args()
+
+    return args
+
+
+# used for the env file
+def load_from_env():
+    # load data from .env file
+    load_dotenv()
+    env_vars = {
+        "BATCH_CONFIG_FILE": os.environ.get("BATCH_CONFIG_FILE"),
+    }
+    return env_vars
+
+
+################################
+# Batch section
+################################
+# option -> (module, function), imported only when the option is run
+BATCH_OPTIONS = {
+    "1": ("Option_1_upper_percentage_atlite", "average_capacity_factors_atlite"),
+    "2": ("Option_2_upper_percentage_WAD", "average_capacity_factors_WAD"),
+    "3": ("Option_3_bound_percentage_atlite", "average_capacity_factors_atlite"),
+    "4": ("Option_4_bound_percentage_WAD", "average_bounded_capacity_factors_WAD"),
+    "5_step2": ("Option_5_step2_tier_generation_average_per_geometry", "option_5_process_geometries_into_tiers"),
+    "6_step2": ("Option_6_step2_tier_generation_bounds_per_geometry", "option_6_process_geometries_into_tiers"),
+    "7": ("Option_7_WAD_Atlite_correction_user_defined", "wind_atlas_correction"),
+    "site_ranking": ("site_ranking", "rank_sites"),
+}
+
+# the step 2 visualizations start a Dash server, which would block the batch
+NO_VISUALIZATION = {
+    "5_step2": {"OPTION_5_VIEW_VALID_GEOMETRIES": "False"},
+    "6_step2": {"OPTION_6_VIEW_VALID_GEOMETRIES": "False"},
+}
+
+
+def read_batch_config(BATCH_CONFIG_FILE):
+    # read and check the batch config file
+    if not os.path.isfile(BATCH_CONFIG_FILE):
+        raise ValueError("Batch config file does not exist: " + str(BATCH_CONFIG_FILE))
+    with open(BATCH_CONFIG_FILE) as config_file:
+        batch_config = json.load(config_file)
+
+    common = batch_config.get("common", {})
+    runs = batch_config.get("runs", [])
+    if not isinstance(common, dict) or not isinstance(runs, list) or len(runs) == 0:
+        raise ValueError("Batch config needs a \"runs\" list (and optionally a \"common\" dictionary).")
+    for run_number, run in enumerate(runs):
+        option = str(run.get("option", "")).replace("_step_", "_step")
+        if option not in BATCH_OPTIONS:
+            raise ValueError("Run " + str(run_number + 1) + ": option " + str(run.get("option")) + " can't be batched, choose one of: " + ", ".join(BATCH_OPTIONS))
+        run["option"] = option
+    return common, runs
+
+
+def run_arguments(option_module, option_function, option, common, run):
+    # start from the option's env file values, then overwrite with the common and run values (as strings, like the args)
+    print("... Reading the .env values for option " + option + ", the batch config values are applied on top of them.")
+    arguments = option_module.load_from_env()
+    parameter_names = set(option_function.__code__.co_varnames[:option_function.__code__.co_argcount])
+    for source in (common, run, NO_VISUALIZATION.get(option, {})):
+        for name, value in source.items():
+            if name in ("option", "name"):
+                continue
+            if name not in parameter_names:
+                if source is run:
+                    print("... WARNING: Option " + option + " has no parameter " + name + ", ignoring it.")
+                continue
+            arguments[name] = value if value is None else str(value)
+    return {name: value for name, value in arguments.items() if name in parameter_names}
+
+
+def batch_runner(BATCH_CONFIG_FILE):
+    if BATCH_CONFIG_FILE is None:
+        raise ValueError("BATCH_CONFIG_FILE is not set.")
+    common, runs = read_batch_config(BATCH_CONFIG_FILE)
+    print("... Read batch config with", len(runs), "runs.")
+
+    # the arguments of all runs are checked before the first run starts, a mistake in the last run would otherwise
+    # only show up after all the other runs
+    batch_runs = []
+    configuration_problems = []
+    for run_number, run in enumerate(runs):
+        option = run["option"]
+        run_name = run.get("name", "run " + str(run_number + 1) + " (option " + option + ")")
+        module_name, function_name = BATCH_OPTIONS[option]
+        try:
+            option_module = importlib.import_module(module_name)
+        except ImportError as e:
+            configuration_problems.append(run_name + ": can't import " + module_name + " (" + str(e) + ")")
+            continue
+        option_function = getattr(option_module, function_name)
+        arguments = run_arguments(option_module, option_function, option, common, run)
+        try:
+            support_functions.check_configuration(arguments)
+        except ValueError as e:
+            configuration_problems.append(run_name + ": " + str(e))
+        batch_runs.append((run_name, option_function, arguments))
+    if configuration_problems:
+        raise ValueError("Batch config has runs with problems, no run was started:\n" + "\n".join(configuration_problems))
+
+    run_summary = []
+    for run_name, option_function, arguments in batch_runs:
+        print("\n################################################################")
+        print("... Batch", run_name)
+        print("################################################################")
+
+        start = time.perf_counter()
+        try:
+            option_function(**arguments)
+            run_summary.append((run_name, "completed", time.perf_counter() - start))
+        except Exception as e:
+            # keep going with the other runs, the summary lists the failures
+            print("... ERROR in", run_name, ":", e)
+            run_summary.append((run_name, "failed: " + str(e), time.perf_counter() - start))
+
+    print("\n################################################################")
+    print("... Batch summary:")
+    for run_name, status, seconds in run_summary:
+        print("... ", run_name, ":", status, "(" + str(round(seconds, 2)) + " s)")
+
+    failed = [run_name for run_name, status, _ in run_summary if status != "completed"]
+    if failed:
+        raise ValueError("Batch runs failed: " + ", ".join(failed))
+    print("\nBatch completed successfully!")
+
+
+if __name__ == '__main__':
+    print("#############")
+    print("Batch runner")
+    print("#############")
+
+    # check args or load env file and run codes
+    args = support_functions.script_arguments(parse_arguments(), load_from_env)
+
+    # RUN CODES
+    batch_runner(**args)
+
+    # example use:
+    # python batch_runner.py --BATCH_CONFIG_FILE "assets/batch_config_example.json"
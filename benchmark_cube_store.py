@@ -0,0 +1,245 @@
+"""
+Purpose: Benchmark of the netcdf cube store. Writes a capacity factor cube (an Atlite/stitched/corrected netcdf file, or
+a synthetic cube) with every chosen compression and chunk layout, then reports the file size, the compression ratio,
+the write speed and the read speed (MB/s of uncompressed values) of the two access patterns of the tiers: gathering
+the time series of single cells (Options 1 and 2, site ranking) and reading whole maps for spatial averages (geometry
+tiers, time averages). The results are saved as a JSON report. The chosen compression and layout can then be used for
+the Option 7 corrected cube (OPTION_7_CUBE_COMPRESSION, OPTION_7_CUBE_CHUNK_LAYOUT).
+
+Author: Kirodh Boodhraj
+"""
+import json
+import os
+import platform
+import time
+from dotenv import load_dotenv
+import numpy as np
+import xarray as xr
+import argparse
+
+import Option_Support_Functions as support_functions
+from benchmark_tiers import git_commit
+
+
+################################
+# system args section
+################################
+# used for running the codes
+def parse_arguments():
+    parser = argparse.ArgumentParser(description="Benchmark of the compression and chunk layouts of the netcdf capacity factor cube.")
+    parser.add_argument('--CUBE_BENCHMARK_SOURCE_FILE', default=None, required=False, help="Optional netcdf cube to benchmark with (same forms as ATLITE_CUBE_FILE). Default a synthetic cube.")
+    parser.add_argument('--DATA_VARIABLE_NAME', default=None, required=False, help="Data variable name of the source cube. Default 'capacity factor'.")
+    parser.add_argument('--TIME_VARIABLE_NAME', default=None, required=False, help="Time variable name of the source cube. Default 'time'.")
+    parser.add_argument('--CUBE_BENCHMARK_SHAPE', default=None, required=False, help="time,latitude,longitude size of the synthetic cube. Default 2160,100,100.")
+    parser.add_argument('--CUBE_BENCHMARK_COMPRESSIONS', default=None, required=False, help="Comma separated compressions (codec or codec:level), e.g. none,zlib,zstd:3,blosc_lz4. Default none,zlib,zstd,blosc_lz4,blosc_zstd.")
+    parser.add_argument('--CUBE_BENCHMARK_LAYOUTS', default=None, required=False, help="Comma separated chunk layouts: spatial, time_series, balanced. Default all three.")
+    parser.add_argument('--CUBE_BENCHMARK_CELLS', default=None, required=False, help="Number of random cells whose time series are read. Default 20.")
+    parser.add_argument('--CUBE_BENCHMARK_REPEATS', default=None, required=False, help="Number of timed runs per measurement, the fastest is reported. Default 3.")
+    parser.add_argument('--CUBE_BENCHMARK_OUTPUT_FOLDER', default=None, required=False, help="Folder for the benchmark cubes and the report. Default assets/benchmark_output/cube_store.")
+    parser.add_argument('--CUBE_BENCHMARK_REPORT_FILE', default=None, required=False, help="JSON report file name inside the output folder. Default cube_store_report.json.")
+
+    # parse args
+    args = parser.parse_args()
+
+    return args
+
+
+# used for the env file
+def load_from_env():
+    # load data from .env file
+    load_dotenv()
+    env_vars = {
+        "CUBE_BENCHMARK_SOURCE_FILE": os.environ.get("CUBE_BENCHMARK_SOURCE_FILE"),
+        "DATA_VARIABLE_NAME": os.environ.get("DATA_VARIABLE_NAME"),
+        "TIME_VARIABLE_NAME": os.environ.get("TIME_VARIABLE_NAME"),
+        "CUBE_BENCHMARK_SHAPE": os.environ.get("CUBE_BENCHMARK_SHAPE"),
+        "CUBE_BENCHMARK_COMPRESSIONS": os.environ.get("CUBE_BENCHMARK_COMPRESSIONS"),
+        "CUBE_BENCHMARK_LAYOUTS": os.environ.get("CUBE_BENCHMARK_LAYOUTS"),
+        "CUBE_BENCHMARK_CELLS": os.environ.get("CUBE_BENCHMARK_CELLS"),
+        "CUBE_BENCHMARK_REPEATS": os.environ.get("CUBE_BENCHMARK_REPEATS"),
+        "CUBE_BENCHMARK_OUTPUT_FOLDER": os.environ.get("CUBE_BENCHMARK_OUTPUT_FOLDER"),
+        "CUBE_BENCHMARK_REPORT_FILE": os.environ.get("CUBE_BENCHMARK_REPORT_FILE"),
+    }
+    return env_vars
+
+
+################################
+# Cube section
+################################
+CUBE_BENCHMARK_DEFAULT_SHAPE = (2160, 100, 100)
+CUBE_BENCHMARK_DEFAULT_COMPRESSIONS = "none,zlib,zstd,blosc_lz4,blosc_zstd"
+CUBE_BENCHMARK_SPATIAL_BLOCK = 168
+
+
+def synthetic_cube(shape):
+    # capacity factor like values: a daily cycle plus weather systems that are smooth in space and time and some cell
+    # noise, so the compression ratios are not those of pure random numbers (which hardly compress at all)
+    number_of_times, number_of_latitudes, number_of_longitudes = shape
+    np.random.seed(44)
+    hours = np.arange(number_of_times)
+    daily_cycle = 0.1 * np.sin(2 * np.pi * hours / 24.0)[:, None, None]
+
+    # weather on a coarse 6 hour, 10 cell grid, repeated to the full grid
+    coarse = np.random.rand(number_of_times // 6 + 1, number_of_latitudes // 10 + 1, number_of_longitudes // 10 + 1)
+    weather = np.repeat(np.repeat(np.repeat(coarse, 6, axis=0), 10, axis=1), 10, axis=2)[:number_of_times, :number_of_latitudes, :number_of_longitudes]
+    values = 0.35 + daily_cycle + 0.4 * (weather - 0.5) + 0.05 * np.random.rand(*shape)
+    return np.clip(values, 0, 1).astype(np.float32)
+
+
+def read_source_cube(CUBE_BENCHMARK_SOURCE_FILE, DATA_VARIABLE_NAME, TIME_VARIABLE_NAME, CUBE_BENCHMARK_SHAPE):
+    # (time, latitude, longitude) float32 values of the source file, or of a synthetic cube
+    if CUBE_BENCHMARK_SOURCE_FILE is not None and str(CUBE_BENCHMARK_SOURCE_FILE).strip() != "":
+        print("... Reading the source cube:", CUBE_BENCHMARK_SOURCE_FILE)
+        source = support_functions.open_atlite_cube(CUBE_BENCHMARK_SOURCE_FILE, DATA_VARIABLE_NAME or 'capacity factor', TIME_VARIABLE_NAME or 'time')
+        return source[DATA_VARIABLE_NAME or 'capacity factor'].values.astype(np.float32)
+
+    shape = CUBE_BENCHMARK_DEFAULT_SHAPE
+    if CUBE_BENCHMARK_SHAPE is not None and str(CUBE_BENCHMARK_SHAPE).strip() != "":
+        shape = tuple(int(size) for size in str(CUBE_BENCHMARK_SHAPE).split(","))
+        if len(shape) != 3 or min(shape) < 1:
+            raise ValueError("CUBE_BENCHMARK_SHAPE must be three positive sizes: time,latitude,longitude, got: " + str(CUBE_BENCHMARK_SHAPE))
+    print("... Creating a synthetic cube of shape (time, latitude, longitude):", shape)
+    return synthetic_cube(shape)
+
+
+################################
+# Measurement section
+################################
+def fastest(repeats, measurement):
+    # the fastest of the repeats, the first run is also timed (the files are in the OS cache after writing anyway)
+    seconds = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        measurement()
+        seconds.append(time.perf_counter() - start)
+    return min(seconds)
+
+
+def write_cube(cube_file, values, cube_storage):
+    import netCDF4
+    with netCDF4.Dataset(cube_file, 'w') as cube:
+        for dimension, size in zip(('time', 'latitude', 'longitude'), values.shape):
+            cube.createDimension(dimension, size)
+        cube.createVariable('capacity factor', 'f4', ('time', 'latitude', 'longitude'), **cube_storage)[:] = values
+
+
+def read_cell_series(cube_file, cells):
+    # the whole time series of single cells, as gathered for the cell tiers and the site series. With the default
+    # netcdf chunk cache a chunk bigger than the cache is decompressed again for every cell, which is what the
+    # time_series layout avoids
+    import netCDF4
+    with netCDF4.Dataset(cube_file) as cube:
+        variable = cube['capacity factor']
+        return [variable[:, latitude, longitude] for latitude, longitude in cells]
+
+
+def read_spatial_means(cube_file, number_of_times):
+    # whole maps, a week at a time, averaged in space as for the geometry tiers
+    import netCDF4
+    with netCDF4.Dataset(cube_file) as cube:
+        variable = cube['capacity factor']
+        return [variable[start:start + CUBE_BENCHMARK_SPATIAL_BLOCK].mean(axis=(1, 2)) for start in range(0, number_of_times, CUBE_BENCHMARK_SPATIAL_BLOCK)]
+
+
+def benchmark_store(values, compression, layout, cells, repeats, output_folder):
+    codec, level = support_functions.parse_cube_compression(compression)
+    if not support_functions.compression_available(codec):
+        print("... ", compression, "is not available in this netCDF4/HDF5 installation, skipping it.")
+        return {"available": False}
+
+    chunk_sizes = support_functions.cube_chunk_sizes(values.shape, layout)
+    cube_storage = support_functions.cube_encoding(compression, chunk_sizes)
+    cube_file = os.path.join(output_folder, "cube_" + codec + "_" + str(level) + "_" + layout + ".nc")
+    megabytes = values.nbytes / 1e6
+    cell_megabytes = len(cells) * values.shape[0] * values.itemsize / 1e6
+
+    write_seconds = fastest(repeats, lambda: write_cube(cube_file, values, cube_storage))
+    file_megabytes = os.path.getsize(cube_file) / 1e6
+    cell_seconds = fastest(repeats, lambda: read_cell_series(cube_file, cells))
+    spatial_seconds = fastest(repeats, lambda: read_spatial_means(cube_file, values.shape[0]))
+    os.remove(cube_file)
+
+    return {
+        "available": True,
+        "chunk_sizes": list(chunk_sizes),
+        "file_mb": file_megabytes,
+        "compression_ratio": megabytes / file_megabytes,
+        "write_mb_per_s": megabytes / write_seconds,
+        "time_series_mb_per_s": cell_megabytes / cell_seconds,
+        "spatial_mb_per_s": megabytes / spatial_seconds,
+    }
+
+
+def print_store_table(stores):
+    print("\n... Cube store results (MB/s of uncompressed float32 values):")
+    print("...... {:<14} {:<12} {:>8} {:>7} {:>10} {:>12} {:>10}".format("compression", "layout", "file MB", "ratio", "write", "time series", "spatial"))
+    for compression, layouts in stores.items():
+        for layout, store in layouts.items():
+            if not store["available"]:
+                print("...... {:<14} {:<12} not available".format(compression, layout))
+                continue
+            print("...... {:<14} {:<12} {:>8.1f} {:>7.2f} {:>10.1f} {:>12.2f} {:>10.1f}".format(
+                compression, layout, store["file_mb"], store["compression_ratio"], store["write_mb_per_s"], store["time_series_mb_per_s"], store["spatial_mb_per_s"]))
+
+
+def benchmark_cube_store(CUBE_BENCHMARK_SOURCE_FILE=None, DATA_VARIABLE_NAME=None, TIME_VARIABLE_NAME=None, CUBE_BENCHMARK_SHAPE=None, CUBE_BENCHMARK_COMPRESSIONS=None, CUBE_BENCHMARK_LAYOUTS=None, CUBE_BENCHMARK_CELLS=None, CUBE_BENCHMARK_REPEATS=None, CUBE_BENCHMARK_OUTPUT_FOLDER=None, CUBE_BENCHMARK_REPORT_FILE=None):
+    compressions = [compression.strip() for compression in (CUBE_BENCHMARK_COMPRESSIONS or CUBE_BENCHMARK_DEFAULT_COMPRESSIONS).split(",") if compression.strip() != ""]
+    layouts = [layout.strip() for layout in (CUBE_BENCHMARK_LAYOUTS or ",".join(support_functions.CUBE_CHUNK_LAYOUTS)).split(",") if layout.strip() != ""]
+    for compression in compressions:
+        support_functions.parse_cube_compression(compression)
+    for layout in layouts:
+        support_functions.cube_chunk_sizes((1, 1, 1), layout)
+    output_folder = CUBE_BENCHMARK_OUTPUT_FOLDER or os.path.join("assets", "benchmark_output", "cube_store")
+    os.makedirs(output_folder, exist_ok=True)
+    report_file = os.path.join(output_folder, CUBE_BENCHMARK_REPORT_FILE or "cube_store_report.json")
+    number_of_cells = int(CUBE_BENCHMARK_CELLS) if CUBE_BENCHMARK_CELLS is not None and str(CUBE_BENCHMARK_CELLS).strip() != "" else 20
+    repeats = int(CUBE_BENCHMARK_REPEATS) if CUBE_BENCHMARK_REPEATS is not None and str(CUBE_BENCHMARK_REPEATS).strip() != "" else 3
+
+    values = read_source_cube(CUBE_BENCHMARK_SOURCE_FILE, DATA_VARIABLE_NAME, TIME_VARIABLE_NAME, CUBE_BENCHMARK_SHAPE)
+    np.random.seed(0)
+    cells = list(zip(np.random.randint(0, values.shape[1], number_of_cells).tolist(), np.random.randint(0, values.shape[2], number_of_cells).tolist()))
+
+    report = {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "git_commit": git_commit(),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "xarray": xr.__version__,
+        "machine": platform.platform(),
+        "source": CUBE_BENCHMARK_SOURCE_FILE or "synthetic",
+        "shape": list(values.shape),
+        "cells": number_of_cells,
+        "stores": {},
+    }
+
+    for compression in compressions:
+        for layout in layouts:
+            print("... Benchmarking compression", compression, "with the", layout, "chunk layout.")
+            report["stores"].setdefault(compression, {})[layout] = benchmark_store(values, compression, layout, cells, repeats, output_folder)
+
+    print_store_table(report["stores"])
+    # the files were just written, so the reads come from the OS cache: the numbers compare the decompression and
+    # chunk overheads, reads from a cold disk or a network drive also pay for the file size
+    print("... The reads are from the OS file cache, on a cold disk the smaller files gain further.")
+
+    with open(report_file, "w") as json_file:
+        json.dump(report, json_file, indent=2)
+    print("\n... Saved cube store report to:", report_file)
+    print("\nCube store benchmark completed successfully!")
+    return report
+
+
+if __name__ == '__main__':
+    print("#############")
+    print("Cube store benchmark")
+    print("#############")
+
+    # check args or load env file and run codes
+    args = support_functions.script_arguments(parse_arguments(), load_from_env)
+
+    # RUN CODES
+    benchmark_cube_store(**args)
+
+    # example use:
+    # python benchmark_cube_store.py
+    # python benchmark_cube_store.py --CUBE_BENCHMARK_SOURCE_FILE "assets/option_7_output/option_7_corrected_atlite_capacity_factors.nc" --CUBE_BENCHMARK_COMPRESSIONS "zlib:4,zstd:3" --CUBE_BENCHMARK_LAYOUTS "spatial,time_series"
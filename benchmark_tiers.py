@@ -0,0 +1,283 @@
+"""
+Purpose: Benchmark of the tier generation. Generates synthetic Atlite csv folders, a WAD netcdf and a GeoJSON geometry
+inventory at the chosen scales (small, national, continental), then times (and memory profiles) each stage: stitching
+the csv files, averaging, reading the WAD data and the tier builders of Options 1 to 6. The results are saved as a JSON
+report, and compared to a previous report (e.g. of the last release) when BENCHMARK_BASELINE_REPORT is given.
+
+Author: Kirodh Boodhraj
+"""
+import json
+import os
+import platform
+import subprocess
+import time
+import tracemalloc
+from dotenv import load_dotenv
+import numpy as np
+import xarray as xr
+import argparse
+import contextlib
+
+import Option_Support_Functions as support_functions
+
+
+################################
+# system args section
+################################
+# used for running the codes
+def parse_arguments():
+    parser = argparse.ArgumentParser(description="Benchmark of the tier generation on synthetic data at several scales.")
+    parser.add_argument('--BENCHMARK_SCALES', default=None, required=False, help="Comma separated scales to run: small, national, continental. Default small.")
+    parser.add_argument('--BENCHMARK_OUTPUT_FOLDER', default=None, required=False, help="Folder for the synthetic data and the report. Default assets/benchmark_output.")
+    parser.add_argument('--BENCHMARK_REPORT_FILE', default=None, required=False, help="JSON report file name inside the output folder. Default benchmark_report.json.")
+    parser.add_argument('--BENCHMARK_REPEATS', default=None, required=False, help="Number of timed runs per stage, the minimum and median are reported. Default 3.")
+    parser.add_argument('--BENCHMARK_MEMORY', default=None, required=False, help="True/False: also run every stage once with tracemalloc to report its peak memory. Default True.")
+    parser.add_argument('--BENCHMARK_BASELINE_REPORT', default=None, required=False, help="Optional previous JSON report to compare the timings against.")
+
+    # parse args
+    args = parser.parse_args()
+
+    return args
+
+
+# used for the env file
+def load_from_env():
+    # load data from .env file
+    load_dotenv()
+    env_vars = {
+        "BENCHMARK_SCALES": os.environ.get("BENCHMARK_SCALES"),
+        "BENCHMARK_OUTPUT_FOLDER": os.environ.get("BENCHMARK_OUTPUT_FOLDER"),
+        "BENCHMARK_REPORT_FILE": os.environ.get("BENCHMARK_REPORT_FILE"),
+        "BENCHMARK_REPEATS": os.environ.get("BENCHMARK_REPEATS"),
+        "BENCHMARK_MEMORY": os.environ.get("BENCHMARK_MEMORY"),
+        "BENCHMARK_BASELINE_REPORT": os.environ.get("BENCHMARK_BASELINE_REPORT"),
+    }
+    return env_vars
+
+
+################################
+# Synthetic data section
+################################
+# bounds in degrees, Atlite and WAD grid resolutions, hourly time steps, number of geometries and csv folders
+BENCHMARK_SCALE_SETTINGS = {
+    "small": {"latitude_bottom": -32.0, "latitude_top": -30.0, "longitude_left": 26.0, "longitude_right": 28.0, "resolution": 0.1, "wind_atlas_resolution": 0.02, "time_steps": 168, "geometries": 10, "folders": 1},
+    "national": {"latitude_bottom": -35.0, "latitude_top": -25.0, "longitude_left": 20.0, "longitude_right": 30.0, "resolution": 0.1, "wind_atlas_resolution": 0.02, "time_steps": 744, "geometries": 100, "folders": 2},
+    "continental": {"latitude_bottom": -35.0, "latitude_top": 5.0, "longitude_left": 10.0, "longitude_right": 50.0, "resolution": 0.25, "wind_atlas_resolution": 0.05, "time_steps": 744, "geometries": 500, "folders": 4},
+}
+
+BENCHMARK_START_DATE = "2023-01-01"
+BENCHMARK_MAXIMUM_CAPACITY = 50
+BENCHMARK_TIER_BANDS = np.array([[0, 10], [10, 20], [0, 40], [60, 100], [40, 60]], dtype=float)
+# part of the bounding box that is land in the coastal cube
+BENCHMARK_LAND_FRACTION = 0.3
+
+
+def create_benchmark_data(scale, settings, OUTPUT_FOLDER):
+    # same random data for every run of a scale, so reports of different releases are comparable
+    np.random.seed(sum(ord(character) for character in scale))
+    scale_folder = os.path.join(OUTPUT_FOLDER, scale)
+    os.makedirs(scale_folder, exist_ok=True)
+    bounds = (settings["latitude_bottom"], settings["latitude_top"], settings["longitude_left"], settings["longitude_right"])
+
+    end_date = str(np.datetime64(BENCHMARK_START_DATE) + np.timedelta64(settings["time_steps"] - 1, 'h'))
+    atlite_capacity_factors = support_functions.create_temporary_atlite_dataset(BENCHMARK_START_DATE, end_date, *bounds, BENCHMARK_MAXIMUM_CAPACITY, "capacity_factors", DUMMY_RESOLUTION=settings["resolution"])
+    atlite_folders = support_functions.write_temporary_atlite_csv_folders(atlite_capacity_factors, "capacity_factors", scale_folder, settings["folders"])
+    wind_atlas_file = support_functions.create_temporary_wind_atlas_file(os.path.join(scale_folder, "wind_atlas_capacity_factors.nc"), *bounds, settings["wind_atlas_resolution"])
+    geometry_file = support_functions.create_temporary_geometry_file(os.path.join(scale_folder, "geometries.geojson"), *bounds, settings["geometries"])
+    # the same data as a netcdf cube with the eastern part at sea (NaN), for the land cells stages
+    coast = bounds[2] + BENCHMARK_LAND_FRACTION * (bounds[3] - bounds[2])
+    coastal_cube_file = os.path.join(scale_folder, "atlite_cube_coastal.nc")
+    atlite_capacity_factors.where(atlite_capacity_factors["longitude"] < coast).to_netcdf(coastal_cube_file)
+
+    return {
+        "atlite_folders": atlite_folders,
+        "wind_atlas_file": wind_atlas_file,
+        "geometry_file": geometry_file,
+        "coastal_cube_file": coastal_cube_file,
+        "grid": [int(atlite_capacity_factors.sizes["latitude"]), int(atlite_capacity_factors.sizes["longitude"])],
+        "time_steps": int(atlite_capacity_factors.sizes["time"]),
+    }
+
+
+################################
+# Timing section
+################################
+def clear_caches():
+    # every timed run starts cold, otherwise the memoized sorts and loaded data hide the real cost
+    support_functions.sorted_field_cache.clear()
+    support_functions.percentile_cache.clear()
+    support_functions.loaded_data_cache.clear()
+    support_functions.summed_area_cache.clear()
+    support_functions.block_max_cache.clear()
+
+
+def time_stage(stage, repeats, memory):
+    # returns the result of the last run and the timings (and peak memory) of the stage, the stage messages are hidden
+    seconds = []
+    for _ in range(repeats):
+        clear_caches()
+        start = time.perf_counter()
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            result = stage()
+        seconds.append(time.perf_counter() - start)
+    timings = {"seconds_min": min(seconds), "seconds_median": float(np.median(seconds)), "repeats": repeats}
+
+    if memory:
+        # separate run, tracemalloc slows the allocations down
+        clear_caches()
+        tracemalloc.start()
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            stage()
+        timings["peak_memory_mb"] = tracemalloc.get_traced_memory()[1] / 1e6
+        tracemalloc.stop()
+    return result, timings
+
+
+def run_scale(scale, benchmark_data, repeats, memory):
+    import shapely.geometry
+
+    stage_timings = {}
+
+    def timed(stage_name, stage):
+        result, stage_timings[stage_name] = time_stage(stage, repeats, memory)
+        print("...... ", stage_name, ":", round(stage_timings[stage_name]["seconds_min"], 4), "s")
+        return result
+
+    # input stages
+    atlite_capacity_factors = timed("stitch_atlite_data", lambda: support_functions.stitch_Atlite_data(benchmark_data["atlite_folders"], BENCHMARK_START_DATE, "capacity_factors"))
+    # the local files answer at once, on a network drive the read ahead also hides the round trip of every file
+    timed("stitch_atlite_data_prefetch_16", lambda: support_functions.stitch_Atlite_data(benchmark_data["atlite_folders"], BENCHMARK_START_DATE, "capacity_factors", ATLITE_PREFETCH_DEPTH=16))
+    atlite_capacity_factors_avg = timed("average_atlite_data", lambda: atlite_capacity_factors.mean(dim="time"))
+    def read_wind_atlas_data():
+        # the WAD data is read lazily, so the values are loaded inside the stage
+        latitude_wad, longitude_wad, all_data_wad = support_functions.read_wind_atlas_data_full(benchmark_data["wind_atlas_file"], "lat", "lon", "Band1")
+        return latitude_wad, longitude_wad, np.asarray(all_data_wad.values, dtype=float)
+    latitude_wad, longitude_wad, wad_values = timed("read_wind_atlas_data", read_wind_atlas_data)
+
+    def read_geometries():
+        with open(benchmark_data["geometry_file"]) as geojson_file:
+            return [shapely.geometry.shape(feature["geometry"]) for feature in json.load(geojson_file)["features"]]
+    geometries = timed("read_geometries", read_geometries)
+
+    full_values = atlite_capacity_factors["capacity_factors"].values
+    average_values = atlite_capacity_factors_avg["capacity_factors"].values
+    latitudes = atlite_capacity_factors["latitude"].values
+    longitudes = atlite_capacity_factors["longitude"].values
+
+    # tier builders of the options
+    timed("option_1_upper_percentage", lambda: support_functions.generate_upper_percentage_sweep(average_values, full_values, [10]))
+    timed("option_1_upper_percentage_sweep", lambda: support_functions.generate_upper_percentage_sweep(average_values, full_values, np.arange(1, 101)))
+    closest_atlite_cells = timed("wad_nearest_atlite_cells", lambda: support_functions.nearest_cell_index(latitude_wad, longitude_wad, latitudes, longitudes))
+    timed("option_2_upper_percentage_wad", lambda: support_functions.generate_upper_percentage_sweep(wad_values, full_values, [10], closest_atlite_cells))
+    timed("option_3_bounded_tiers", lambda: support_functions.generate_bounded_tiers(average_values, full_values, BENCHMARK_TIER_BANDS))
+    timed("option_4_bounded_tiers_wad", lambda: support_functions.generate_bounded_tiers(wad_values, full_values, BENCHMARK_TIER_BANDS, closest_atlite_cells))
+    timed("option_5_geometry_averages", lambda: [support_functions.geometry_tier_series(geometry, latitudes, longitudes, average_values, full_values) for geometry in geometries])
+    timed("option_6_geometry_tiers", lambda: [support_functions.geometry_tier_series(geometry, latitudes, longitudes, average_values, full_values, BENCHMARK_TIER_BANDS if geometry.geom_type != "Point" else None) for geometry in geometries])
+    timed("site_ranking_top_100_wad", lambda: support_functions.top_k_sites(wad_values, latitude_wad, longitude_wad, 100))
+    timed("site_ranking_top_100_wad_10km_apart", lambda: support_functions.top_k_sites(wad_values, latitude_wad, longitude_wad, 100, 10))
+
+    # loading a cube that is mostly sea: the whole (time, lat, lon) cube, or only its land cells read chunk by chunk
+    def load_coastal_cube(ATLITE_LAND_CELLS, ATLITE_CHUNKS=None):
+        atlite_cube, atlite_cube_avg = support_functions.create_average_capacity_factor_file_atlite("False", None, BENCHMARK_START_DATE, None, None, None, None, None, BENCHMARK_MAXIMUM_CAPACITY, "capacity_factors", "time", os.path.join(os.path.dirname(benchmark_data["coastal_cube_file"]), "atlite_cube_coastal_average.nc"), ATLITE_CUBE_FILE=benchmark_data["coastal_cube_file"], ATLITE_CHUNKS=ATLITE_CHUNKS, ATLITE_LAND_CELLS=ATLITE_LAND_CELLS)
+        # the tiers are reduced from the loaded cube, the peak memory covers both
+        return support_functions.generate_bounded_tiers(atlite_cube_avg.values, support_functions.tier_values(atlite_cube, "capacity_factors"), BENCHMARK_TIER_BANDS)
+    timed("coastal_cube_dense_tiers", lambda: load_coastal_cube("False"))
+    timed("coastal_cube_land_cells_tiers", lambda: load_coastal_cube("True"))
+    timed("coastal_cube_land_cells_tiers_chunked", lambda: load_coastal_cube("True", "168"))
+    if memory:
+        print("...... land cells peak memory:", round(stage_timings["coastal_cube_land_cells_tiers"]["peak_memory_mb"], 1), "MB, whole cube:", round(stage_timings["coastal_cube_dense_tiers"]["peak_memory_mb"], 1), "MB")
+
+    return stage_timings
+
+
+################################
+# Report section
+################################
+def git_commit():
+    # the commit the benchmark ran on, if this is a git checkout
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except Exception:
+        return None
+
+
+def compare_to_baseline(report, BENCHMARK_BASELINE_REPORT):
+    # ratio of the current to the baseline minimum time, per scale and stage (below 1 is faster)
+    with open(BENCHMARK_BASELINE_REPORT) as baseline_file:
+        baseline = json.load(baseline_file)
+    comparison = {}
+    print("\n... Comparison to baseline report (commit ", baseline.get("git_commit"), "), current / baseline time:")
+    for scale, scale_report in report["scales"].items():
+        baseline_stages = baseline.get("scales", {}).get(scale, {}).get("stages", {})
+        for stage, timings in scale_report["stages"].items():
+            if stage not in baseline_stages or baseline_stages[stage]["seconds_min"] <= 0:
+                continue
+            ratio = timings["seconds_min"] / baseline_stages[stage]["seconds_min"]
+            comparison.setdefault(scale, {})[stage] = ratio
+            print("...... ", scale, stage, ":", round(ratio, 3))
+    return comparison
+
+
+def benchmark_tiers(BENCHMARK_SCALES=None, BENCHMARK_OUTPUT_FOLDER=None, BENCHMARK_REPORT_FILE=None, BENCHMARK_REPEATS=None, BENCHMARK_MEMORY=None, BENCHMARK_BASELINE_REPORT=None):
+    scales = [scale.strip() for scale in (BENCHMARK_SCALES or "small").split(",") if scale.strip() != ""]
+    for scale in scales:
+        if scale not in BENCHMARK_SCALE_SETTINGS:
+            raise ValueError("Unknown benchmark scale: " + scale + ". Choose from: " + ", ".join(BENCHMARK_SCALE_SETTINGS))
+    output_folder = BENCHMARK_OUTPUT_FOLDER or os.path.join("assets", "benchmark_output")
+    report_file = os.path.join(output_folder, BENCHMARK_REPORT_FILE or "benchmark_report.json")
+    repeats = int(BENCHMARK_REPEATS) if BENCHMARK_REPEATS is not None and str(BENCHMARK_REPEATS).strip() != "" else 3
+    memory = str(BENCHMARK_MEMORY).lower() != "false"
+
+    report = {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "git_commit": git_commit(),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "xarray": xr.__version__,
+        "machine": platform.platform(),
+        "scales": {},
+    }
+
+    for scale in scales:
+        settings = BENCHMARK_SCALE_SETTINGS[scale]
+        print("\n... Creating synthetic data for scale:", scale)
+        start = time.perf_counter()
+        benchmark_data = create_benchmark_data(scale, settings, output_folder)
+        print("... Created a", benchmark_data["grid"], "grid with", benchmark_data["time_steps"], "time steps in", round(time.perf_counter() - start, 2), "s")
+
+        print("... Benchmarking scale:", scale)
+        report["scales"][scale] = {
+            "settings": settings,
+            "grid": benchmark_data["grid"],
+            "time_steps": benchmark_data["time_steps"],
+            "stages": run_scale(scale, benchmark_data, repeats, memory),
+        }
+
+    # peak resident memory of the whole run (kilobytes on linux)
+    report["max_resident_memory_mb"] = support_functions.peak_memory_mb()
+
+    if BENCHMARK_BASELINE_REPORT is not None and str(BENCHMARK_BASELINE_REPORT).strip() != "":
+        report["baseline_report"] = BENCHMARK_BASELINE_REPORT
+        report["relative_to_baseline"] = compare_to_baseline(report, BENCHMARK_BASELINE_REPORT)
+
+    with open(report_file, "w") as json_file:
+        json.dump(report, json_file, indent=2)
+    print("\n... Saved benchmark report to:", report_file)
+    print("\nBenchmark completed successfully!")
+    return report
+
+
+if __name__ == '__main__':
+    print("#############")
+    print("Benchmark")
+    print("#############")
+
+    # check args or load env file and run codes
+    args = support_functions.script_arguments(parse_arguments(), load_from_env)
+
+    # RUN CODES
+    benchmark_tiers(**args)
+
+    # example use:
+    # python benchmark_tiers.py --BENCHMARK_SCALES "small,national" --BENCHMARK_REPEATS 3
+    # python benchmark_tiers.py --BENCHMARK_SCALES small --BENCHMARK_REPORT_FILE "benchmark_new.json" --BENCHMARK_BASELINE_REPORT "assets/benchmark_output/benchmark_report.json"
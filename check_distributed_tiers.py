@@ -0,0 +1,187 @@
+"""
+Purpose: Check of the distributed tier generation on a single machine. Writes a synthetic Atlite cube and WAD file, runs
+Options 1, 3 and 4 once with the cube in memory and once chunked on a dask distributed cluster (a LocalCluster of
+worker processes by default, or the address of a running scheduler), and compares the tier files of the two runs.
+
+Author: Kirodh Boodhraj
+"""
+import contextlib
+import glob
+import importlib
+import os
+import time
+import tempfile
+from dotenv import load_dotenv
+import numpy as np
+import pandas as pd
+import argparse
+
+import Option_Support_Functions as support_functions
+from batch_runner import BATCH_OPTIONS, run_arguments
+
+
+################################
+# system args section
+################################
+# used for running the codes
+def parse_arguments():
+    parser = argparse.ArgumentParser(description="Compare the tiers of Options 1, 3 and 4 in memory and on a dask distributed cluster.")
+    parser.add_argument('--DISTRIBUTED_CHECK_OUTPUT_FOLDER', default=None, required=False, help="Folder for the synthetic data and the tier files of both runs. Default a new temporary folder (use a shared folder for a remote scheduler).")
+    parser.add_argument('--DISTRIBUTED_CHECK_SCHEDULER', default=None, required=False, help="local (LocalCluster on this machine, default) or the address of a running dask scheduler, e.g. tcp://10.0.0.1:8786.")
+    parser.add_argument('--DISTRIBUTED_CHECK_NUM_WORKERS', default=None, required=False, help="Number of LocalCluster workers. Default 2.")
+    parser.add_argument('--DISTRIBUTED_CHECK_CHUNKS', default=None, required=False, help="Time steps per chunk. Default 168 (a week of hours).")
+
+    # parse args
+    args = parser.parse_args()
+
+    return args
+
+
+# used for the env file
+def load_from_env():
+    # load data from .env file
+    load_dotenv()
+    env_vars = {
+        "DISTRIBUTED_CHECK_OUTPUT_FOLDER": os.environ.get("DISTRIBUTED_CHECK_OUTPUT_FOLDER"),
+        "DISTRIBUTED_CHECK_SCHEDULER": os.environ.get("DISTRIBUTED_CHECK_SCHEDULER"),
+        "DISTRIBUTED_CHECK_NUM_WORKERS": os.environ.get("DISTRIBUTED_CHECK_NUM_WORKERS"),
+        "DISTRIBUTED_CHECK_CHUNKS": os.environ.get("DISTRIBUTED_CHECK_CHUNKS"),
+    }
+    return env_vars
+
+
+################################
+# Synthetic data section
+################################
+# a month of hourly data on a 40 x 40 grid, with a WAD field on a five times finer grid
+CHECK_START_DATE = "2023-01-01"
+CHECK_END_DATE = "2023-01-31 23:00"
+CHECK_BOUNDS = (-32.0, -28.0, 26.0, 30.0)
+CHECK_WIND_ATLAS_RESOLUTION = 0.02
+CHECK_MAXIMUM_CAPACITY = 50
+CHECK_TIER_SPECIFICATION = "0,10;10,20;0,40;60,100;40,60"
+CHECK_OPTIONS = ["1", "3", "4"]
+
+# tier files of the two runs must agree to within the float32 rounding of the cube (the chunked time average adds the
+# time steps up in a different order)
+CHECK_RELATIVE_TOLERANCE = 1e-5
+
+
+def create_check_data(OUTPUT_FOLDER, time_chunk):
+    # same random data for every check
+    np.random.seed(40)
+    atlite_capacity_factors = support_functions.create_temporary_atlite_dataset(CHECK_START_DATE, CHECK_END_DATE, *CHECK_BOUNDS, CHECK_MAXIMUM_CAPACITY, "capacity_factors")
+    cube_file = os.path.join(OUTPUT_FOLDER, "atlite_capacity_factors_cube.nc")
+    # stored in the same time chunks as the run reads them
+    atlite_capacity_factors.astype(np.float32).to_netcdf(cube_file, encoding={"capacity_factors": {"chunksizes": (min(time_chunk, atlite_capacity_factors.sizes["time"]), atlite_capacity_factors.sizes["latitude"], atlite_capacity_factors.sizes["longitude"])}})
+    wind_atlas_file = support_functions.create_temporary_wind_atlas_file(os.path.join(OUTPUT_FOLDER, "wind_atlas_capacity_factors.nc"), *CHECK_BOUNDS, CHECK_WIND_ATLAS_RESOLUTION)
+    return cube_file, wind_atlas_file
+
+
+def common_arguments(cube_file, wind_atlas_file):
+    # option parameters shared by both runs, everything the .env file could switch on is switched off here
+    return {
+        "ATLITE_DUMMY_DATA": "False", "ATLITE_CAPACITY_FACTORS_FOLDERS": "", "ATLITE_CUBE_FILE": cube_file,
+        "DUMMY_START_DATE": CHECK_START_DATE, "DUMMY_END_DATE": CHECK_END_DATE,
+        "DUMMY_LATITUDE_BOTTOM": CHECK_BOUNDS[0], "DUMMY_LATITUDE_TOP": CHECK_BOUNDS[1], "DUMMY_LONGITUDE_LEFT": CHECK_BOUNDS[2], "DUMMY_LONGITUDE_RIGHT": CHECK_BOUNDS[3],
+        "MAXIMUM_CAPACITY": CHECK_MAXIMUM_CAPACITY, "SCALE_CAPACITY_FACTORS": "True",
+        "DATA_VARIABLE_NAME": "capacity_factors", "TIME_VARIABLE_NAME": "time",
+        "AVG_ATLITE_LATITUDE_VARIABLE_NAME": "latitude", "AVG_ATLITE_LONGITUDE_VARIABLE_NAME": "longitude", "AVG_ATLITE_DATA_VARIABLE_NAME": "capacity_factors",
+        "REDUCED_WAD": "False", "WIND_ATLAS_RESOLUTION_REDUCTION": 1, "WIND_ATLAS_CAPACITY_FACTORS_HEATMAP_FILE_LOCATION": wind_atlas_file,
+        "WIND_ATLAS_HEATMAP_LATITUDE_VARIABLE_NAME": "lat", "WIND_ATLAS_HEATMAP_LONGITUDE_VARIABLE_NAME": "lon", "WIND_ATLAS_HEATMAP_DATA_VARIABLE_NAME": "Band1",
+        "PERCENT_UPPER_CAPACITY_FACTORS_1": 10, "TIER_SPECIFICATION": CHECK_TIER_SPECIFICATION,
+        "PERCENT_UPPER_TIER1_CAPACITY_FACTORS": "", "PERCENT_UPPER_TIER2_CAPACITY_FACTORS": "", "PERCENT_UPPER_TIER3_CAPACITY_FACTORS": "", "PERCENT_UPPER_TIER4_CAPACITY_FACTORS": "", "PERCENT_UPPER_TIER5_CAPACITY_FACTORS": "",
+        "PERCENT_UPPER_CAPACITY_FACTORS_TIME_SERIES_FILE_1": "option_1_tiers.csv", "PERCENT_UPPER_CAPACITY_FACTORS_LOCATION_FILE_1": "option_1_locations.csv",
+        "BOUND_CAPACITY_FACTORS_TIME_SERIES_FILE_3": "option_3_tiers.csv", "BOUND_CAPACITY_FACTORS_TIME_SERIES_FILE_4": "option_4_tiers.csv",
+        "ATLITE_TIME_FREQUENCY": "", "TIME_WINDOW_START": "", "TIME_WINDOW_END": "", "TIME_WINDOW_MONTHS": "",
+        "ROI_BBOX": "", "ROI_GEOMETRY_FILE": "", "TIER_STATISTICS": "False", "PERCENT_UPPER_SWEEP_1": "", "STAGE_TIMING_LOG_FILE": "",
+    }
+
+
+def run_options(common, run_folder, run_settings):
+    # runs Options 1, 3 and 4 into run_folder, the option messages are hidden
+    os.makedirs(run_folder, exist_ok=True)
+    seconds = {}
+    for option in CHECK_OPTIONS:
+        module_name, function_name = BATCH_OPTIONS[option]
+        option_module = importlib.import_module(module_name)
+        option_function = getattr(option_module, function_name)
+        run = dict(run_settings, **{
+            "AVG_ATLITE_CAPACITY_FACTORS_FILE_LOCATION": os.path.join(run_folder, "option_" + option + "_average.nc"),
+            "OPTION_" + option + "_OUTPUT_FOLDER": run_folder,
+        })
+        start = time.perf_counter()
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            option_function(**run_arguments(option_module, option_function, option, common, run))
+        seconds[option] = time.perf_counter() - start
+        print("...... Option", option, ":", round(seconds[option], 2), "s")
+    return seconds
+
+
+def compare_tier_files(in_memory_folder, distributed_folder):
+    # largest difference per tier file of the two runs, and whether it is within the tolerance
+    comparison = {}
+    for in_memory_file in sorted(glob.glob(os.path.join(in_memory_folder, "*.csv"))):
+        file_name = os.path.basename(in_memory_file)
+        distributed_file = os.path.join(distributed_folder, file_name)
+        if not os.path.exists(distributed_file):
+            comparison[file_name] = (None, False)
+            continue
+        in_memory = pd.read_csv(in_memory_file, index_col=0)
+        distributed = pd.read_csv(distributed_file, index_col=0)
+        if list(in_memory.columns) != list(distributed.columns) or in_memory.shape != distributed.shape:
+            comparison[file_name] = (None, False)
+            continue
+        in_memory_values = in_memory.to_numpy(dtype=float)
+        distributed_values = distributed.to_numpy(dtype=float)
+        difference = float(np.nanmax(np.abs(in_memory_values - distributed_values), initial=0.0))
+        comparison[file_name] = (difference, bool(np.allclose(in_memory_values, distributed_values, rtol=CHECK_RELATIVE_TOLERANCE, atol=0.0, equal_nan=True)))
+    return comparison
+
+
+def check_distributed_tiers(DISTRIBUTED_CHECK_OUTPUT_FOLDER=None, DISTRIBUTED_CHECK_SCHEDULER=None, DISTRIBUTED_CHECK_NUM_WORKERS=None, DISTRIBUTED_CHECK_CHUNKS=None):
+    # a new temporary folder by default, so a check run leaves nothing behind in the repository
+    output_folder = DISTRIBUTED_CHECK_OUTPUT_FOLDER or tempfile.mkdtemp(prefix="distributed_check_")
+    scheduler = DISTRIBUTED_CHECK_SCHEDULER or "local"
+    number_of_workers = DISTRIBUTED_CHECK_NUM_WORKERS or 2
+    time_chunk = int(DISTRIBUTED_CHECK_CHUNKS or 168)
+    os.makedirs(output_folder, exist_ok=True)
+
+    print("... Creating synthetic cube and WAD data in:", output_folder)
+    cube_file, wind_atlas_file = create_check_data(output_folder, time_chunk)
+    common = common_arguments(cube_file, wind_atlas_file)
+
+    print("... Running Options", ", ".join(CHECK_OPTIONS), "with the cube in memory:")
+    in_memory_folder = os.path.join(output_folder, "in_memory")
+    run_options(common, in_memory_folder, {"ATLITE_CHUNKS": "", "TIER_DASK_SCHEDULER": "", "TIER_DASK_NUM_WORKERS": ""})
+
+    print("... Running Options", ", ".join(CHECK_OPTIONS), "chunked (" + str(time_chunk) + " time steps) on the dask distributed cluster:", scheduler)
+    distributed_folder = os.path.join(output_folder, "distributed")
+    run_options(common, distributed_folder, {"ATLITE_CHUNKS": time_chunk, "TIER_DASK_SCHEDULER": scheduler, "TIER_DASK_NUM_WORKERS": number_of_workers})
+
+    print("\n... Largest difference per tier file (in memory vs distributed):")
+    comparison = compare_tier_files(in_memory_folder, distributed_folder)
+    for file_name, (difference, agrees) in comparison.items():
+        print("...... ", file_name, ":", "missing or different columns" if difference is None else difference, "OK" if agrees else "DIFFERENT")
+
+    different = [file_name for file_name, (_, agrees) in comparison.items() if not agrees]
+    if different:
+        raise ValueError("The distributed tiers differ from the in memory tiers: " + ", ".join(different))
+    print("\nDistributed check completed successfully!")
+    return comparison
+
+
+if __name__ == '__main__':
+    print("#############")
+    print("Distributed tier check")
+    print("#############")
+
+    # check args or load env file and run codes
+    args = support_functions.script_arguments(parse_arguments(), load_from_env)
+
+    # RUN CODES
+    check_distributed_tiers(**args)
+
+    # example use:
+    # python check_distributed_tiers.py --DISTRIBUTED_CHECK_NUM_WORKERS 4
+    # python check_distributed_tiers.py --DISTRIBUTED_CHECK_SCHEDULER "tcp://10.0.0.1:8786" --DISTRIBUTED_CHECK_OUTPUT_FOLDER "/shared/distributed_check_output"
@@ -0,0 +1,251 @@
+"""
+Purpose: Best site finder. Ranks the cells of the averaged Atlite field (or of the Wind Atlas field) and returns the best
+K sites, optionally inside a region and at least a minimum distance apart, with the Atlite time series of every site.
+The search runs over a block max pyramid of the field, so only the blocks that can still hold one of the best sites are
+opened, which keeps it fast even on the full resolution Wind Atlas data.
+
+Author: Kirodh Boodhraj
+"""
+import numpy as np
+import os
+from dotenv import load_dotenv
+import pandas as pd
+import warnings
+import argparse
+
+import Option_Support_Functions as support_functions
+
+
+
+################################
+# system args section
+################################
+# used for running the codes
+def parse_arguments():
+    parser = argparse.ArgumentParser(description="Script to find the best K sites of the averaged capacity factors.")
+    parser.add_argument('--ATLITE_DUMMY_DATA', default=None, required=False,help="Boolean to use the dummy Atlite data (True) or not.")
+    parser.add_argument('--ATLITE_CAPACITY_FACTORS_FOLDERS', default=None, required=False,help="Folders continaing hourly Atlite data files needing stitching.")
+    parser.add_argument('--DUMMY_START_DATE', default=None, required=False, help="Start date.")
+    parser.add_argument('--DUMMY_END_DATE', default=None, required=False, help="End date.")
+    parser.add_argument('--DUMMY_LATITUDE_BOTTOM', default=None, required=False, help="Latitude bottom.")
+    parser.add_argument('--DUMMY_LATITUDE_TOP', default=None, required=False, help="Latitude top.")
+    parser.add_argument('--DUMMY_LONGITUDE_LEFT', default=None, required=False, help="Longitude left.")
+    parser.add_argument('--DUMMY_LONGITUDE_RIGHT', default=None, required=False, help="Longitude right.")
+    parser.add_argument('--MAXIMUM_CAPACITY', default=None, required=False, help="Maximum capacity.")
+    parser.add_argument('--DATA_VARIABLE_NAME', default=None, required=False, help="Data variable name.")
+    parser.add_argument('--TIME_VARIABLE_NAME', default=None, required=False, help="Time variable name.")
+    parser.add_argument('--AVG_ATLITE_CAPACITY_FACTORS_FILE_LOCATION', default=None, required=False,help="Average ATLITE capacity factors file location.")
+    parser.add_argument('--AVG_ATLITE_LATITUDE_VARIABLE_NAME', default=None, required=False,help="Average ATLITE latitude variable name.")
+    parser.add_argument('--AVG_ATLITE_LONGITUDE_VARIABLE_NAME', default=None, required=False,help="Average ATLITE longitude variable name.")
+    parser.add_argument('--REDUCED_WAD', default=None, required=False, help="Whether to use reduced WAD data.")
+    parser.add_argument('--WIND_ATLAS_RESOLUTION_REDUCTION', default=None, required=False,help="WIND ATLAS resolution reduction.")
+    parser.add_argument('--WIND_ATLAS_CAPACITY_FACTORS_HEATMAP_FILE_LOCATION', default=None, required=False,help="WIND ATLAS capacity factors heatmap file location.")
+    parser.add_argument('--WIND_ATLAS_HEATMAP_LATITUDE_VARIABLE_NAME', default=None, required=False,help="WIND ATLAS heatmap latitude variable name.")
+    parser.add_argument('--WIND_ATLAS_HEATMAP_LONGITUDE_VARIABLE_NAME', default=None, required=False,help="WIND ATLAS heatmap longitude variable name.")
+    parser.add_argument('--WIND_ATLAS_HEATMAP_DATA_VARIABLE_NAME', default=None, required=False,help="WIND ATLAS heatmap data variable name.")
+    parser.add_argument('--SCALE_CAPACITY_FACTORS', default=None, required=False, help="Scale capacity factors.")
+    parser.add_argument('--SITE_RANKING_FIELD', default=None, required=False, help="Field the sites are ranked on: atlite (averaged Atlite capacity factors, default) or wad (Wind Atlas data).")
+    parser.add_argument('--SITE_RANKING_TOP_K', default=None, required=False, help="Number of sites to return.")
+    parser.add_argument('--SITE_RANKING_MIN_DISTANCE_KM', default=None, required=False, help="Minimum distance between the sites in km (leave empty for no spacing).")
+    parser.add_argument('--SITE_RANKING_BBOX', default=None, required=False, help="Region the sites are searched in, latitude bottom, latitude top, longitude left, longitude right, e.g. --SITE_RANKING_BBOX=-33,-30,18,22 (leave empty for the whole loaded domain)")
+    parser.add_argument('--SITE_RANKING_OUTPUT_FOLDER', default=None, required=False, help="Site ranking output folder.")
+    parser.add_argument('--SITE_RANKING_TIME_SERIES_FILE', default=None, required=False, help="Output file for the time series of the sites.")
+    parser.add_argument('--SITE_RANKING_LOCATION_FILE', default=None, required=False, help="Output file for the ranked site locations.")
+    parser.add_argument('--ATLITE_TIME_FREQUENCY', default=None, required=False, help="Time step frequency of the Atlite files e.g. h for hourly.")
+    parser.add_argument('--TIME_WINDOW_START', default=None, required=False, help="Start date of the time window to process (inclusive).")
+    parser.add_argument('--TIME_WINDOW_END', default=None, required=False, help="End date of the time window to process (exclusive).")
+    parser.add_argument('--TIME_WINDOW_MONTHS', default=None, required=False, help="Months or seasons to process e.g. 6,7,8 or JJA.")
+    parser.add_argument('--ATLITE_CUBE_FILE', default=None, required=False, help="Stitched netcdf cube of capacity factors (e.g. the Option 7 corrected cube) used instead of the Atlite folders.")
+    parser.add_argument('--STAGE_TIMING_LOG_FILE', default=None, required=False, help="Optional JSON lines file the stage timings (seconds, peak memory, items) are appended to.")
+    parser.add_argument('--ROI_BBOX', default=None, required=False, help="Region of interest to read, latitude bottom, latitude top, longitude left, longitude right, e.g. --ROI_BBOX=-35,-22,16,33 (with = because of the minus signs, leave empty for the whole domain)")
+    parser.add_argument('--ROI_GEOMETRY_FILE', default=None, required=False, help="GeoJSON file whose geometries bound the region of interest to read (leave empty for the whole domain)")
+    parser.add_argument('--ATLITE_CHUNKS', default=None, required=False, help="Time steps per chunk to process the Atlite data out-of-core with dask, e.g. 744 or auto (leave empty to load it into memory)")
+    parser.add_argument('--TIER_DASK_SCHEDULER', default=None, required=False, help="Dask scheduler for the chunked computations: threads (default), processes, synchronous, local or a scheduler address (tcp://...)")
+    parser.add_argument('--TIER_DASK_NUM_WORKERS', default=None, required=False, help="Number of dask workers (default: all cores)")
+    parser.add_argument('--ATLITE_PREFETCH_DEPTH', default=None, required=False, help="Number of Atlite csv files read ahead by background threads, e.g. 16 on a network drive (leave empty or 0 to read one file after the other)")
+    parser.add_argument('--ATLITE_FOLDER_MANIFESTS', default=None, required=False, help="True/False: keep a manifest of the csv files (order, sizes, header hashes) in every Atlite folder, unchanged folders are then not listed again. Default False")
+    parser.add_argument('--ATLITE_LAND_CELLS', default=None, required=False, help="True/False: keep only the Atlite cells with a valid average (land cells) as a (time, cell) matrix, so the memory and the tier reductions scale with the land area. Default False")
+    parser.add_argument('--WIND_ATLAS_REDUCTION_METHOD', default=None, required=False, help="How a block of WIND ATLAS cells is reduced to one cell: mean, max, quantile or stride.")
+    parser.add_argument('--WIND_ATLAS_REDUCTION_QUANTILE', default=None, required=False, help="Quantile (0 to 1) of the block for WIND_ATLAS_REDUCTION_METHOD quantile.")
+    parser.add_argument('--WIND_ATLAS_PYRAMID_FOLDER', default=None, required=False, help="Folder of the reduced WIND ATLAS files.")
+
+    # parse args
+    args = parser.parse_args()
+
+    # Check if only some of the arguments are provided (none at all: the .env file is used)
+    if any(arg is None for arg in vars(args).values()) and not all(arg is None for arg in vars(args).values()):
+        print("Warning only some arguments provided! The others are read from the .env file.")
+
+    return args
+
+
+def load_from_env():
+    # Load data from .env file
+    load_dotenv()
+    env_vars = {
+        "ATLITE_DUMMY_DATA": os.environ.get("ATLITE_DUMMY_DATA"),
+        "ATLITE_CAPACITY_FACTORS_FOLDERS" : os.environ.get("ATLITE_CAPACITY_FACTORS_FOLDERS"),
+        "DUMMY_START_DATE": os.environ.get("DUMMY_START_DATE"),
+        "DUMMY_END_DATE": os.environ.get("DUMMY_END_DATE"),
+        "DUMMY_LATITUDE_BOTTOM": os.environ.get("DUMMY_LATITUDE_BOTTOM"),
+        "DUMMY_LATITUDE_TOP": os.environ.get("DUMMY_LATITUDE_TOP"),
+        "DUMMY_LONGITUDE_LEFT": os.environ.get("DUMMY_LONGITUDE_LEFT"),
+        "DUMMY_LONGITUDE_RIGHT": os.environ.get("DUMMY_LONGITUDE_RIGHT"),
+        "MAXIMUM_CAPACITY": os.environ.get("MAXIMUM_CAPACITY"),
+        "DATA_VARIABLE_NAME": os.environ.get("DATA_VARIABLE_NAME"),
+        "TIME_VARIABLE_NAME": os.environ.get("TIME_VARIABLE_NAME"),
+        "AVG_ATLITE_CAPACITY_FACTORS_FILE_LOCATION": os.environ.get("AVG_ATLITE_CAPACITY_FACTORS_FILE_LOCATION"),
+        "AVG_ATLITE_LATITUDE_VARIABLE_NAME": os.environ.get("AVG_ATLITE_LATITUDE_VARIABLE_NAME"),
+        "AVG_ATLITE_LONGITUDE_VARIABLE_NAME": os.environ.get("AVG_ATLITE_LONGITUDE_VARIABLE_NAME"),
+        "REDUCED_WAD": os.environ.get("REDUCED_WAD"),
+        "WIND_ATLAS_RESOLUTION_REDUCTION": os.environ.get("WIND_ATLAS_RESOLUTION_REDUCTION"),
+        "WIND_ATLAS_CAPACITY_FACTORS_HEATMAP_FILE_LOCATION": os.environ.get("WIND_ATLAS_CAPACITY_FACTORS_HEATMAP_FILE_LOCATION"),
+        "WIND_ATLAS_HEATMAP_LATITUDE_VARIABLE_NAME": os.environ.get("WIND_ATLAS_HEATMAP_LATITUDE_VARIABLE_NAME"),
+        "WIND_ATLAS_HEATMAP_LONGITUDE_VARIABLE_NAME": os.environ.get("WIND_ATLAS_HEATMAP_LONGITUDE_VARIABLE_NAME"),
+        "WIND_ATLAS_HEATMAP_DATA_VARIABLE_NAME": os.environ.get("WIND_ATLAS_HEATMAP_DATA_VARIABLE_NAME"),
+        "SCALE_CAPACITY_FACTORS": os.environ.get("SCALE_CAPACITY_FACTORS"),
+        "SITE_RANKING_FIELD": os.environ.get("SITE_RANKING_FIELD"),
+        "SITE_RANKING_TOP_K": os.environ.get("SITE_RANKING_TOP_K"),
+        "SITE_RANKING_MIN_DISTANCE_KM": os.environ.get("SITE_RANKING_MIN_DISTANCE_KM"),
+        "SITE_RANKING_BBOX": os.environ.get("SITE_RANKING_BBOX"),
+        "SITE_RANKING_OUTPUT_FOLDER": os.environ.get("SITE_RANKING_OUTPUT_FOLDER"),
+        "SITE_RANKING_TIME_SERIES_FILE": os.environ.get("SITE_RANKING_TIME_SERIES_FILE"),
+        "SITE_RANKING_LOCATION_FILE": os.environ.get("SITE_RANKING_LOCATION_FILE"),
+        "ATLITE_TIME_FREQUENCY": os.environ.get("ATLITE_TIME_FREQUENCY"),
+        "TIME_WINDOW_START": os.environ.get("TIME_WINDOW_START"),
+        "TIME_WINDOW_END": os.environ.get("TIME_WINDOW_END"),
+        "TIME_WINDOW_MONTHS": os.environ.get("TIME_WINDOW_MONTHS"),
+        "ATLITE_CUBE_FILE": os.environ.get("ATLITE_CUBE_FILE"),
+        "STAGE_TIMING_LOG_FILE": os.environ.get("STAGE_TIMING_LOG_FILE"),
+        "ROI_BBOX": os.environ.get("ROI_BBOX"),
+        "ROI_GEOMETRY_FILE": os.environ.get("ROI_GEOMETRY_FILE"),
+        "ATLITE_CHUNKS": os.environ.get("ATLITE_CHUNKS"),
+        "TIER_DASK_SCHEDULER": os.environ.get("TIER_DASK_SCHEDULER"),
+        "TIER_DASK_NUM_WORKERS": os.environ.get("TIER_DASK_NUM_WORKERS"),
+        "ATLITE_PREFETCH_DEPTH": os.environ.get("ATLITE_PREFETCH_DEPTH"),
+        "ATLITE_FOLDER_MANIFESTS": os.environ.get("ATLITE_FOLDER_MANIFESTS"),
+        "ATLITE_LAND_CELLS": os.environ.get("ATLITE_LAND_CELLS"),
+        "WIND_ATLAS_REDUCTION_METHOD": os.environ.get("WIND_ATLAS_REDUCTION_METHOD"),
+        "WIND_ATLAS_REDUCTION_QUANTILE": os.environ.get("WIND_ATLAS_REDUCTION_QUANTILE"),
+        "WIND_ATLAS_PYRAMID_FOLDER": os.environ.get("WIND_ATLAS_PYRAMID_FOLDER"),
+    }
+
+    # Store the names of variables that are None
+    unset_variables = []
+
+    for key, value in env_vars.items():
+        if value is None:
+            unset_variables.append(key)
+
+    if unset_variables:
+        print("WARNING: The following environment variables are not set in the .env file:")
+        for var in unset_variables:
+            print("...... -  ", var)
+
+    return env_vars
+
+
+################################################################
+# main codes:
+
+def rank_sites(ATLITE_DUMMY_DATA, ATLITE_CAPACITY_FACTORS_FOLDERS, DUMMY_START_DATE, DUMMY_END_DATE, DUMMY_LATITUDE_BOTTOM, DUMMY_LATITUDE_TOP, DUMMY_LONGITUDE_LEFT, DUMMY_LONGITUDE_RIGHT, MAXIMUM_CAPACITY, DATA_VARIABLE_NAME, TIME_VARIABLE_NAME, AVG_ATLITE_CAPACITY_FACTORS_FILE_LOCATION, AVG_ATLITE_LATITUDE_VARIABLE_NAME, AVG_ATLITE_LONGITUDE_VARIABLE_NAME, REDUCED_WAD, WIND_ATLAS_RESOLUTION_REDUCTION, WIND_ATLAS_CAPACITY_FACTORS_HEATMAP_FILE_LOCATION, WIND_ATLAS_HEATMAP_LATITUDE_VARIABLE_NAME, WIND_ATLAS_HEATMAP_LONGITUDE_VARIABLE_NAME, WIND_ATLAS_HEATMAP_DATA_VARIABLE_NAME, SCALE_CAPACITY_FACTORS, SITE_RANKING_FIELD, SITE_RANKING_TOP_K, SITE_RANKING_MIN_DISTANCE_KM, SITE_RANKING_BBOX, SITE_RANKING_OUTPUT_FOLDER, SITE_RANKING_TIME_SERIES_FILE, SITE_RANKING_LOCATION_FILE, ATLITE_TIME_FREQUENCY=None, TIME_WINDOW_START=None, TIME_WINDOW_END=None, TIME_WINDOW_MONTHS=None, ATLITE_CUBE_FILE=None, STAGE_TIMING_LOG_FILE=None, ROI_BBOX=None, ROI_GEOMETRY_FILE=None, ATLITE_CHUNKS=None, TIER_DASK_SCHEDULER=None, TIER_DASK_NUM_WORKERS=None, ATLITE_PREFETCH_DEPTH=None, ATLITE_FOLDER_MANIFESTS=None, ATLITE_LAND_CELLS=None, WIND_ATLAS_REDUCTION_METHOD=None, WIND_ATLAS_REDUCTION_QUANTILE=None, WIND_ATLAS_PYRAMID_FOLDER=None):
+    support_functions.check_configuration(locals())
+    # Code block where you want to suppress warnings
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        support_functions.start_stage_log("site_ranking",STAGE_TIMING_LOG_FILE)
+        support_functions.set_dask_scheduler(TIER_DASK_SCHEDULER,TIER_DASK_NUM_WORKERS)
+
+        # check the ranking settings before reading any data
+        ranking_field = "atlite" if SITE_RANKING_FIELD is None or str(SITE_RANKING_FIELD).strip() == "" else str(SITE_RANKING_FIELD).strip().lower()
+        if ranking_field not in ("atlite", "wad"):
+            raise ValueError("SITE_RANKING_FIELD must be atlite or wad, got: " + str(SITE_RANKING_FIELD))
+        try:
+            number_of_sites = int(SITE_RANKING_TOP_K)
+        except (TypeError, ValueError):
+            raise ValueError("SITE_RANKING_TOP_K must be a whole number of sites, got: " + str(SITE_RANKING_TOP_K))
+        if number_of_sites < 1:
+            raise ValueError("SITE_RANKING_TOP_K must be at least 1, got: " + str(SITE_RANKING_TOP_K))
+        minimum_distance_km = None
+        if SITE_RANKING_MIN_DISTANCE_KM is not None and str(SITE_RANKING_MIN_DISTANCE_KM).strip() != "":
+            minimum_distance_km = float(SITE_RANKING_MIN_DISTANCE_KM)
+        search_region = support_functions.region_of_interest(SITE_RANKING_BBOX)
+
+        # average the capacity factors according to time:
+        atlite_capacity_factors, atlite_capacity_factors_avg = support_functions.create_average_capacity_factor_file_atlite(ATLITE_DUMMY_DATA, ATLITE_CAPACITY_FACTORS_FOLDERS,DUMMY_START_DATE,DUMMY_END_DATE,DUMMY_LATITUDE_BOTTOM,DUMMY_LATITUDE_TOP,DUMMY_LONGITUDE_LEFT,DUMMY_LONGITUDE_RIGHT,MAXIMUM_CAPACITY,DATA_VARIABLE_NAME,TIME_VARIABLE_NAME,AVG_ATLITE_CAPACITY_FACTORS_FILE_LOCATION,ATLITE_TIME_FREQUENCY=ATLITE_TIME_FREQUENCY,TIME_WINDOW_START=TIME_WINDOW_START,TIME_WINDOW_END=TIME_WINDOW_END,TIME_WINDOW_MONTHS=TIME_WINDOW_MONTHS,ATLITE_CUBE_FILE=ATLITE_CUBE_FILE,ROI_BBOX=ROI_BBOX,ROI_GEOMETRY_FILE=ROI_GEOMETRY_FILE,ATLITE_CHUNKS=ATLITE_CHUNKS,ATLITE_PREFETCH_DEPTH=ATLITE_PREFETCH_DEPTH,ATLITE_FOLDER_MANIFESTS=ATLITE_FOLDER_MANIFESTS,ATLITE_LAND_CELLS=ATLITE_LAND_CELLS)
+        atlite_lats = atlite_capacity_factors[AVG_ATLITE_LATITUDE_VARIABLE_NAME].values
+        atlite_lons = atlite_capacity_factors[AVG_ATLITE_LONGITUDE_VARIABLE_NAME].values
+        print("... Read averaged atlite capacity factor data.")
+
+        if ranking_field == "wad":
+            with support_functions.stage_span("read_wad") as span:
+                if REDUCED_WAD.lower() == "true":
+                    # open the WAD data
+                    latitude_wad,longitude_wad,all_data_wad = support_functions.read_wind_atlas_data_reduced(WIND_ATLAS_RESOLUTION_REDUCTION,WIND_ATLAS_CAPACITY_FACTORS_HEATMAP_FILE_LOCATION,WIND_ATLAS_HEATMAP_LATITUDE_VARIABLE_NAME,WIND_ATLAS_HEATMAP_LONGITUDE_VARIABLE_NAME,WIND_ATLAS_HEATMAP_DATA_VARIABLE_NAME,ROI_BBOX=ROI_BBOX,ROI_GEOMETRY_FILE=ROI_GEOMETRY_FILE,WIND_ATLAS_REDUCTION_METHOD=WIND_ATLAS_REDUCTION_METHOD,WIND_ATLAS_REDUCTION_QUANTILE=WIND_ATLAS_REDUCTION_QUANTILE,WIND_ATLAS_PYRAMID_FOLDER=WIND_ATLAS_PYRAMID_FOLDER)
+                else:
+                    # open the WAD data
+                    latitude_wad, longitude_wad, all_data_wad = support_functions.read_wind_atlas_data_full(WIND_ATLAS_CAPACITY_FACTORS_HEATMAP_FILE_LOCATION,WIND_ATLAS_HEATMAP_LATITUDE_VARIABLE_NAME,WIND_ATLAS_HEATMAP_LONGITUDE_VARIABLE_NAME,WIND_ATLAS_HEATMAP_DATA_VARIABLE_NAME,ROI_BBOX=ROI_BBOX,ROI_GEOMETRY_FILE=ROI_GEOMETRY_FILE)
+                span['items'] = int(all_data_wad.size)
+            field_values, field_lats, field_lons = all_data_wad.values, np.asarray(latitude_wad), np.asarray(longitude_wad)
+        else:
+            field_values, field_lats, field_lons = atlite_capacity_factors_avg.values, atlite_lats, atlite_lons
+
+        # best K cells of the field, best first
+        print("... Ranking the best ",number_of_sites," sites of the ",ranking_field," field",("" if minimum_distance_km is None else " at least "+str(minimum_distance_km)+" km apart"))
+        with support_functions.stage_span("ranking",number_of_sites):
+            site_cells = support_functions.top_k_sites(field_values,field_lats,field_lons,number_of_sites,minimum_distance_km,search_region)
+        if len(site_cells) < number_of_sites:
+            print("... WARNING: only ",len(site_cells)," sites found in the search region.")
+        site_lat_index, site_lon_index = site_cells // len(field_lons), site_cells % len(field_lons)
+
+        # the closest atlite cell of every site (the site itself for the atlite field)
+        closest_lat_index = np.argmin(np.abs(field_lats[site_lat_index][:, np.newaxis] - atlite_lats[np.newaxis, :]), axis=1)
+        closest_lon_index = np.argmin(np.abs(field_lons[site_lon_index][:, np.newaxis] - atlite_lons[np.newaxis, :]), axis=1)
+
+        site_names = ['site_'+str(site_number+1) for site_number in range(len(site_cells))]
+        location_df = pd.DataFrame({'latitude': field_lats[site_lat_index], 'longitude': field_lons[site_lon_index], 'average_capacity_factor': np.asarray(field_values)[site_lat_index, site_lon_index].astype(float)}, index=site_names)
+        if ranking_field == "wad":
+            location_df['atlite_latitude'] = atlite_lats[closest_lat_index]
+            location_df['atlite_longitude'] = atlite_lons[closest_lon_index]
+            location_df['atlite_average_capacity_factor'] = atlite_capacity_factors_avg.data[closest_lat_index, closest_lon_index].astype(float)
+
+        # timeseries of all sites in one read (chunk by chunk for chunked data)
+        with support_functions.stage_span("gather",len(site_cells)):
+            site_series = support_functions.gather_cell_series(support_functions.tier_values(atlite_capacity_factors,DATA_VARIABLE_NAME),closest_lat_index * len(atlite_lons) + closest_lon_index)
+            sites_df = pd.DataFrame(site_series, columns=site_names, index=support_functions.tier_time_index(atlite_capacity_factors,TIME_VARIABLE_NAME))
+
+        # scale capacity factors if required:
+        if SCALE_CAPACITY_FACTORS.lower() == "true":
+            sites_df = sites_df / float(MAXIMUM_CAPACITY)  # divide by the weightings
+            print("\n... Capacity factors were scaled by division of maximum capacity:",MAXIMUM_CAPACITY)
+
+        # check if output directories are created
+        if not os.path.exists(SITE_RANKING_OUTPUT_FOLDER):
+            os.makedirs(SITE_RANKING_OUTPUT_FOLDER)
+
+        # save to csv files
+        with support_functions.stage_span("write",2):
+            sites_df.to_csv(os.path.join(SITE_RANKING_OUTPUT_FOLDER,SITE_RANKING_TIME_SERIES_FILE))
+            location_df.to_csv(os.path.join(SITE_RANKING_OUTPUT_FOLDER,SITE_RANKING_LOCATION_FILE))
+
+        print("\n... Files for the best "+str(len(site_cells))+" sites created:")
+        print("...... Location file located in: "+SITE_RANKING_LOCATION_FILE)
+        print("...... Time series file located in: "+SITE_RANKING_TIME_SERIES_FILE)
+
+        support_functions.print_stage_summary()
+        print("\nSite ranking completed successfully!")
+
+
+if __name__ == '__main__':
+    print("#############")
+    print("Site ranking")
+    print("#############")
+
+    # check args or load env file and run codes
+    args = support_functions.script_arguments(parse_arguments(), load_from_env)
+
+    # RUN CODES
+    rank_sites(**args)
+
+    # example use:
+    # python site_ranking.py --ATLITE_DUMMY_DATA True --DUMMY_START_DATE  '2023-01-01' --DUMMY_END_DATE  '2024-01-01' --DUMMY_LATITUDE_BOTTOM  -32.0 --DUMMY_LATITUDE_TOP  -30.0 --DUMMY_LONGITUDE_LEFT  26.0 --DUMMY_LONGITUDE_RIGHT  28.0 --MAXIMUM_CAPACITY  50 --DATA_VARIABLE_NAME  capacity_factors --TIME_VARIABLE_NAME  time --AVG_ATLITE_CAPACITY_FACTORS_FILE_LOCATION  "assets/avg_atlite_capacity_factors.nc" --AVG_ATLITE_LATITUDE_VARIABLE_NAME  latitude --AVG_ATLITE_LONGITUDE_VARIABLE_NAME  longitude --REDUCED_WAD  False --WIND_ATLAS_CAPACITY_FACTORS_HEATMAP_FILE_LOCATION  "assets/wind_atlas_capacity_factors.nc" --WIND_ATLAS_HEATMAP_LATITUDE_VARIABLE_NAME  lat --WIND_ATLAS_HEATMAP_LONGITUDE_VARIABLE_NAME  lon --WIND_ATLAS_HEATMAP_DATA_VARIABLE_NAME  Band1 --SCALE_CAPACITY_FACTORS  True --SITE_RANKING_FIELD  wad --SITE_RANKING_TOP_K  20 --SITE_RANKING_MIN_DISTANCE_KM  10 --SITE_RANKING_OUTPUT_FOLDER  "assets/site_ranking_output" --SITE_RANKING_TIME_SERIES_FILE  "site_ranking_time_series.csv" --SITE_RANKING_LOCATION_FILE  "site_ranking_locations.csv"
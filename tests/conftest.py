@@ -0,0 +1,26 @@
+"""
+Purpose: Shared fixtures of the tier engine tests: a tiny synthetic Atlite cube and its average.
+
+Author: Kirodh Boodhraj
+"""
+import os
+import sys
+import numpy as np
+import pytest
+
+# the option scripts and the support functions live in the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import Option_Support_Functions as support_functions
+
+
+@pytest.fixture
+def atlite_cube():
+    # 49 hourly time steps on a 10 x 12 grid of random capacity factors, the same every run
+    np.random.seed(2024)
+    return support_functions.create_temporary_atlite_dataset('2023-01-01', '2023-01-03', -32.0, -31.0, 26.0, 27.2, 50, 'capacity_factors')
+
+
+@pytest.fixture
+def atlite_average(atlite_cube):
+    return atlite_cube['capacity_factors'].mean(dim='time')
@@ -0,0 +1,349 @@
+"""
+Purpose: Check the tier engines against brute force calculations of the original option scripts on a tiny cube.
+
+Author: Kirodh Boodhraj
+"""
+import os
+import sys
+import subprocess
+import numpy as np
+import pytest
+
+import Option_Support_Functions as support_functions
+
+
+def brute_force_bounded_tier(average_values, full_values, lower, upper, weights=None):
+    # the original Option 3: the cells strictly between the (100 - upper) and (100 - lower) percentiles, averaged
+    bottom = np.nanquantile(average_values, 1.0 - upper / 100.0)
+    top = np.nanquantile(average_values, 1.0 - lower / 100.0)
+    selected = (average_values > bottom) & (average_values < top)
+    weights = np.ones(average_values.shape) if weights is None else weights
+    return (full_values[:, selected] * weights[selected]).sum(axis=1) / weights[selected].sum(), bottom, top, selected.sum()
+
+
+# Bounded tiers (Options 3, 4, 6)
+def test_bounded_tiers_match_brute_force(atlite_cube, atlite_average):
+    full_values = atlite_cube['capacity_factors'].values
+    tier_bands = support_functions.parse_tier_specification("0,10;10,30;30,60;60,100;0,100")
+    tier_means, bottom_bounds, top_bounds, cells_per_tier = support_functions.generate_bounded_tiers(atlite_average.values, full_values, tier_bands)
+    for tier_number, (lower, upper) in enumerate(tier_bands):
+        expected, bottom, top, cells = brute_force_bounded_tier(atlite_average.values, full_values, lower, upper)
+        np.testing.assert_allclose(tier_means[:, tier_number], expected)
+        assert np.isclose(bottom_bounds[tier_number], bottom) and np.isclose(top_bounds[tier_number], top)
+        assert cells_per_tier[tier_number] == cells
+
+
+def test_bounded_tiers_on_a_finer_grid(atlite_cube, atlite_average):
+    # Option 4: the bounds come from a finer (WAD) field, every fine cell takes the series of its nearest Atlite cell
+    full_values = atlite_cube['capacity_factors'].values
+    fine_latitudes = np.arange(-32.0, -31.0, 0.05)
+    fine_longitudes = np.arange(26.0, 27.2, 0.05)
+    fine_values = np.random.rand(len(fine_latitudes), len(fine_longitudes))
+    cell_index = support_functions.nearest_cell_index(fine_latitudes, fine_longitudes, atlite_average['latitude'].values, atlite_average['longitude'].values)
+    tier_bands = support_functions.parse_tier_specification("0,20;20,50")
+    tier_means, _, _, _ = support_functions.generate_bounded_tiers(fine_values, full_values, tier_bands, cell_index)
+    fine_series = full_values.reshape(full_values.shape[0], -1)[:, cell_index].reshape(full_values.shape[0], len(fine_latitudes), len(fine_longitudes))
+    for tier_number, (lower, upper) in enumerate(tier_bands):
+        np.testing.assert_allclose(tier_means[:, tier_number], brute_force_bounded_tier(fine_values, fine_series, lower, upper)[0])
+
+
+def test_bounded_tiers_skip_nan_cells(atlite_cube, atlite_average):
+    full_values = atlite_cube['capacity_factors'].values
+    average_values = atlite_average.values.copy()
+    average_values[:3, :4] = np.nan
+    tier_bands = support_functions.parse_tier_specification("0,25;25,75")
+    tier_means, _, _, _ = support_functions.generate_bounded_tiers(average_values, full_values, tier_bands)
+    for tier_number, (lower, upper) in enumerate(tier_bands):
+        np.testing.assert_allclose(tier_means[:, tier_number], brute_force_bounded_tier(average_values, full_values, lower, upper)[0])
+
+
+# Upper percentage sweep (Options 1, 2)
+def test_percentage_sweep_matches_brute_force(atlite_cube, atlite_average):
+    # the original Option 1: the mean series of the cells above the (100 - percentage) percentile, one percentage at a time
+    full_values = atlite_cube['capacity_factors'].values
+    percentages = support_functions.parse_percentage_sweep("1,5:50:5,100")
+    sweep_means, cells_per_percentage = support_functions.generate_upper_percentage_sweep(atlite_average.values, full_values, percentages)
+    for column, percentage in enumerate(percentages):
+        selected = atlite_average.values > np.nanquantile(atlite_average.values, 1.0 - percentage / 100.0)
+        assert cells_per_percentage[column] == selected.sum()
+        if selected.sum() == 0:
+            assert np.isnan(sweep_means[:, column]).all()
+        else:
+            np.testing.assert_allclose(sweep_means[:, column], full_values[:, selected].mean(axis=1))
+
+
+# Chunked tiers (dask, Options 1 to 6 step 2)
+REPOSITORY_FOLDER = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CHUNKED_RUN = """
+import numpy as np
+from dotenv import load_dotenv
+load_dotenv('sample.env')
+import Option_Support_Functions as support_functions
+np.random.seed(2024)
+atlite_cube = support_functions.create_temporary_atlite_dataset('2023-01-01', '2023-01-03', -32.0, -31.0, 26.0, 27.2, 50, 'capacity_factors')
+average_values = atlite_cube['capacity_factors'].mean(dim='time').values
+tier_bands = support_functions.parse_tier_specification('0,10;10,50')
+chunked_cube = atlite_cube.chunk({'time': 10})
+assert support_functions.is_chunked(support_functions.tier_values(chunked_cube, 'capacity_factors'))
+in_memory = support_functions.generate_bounded_tiers(average_values, atlite_cube['capacity_factors'].values, tier_bands)[0]
+chunked = support_functions.generate_bounded_tiers(average_values, support_functions.tier_values(chunked_cube, 'capacity_factors'), tier_bands)[0]
+np.testing.assert_allclose(chunked, in_memory)
+print('chunked tiers ok')
+"""
+
+
+@pytest.mark.parametrize("old_settings", [{}, {'DASK_SCHEDULER': '', 'DASK_NUM_WORKERS': ''}])
+def test_chunked_tiers_with_the_sample_env(old_settings):
+    # a fresh process, dask reads its DASK_* settings from the environment when it is first imported. The empty
+    # DASK_* values of older .env files are dropped
+    environment = {name: value for name, value in os.environ.items() if not name.startswith('DASK_')}
+    environment.update(old_settings)
+    run = subprocess.run([sys.executable, "-c", CHUNKED_RUN], cwd=REPOSITORY_FOLDER, env=environment, capture_output=True, text=True)
+    assert run.returncode == 0, run.stderr
+    assert 'chunked tiers ok' in run.stdout
+
+
+# Summed area tables (Option 5 rectangles)
+def test_rectangle_means_match_brute_force(atlite_cube, atlite_average):
+    # the original Option 5: the mean series of the non NaN cells with their centre strictly inside the rectangle
+    from shapely.geometry import box
+    full_values = atlite_cube['capacity_factors'].values.copy()
+    full_values[:5, 2, 3] = np.nan
+    latitudes = atlite_average['latitude'].values
+    longitudes = atlite_average['longitude'].values
+    for rectangle in (box(26.1, -31.9, 26.7, -31.4), box(26.0, -32.0, 27.2, -31.0), box(26.31, -31.52, 26.33, -31.5)):
+        series, cells = support_functions.geometry_tier_series(rectangle, latitudes, longitudes, atlite_average.values, full_values)
+        inside = (latitudes[:, np.newaxis] > rectangle.bounds[1]) & (latitudes[:, np.newaxis] < rectangle.bounds[3]) & (longitudes > rectangle.bounds[0]) & (longitudes < rectangle.bounds[2])
+        assert cells == inside.sum()
+        if cells == 0:
+            assert np.isnan(series['tier_1']).all()
+        else:
+            np.testing.assert_allclose(series['tier_1'], np.nanmean(full_values[:, inside], axis=1))
+    # the corner series of the tables are the running sums of the cells below and left of them
+    value_sums, cell_counts = support_functions.summed_area_tables(full_values)
+    np.testing.assert_allclose(value_sums[4, 7], np.nansum(full_values[:, :4, :7], axis=(1, 2)))
+    assert (cell_counts[4, 7] == (~np.isnan(full_values[:, :4, :7])).sum(axis=(1, 2))).all()
+
+
+# Block max pyramid top K (site ranking)
+def brute_force_top_sites(values, latitudes, longitudes, number_of_sites, minimum_distance_km=None):
+    # every cell in descending order, taken when it is far enough from the sites already taken
+    order = np.argsort(-np.where(np.isnan(values), -np.inf, values), axis=None, kind='stable')
+    sites = []
+    for cell in order:
+        if len(sites) == number_of_sites or np.isnan(values.flat[cell]):
+            break
+        latitude, longitude = latitudes[cell // len(longitudes)], longitudes[cell % len(longitudes)]
+        if minimum_distance_km and sites and support_functions.distance_km(latitude, longitude, latitudes[[site // len(longitudes) for site in sites]], longitudes[[site % len(longitudes) for site in sites]]).min() < minimum_distance_km:
+            continue
+        sites.append(cell)
+    return np.array(sites, dtype=int)
+
+
+@pytest.mark.parametrize("number_of_sites, minimum_distance_km", [(1, None), (7, None), (200, None), (5, 25.0)])
+def test_top_sites_match_brute_force(atlite_average, number_of_sites, minimum_distance_km):
+    values = atlite_average.values.copy()
+    values[0, :5] = np.nan
+    latitudes = atlite_average['latitude'].values
+    longitudes = atlite_average['longitude'].values
+    sites = support_functions.top_k_sites(values, latitudes, longitudes, number_of_sites, minimum_distance_km, block_size=3)
+    np.testing.assert_array_equal(sites, brute_force_top_sites(values, latitudes, longitudes, number_of_sites, minimum_distance_km))
+
+
+def test_top_sites_inside_a_region(atlite_average):
+    values = atlite_average.values
+    latitudes = atlite_average['latitude'].values
+    longitudes = atlite_average['longitude'].values
+    region = (-31.8, -31.3, 26.3, 26.9)
+    inside = ((latitudes[:, np.newaxis] >= region[0]) & (latitudes[:, np.newaxis] <= region[1])) & ((longitudes >= region[2]) & (longitudes <= region[3]))
+    sites = support_functions.top_k_sites(values, latitudes, longitudes, 4, region=region, block_size=3)
+    np.testing.assert_array_equal(sites, brute_force_top_sites(np.where(inside, values, np.nan), latitudes, longitudes, 4))
+    assert support_functions.block_max_pyramid(values, 3)[-1][0, 0] == np.nanmax(values)
+
+
+# Checkpoints and resume (Options 1 to 6)
+def test_resume_loads_the_finished_stages(tmp_path, atlite_cube, atlite_average):
+    full_values = atlite_cube['capacity_factors'].values
+    tier_bands = support_functions.parse_tier_specification("0,10;10,50")
+    arguments = {'TIERS': "0,10;10,50", 'RESUME': None}
+    computed = []
+
+    def reduce_tiers():
+        computed.append('reduce')
+        return support_functions.generate_bounded_tiers(atlite_average.values, full_values, tier_bands)
+
+    def failing_stage():
+        raise RuntimeError("the run stopped")
+
+    # a run that fails after its reduce stage
+    support_functions.start_pipeline("option_3", arguments, str(tmp_path))
+    expected = support_functions.pipeline_stage("reduce", reduce_tiers)
+    with pytest.raises(RuntimeError):
+        support_functions.pipeline_stage("write", failing_stage)
+
+    # resumed with the same settings: the reduce stage is read from its checkpoint, not computed again
+    support_functions.start_pipeline("option_3", dict(arguments, RESUME='True'), str(tmp_path), 'True')
+    resumed = support_functions.pipeline_stage("reduce", reduce_tiers)
+    assert computed == ['reduce']
+    for expected_values, resumed_values in zip(expected, resumed):
+        np.testing.assert_array_equal(expected_values, resumed_values)
+    assert support_functions.pipeline_stage("write", lambda: "written") == "written"
+    support_functions.finish_pipeline()
+    assert os.listdir(tmp_path) == []
+
+    # other settings do not use the checkpoints of the first run
+    support_functions.start_pipeline("option_3", arguments, str(tmp_path))
+    support_functions.pipeline_stage("reduce", reduce_tiers)
+    support_functions.start_pipeline("option_3", dict(arguments, TIERS="0,20"), str(tmp_path), 'True')
+    support_functions.pipeline_stage("reduce", reduce_tiers)
+    assert computed == ['reduce', 'reduce', 'reduce']
+    support_functions.finish_pipeline()
+
+
+# Land cells (ATLITE_LAND_CELLS)
+def test_land_cell_tiers_match_dense_tiers(atlite_cube):
+    # the cells east of 26.7 are sea (NaN): the land cells of an in memory and of a chunked cube give the dense tiers
+    coastal_cube = atlite_cube.where(atlite_cube['longitude'] < 26.7)
+    average = coastal_cube['capacity_factors'].mean(dim='time')
+    tier_bands = support_functions.parse_tier_specification("0,10;10,30;30,100")
+    dense = support_functions.generate_bounded_tiers(average.values, coastal_cube['capacity_factors'].values, tier_bands)[0]
+    for cube in (coastal_cube, coastal_cube.chunk({'time': 10})):
+        land_cells = support_functions.to_land_cells(cube, average, 'capacity_factors', 'time')
+        assert land_cells.sizes['cell'] == (~np.isnan(average.values)).sum()
+        # a chunked cube stays chunked, the land cells are picked out of every chunk when it is read
+        assert support_functions.is_chunked(land_cells['capacity_factors'].data) == support_functions.is_chunked(cube['capacity_factors'].data)
+        np.testing.assert_allclose(support_functions.generate_bounded_tiers(average.values, support_functions.tier_values(land_cells, 'capacity_factors'), tier_bands)[0], dense)
+        restored = support_functions.from_land_cells(land_cells.load(), 'capacity_factors', 'time', 'latitude', 'longitude')
+        np.testing.assert_array_equal(restored['capacity_factors'].values, coastal_cube['capacity_factors'].values)
+
+
+# Tier masks (TIER_MASKS_FOLDER)
+def write_usable_mask(mask_file, latitudes, longitudes, usable, pixels_per_cell):
+    # north up GeoTIFF with pixels_per_cell x pixels_per_cell pixels over every grid cell, rows from north to south
+    import rasterio
+    from rasterio.transform import from_origin
+    resolution = (longitudes[1] - longitudes[0]) / pixels_per_cell
+    with rasterio.open(mask_file, 'w', driver='GTiff', height=usable.shape[0], width=usable.shape[1], count=1, dtype='uint8', crs='EPSG:4326', transform=from_origin(longitudes[0] - resolution * pixels_per_cell / 2, latitudes[-1] + resolution * pixels_per_cell / 2, resolution, resolution)) as mask:
+        mask.write(usable.astype(np.uint8), 1)
+
+
+@pytest.mark.parametrize("mode", ["exclude", "weight"])
+def test_masked_tiers_match_brute_force(tmp_path, atlite_cube, atlite_average, mode):
+    pytest.importorskip("rasterio")
+    full_values = atlite_cube['capacity_factors'].values
+    latitudes = atlite_average['latitude'].values
+    longitudes = atlite_average['longitude'].values
+    pixels_per_cell = 4
+    usable = np.random.default_rng(7).random((len(latitudes) * pixels_per_cell, len(longitudes) * pixels_per_cell)) < 0.6
+    write_usable_mask(str(tmp_path / "usable.tif"), latitudes, longitudes, usable, pixels_per_cell)
+    # usable fraction of every cell: the mean of its pixels, the mask rows run from north to south
+    fractions = usable.reshape(len(latitudes), pixels_per_cell, len(longitudes), pixels_per_cell).mean(axis=(1, 3))[::-1]
+
+    masked_average, cell_weights = support_functions.apply_tier_masks(atlite_average, 'latitude', 'longitude', str(tmp_path), mode, None, str(tmp_path / "cache"))
+    kept = fractions >= 0.5 if mode == 'exclude' else fractions > 0
+    np.testing.assert_allclose(cell_weights, np.where(kept, fractions if mode == 'weight' else 1.0, 0.0), atol=1e-6)
+    np.testing.assert_array_equal(np.isnan(masked_average.values), ~kept)
+
+    tier_bands = support_functions.parse_tier_specification("0,20;20,60")
+    tier_means, _, _, _ = support_functions.generate_bounded_tiers(masked_average.values, full_values, tier_bands, cell_weights=cell_weights)
+    for tier_number, (lower, upper) in enumerate(tier_bands):
+        expected = brute_force_bounded_tier(np.where(kept, atlite_average.values, np.nan), full_values, lower, upper, np.where(kept, fractions if mode == 'weight' else 1.0, 0.0))[0]
+        np.testing.assert_allclose(tier_means[:, tier_number], expected, rtol=1e-6)
+
+
+# Wind atlas pyramid (reduced WAD)
+def brute_force_block_reduction(values, block_size, reduction):
+    # every block_size x block_size block of cells (the last ones partial) reduced over its non NaN cells
+    return np.array([[reduction(values[row:row + block_size, column:column + block_size]) for column in range(0, values.shape[1], block_size)] for row in range(0, values.shape[0], block_size)])
+
+
+def write_wind_atlas(wind_atlas_file):
+    # 23 x 26 cells of a WAD like netcdf, with a few NaN cells
+    import xarray as xr
+    values = np.random.default_rng(5).random((23, 26))
+    values[:4, :5] = np.nan
+    xr.Dataset({'Band1': (('lat', 'lon'), values)}, coords={'lat': np.linspace(-32.0, -31.0, 23), 'lon': np.linspace(26.0, 27.2, 26)}).to_netcdf(wind_atlas_file)
+    return values
+
+
+@pytest.mark.filterwarnings("ignore::RuntimeWarning")
+@pytest.mark.parametrize("method, reduction", [("mean", np.nanmean), ("max", np.nanmax), ("quantile", lambda block: np.nanquantile(block, 0.9))])
+def test_reduced_wind_atlas_matches_block_reduction(tmp_path, method, reduction):
+    values = write_wind_atlas(str(tmp_path / "wad.nc"))
+    # the x 6 level is made from the x 3 level on disk (mean and max), it is read back from the pyramid the second time
+    for block_size in (3, 6, 6):
+        support_functions.loaded_data_cache.clear()
+        latitudes, longitudes, reduced = support_functions.read_wind_atlas_data_reduced(block_size, str(tmp_path / "wad.nc"), 'lat', 'lon', 'Band1', WIND_ATLAS_REDUCTION_METHOD=method, WIND_ATLAS_PYRAMID_FOLDER=str(tmp_path / "pyramid"))
+        assert not support_functions.is_chunked(reduced.data)
+        np.testing.assert_allclose(reduced.values, brute_force_block_reduction(values, block_size, reduction))
+        np.testing.assert_allclose(latitudes, support_functions.block_centres(np.linspace(-32.0, -31.0, 23), block_size))
+        np.testing.assert_allclose(longitudes, support_functions.block_centres(np.linspace(26.0, 27.2, 26), block_size))
+
+
+REDUCED_WAD_RUN = """
+import sys
+import numpy as np
+from dotenv import load_dotenv
+load_dotenv('sample.env')
+import Option_Support_Functions as support_functions
+latitudes, longitudes, reduced = support_functions.read_wind_atlas_data_reduced(3, sys.argv[1], 'lat', 'lon', 'Band1', WIND_ATLAS_PYRAMID_FOLDER=sys.argv[2])
+assert reduced.shape == (8, 9) and not support_functions.is_chunked(reduced.data)
+print('reduced wad ok')
+"""
+
+
+@pytest.mark.parametrize("old_settings", [{}, {'DASK_SCHEDULER': '', 'DASK_NUM_WORKERS': ''}])
+def test_reduced_wind_atlas_with_the_sample_env(tmp_path, old_settings):
+    # the default reduction (block means) in a fresh process with the settings of sample.env
+    write_wind_atlas(str(tmp_path / "wad.nc"))
+    environment = {name: value for name, value in os.environ.items() if not name.startswith('DASK_')}
+    environment.update(old_settings)
+    run = subprocess.run([sys.executable, "-c", REDUCED_WAD_RUN, str(tmp_path / "wad.nc"), str(tmp_path / "pyramid")], cwd=REPOSITORY_FOLDER, env=environment, capture_output=True, text=True)
+    assert run.returncode == 0, run.stderr
+    assert 'reduced wad ok' in run.stdout
+
+
+# Percentile service caches
+def test_percentile_caches_keep_the_fields_in_use(atlite_average):
+    support_functions.sorted_field_cache.clear()
+    support_functions.percentile_cache.clear()
+    field = atlite_average.values
+    bounds = support_functions.field_percentiles(field, [0.1, 0.9])
+    order, sorted_values = support_functions.sorted_valid_values(field)
+    # the cached arrays are shared, they can not be changed in place
+    for cached in (bounds, order, sorted_values):
+        with pytest.raises(ValueError):
+            cached[0] = 0
+    # a field used between every other field stays cached, the least recently used ones are dropped
+    for other in range(support_functions.PERCENTILE_CACHE_SIZE + 3):
+        support_functions.sorted_valid_values(field + other + 1)
+        assert support_functions.sorted_valid_values(field)[0] is order
+    assert len(support_functions.sorted_field_cache) == support_functions.PERCENTILE_CACHE_SIZE
+    np.testing.assert_allclose(support_functions.field_percentiles(field, [0.1, 0.9]), np.nanquantile(field, [0.1, 0.9]))
+
+
+# Option 7 correction
+def test_regrid_leaves_out_the_wind_atlas_outside_the_atlite_grid():
+    # a 0.01 degree WAD reaching 1 degree past every side of a 0.1 degree Atlite grid: 1 inside the grid, 5 outside
+    atlite_latitudes = np.round(np.arange(-32.0, -30.95, 0.1), 6)
+    atlite_longitudes = np.round(np.arange(26.0, 27.05, 0.1), 6)
+    wad_latitudes = np.round(np.arange(-33.0, -29.995, 0.01), 6)
+    wad_longitudes = np.round(np.arange(25.0, 28.005, 0.01), 6)
+    inside_latitudes = (wad_latitudes >= -32.05) & (wad_latitudes <= -30.95)
+    inside_longitudes = (wad_longitudes >= 25.95) & (wad_longitudes <= 27.05)
+    wad_values = np.where(inside_latitudes[:, None] & inside_longitudes[None, :], 1.0, 5.0)
+    regrid_index, area_weights = support_functions.area_weighted_regrid_index(wad_latitudes, wad_longitudes, atlite_latitudes, atlite_longitudes)
+    assert np.sum(regrid_index < 0) == np.sum(wad_values == 5.0)
+    regridded = support_functions.regrid_to_target_grid(wad_values, regrid_index, area_weights, (len(atlite_latitudes), len(atlite_longitudes)))
+    np.testing.assert_allclose(regridded, 1.0)
+
+
+def test_corrected_cube_is_clipped_and_read_in_time_chunks(tmp_path, atlite_cube):
+    import xarray as xr
+    scale_factors = np.full(atlite_cube['capacity_factors'].shape[1:], 1.5)
+    scale_factors[0, 0] = -1.0
+    chunked_cube = atlite_cube.chunk({'time': 10})
+    support_functions.write_corrected_cube(chunked_cube, scale_factors, str(tmp_path / "corrected.nc"), 'capacity_factors', 'time', 'latitude', 'longitude', CORRECTION_TIME_CHUNK=10)
+    with xr.open_dataset(str(tmp_path / "corrected.nc")) as corrected:
+        expected = np.clip(atlite_cube['capacity_factors'].values * scale_factors, 0, 1)
+        np.testing.assert_allclose(corrected['capacity_factors'].values, expected, rtol=1e-6)
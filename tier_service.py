@@ -0,0 +1,365 @@
+"""
+Purpose: Long running local tier service. Loads the Atlite capacity factors (and the Wind Atlas data) once and answers tier
+requests for Options 1 to 6 from memory over HTTP/JSON, with a cache of the most recent results.
+
+    GET  /health  -> grid size, number of time steps and cache usage
+    POST /tiers   -> JSON request, e.g.
+        {"option": 1, "percent_upper": 10}                          (also a sweep e.g. "1:50:1")
+        {"option": 2, "percent_upper": "1,5,10"}                    (needs the Wind Atlas data)
+        {"option": 3, "tiers": "0,10;10,20;20,40"}                  (or a list of [lower, upper] pairs)
+        {"option": 4, "tiers": [[0, 10], [10, 20]]}                 (needs the Wind Atlas data)
+        {"option": 5, "geometries": <GeoJSON FeatureCollection>}
+        {"option": 6, "geometries": <GeoJSON FeatureCollection>, "tiers": "0,10;10,20"}
+        {"option": "sites", "top_k": 10, "min_distance_km": 20, "field": "wad", "bbox": "-33,-30,18,22"}
+                                                                    (best sites, see site_ranking.py)
+    add "scale": true to divide the capacity factors by MAXIMUM_CAPACITY
+
+Author: Kirodh Boodhraj
+"""
+import json
+import os
+import threading
+import time
+from dotenv import load_dotenv
+import numpy as np
+import warnings
+import argparse
+from flask import Flask, request, jsonify
+
+import Option_Support_Functions as support_functions
+
+
+################################
+# system args section
+################################
+# used for running the codes
+def parse_arguments():
+    parser = argparse.ArgumentParser(description="Tier service: keeps the capacity factors in memory and answers tier requests for Options 1 to 6.")
+    parser.add_argument('--ATLITE_DUMMY_DATA', default=None, required=False,help="Boolean to use the dummy Atlite data (True) or not.")
+    parser.add_argument('--ATLITE_CAPACITY_FACTORS_FOLDERS', default=None, required=False,help="Folders continaing hourly Atlite data files needing stitching.")
+    parser.add_argument('--DUMMY_START_DATE', default=None, required=False, help="Start date.")
+    parser.add_argument('--DUMMY_END_DATE', default=None, required=False, help="End date.")
+    parser.add_argument('--DUMMY_LATITUDE_BOTTOM', default=None, required=False, help="Latitude bottom.")
+    parser.add_argument('--DUMMY_LATITUDE_TOP', default=None, required=False, help="Latitude top.")
+    parser.add_argument('--DUMMY_LONGITUDE_LEFT', default=None, required=False, help="Longitude left.")
+    parser.add_argument('--DUMMY_LONGITUDE_RIGHT', default=None, required=False, help="Longitude right.")
+    parser.add_argument('--MAXIMUM_CAPACITY', default=None, required=False, help="Maximum capacity.")
+    parser.add_argument('--DATA_VARIABLE_NAME', default=None, required=False, help="Data variable name.")
+    parser.add_argument('--TIME_VARIABLE_NAME', default=None, required=False, help="Time variable name.")
+    parser.add_argument('--AVG_ATLITE_CAPACITY_FACTORS_FILE_LOCATION', default=None, required=False,help="Average ATLITE capacity factors file location.")
+    parser.add_argument('--AVG_ATLITE_LATITUDE_VARIABLE_NAME', default=None, required=False,help="Average ATLITE latitude variable name.")
+    parser.add_argument('--AVG_ATLITE_LONGITUDE_VARIABLE_NAME', default=None, required=False,help="Average ATLITE longitude variable name.")
+    parser.add_argument('--REDUCED_WAD', default=None, required=False, help="Whether to use reduced WAD data.")
+    parser.add_argument('--WIND_ATLAS_RESOLUTION_REDUCTION', default=None, required=False,help="WIND ATLAS resolution reduction.")
+    parser.add_argument('--WIND_ATLAS_CAPACITY_FACTORS_HEATMAP_FILE_LOCATION', default=None, required=False,help="WIND ATLAS capacity factors heatmap file location, leave empty to serve Options 1, 3, 5 and 6 only.")
+    parser.add_argument('--WIND_ATLAS_HEATMAP_LATITUDE_VARIABLE_NAME', default=None, required=False,help="WIND ATLAS heatmap latitude variable name.")
+    parser.add_argument('--WIND_ATLAS_HEATMAP_LONGITUDE_VARIABLE_NAME', default=None, required=False,help="WIND ATLAS heatmap longitude variable name.")
+    parser.add_argument('--WIND_ATLAS_HEATMAP_DATA_VARIABLE_NAME', default=None, required=False,help="WIND ATLAS heatmap data variable name.")
+    parser.add_argument('--ATLITE_TIME_FREQUENCY', default=None, required=False, help="Time step frequency of the Atlite files e.g. h for hourly.")
+    parser.add_argument('--TIME_WINDOW_START', default=None, required=False, help="Start date of the time window to process (inclusive).")
+    parser.add_argument('--TIME_WINDOW_END', default=None, required=False, help="End date of the time window to process (exclusive).")
+    parser.add_argument('--TIME_WINDOW_MONTHS', default=None, required=False, help="Months or seasons to process e.g. 6,7,8 or JJA.")
+    parser.add_argument('--ATLITE_CUBE_FILE', default=None, required=False, help="Stitched netcdf cube of capacity factors (e.g. the Option 7 corrected cube) used instead of the Atlite folders.")
+    parser.add_argument('--TIER_SERVICE_HOST', default=None, required=False, help="Host the tier service listens on (default 127.0.0.1).")
+    parser.add_argument('--TIER_SERVICE_PORT', default=None, required=False, help="Port the tier service listens on (default 8060).")
+    parser.add_argument('--TIER_SERVICE_CACHE_SIZE', default=None, required=False, help="Number of recent tier results kept in memory (default 64).")
+    parser.add_argument('--ROI_BBOX', default=None, required=False, help="Region of interest to load, latitude bottom, latitude top, longitude left, longitude right, e.g. --ROI_BBOX=-35,-22,16,33 (with = because of the minus signs, leave empty for the whole domain)")
+    parser.add_argument('--ROI_GEOMETRY_FILE', default=None, required=False, help="GeoJSON file whose geometries bound the region of interest to load (leave empty for the whole domain)")
+    parser.add_argument('--ATLITE_PREFETCH_DEPTH', default=None, required=False, help="Number of Atlite csv files read ahead by background threads, e.g. 16 on a network drive (leave empty or 0 to read one file after the other)")
+    parser.add_argument('--ATLITE_FOLDER_MANIFESTS', default=None, required=False, help="True/False: keep a manifest of the csv files (order, sizes, header hashes) in every Atlite folder, unchanged folders are then not listed again. Default False")
+    parser.add_argument('--ATLITE_LAND_CELLS', default=None, required=False, help="True/False: keep only the Atlite cells with a valid average (land cells) as a (time, cell) matrix, so the memory and the tier reductions scale with the land area. Default False")
+    parser.add_argument('--WIND_ATLAS_REDUCTION_METHOD', default=None, required=False, help="How a block of WIND ATLAS cells is reduced to one cell: mean, max, quantile or stride.")
+    parser.add_argument('--WIND_ATLAS_REDUCTION_QUANTILE', default=None, required=False, help="Quantile (0 to 1) of the block for WIND_ATLAS_REDUCTION_METHOD quantile.")
+    parser.add_argument('--WIND_ATLAS_PYRAMID_FOLDER', default=None, required=False, help="Folder of the reduced WIND ATLAS files.")
+
+    # parse args
+    args = parser.parse_args()
+
+    # Check if only some of the arguments are provided (none at all: the .env file is used)
+    if any(arg is None for arg in vars(args).values()) and not all(arg is None for arg in vars(args).values()):
+        print("Warning only some arguments provided! The others are read from the .env file.")
+
+    return args
+
+
+def load_from_env():
+    # Load data from .env file
+    load_dotenv()
+    env_vars = {
+        "ATLITE_DUMMY_DATA": os.environ.get("ATLITE_DUMMY_DATA"),
+        "ATLITE_CAPACITY_FACTORS_FOLDERS": os.environ.get("ATLITE_CAPACITY_FACTORS_FOLDERS"),
+        "DUMMY_START_DATE": os.environ.get("DUMMY_START_DATE"),
+        "DUMMY_END_DATE": os.environ.get("DUMMY_END_DATE"),
+        "DUMMY_LATITUDE_BOTTOM": os.environ.get("DUMMY_LATITUDE_BOTTOM"),
+        "DUMMY_LATITUDE_TOP": os.environ.get("DUMMY_LATITUDE_TOP"),
+        "DUMMY_LONGITUDE_LEFT": os.environ.get("DUMMY_LONGITUDE_LEFT"),
+        "DUMMY_LONGITUDE_RIGHT": os.environ.get("DUMMY_LONGITUDE_RIGHT"),
+        "MAXIMUM_CAPACITY": os.environ.get("MAXIMUM_CAPACITY"),
+        "DATA_VARIABLE_NAME": os.environ.get("DATA_VARIABLE_NAME"),
+        "TIME_VARIABLE_NAME": os.environ.get("TIME_VARIABLE_NAME"),
+        "AVG_ATLITE_CAPACITY_FACTORS_FILE_LOCATION": os.environ.get("AVG_ATLITE_CAPACITY_FACTORS_FILE_LOCATION"),
+        "AVG_ATLITE_LATITUDE_VARIABLE_NAME": os.environ.get("AVG_ATLITE_LATITUDE_VARIABLE_NAME"),
+        "AVG_ATLITE_LONGITUDE_VARIABLE_NAME": os.environ.get("AVG_ATLITE_LONGITUDE_VARIABLE_NAME"),
+        "REDUCED_WAD": os.environ.get("REDUCED_WAD"),
+        "WIND_ATLAS_RESOLUTION_REDUCTION": os.environ.get("WIND_ATLAS_RESOLUTION_REDUCTION"),
+        "WIND_ATLAS_CAPACITY_FACTORS_HEATMAP_FILE_LOCATION": os.environ.get("WIND_ATLAS_CAPACITY_FACTORS_HEATMAP_FILE_LOCATION"),
+        "WIND_ATLAS_HEATMAP_LATITUDE_VARIABLE_NAME": os.environ.get("WIND_ATLAS_HEATMAP_LATITUDE_VARIABLE_NAME"),
+        "WIND_ATLAS_HEATMAP_LONGITUDE_VARIABLE_NAME": os.environ.get("WIND_ATLAS_HEATMAP_LONGITUDE_VARIABLE_NAME"),
+        "WIND_ATLAS_HEATMAP_DATA_VARIABLE_NAME": os.environ.get("WIND_ATLAS_HEATMAP_DATA_VARIABLE_NAME"),
+        "ATLITE_TIME_FREQUENCY": os.environ.get("ATLITE_TIME_FREQUENCY"),
+        "TIME_WINDOW_START": os.environ.get("TIME_WINDOW_START"),
+        "TIME_WINDOW_END": os.environ.get("TIME_WINDOW_END"),
+        "TIME_WINDOW_MONTHS": os.environ.get("TIME_WINDOW_MONTHS"),
+        "ATLITE_CUBE_FILE": os.environ.get("ATLITE_CUBE_FILE"),
+        "TIER_SERVICE_HOST": os.environ.get("TIER_SERVICE_HOST"),
+        "TIER_SERVICE_PORT": os.environ.get("TIER_SERVICE_PORT"),
+        "TIER_SERVICE_CACHE_SIZE": os.environ.get("TIER_SERVICE_CACHE_SIZE"),
+        "ROI_BBOX": os.environ.get("ROI_BBOX"),
+        "ROI_GEOMETRY_FILE": os.environ.get("ROI_GEOMETRY_FILE"),
+        "ATLITE_PREFETCH_DEPTH": os.environ.get("ATLITE_PREFETCH_DEPTH"),
+        "ATLITE_FOLDER_MANIFESTS": os.environ.get("ATLITE_FOLDER_MANIFESTS"),
+        "ATLITE_LAND_CELLS": os.environ.get("ATLITE_LAND_CELLS"),
+        "WIND_ATLAS_REDUCTION_METHOD": os.environ.get("WIND_ATLAS_REDUCTION_METHOD"),
+        "WIND_ATLAS_REDUCTION_QUANTILE": os.environ.get("WIND_ATLAS_REDUCTION_QUANTILE"),
+        "WIND_ATLAS_PYRAMID_FOLDER": os.environ.get("WIND_ATLAS_PYRAMID_FOLDER"),
+    }
+
+    # Store the names of variables that are None
+    unset_variables = []
+
+    for key, value in env_vars.items():
+        if value is None:
+            unset_variables.append(key)
+
+    if unset_variables:
+        print("WARNING: The following environment variables are not set in the .env file:")
+        for var in unset_variables:
+            print("...... -  ", var)
+
+    return env_vars
+
+
+################################################################
+# main codes:
+
+################################
+# Warm data: loaded once when the service starts
+################################
+def load_warm_data(ATLITE_DUMMY_DATA, ATLITE_CAPACITY_FACTORS_FOLDERS, DUMMY_START_DATE, DUMMY_END_DATE, DUMMY_LATITUDE_BOTTOM, DUMMY_LATITUDE_TOP, DUMMY_LONGITUDE_LEFT, DUMMY_LONGITUDE_RIGHT, MAXIMUM_CAPACITY, DATA_VARIABLE_NAME, TIME_VARIABLE_NAME, AVG_ATLITE_CAPACITY_FACTORS_FILE_LOCATION, AVG_ATLITE_LATITUDE_VARIABLE_NAME, AVG_ATLITE_LONGITUDE_VARIABLE_NAME, REDUCED_WAD, WIND_ATLAS_RESOLUTION_REDUCTION, WIND_ATLAS_CAPACITY_FACTORS_HEATMAP_FILE_LOCATION, WIND_ATLAS_HEATMAP_LATITUDE_VARIABLE_NAME, WIND_ATLAS_HEATMAP_LONGITUDE_VARIABLE_NAME, WIND_ATLAS_HEATMAP_DATA_VARIABLE_NAME, ATLITE_TIME_FREQUENCY=None, TIME_WINDOW_START=None, TIME_WINDOW_END=None, TIME_WINDOW_MONTHS=None, ATLITE_CUBE_FILE=None, ROI_BBOX=None, ROI_GEOMETRY_FILE=None, ATLITE_PREFETCH_DEPTH=None, ATLITE_FOLDER_MANIFESTS=None, ATLITE_LAND_CELLS=None, WIND_ATLAS_REDUCTION_METHOD=None, WIND_ATLAS_REDUCTION_QUANTILE=None, WIND_ATLAS_PYRAMID_FOLDER=None):
+    # the hourly cube, its average and (optionally) the WAD field as plain numpy arrays, ready for the tier engines
+    # (the hourly series of the land cells only with ATLITE_LAND_CELLS)
+    atlite_capacity_factors, atlite_capacity_factors_avg = support_functions.create_average_capacity_factor_file_atlite(ATLITE_DUMMY_DATA, ATLITE_CAPACITY_FACTORS_FOLDERS,DUMMY_START_DATE,DUMMY_END_DATE,DUMMY_LATITUDE_BOTTOM,DUMMY_LATITUDE_TOP,DUMMY_LONGITUDE_LEFT,DUMMY_LONGITUDE_RIGHT,MAXIMUM_CAPACITY,DATA_VARIABLE_NAME,TIME_VARIABLE_NAME,AVG_ATLITE_CAPACITY_FACTORS_FILE_LOCATION,ATLITE_TIME_FREQUENCY=ATLITE_TIME_FREQUENCY,TIME_WINDOW_START=TIME_WINDOW_START,TIME_WINDOW_END=TIME_WINDOW_END,TIME_WINDOW_MONTHS=TIME_WINDOW_MONTHS,ATLITE_CUBE_FILE=ATLITE_CUBE_FILE,ROI_BBOX=ROI_BBOX,ROI_GEOMETRY_FILE=ROI_GEOMETRY_FILE,ATLITE_PREFETCH_DEPTH=ATLITE_PREFETCH_DEPTH,ATLITE_FOLDER_MANIFESTS=ATLITE_FOLDER_MANIFESTS,ATLITE_LAND_CELLS=ATLITE_LAND_CELLS)
+    full_values = support_functions.tier_values(atlite_capacity_factors,DATA_VARIABLE_NAME)
+    if isinstance(full_values, dict):
+        full_values['series'] = np.asarray(full_values['series'], dtype=float)
+    else:
+        full_values = np.asarray(full_values, dtype=float)
+    warm_data = {
+        'full_values': full_values,
+        'average_values': np.asarray(atlite_capacity_factors_avg.values, dtype=float),
+        'latitudes': atlite_capacity_factors[AVG_ATLITE_LATITUDE_VARIABLE_NAME].values,
+        'longitudes': atlite_capacity_factors[AVG_ATLITE_LONGITUDE_VARIABLE_NAME].values,
+        'time': [str(timestamp) for timestamp in support_functions.tier_time_index(atlite_capacity_factors,TIME_VARIABLE_NAME)],
+        'maximum_capacity': float(MAXIMUM_CAPACITY),
+        'wad_values': None,
+        'wad_latitudes': None,
+        'wad_longitudes': None,
+        'wad_cell_index': None,
+    }
+    print("... Loaded ",len(warm_data['time'])," time steps on a ",len(warm_data['latitudes'])," x ",len(warm_data['longitudes'])," atlite grid.")
+
+    if WIND_ATLAS_CAPACITY_FACTORS_HEATMAP_FILE_LOCATION is not None and str(WIND_ATLAS_CAPACITY_FACTORS_HEATMAP_FILE_LOCATION).strip() != "":
+        if REDUCED_WAD is not None and REDUCED_WAD.lower() == "true":
+            latitude_wad,longitude_wad,all_data_wad = support_functions.read_wind_atlas_data_reduced(WIND_ATLAS_RESOLUTION_REDUCTION,WIND_ATLAS_CAPACITY_FACTORS_HEATMAP_FILE_LOCATION,WIND_ATLAS_HEATMAP_LATITUDE_VARIABLE_NAME,WIND_ATLAS_HEATMAP_LONGITUDE_VARIABLE_NAME,WIND_ATLAS_HEATMAP_DATA_VARIABLE_NAME,ROI_BBOX=ROI_BBOX,ROI_GEOMETRY_FILE=ROI_GEOMETRY_FILE,WIND_ATLAS_REDUCTION_METHOD=WIND_ATLAS_REDUCTION_METHOD,WIND_ATLAS_REDUCTION_QUANTILE=WIND_ATLAS_REDUCTION_QUANTILE,WIND_ATLAS_PYRAMID_FOLDER=WIND_ATLAS_PYRAMID_FOLDER)
+        else:
+            latitude_wad, longitude_wad, all_data_wad = support_functions.read_wind_atlas_data_full(WIND_ATLAS_CAPACITY_FACTORS_HEATMAP_FILE_LOCATION,WIND_ATLAS_HEATMAP_LATITUDE_VARIABLE_NAME,WIND_ATLAS_HEATMAP_LONGITUDE_VARIABLE_NAME,WIND_ATLAS_HEATMAP_DATA_VARIABLE_NAME,ROI_BBOX=ROI_BBOX,ROI_GEOMETRY_FILE=ROI_GEOMETRY_FILE)
+        warm_data['wad_values'] = np.asarray(all_data_wad.values, dtype=float)
+        warm_data['wad_latitudes'] = np.asarray(latitude_wad)
+        warm_data['wad_longitudes'] = np.asarray(longitude_wad)
+        # the closest atlite cell of every WAD cell, computed once for all Option 2 and 4 requests
+        warm_data['wad_cell_index'] = support_functions.nearest_cell_index(latitude_wad,longitude_wad,warm_data['latitudes'],warm_data['longitudes'])
+        print("... Loaded ",warm_data['wad_values'].size," wind atlas cells.")
+    else:
+        print("... No wind atlas data given, Options 2 and 4 are not available.")
+
+    # sort the averaged fields (and build their block max pyramids) now, so the first request does not pay for it
+    support_functions.sorted_valid_values(warm_data['average_values'])
+    support_functions.block_max_pyramid(warm_data['average_values'])
+    if warm_data['wad_values'] is not None:
+        support_functions.sorted_valid_values(warm_data['wad_values'])
+        support_functions.block_max_pyramid(warm_data['wad_values'])
+
+    return warm_data
+
+
+################################
+# Tier requests
+################################
+def tier_bands_from_request(tier_request):
+    # "0,10;10,20" or [[0, 10], [10, 20]]
+    tiers = tier_request.get('tiers')
+    if isinstance(tiers, list):
+        tiers = ";".join(",".join(str(bound) for bound in band) for band in tiers)
+    return support_functions.parse_tier_specification(tiers)
+
+
+def geometries_from_request(tier_request):
+    # shapely geometries of a GeoJSON FeatureCollection, Feature or bare geometry
+    from shapely.geometry import shape
+    geometries = tier_request.get('geometries')
+    if geometries is None:
+        raise ValueError("Options 5 and 6 need 'geometries' (GeoJSON).")
+    if geometries.get('type') == 'FeatureCollection':
+        return [shape(feature['geometry']) for feature in geometries['features']]
+    if geometries.get('type') == 'Feature':
+        return [shape(geometries['geometry'])]
+    return [shape(geometries)]
+
+
+def compute_tiers(warm_data,tier_request):
+    # answers one tier request from the warm data, returns the tier series and the number of cells used per tier
+    option = str(tier_request.get('option', '')).strip().lower()
+    if option == 'sites' and str(tier_request.get('field', 'atlite')).lower() == 'wad' and warm_data['wad_values'] is None:
+        raise ValueError("Ranking the sites on the wind atlas field needs the wind atlas data, start the service with WIND_ATLAS_CAPACITY_FACTORS_HEATMAP_FILE_LOCATION.")
+    if option in ('2', '4') and warm_data['wad_values'] is None:
+        raise ValueError("Option " + option + " needs the wind atlas data, start the service with WIND_ATLAS_CAPACITY_FACTORS_HEATMAP_FILE_LOCATION.")
+
+    if option in ('1', '2'):
+        if tier_request.get('percent_upper') is None:
+            raise ValueError("Options 1 and 2 need 'percent_upper', e.g. 10 or 1,5,10 or 1:50:1.")
+        percentages = support_functions.parse_percentage_sweep(tier_request['percent_upper'])
+        average_values, cell_index = (warm_data['average_values'], None) if option == '1' else (warm_data['wad_values'], warm_data['wad_cell_index'])
+        sweep_means, cells_per_percentage = support_functions.generate_upper_percentage_sweep(average_values,warm_data['full_values'],percentages,cell_index)
+        tiers = dict(zip(support_functions.percentage_sweep_column_names(percentages), sweep_means.T))
+        cells = cells_per_percentage.tolist()
+    elif option in ('3', '4'):
+        tier_bands = tier_bands_from_request(tier_request)
+        average_values, cell_index = (warm_data['average_values'], None) if option == '3' else (warm_data['wad_values'], warm_data['wad_cell_index'])
+        tier_means, bottom_bounds, top_bounds, lengths = support_functions.generate_bounded_tiers(average_values,warm_data['full_values'],tier_bands,cell_index)
+        tiers = {'tier_'+str(tier_number+1): tier_means[:, tier_number] for tier_number in range(len(tier_bands))}
+        cells = lengths.tolist()
+    elif option in ('5', '6'):
+        tier_bands = tier_bands_from_request(tier_request) if option == '6' else None
+        tiers = {}
+        cells = {}
+        for geometry_number, geometry in enumerate(geometries_from_request(tier_request)):
+            geometry_label = 'tier_'+str(geometry_number+1) if option == '5' else 'geometry_'+str(geometry_number+1)
+            series, number_of_cells = support_functions.geometry_tier_series(geometry,warm_data['latitudes'],warm_data['longitudes'],warm_data['average_values'],warm_data['full_values'],tier_bands)
+            if option == '5':
+                tiers[geometry_label] = series['tier_1']
+            else:
+                tiers.update({geometry_label+'_'+tier_label: values for tier_label, values in series.items()})
+            cells[geometry_label] = number_of_cells
+    elif option == 'sites':
+        # best sites of the averaged atlite (or WAD) field, with the series of their (closest) atlite cells
+        if str(tier_request.get('field', 'atlite')).lower() == 'wad':
+            field_values, field_latitudes, field_longitudes = warm_data['wad_values'], warm_data['wad_latitudes'], warm_data['wad_longitudes']
+        else:
+            field_values, field_latitudes, field_longitudes = warm_data['average_values'], warm_data['latitudes'], warm_data['longitudes']
+        bbox = tier_request.get('bbox')
+        if isinstance(bbox, list):
+            bbox = ",".join(str(bound) for bound in bbox)
+        site_cells = support_functions.top_k_sites(field_values,field_latitudes,field_longitudes,int(tier_request.get('top_k', 10)),tier_request.get('min_distance_km'),support_functions.region_of_interest(bbox))
+        atlite_cells = site_cells if field_values is warm_data['average_values'] else warm_data['wad_cell_index'][site_cells]
+        site_series = support_functions.gather_cell_series(warm_data['full_values'],atlite_cells)
+        tiers = {'site_'+str(site_number+1): site_series[:, site_number] for site_number in range(len(site_cells))}
+        cells = [{'latitude': float(field_latitudes[site // len(field_longitudes)]), 'longitude': float(field_longitudes[site % len(field_longitudes)]), 'average_capacity_factor': float(field_values.ravel()[site])} for site in site_cells]
+    else:
+        raise ValueError("Unknown option: " + option + ". The tier service answers options 1 to 6 and sites.")
+
+    # scale capacity factors if required:
+    if str(tier_request.get('scale', False)).lower() == "true":
+        tiers = {tier_label: values / warm_data['maximum_capacity'] for tier_label, values in tiers.items()}
+
+    # NaN is not valid JSON, empty tiers are sent as null
+    tiers = {tier_label: [None if np.isnan(value) else float(value) for value in values] for tier_label, values in tiers.items()}
+    return {'option': option, 'tiers': tiers, 'cells': cells}
+
+
+################################
+# Cache of recent results
+################################
+def cached_tiers(warm_data,tier_request,result_cache,cache_size,cache_lock):
+    # least recently used cache keyed on the (sorted) JSON request
+    key = json.dumps(tier_request, sort_keys=True)
+    with cache_lock:
+        if key in result_cache:
+            result_cache[key] = result_cache.pop(key)
+            return result_cache[key], True
+
+    result = compute_tiers(warm_data,tier_request)
+
+    with cache_lock:
+        result_cache[key] = result
+        while len(result_cache) > cache_size:
+            result_cache.pop(next(iter(result_cache)))
+    return result, False
+
+
+def create_app(warm_data,cache_size):
+    # flask app (the same server dash runs on) with the health and tier endpoints
+    app = Flask(__name__)
+    result_cache = {}
+    cache_lock = threading.Lock()
+
+    @app.route('/health', methods=['GET'])
+    def health():
+        return jsonify({
+            'status': 'ok',
+            'time_steps': len(warm_data['time']),
+            'grid': [len(warm_data['latitudes']), len(warm_data['longitudes'])],
+            'wind_atlas': warm_data['wad_values'] is not None,
+            'cached_results': len(result_cache),
+            'cache_size': cache_size,
+        })
+
+    @app.route('/tiers', methods=['POST'])
+    def tiers():
+        start_time = time.perf_counter()
+        tier_request = request.get_json(force=True, silent=True)
+        if not isinstance(tier_request, dict):
+            return jsonify({'error': 'The request body must be a JSON object.'}), 400
+        try:
+            result, from_cache = cached_tiers(warm_data,tier_request,result_cache,cache_size,cache_lock)
+        except (ValueError, KeyError, TypeError) as e:
+            return jsonify({'error': str(e)}), 400
+        response = dict(result)
+        response['time'] = warm_data['time']
+        response['cached'] = from_cache
+        response['seconds'] = round(time.perf_counter() - start_time, 4)
+        print("... Option ",result['option']," request answered in ",response['seconds']," s",(" (cached)" if from_cache else ""))
+        return jsonify(response)
+
+    return app
+
+
+def tier_service(ATLITE_DUMMY_DATA, ATLITE_CAPACITY_FACTORS_FOLDERS, DUMMY_START_DATE, DUMMY_END_DATE, DUMMY_LATITUDE_BOTTOM, DUMMY_LATITUDE_TOP, DUMMY_LONGITUDE_LEFT, DUMMY_LONGITUDE_RIGHT, MAXIMUM_CAPACITY, DATA_VARIABLE_NAME, TIME_VARIABLE_NAME, AVG_ATLITE_CAPACITY_FACTORS_FILE_LOCATION, AVG_ATLITE_LATITUDE_VARIABLE_NAME, AVG_ATLITE_LONGITUDE_VARIABLE_NAME, REDUCED_WAD=None, WIND_ATLAS_RESOLUTION_REDUCTION=None, WIND_ATLAS_CAPACITY_FACTORS_HEATMAP_FILE_LOCATION=None, WIND_ATLAS_HEATMAP_LATITUDE_VARIABLE_NAME=None, WIND_ATLAS_HEATMAP_LONGITUDE_VARIABLE_NAME=None, WIND_ATLAS_HEATMAP_DATA_VARIABLE_NAME=None, ATLITE_TIME_FREQUENCY=None, TIME_WINDOW_START=None, TIME_WINDOW_END=None, TIME_WINDOW_MONTHS=None, ATLITE_CUBE_FILE=None, TIER_SERVICE_HOST=None, TIER_SERVICE_PORT=None, TIER_SERVICE_CACHE_SIZE=None, ROI_BBOX=None, ROI_GEOMETRY_FILE=None, ATLITE_PREFETCH_DEPTH=None, ATLITE_FOLDER_MANIFESTS=None, ATLITE_LAND_CELLS=None, WIND_ATLAS_REDUCTION_METHOD=None, WIND_ATLAS_REDUCTION_QUANTILE=None, WIND_ATLAS_PYRAMID_FOLDER=None):
+    support_functions.check_configuration(locals())
+    # Code block where you want to suppress warnings
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        warm_data = load_warm_data(ATLITE_DUMMY_DATA, ATLITE_CAPACITY_FACTORS_FOLDERS, DUMMY_START_DATE, DUMMY_END_DATE, DUMMY_LATITUDE_BOTTOM, DUMMY_LATITUDE_TOP, DUMMY_LONGITUDE_LEFT, DUMMY_LONGITUDE_RIGHT, MAXIMUM_CAPACITY, DATA_VARIABLE_NAME, TIME_VARIABLE_NAME, AVG_ATLITE_CAPACITY_FACTORS_FILE_LOCATION, AVG_ATLITE_LATITUDE_VARIABLE_NAME, AVG_ATLITE_LONGITUDE_VARIABLE_NAME, REDUCED_WAD, WIND_ATLAS_RESOLUTION_REDUCTION, WIND_ATLAS_CAPACITY_FACTORS_HEATMAP_FILE_LOCATION, WIND_ATLAS_HEATMAP_LATITUDE_VARIABLE_NAME, WIND_ATLAS_HEATMAP_LONGITUDE_VARIABLE_NAME, WIND_ATLAS_HEATMAP_DATA_VARIABLE_NAME, ATLITE_TIME_FREQUENCY=ATLITE_TIME_FREQUENCY, TIME_WINDOW_START=TIME_WINDOW_START, TIME_WINDOW_END=TIME_WINDOW_END, TIME_WINDOW_MONTHS=TIME_WINDOW_MONTHS, ATLITE_CUBE_FILE=ATLITE_CUBE_FILE, ROI_BBOX=ROI_BBOX, ROI_GEOMETRY_FILE=ROI_GEOMETRY_FILE, ATLITE_PREFETCH_DEPTH=ATLITE_PREFETCH_DEPTH, ATLITE_FOLDER_MANIFESTS=ATLITE_FOLDER_MANIFESTS, ATLITE_LAND_CELLS=ATLITE_LAND_CELLS, WIND_ATLAS_REDUCTION_METHOD=WIND_ATLAS_REDUCTION_METHOD, WIND_ATLAS_REDUCTION_QUANTILE=WIND_ATLAS_REDUCTION_QUANTILE, WIND_ATLAS_PYRAMID_FOLDER=WIND_ATLAS_PYRAMID_FOLDER)
+
+    host = TIER_SERVICE_HOST if TIER_SERVICE_HOST is not None and str(TIER_SERVICE_HOST).strip() != "" else "127.0.0.1"
+    port = int(TIER_SERVICE_PORT) if TIER_SERVICE_PORT is not None and str(TIER_SERVICE_PORT).strip() != "" else 8060
+    cache_size = int(TIER_SERVICE_CACHE_SIZE) if TIER_SERVICE_CACHE_SIZE is not None and str(TIER_SERVICE_CACHE_SIZE).strip() != "" else 64
+
+    app = create_app(warm_data,cache_size)
+    print("\n... Tier service ready on http://"+host+":"+str(port)+" (POST /tiers, GET /health)")
+    app.run(host=host, port=port, threaded=True)
+
+
+if __name__ == '__main__':
+    print("#############")
+    print("Tier service")
+    print("#############")
+
+    # check args or load env file and run codes
+    args = support_functions.script_arguments(parse_arguments(), load_from_env)
+
+    # RUN CODES
+    tier_service(**args)
+
+    # example use:
+    # python tier_service.py --ATLITE_DUMMY_DATA True --DUMMY_START_DATE  '2023-01-01' --DUMMY_END_DATE  '2024-01-01' --DUMMY_LATITUDE_BOTTOM  -32.0 --DUMMY_LATITUDE_TOP  -30.0 --DUMMY_LONGITUDE_LEFT  26.0 --DUMMY_LONGITUDE_RIGHT  28.0 --MAXIMUM_CAPACITY  50 --DATA_VARIABLE_NAME  capacity_factors --TIME_VARIABLE_NAME  time --AVG_ATLITE_CAPACITY_FACTORS_FILE_LOCATION  "assets/avg_atlite_capacity_factors.nc" --AVG_ATLITE_LATITUDE_VARIABLE_NAME  latitude --AVG_ATLITE_LONGITUDE_VARIABLE_NAME  longitude --REDUCED_WAD  True --WIND_ATLAS_RESOLUTION_REDUCTION  15 --WIND_ATLAS_CAPACITY_FACTORS_HEATMAP_FILE_LOCATION  "assets/wind_atlas_capacity_factors.nc" --WIND_ATLAS_HEATMAP_LATITUDE_VARIABLE_NAME  lat --WIND_ATLAS_HEATMAP_LONGITUDE_VARIABLE_NAME  lon --WIND_ATLAS_HEATMAP_DATA_VARIABLE_NAME  Band1 --TIER_SERVICE_PORT 8060
+    # curl -X POST http://127.0.0.1:8060/tiers -H "Content-Type: application/json" -d '{"option": 3, "tiers": "0,10;10,20"}'
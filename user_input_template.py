@@ -1,13 +1,18 @@
-from Option_1_upper_percentage_atlite import average_capacity_factors_atlite as option_1
-from Option_2_upper_percentage_WAD import average_capacity_factors_WAD as option_2
-from Option_3_bound_percentage_atlite import average_capacity_factors_atlite as option_3
-from Option_4_bound_percentage_WAD import average_bounded_capacity_factors_WAD as option_4
-from Option_5_step1_geometry_selection import geometry_selection as option_5_step_1
-from Option_5_step2_tier_generation_average_per_geometry import option_5_process_geometries_into_tiers as option_5_step_2
-from Option_6_step1_geometry_selection import geometry_selection as option_6_step_1
-from Option_6_step2_tier_generation_bounds_per_geometry import option_6_process_geometries_into_tiers as option_6_step_2
-from Option_7_WAD_Atlite_correction_user_defined import wind_atlas_correction as option_7
-
+import sys
+
+# the option modules are imported in the branch of the option that is run, so e.g. Option 1 does not load the web/GIS
+# packages of the geometry options. Run "python user_input_template.py --profile-imports" to see the startup cost of each.
+OPTION_MODULES = [
+    "Option_1_upper_percentage_atlite",
+    "Option_2_upper_percentage_WAD",
+    "Option_3_bound_percentage_atlite",
+    "Option_4_bound_percentage_WAD",
+    "Option_5_step1_geometry_selection",
+    "Option_5_step2_tier_generation_average_per_geometry",
+    "Option_6_step1_geometry_selection",
+    "Option_6_step2_tier_generation_bounds_per_geometry",
+    "Option_7_WAD_Atlite_correction_user_defined",
+]
 
 # User inputs start
 #------------------
@@ -32,6 +37,54 @@ DUMMY_LATITUDE_BOTTOM='-32.0'
 DUMMY_LONGITUDE_LEFT='26.0'
 DUMMY_LONGITUDE_RIGHT='28.0'
 #-------------------------
+# time axis and time window (DUMMY_START_DATE is also the first timestamp of the real atlite data)
+#-------------------------
+ATLITE_TIME_FREQUENCY='h'        # time step between consecutive atlite files, e.g. h for hourly
+TIME_WINDOW_START=''             # e.g. 2023-06-01, inclusive, leave empty for no restriction
+TIME_WINDOW_END=''               # e.g. 2023-09-01, exclusive, leave empty for no restriction
+TIME_WINDOW_MONTHS=''            # e.g. 6,7,8 or JJA or DJF,MAM, leave empty for all months
+#-------------------------
+# netcdf capacity factors used instead of the atlite csv folders (leave empty to stitch the folders): a stitched cube, e.g. the Option 7
+# corrected cube, or Atlite's own cutout output, one file, a comma separated list or a glob pattern such as assets/atlite_cutout/*.nc
+#-------------------------
+ATLITE_CUBE_FILE=''              # e.g. assets/option_7_output/option_7_corrected_atlite_capacity_factors.nc
+#-------------------------
+# stage timings (seconds, peak memory, items per stage) are printed at the end of a run and appended to this JSON lines file if set
+#-------------------------
+STAGE_TIMING_LOG_FILE=''         # e.g. assets/stage_timings.jsonl
+#-------------------------
+# region of interest: only this part of the Atlite and Wind Atlas data is read (leave both empty for the whole domain)
+#-------------------------
+ROI_BBOX=''                      # latitude bottom, latitude top, longitude left, longitude right, e.g. -35,-22,16,33
+ROI_GEOMETRY_FILE=''             # e.g. assets/province.geojson, the bounds of all its geometries are used
+#-------------------------
+# chunked (out-of-core) tier generation with dask (Options 1 to 6 step 2), for cubes larger than memory, use with ATLITE_CUBE_FILE
+#-------------------------
+ATLITE_CHUNKS=''                 # time steps per chunk, e.g. 744 or auto, leave empty to load the data into memory
+TIER_DASK_SCHEDULER=''           # threads (default), processes, synchronous, local or a scheduler address (tcp://...)
+TIER_DASK_NUM_WORKERS=''         # leave empty to use all cores
+#-------------------------
+# read ahead of the atlite csv files, for folders on a network drive (NFS, SMB) where every file read waits for a round trip
+#-------------------------
+ATLITE_PREFETCH_DEPTH=''         # number of files read ahead, e.g. 16, leave empty or 0 to read one file after the other
+ATLITE_FOLDER_MANIFESTS='False'  # True keeps a manifest (atlite_folder_manifest.json) of the csv files in every folder, unchanged folders are then not listed again
+#-------------------------
+# land cells: only the cells with a valid average capacity factor are kept (Options 1-4, site ranking, tier service)
+#-------------------------
+ATLITE_LAND_CELLS='False'        # True holds the land cells as a (time, cell) matrix instead of the whole (time, lat, lon) grid
+#-------------------------
+# tier masks: .tif masks (value above 0 = usable land) applied to the tier selection of Options 1-6
+#-------------------------
+TIER_MASKS_FOLDER=''             # e.g. assets/masks, leave empty for no masks (MASKS_FOLDER is only drawn on the maps)
+TIER_MASK_MODE='exclude'         # exclude leaves out the cells below TIER_MASK_MIN_FRACTION usable, weight also weights the cells by their usable fraction
+TIER_MASK_MIN_FRACTION=''        # smallest usable fraction of a cell, default 0.5 with exclude, any usable part with weight
+TIER_MASK_CACHE_FOLDER=''        # the masks reprojected onto the grids, default TIER_MASKS_FOLDER/grid_cache
+#-------------------------
+# checkpoints of the pipeline stages (ingest, average, reduce), a failed run can be resumed from its last finished stage
+#-------------------------
+CHECKPOINT_FOLDER=''             # e.g. assets/checkpoints, leave empty for no checkpoints
+RESUME='False'                   # True resumes a failed run with the same settings from the checkpoints in CHECKPOINT_FOLDER
+#-------------------------
 # full capacity factors data
 DATA_VARIABLE_NAME='capacity_factors'
 TIME_VARIABLE_NAME='time'
@@ -49,6 +102,9 @@ AVG_ATLITE_DATA_VARIABLE_NAME='capacity_factors'
 #----------------------------
 # a good resolution is between 12 and 20?, make sure it is integer
 WIND_ATLAS_RESOLUTION_REDUCTION='15'
+WIND_ATLAS_REDUCTION_METHOD='mean'      # how a block of cells becomes one cell: mean, max, quantile or stride (every n-th cell, as before)
+WIND_ATLAS_REDUCTION_QUANTILE=''        # quantile of the block (0 to 1) for quantile, default 0.9
+WIND_ATLAS_PYRAMID_FOLDER=''            # the reduced wind atlas files, default wind_atlas_pyramid next to the wind atlas file
 WIND_ATLAS_CAPACITY_FACTORS_HEATMAP_FILE_LOCATION="assets/wind_atlas_capacity_factors.nc"
 # variable names within netcdf file:
 WIND_ATLAS_HEATMAP_LATITUDE_VARIABLE_NAME='lat'
@@ -68,6 +124,11 @@ MASKS_FOLDER="assets/masks"
 SCALE_CAPACITY_FACTORS='True'
 MAXIMUM_CAPACITY='50' # MW
 
+# tier statistics (Option 1,2,3,4,5,6)
+#-----------
+# monthly means, hour of day profile, P50/P90 and ramp statistics saved beside each tier file
+TIER_STATISTICS='True'
+
 
 
 # global wind atlas capacity factors PNG (Options 5, 6)
@@ -88,6 +149,9 @@ PERCENT_UPPER_TIER2_CAPACITY_FACTORS='10,20'
 PERCENT_UPPER_TIER3_CAPACITY_FACTORS='0,40'
 PERCENT_UPPER_TIER4_CAPACITY_FACTORS='60,100'
 PERCENT_UPPER_TIER5_CAPACITY_FACTORS='40,60'
+# any number of tiers, overrides the 5 tiers above when set: lower,upper percentages separated by ; e.g. '0,5;5,10;10,20;20,50'
+# or a .json/.yaml file with a list of [lower, upper] pairs e.g. [[0, 5], [5, 10], [10, 20]]
+TIER_SPECIFICATION=''
 
 
 # Option 1 variables:
@@ -97,6 +161,9 @@ PERCENT_UPPER_CAPACITY_FACTORS_1='10'  # used for option 1, the above parameters
 # file locations option 1
 PERCENT_UPPER_CAPACITY_FACTORS_LOCATION_FILE_1="option_1_top_percentage_locations.csv"
 PERCENT_UPPER_CAPACITY_FACTORS_TIME_SERIES_FILE_1="option_1_top_percentage_capacity_factor_time_series.csv"
+# sweep mode: many upper percentages at once in one multi-column file (replaces the single percentage above), e.g. '1:50:1' or '1,2,5,10,20'
+PERCENT_UPPER_SWEEP_1=''
+PERCENT_UPPER_SWEEP_TIME_SERIES_FILE_1="option_1_percentage_sweep_capacity_factor_time_series.csv"
 
 # Option 2 variables:
 #------------------
@@ -106,6 +173,9 @@ PERCENT_UPPER_CAPACITY_FACTORS_2='10'
 PERCENT_UPPER_CAPACITY_FACTORS_LOCATION_FILE_WAD_2="option_2_top_percentage_locations_wad.csv"
 PERCENT_UPPER_CAPACITY_FACTORS_LOCATION_FILE_ATLITE_2="option_2_top_percentage_locations_atlite.csv"
 PERCENT_UPPER_CAPACITY_FACTORS_TIME_SERIES_FILE_2="option_2_top_percentage_capacity_factor_time_series.csv"
+# sweep mode: many upper percentages at once in one multi-column file (replaces the single percentage above), e.g. '1:50:1' or '1,2,5,10,20'
+PERCENT_UPPER_SWEEP_2=''
+PERCENT_UPPER_SWEEP_TIME_SERIES_FILE_2="option_2_percentage_sweep_capacity_factor_time_series.csv"
 
 
 # Option 3 variables:
@@ -140,6 +210,12 @@ OPTION_6_VIEW_VALID_GEOMETRIES='True'
 # Option 7 variables: (user defined functions)
 #------------------
 OPTION_7_OUTPUT_FOLDER="assets/option_7_output"
+OPTION_7_CORRECTION_METHOD='scale'         # scale (per cell WAD/Atlite mean ratio) or quantile (quantile mapping of the long term means)
+OPTION_7_CORRECTED_CUBE_FILE="option_7_corrected_atlite_capacity_factors.nc"
+OPTION_7_CORRECTION_FACTORS_FILE="option_7_correction_factors.nc"
+OPTION_7_CORRECTION_TIME_CHUNK='744'       # time steps read, corrected and written at a time
+OPTION_7_CUBE_COMPRESSION=''            # none (empty), zlib, zstd, bzip2, blosc_lz4, blosc_zstd, ... with an optional level e.g. zstd:3, compare them with benchmark_cube_store.py
+OPTION_7_CUBE_CHUNK_LAYOUT=''           # spatial (default, whole maps per chunk), time_series (cell series gathers) or balanced
 
 # User inputs ends.
 #------------------
@@ -147,15 +223,42 @@ OPTION_7_OUTPUT_FOLDER="assets/option_7_output"
 
 # no user input below
 if __name__ == '__main__':
-    if OPTION == '1':
+    if '--profile-imports' in sys.argv:
+        # startup cost report of every option, nothing is run
+        import Option_Support_Functions as support_functions
+        support_functions.print_import_profile(support_functions.profile_imports(OPTION_MODULES + ["tier_service"]))
+    elif OPTION == '1':
+        from Option_1_upper_percentage_atlite import average_capacity_factors_atlite as option_1
         option_1(ATLITE_DUMMY_DATA, ATLITE_CAPACITY_FACTORS_FOLDERS, DUMMY_START_DATE,
                                     DUMMY_END_DATE, DUMMY_LATITUDE_BOTTOM, DUMMY_LATITUDE_TOP, DUMMY_LONGITUDE_LEFT,
                                     DUMMY_LONGITUDE_RIGHT, MAXIMUM_CAPACITY, DATA_VARIABLE_NAME, TIME_VARIABLE_NAME,
                                     AVG_ATLITE_CAPACITY_FACTORS_FILE_LOCATION, AVG_ATLITE_LATITUDE_VARIABLE_NAME,
                                     AVG_ATLITE_LONGITUDE_VARIABLE_NAME, PERCENT_UPPER_CAPACITY_FACTORS_1,
                                     OPTION_1_OUTPUT_FOLDER, PERCENT_UPPER_CAPACITY_FACTORS_TIME_SERIES_FILE_1,
-                                    PERCENT_UPPER_CAPACITY_FACTORS_LOCATION_FILE_1, SCALE_CAPACITY_FACTORS)
+                                    PERCENT_UPPER_CAPACITY_FACTORS_LOCATION_FILE_1, SCALE_CAPACITY_FACTORS,
+                 ATLITE_TIME_FREQUENCY=ATLITE_TIME_FREQUENCY, TIME_WINDOW_START=TIME_WINDOW_START,
+                 TIME_WINDOW_END=TIME_WINDOW_END, TIME_WINDOW_MONTHS=TIME_WINDOW_MONTHS,
+                 TIER_STATISTICS=TIER_STATISTICS,
+                 PERCENT_UPPER_SWEEP_1=PERCENT_UPPER_SWEEP_1,
+                 PERCENT_UPPER_SWEEP_TIME_SERIES_FILE_1=PERCENT_UPPER_SWEEP_TIME_SERIES_FILE_1,
+                 ATLITE_CUBE_FILE=ATLITE_CUBE_FILE,
+                 STAGE_TIMING_LOG_FILE=STAGE_TIMING_LOG_FILE,
+                 ROI_BBOX=ROI_BBOX,
+                 ROI_GEOMETRY_FILE=ROI_GEOMETRY_FILE,
+                 ATLITE_CHUNKS=ATLITE_CHUNKS,
+                 TIER_DASK_SCHEDULER=TIER_DASK_SCHEDULER,
+                 TIER_DASK_NUM_WORKERS=TIER_DASK_NUM_WORKERS,
+                 ATLITE_PREFETCH_DEPTH=ATLITE_PREFETCH_DEPTH,
+                 ATLITE_FOLDER_MANIFESTS=ATLITE_FOLDER_MANIFESTS,
+                 CHECKPOINT_FOLDER=CHECKPOINT_FOLDER,
+                 RESUME=RESUME,
+                 ATLITE_LAND_CELLS=ATLITE_LAND_CELLS,
+                 TIER_MASKS_FOLDER=TIER_MASKS_FOLDER,
+                 TIER_MASK_MODE=TIER_MASK_MODE,
+                 TIER_MASK_MIN_FRACTION=TIER_MASK_MIN_FRACTION,
+                 TIER_MASK_CACHE_FOLDER=TIER_MASK_CACHE_FOLDER)
     elif OPTION == '2':
+        from Option_2_upper_percentage_WAD import average_capacity_factors_WAD as option_2
         option_2(ATLITE_DUMMY_DATA, ATLITE_CAPACITY_FACTORS_FOLDERS, DUMMY_START_DATE,
                                      DUMMY_END_DATE, DUMMY_LATITUDE_BOTTOM, DUMMY_LATITUDE_TOP, DUMMY_LONGITUDE_LEFT,
                                      DUMMY_LONGITUDE_RIGHT, MAXIMUM_CAPACITY, DATA_VARIABLE_NAME, TIME_VARIABLE_NAME,
@@ -167,8 +270,33 @@ if __name__ == '__main__':
                                      PERCENT_UPPER_CAPACITY_FACTORS_2, OPTION_2_OUTPUT_FOLDER, SCALE_CAPACITY_FACTORS,
                                      PERCENT_UPPER_CAPACITY_FACTORS_TIME_SERIES_FILE_2,
                                      PERCENT_UPPER_CAPACITY_FACTORS_LOCATION_FILE_WAD_2,
-                                     PERCENT_UPPER_CAPACITY_FACTORS_LOCATION_FILE_ATLITE_2)
+                                     PERCENT_UPPER_CAPACITY_FACTORS_LOCATION_FILE_ATLITE_2,
+                 ATLITE_TIME_FREQUENCY=ATLITE_TIME_FREQUENCY, TIME_WINDOW_START=TIME_WINDOW_START,
+                 TIME_WINDOW_END=TIME_WINDOW_END, TIME_WINDOW_MONTHS=TIME_WINDOW_MONTHS,
+                 TIER_STATISTICS=TIER_STATISTICS,
+                 PERCENT_UPPER_SWEEP_2=PERCENT_UPPER_SWEEP_2,
+                 PERCENT_UPPER_SWEEP_TIME_SERIES_FILE_2=PERCENT_UPPER_SWEEP_TIME_SERIES_FILE_2,
+                 ATLITE_CUBE_FILE=ATLITE_CUBE_FILE,
+                 STAGE_TIMING_LOG_FILE=STAGE_TIMING_LOG_FILE,
+                 ROI_BBOX=ROI_BBOX,
+                 ROI_GEOMETRY_FILE=ROI_GEOMETRY_FILE,
+                 ATLITE_CHUNKS=ATLITE_CHUNKS,
+                 TIER_DASK_SCHEDULER=TIER_DASK_SCHEDULER,
+                 TIER_DASK_NUM_WORKERS=TIER_DASK_NUM_WORKERS,
+                 ATLITE_PREFETCH_DEPTH=ATLITE_PREFETCH_DEPTH,
+                 ATLITE_FOLDER_MANIFESTS=ATLITE_FOLDER_MANIFESTS,
+                 CHECKPOINT_FOLDER=CHECKPOINT_FOLDER,
+                 RESUME=RESUME,
+                 ATLITE_LAND_CELLS=ATLITE_LAND_CELLS,
+                 TIER_MASKS_FOLDER=TIER_MASKS_FOLDER,
+                 TIER_MASK_MODE=TIER_MASK_MODE,
+                 TIER_MASK_MIN_FRACTION=TIER_MASK_MIN_FRACTION,
+                 TIER_MASK_CACHE_FOLDER=TIER_MASK_CACHE_FOLDER,
+                 WIND_ATLAS_REDUCTION_METHOD=WIND_ATLAS_REDUCTION_METHOD,
+                 WIND_ATLAS_REDUCTION_QUANTILE=WIND_ATLAS_REDUCTION_QUANTILE,
+                 WIND_ATLAS_PYRAMID_FOLDER=WIND_ATLAS_PYRAMID_FOLDER)
     elif OPTION == '3':
+        from Option_3_bound_percentage_atlite import average_capacity_factors_atlite as option_3
         option_3(ATLITE_DUMMY_DATA, ATLITE_CAPACITY_FACTORS_FOLDERS, DUMMY_START_DATE,
                                         DUMMY_END_DATE, DUMMY_LATITUDE_BOTTOM, DUMMY_LATITUDE_TOP, DUMMY_LONGITUDE_LEFT,
                                         DUMMY_LONGITUDE_RIGHT, DATA_VARIABLE_NAME, TIME_VARIABLE_NAME,
@@ -177,8 +305,29 @@ if __name__ == '__main__':
                                         PERCENT_UPPER_TIER4_CAPACITY_FACTORS, PERCENT_UPPER_TIER5_CAPACITY_FACTORS,
                                         AVG_ATLITE_LATITUDE_VARIABLE_NAME, AVG_ATLITE_LONGITUDE_VARIABLE_NAME,
                                         OPTION_3_OUTPUT_FOLDER, MAXIMUM_CAPACITY,
-                                        BOUND_CAPACITY_FACTORS_TIME_SERIES_FILE_3, SCALE_CAPACITY_FACTORS)
+                                        BOUND_CAPACITY_FACTORS_TIME_SERIES_FILE_3, SCALE_CAPACITY_FACTORS,
+                 ATLITE_TIME_FREQUENCY=ATLITE_TIME_FREQUENCY, TIME_WINDOW_START=TIME_WINDOW_START,
+                 TIME_WINDOW_END=TIME_WINDOW_END, TIME_WINDOW_MONTHS=TIME_WINDOW_MONTHS,
+                 TIER_STATISTICS=TIER_STATISTICS,
+                 TIER_SPECIFICATION=TIER_SPECIFICATION,
+                 ATLITE_CUBE_FILE=ATLITE_CUBE_FILE,
+                 STAGE_TIMING_LOG_FILE=STAGE_TIMING_LOG_FILE,
+                 ROI_BBOX=ROI_BBOX,
+                 ROI_GEOMETRY_FILE=ROI_GEOMETRY_FILE,
+                 ATLITE_CHUNKS=ATLITE_CHUNKS,
+                 TIER_DASK_SCHEDULER=TIER_DASK_SCHEDULER,
+                 TIER_DASK_NUM_WORKERS=TIER_DASK_NUM_WORKERS,
+                 ATLITE_PREFETCH_DEPTH=ATLITE_PREFETCH_DEPTH,
+                 ATLITE_FOLDER_MANIFESTS=ATLITE_FOLDER_MANIFESTS,
+                 CHECKPOINT_FOLDER=CHECKPOINT_FOLDER,
+                 RESUME=RESUME,
+                 ATLITE_LAND_CELLS=ATLITE_LAND_CELLS,
+                 TIER_MASKS_FOLDER=TIER_MASKS_FOLDER,
+                 TIER_MASK_MODE=TIER_MASK_MODE,
+                 TIER_MASK_MIN_FRACTION=TIER_MASK_MIN_FRACTION,
+                 TIER_MASK_CACHE_FOLDER=TIER_MASK_CACHE_FOLDER)
     elif OPTION == '4':
+        from Option_4_bound_percentage_WAD import average_bounded_capacity_factors_WAD as option_4
         option_4(ATLITE_DUMMY_DATA, ATLITE_CAPACITY_FACTORS_FOLDERS, DUMMY_START_DATE,
                                              DUMMY_END_DATE, DUMMY_LATITUDE_BOTTOM, DUMMY_LATITUDE_TOP,
                                              DUMMY_LONGITUDE_LEFT, DUMMY_LONGITUDE_RIGHT, MAXIMUM_CAPACITY,
@@ -194,8 +343,32 @@ if __name__ == '__main__':
                                              PERCENT_UPPER_TIER3_CAPACITY_FACTORS, PERCENT_UPPER_TIER4_CAPACITY_FACTORS,
                                              PERCENT_UPPER_TIER5_CAPACITY_FACTORS, AVG_ATLITE_DATA_VARIABLE_NAME,
                                              OPTION_4_OUTPUT_FOLDER, SCALE_CAPACITY_FACTORS,
-                                             BOUND_CAPACITY_FACTORS_TIME_SERIES_FILE_4)
+                                             BOUND_CAPACITY_FACTORS_TIME_SERIES_FILE_4,
+                 ATLITE_TIME_FREQUENCY=ATLITE_TIME_FREQUENCY, TIME_WINDOW_START=TIME_WINDOW_START,
+                 TIME_WINDOW_END=TIME_WINDOW_END, TIME_WINDOW_MONTHS=TIME_WINDOW_MONTHS,
+                 TIER_STATISTICS=TIER_STATISTICS,
+                 TIER_SPECIFICATION=TIER_SPECIFICATION,
+                 ATLITE_CUBE_FILE=ATLITE_CUBE_FILE,
+                 STAGE_TIMING_LOG_FILE=STAGE_TIMING_LOG_FILE,
+                 ROI_BBOX=ROI_BBOX,
+                 ROI_GEOMETRY_FILE=ROI_GEOMETRY_FILE,
+                 ATLITE_CHUNKS=ATLITE_CHUNKS,
+                 TIER_DASK_SCHEDULER=TIER_DASK_SCHEDULER,
+                 TIER_DASK_NUM_WORKERS=TIER_DASK_NUM_WORKERS,
+                 ATLITE_PREFETCH_DEPTH=ATLITE_PREFETCH_DEPTH,
+                 ATLITE_FOLDER_MANIFESTS=ATLITE_FOLDER_MANIFESTS,
+                 CHECKPOINT_FOLDER=CHECKPOINT_FOLDER,
+                 RESUME=RESUME,
+                 ATLITE_LAND_CELLS=ATLITE_LAND_CELLS,
+                 TIER_MASKS_FOLDER=TIER_MASKS_FOLDER,
+                 TIER_MASK_MODE=TIER_MASK_MODE,
+                 TIER_MASK_MIN_FRACTION=TIER_MASK_MIN_FRACTION,
+                 TIER_MASK_CACHE_FOLDER=TIER_MASK_CACHE_FOLDER,
+                 WIND_ATLAS_REDUCTION_METHOD=WIND_ATLAS_REDUCTION_METHOD,
+                 WIND_ATLAS_REDUCTION_QUANTILE=WIND_ATLAS_REDUCTION_QUANTILE,
+                 WIND_ATLAS_PYRAMID_FOLDER=WIND_ATLAS_PYRAMID_FOLDER)
     elif OPTION == '5_1':
+        from Option_5_step1_geometry_selection import geometry_selection as option_5_step_1
         option_5_step_1(ATLITE_DUMMY_DATA, ATLITE_CAPACITY_FACTORS_FOLDERS, DUMMY_START_DATE, DUMMY_END_DATE,
                            DUMMY_LATITUDE_BOTTOM, DUMMY_LATITUDE_TOP, DUMMY_LONGITUDE_LEFT, DUMMY_LONGITUDE_RIGHT,
                            MAXIMUM_CAPACITY, DATA_VARIABLE_NAME, TIME_VARIABLE_NAME,
@@ -205,8 +378,21 @@ if __name__ == '__main__':
                            WIND_ATLAS_PNG_LONGITUDE_RIGHT, WIND_ATLAS_PNG_LATITUDE_TOP, WIND_ATLAS_RESOLUTION_REDUCTION,
                            WIND_ATLAS_CAPACITY_FACTORS_HEATMAP_FILE_LOCATION, WIND_ATLAS_HEATMAP_LATITUDE_VARIABLE_NAME,
                            WIND_ATLAS_HEATMAP_LONGITUDE_VARIABLE_NAME, WIND_ATLAS_HEATMAP_DATA_VARIABLE_NAME,
-                           MASKS_FOLDER)
+                           MASKS_FOLDER,
+                 ATLITE_TIME_FREQUENCY=ATLITE_TIME_FREQUENCY, TIME_WINDOW_START=TIME_WINDOW_START,
+                 TIME_WINDOW_END=TIME_WINDOW_END, TIME_WINDOW_MONTHS=TIME_WINDOW_MONTHS,
+                 ATLITE_CUBE_FILE=ATLITE_CUBE_FILE,
+                 SCALE_CAPACITY_FACTORS=SCALE_CAPACITY_FACTORS,
+                 STAGE_TIMING_LOG_FILE=STAGE_TIMING_LOG_FILE,
+                 ROI_BBOX=ROI_BBOX,
+                 ROI_GEOMETRY_FILE=ROI_GEOMETRY_FILE,
+                 ATLITE_PREFETCH_DEPTH=ATLITE_PREFETCH_DEPTH,
+                 ATLITE_FOLDER_MANIFESTS=ATLITE_FOLDER_MANIFESTS,
+                 WIND_ATLAS_REDUCTION_METHOD=WIND_ATLAS_REDUCTION_METHOD,
+                 WIND_ATLAS_REDUCTION_QUANTILE=WIND_ATLAS_REDUCTION_QUANTILE,
+                 WIND_ATLAS_PYRAMID_FOLDER=WIND_ATLAS_PYRAMID_FOLDER)
     elif OPTION == '5_2':
+        from Option_5_step2_tier_generation_average_per_geometry import option_5_process_geometries_into_tiers as option_5_step_2
         option_5_step_2(ATLITE_CAPACITY_FACTORS_FOLDERS, AVG_ATLITE_LONGITUDE_VARIABLE_NAME,
                                                AVG_ATLITE_LATITUDE_VARIABLE_NAME, AVG_ATLITE_DATA_VARIABLE_NAME,
                                                OPTION_5_USER_GEOMETRIES_GEOJSON_FILE, ATLITE_DUMMY_DATA,
@@ -215,8 +401,27 @@ if __name__ == '__main__':
                                                MAXIMUM_CAPACITY, DATA_VARIABLE_NAME, TIME_VARIABLE_NAME,
                                                AVG_ATLITE_CAPACITY_FACTORS_FILE_LOCATION, OPTION_5_OUTPUT_FOLDER,
                                                SCALE_CAPACITY_FACTORS, OPTION_5_OUTPUT_TIERS_FILE,
-                                               OPTION_5_GEOMETRY_REFERENCE_FILE, OPTION_5_VIEW_VALID_GEOMETRIES)
+                                               OPTION_5_GEOMETRY_REFERENCE_FILE, OPTION_5_VIEW_VALID_GEOMETRIES,
+                 ATLITE_TIME_FREQUENCY=ATLITE_TIME_FREQUENCY, TIME_WINDOW_START=TIME_WINDOW_START,
+                 TIME_WINDOW_END=TIME_WINDOW_END, TIME_WINDOW_MONTHS=TIME_WINDOW_MONTHS,
+                 TIER_STATISTICS=TIER_STATISTICS,
+                 ATLITE_CUBE_FILE=ATLITE_CUBE_FILE,
+                 STAGE_TIMING_LOG_FILE=STAGE_TIMING_LOG_FILE,
+                 ROI_BBOX=ROI_BBOX,
+                 ROI_GEOMETRY_FILE=ROI_GEOMETRY_FILE,
+                 ATLITE_CHUNKS=ATLITE_CHUNKS,
+                 TIER_DASK_SCHEDULER=TIER_DASK_SCHEDULER,
+                 TIER_DASK_NUM_WORKERS=TIER_DASK_NUM_WORKERS,
+                 ATLITE_PREFETCH_DEPTH=ATLITE_PREFETCH_DEPTH,
+                 ATLITE_FOLDER_MANIFESTS=ATLITE_FOLDER_MANIFESTS,
+                 CHECKPOINT_FOLDER=CHECKPOINT_FOLDER,
+                 RESUME=RESUME,
+                 TIER_MASKS_FOLDER=TIER_MASKS_FOLDER,
+                 TIER_MASK_MODE=TIER_MASK_MODE,
+                 TIER_MASK_MIN_FRACTION=TIER_MASK_MIN_FRACTION,
+                 TIER_MASK_CACHE_FOLDER=TIER_MASK_CACHE_FOLDER)
     elif OPTION == '6_1':
+        from Option_6_step1_geometry_selection import geometry_selection as option_6_step_1
         option_6_step_1(ATLITE_DUMMY_DATA, ATLITE_CAPACITY_FACTORS_FOLDERS, DUMMY_START_DATE, DUMMY_END_DATE,
                            DUMMY_LATITUDE_BOTTOM, DUMMY_LATITUDE_TOP, DUMMY_LONGITUDE_LEFT, DUMMY_LONGITUDE_RIGHT,
                            MAXIMUM_CAPACITY, DATA_VARIABLE_NAME, TIME_VARIABLE_NAME,
@@ -226,8 +431,27 @@ if __name__ == '__main__':
                            WIND_ATLAS_PNG_LONGITUDE_RIGHT, WIND_ATLAS_PNG_LATITUDE_TOP, WIND_ATLAS_RESOLUTION_REDUCTION,
                            WIND_ATLAS_CAPACITY_FACTORS_HEATMAP_FILE_LOCATION, WIND_ATLAS_HEATMAP_LATITUDE_VARIABLE_NAME,
                            WIND_ATLAS_HEATMAP_LONGITUDE_VARIABLE_NAME, WIND_ATLAS_HEATMAP_DATA_VARIABLE_NAME,
-                           MASKS_FOLDER)
+                           MASKS_FOLDER,
+                 ATLITE_TIME_FREQUENCY=ATLITE_TIME_FREQUENCY, TIME_WINDOW_START=TIME_WINDOW_START,
+                 TIME_WINDOW_END=TIME_WINDOW_END, TIME_WINDOW_MONTHS=TIME_WINDOW_MONTHS,
+                 ATLITE_CUBE_FILE=ATLITE_CUBE_FILE,
+                 SCALE_CAPACITY_FACTORS=SCALE_CAPACITY_FACTORS,
+                 PERCENT_UPPER_TIER1_CAPACITY_FACTORS=PERCENT_UPPER_TIER1_CAPACITY_FACTORS,
+                 PERCENT_UPPER_TIER2_CAPACITY_FACTORS=PERCENT_UPPER_TIER2_CAPACITY_FACTORS,
+                 PERCENT_UPPER_TIER3_CAPACITY_FACTORS=PERCENT_UPPER_TIER3_CAPACITY_FACTORS,
+                 PERCENT_UPPER_TIER4_CAPACITY_FACTORS=PERCENT_UPPER_TIER4_CAPACITY_FACTORS,
+                 PERCENT_UPPER_TIER5_CAPACITY_FACTORS=PERCENT_UPPER_TIER5_CAPACITY_FACTORS,
+                 TIER_SPECIFICATION=TIER_SPECIFICATION,
+                 STAGE_TIMING_LOG_FILE=STAGE_TIMING_LOG_FILE,
+                 ROI_BBOX=ROI_BBOX,
+                 ROI_GEOMETRY_FILE=ROI_GEOMETRY_FILE,
+                 ATLITE_PREFETCH_DEPTH=ATLITE_PREFETCH_DEPTH,
+                 ATLITE_FOLDER_MANIFESTS=ATLITE_FOLDER_MANIFESTS,
+                 WIND_ATLAS_REDUCTION_METHOD=WIND_ATLAS_REDUCTION_METHOD,
+                 WIND_ATLAS_REDUCTION_QUANTILE=WIND_ATLAS_REDUCTION_QUANTILE,
+                 WIND_ATLAS_PYRAMID_FOLDER=WIND_ATLAS_PYRAMID_FOLDER)
     elif OPTION == '6_2':
+        from Option_6_step2_tier_generation_bounds_per_geometry import option_6_process_geometries_into_tiers as option_6_step_2
         option_6_step_2(ATLITE_CAPACITY_FACTORS_FOLDERS, AVG_ATLITE_LONGITUDE_VARIABLE_NAME,
                                                AVG_ATLITE_LATITUDE_VARIABLE_NAME, AVG_ATLITE_DATA_VARIABLE_NAME,
                                                PERCENT_UPPER_TIER1_CAPACITY_FACTORS,
@@ -241,9 +465,54 @@ if __name__ == '__main__':
                                                DUMMY_LONGITUDE_RIGHT, MAXIMUM_CAPACITY, TIME_VARIABLE_NAME,
                                                AVG_ATLITE_CAPACITY_FACTORS_FILE_LOCATION, SCALE_CAPACITY_FACTORS,
                                                OPTION_6_OUTPUT_TIERS_FILE, OPTION_6_GEOMETRY_REFERENCE_FILE,
-                                               OPTION_6_VIEW_VALID_GEOMETRIES)
+                                               OPTION_6_VIEW_VALID_GEOMETRIES,
+                 ATLITE_TIME_FREQUENCY=ATLITE_TIME_FREQUENCY, TIME_WINDOW_START=TIME_WINDOW_START,
+                 TIME_WINDOW_END=TIME_WINDOW_END, TIME_WINDOW_MONTHS=TIME_WINDOW_MONTHS,
+                 TIER_STATISTICS=TIER_STATISTICS,
+                 TIER_SPECIFICATION=TIER_SPECIFICATION,
+                 ATLITE_CUBE_FILE=ATLITE_CUBE_FILE,
+                 STAGE_TIMING_LOG_FILE=STAGE_TIMING_LOG_FILE,
+                 ROI_BBOX=ROI_BBOX,
+                 ROI_GEOMETRY_FILE=ROI_GEOMETRY_FILE,
+                 ATLITE_CHUNKS=ATLITE_CHUNKS,
+                 TIER_DASK_SCHEDULER=TIER_DASK_SCHEDULER,
+                 TIER_DASK_NUM_WORKERS=TIER_DASK_NUM_WORKERS,
+                 ATLITE_PREFETCH_DEPTH=ATLITE_PREFETCH_DEPTH,
+                 ATLITE_FOLDER_MANIFESTS=ATLITE_FOLDER_MANIFESTS,
+                 CHECKPOINT_FOLDER=CHECKPOINT_FOLDER,
+                 RESUME=RESUME,
+                 TIER_MASKS_FOLDER=TIER_MASKS_FOLDER,
+                 TIER_MASK_MODE=TIER_MASK_MODE,
+                 TIER_MASK_MIN_FRACTION=TIER_MASK_MIN_FRACTION,
+                 TIER_MASK_CACHE_FOLDER=TIER_MASK_CACHE_FOLDER)
     elif OPTION == '7':
-        option_7(WIND_ATLAS_CAPACITY_FACTORS_HEATMAP_FILE_LOCATION, ATLITE_CAPACITY_FACTORS_FOLDERS)
+        from Option_7_WAD_Atlite_correction_user_defined import wind_atlas_correction as option_7
+        option_7(ATLITE_DUMMY_DATA, ATLITE_CAPACITY_FACTORS_FOLDERS, DUMMY_START_DATE, DUMMY_END_DATE,
+                 DUMMY_LATITUDE_BOTTOM, DUMMY_LATITUDE_TOP, DUMMY_LONGITUDE_LEFT, DUMMY_LONGITUDE_RIGHT,
+                 MAXIMUM_CAPACITY, DATA_VARIABLE_NAME, TIME_VARIABLE_NAME, AVG_ATLITE_CAPACITY_FACTORS_FILE_LOCATION,
+                 AVG_ATLITE_LATITUDE_VARIABLE_NAME, AVG_ATLITE_LONGITUDE_VARIABLE_NAME, REDUCED_WAD,
+                 WIND_ATLAS_RESOLUTION_REDUCTION, WIND_ATLAS_CAPACITY_FACTORS_HEATMAP_FILE_LOCATION,
+                 WIND_ATLAS_HEATMAP_LATITUDE_VARIABLE_NAME, WIND_ATLAS_HEATMAP_LONGITUDE_VARIABLE_NAME,
+                 WIND_ATLAS_HEATMAP_DATA_VARIABLE_NAME, OPTION_7_OUTPUT_FOLDER,
+                 OPTION_7_CORRECTION_METHOD=OPTION_7_CORRECTION_METHOD,
+                 OPTION_7_CORRECTED_CUBE_FILE=OPTION_7_CORRECTED_CUBE_FILE,
+                 OPTION_7_CORRECTION_FACTORS_FILE=OPTION_7_CORRECTION_FACTORS_FILE,
+                 OPTION_7_CORRECTION_TIME_CHUNK=OPTION_7_CORRECTION_TIME_CHUNK,
+                 ATLITE_TIME_FREQUENCY=ATLITE_TIME_FREQUENCY, TIME_WINDOW_START=TIME_WINDOW_START,
+                 TIME_WINDOW_END=TIME_WINDOW_END, TIME_WINDOW_MONTHS=TIME_WINDOW_MONTHS,
+                 STAGE_TIMING_LOG_FILE=STAGE_TIMING_LOG_FILE,
+                 ROI_BBOX=ROI_BBOX,
+                 ROI_GEOMETRY_FILE=ROI_GEOMETRY_FILE,
+                 ATLITE_CUBE_FILE=ATLITE_CUBE_FILE,
+                 OPTION_7_CUBE_COMPRESSION=OPTION_7_CUBE_COMPRESSION,
+                 OPTION_7_CUBE_CHUNK_LAYOUT=OPTION_7_CUBE_CHUNK_LAYOUT,
+                 ATLITE_PREFETCH_DEPTH=ATLITE_PREFETCH_DEPTH,
+                 ATLITE_FOLDER_MANIFESTS=ATLITE_FOLDER_MANIFESTS,
+                 CHECKPOINT_FOLDER=CHECKPOINT_FOLDER,
+                 RESUME=RESUME,
+                 WIND_ATLAS_REDUCTION_METHOD=WIND_ATLAS_REDUCTION_METHOD,
+                 WIND_ATLAS_REDUCTION_QUANTILE=WIND_ATLAS_REDUCTION_QUANTILE,
+                 WIND_ATLAS_PYRAMID_FOLDER=WIND_ATLAS_PYRAMID_FOLDER)
     else:
         print("WARNING: Unknown option: ",OPTION, ". Available options are 1,2,3,4,51,52,61,62,7")
 
@@ -5,6 +5,7 @@ import dash
 from dash import dcc, html
 from dotenv import load_dotenv
 import argparse
+import Option_Support_Functions as support_functions
 
 ################################
 # system args section
@@ -22,13 +23,9 @@ def parse_arguments():
     # parse args
     args = parser.parse_args()
 
-    # Check if all arguments are provided
-    if all(arg is None for arg in vars(args).values()):
-        raise ValueError("ERROR: All arguments are None!")
-
-    # Check if any of the arguments are provided
-    if any(arg is None for arg in vars(args).values()):
-        print("Warning only some arguments provided! Code may fail.")
+    # Check if only some of the arguments are provided (none at all: the .env file is used)
+    if any(arg is None for arg in vars(args).values()) and not all(arg is None for arg in vars(args).values()):
+        print("Warning only some arguments provided! The others are read from the .env file.")
 
     return args
 
@@ -72,11 +69,13 @@ def process_csv_files(folder_path,file_size_too_big):
     plots = []
     for root, dirs, files in os.walk(folder_path):
         for file in files:
-            if file.endswith(".csv"):
+            # the tier statistics summary is a table per statistic, not a time series
+            if file.endswith(".csv") and not file.endswith("_summary_statistics.csv"):
                 file_path = os.path.join(root, file)
                 file_size = os.path.getsize(file_path)
                 if file_size <= 50 * 1024 * 1024:  # 50 MB
-                    df = pd.read_csv(file_path)
+                    # first column is the time index of the tiers
+                    df = pd.read_csv(file_path, index_col=0, parse_dates=True)
                     if 'tier_1' in df.columns:
                         fig = px.line(df, x=df.index, y=df.columns, title=f'File: {file}')
                         plots.append(dcc.Graph(figure=fig))
@@ -147,28 +146,10 @@ if __name__ == '__main__':
     # check args or load env file and run codes
     print("Starting plotting for all options present ...")
 
-    try:
-        print("TRYING TO USE ARGUMENTS")
-        args = parse_arguments()
-        print("ARGUMENTS FOUND. USING ARGUMENTS")
-
-        # RUN CODES
-        plot_all_tiers(**vars(args))
-    except Exception as e:
-        print("ARGUMENTS NOT FOUND: ", e)
-        try:
-            print("TRYING TO LOAD ENV FILE VARIABLES")
-            # Load variables from the .env file
-            args = load_from_env()
-            print("ENV FILE FOUND. USING ENV FILE")
-
-            # RUN CODES
-            plot_all_tiers(**args)
-
-        except Exception as e:
-            print("ENV FILE NOT FOUND: ", e)
-            print("ERROR ... USER ARGS AND ENV FILE NOT FOUND, ABORTING!")
-            raise ValueError("COULD NOT FIND ARGS OR LOAD ENV FILE. USER ARGS OR ENV FILE MISSING.")
+    args = support_functions.script_arguments(parse_arguments(), load_from_env)
+
+    # RUN CODES
+    plot_all_tiers(**args)
 
     # args example use:
     # python View_all_tiers.py --OPTION_1_OUTPUT_FOLDER "assets/option_1_output" --OPTION_2_OUTPUT_FOLDER "assets/option_2_output"  --OPTION_3_OUTPUT_FOLDER "assets/option_3_output"  --OPTION_4_OUTPUT_FOLDER "assets/option_4_output"  --OPTION_5_OUTPUT_FOLDER "assets/option_5_output"  --OPTION_6_OUTPUT_FOLDER "assets/option_6_output"